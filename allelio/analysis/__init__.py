@@ -1,16 +1,30 @@
 """Allelio analysis module."""
 
+from .alleles import allele_dosage, hit_dosage
+from .cache import ResultCache, hash_genome
+from .cohort import CohortAnalysis, analyze_cohort
+from .incremental import FindingChange, GenomeDiff, reanalyze_cached, reanalyze_genome
 from .lookup import (
     ClinVarEntry,
     GWASEntry,
     VariantResult,
     VariantCategory,
     analyze_variants,
+    analyze_top_variants,
+    iter_ranked_hits,
+    iter_variant_results,
+    results_from_hits,
+    select_top_variants,
+    TopVariants,
     SIGNIFICANCE_RANKS,
     REVIEW_STATUS_STARS,
     HIGH_IMPACT_GENES,
     _get_review_stars,
 )
+from .pgx import DiplotypeCall, StarAlleleCaller, call_diplotypes
+from .prs import PRSResult, ScoreSet, stream_scores
+from .relatedness import PackedGenomes, PairComparison, compare_genomes, pack_genomes
+from .session import AnalysisSession, ResultPage, SessionPool
 
 __all__ = [
     "ClinVarEntry",
@@ -18,6 +32,35 @@ __all__ = [
     "VariantResult",
     "VariantCategory",
     "analyze_variants",
+    "analyze_top_variants",
+    "iter_ranked_hits",
+    "iter_variant_results",
+    "results_from_hits",
+    "select_top_variants",
+    "TopVariants",
+    "allele_dosage",
+    "hit_dosage",
+    "ResultCache",
+    "hash_genome",
+    "CohortAnalysis",
+    "analyze_cohort",
+    "DiplotypeCall",
+    "StarAlleleCaller",
+    "call_diplotypes",
+    "PRSResult",
+    "ScoreSet",
+    "stream_scores",
+    "PackedGenomes",
+    "PairComparison",
+    "compare_genomes",
+    "pack_genomes",
+    "AnalysisSession",
+    "ResultPage",
+    "SessionPool",
+    "FindingChange",
+    "GenomeDiff",
+    "reanalyze_cached",
+    "reanalyze_genome",
     "SIGNIFICANCE_RANKS",
     "REVIEW_STATUS_STARS",
     "HIGH_IMPACT_GENES",
@@ -0,0 +1,166 @@
+"""Genotype-aware allele matching.
+
+A lookup hit only says the user's rsID is annotated; whether the genotype
+actually carries the reported allele decides if the finding applies. The
+dosage of an allele (0, 1 or 2 copies) is resolved here against the alleles
+ingested with the annotation: ClinVar's REF>ALT pairs and the GWAS
+catalog's strongest risk allele.
+
+Consumer arrays report genotypes on either strand, so a genotype that only
+fits the known alleles after complementing is counted on the flipped
+strand. A/T and C/G SNPs look the same on both strands and are counted as
+reported. Array indels are encoded as I (the longer allele) and D (the
+shorter one). Anything that can't be resolved yields None rather than a
+guess, and callers keep such hits.
+
+Example:
+    allele_dosage("CT", "T", ("C", "T"))   # 1
+    allele_dosage("GA", "T", ("C", "T"))   # 1, reported on the minus strand
+    allele_dosage("DI", "AT", ("A", "AT")) # 1
+"""
+
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
+
+
+_COMPLEMENT = str.maketrans("ACGT", "TGCA")
+# Genotype characters that mark a no-call
+_NO_CALL = frozenset("-0.N")
+# Array encoding of insertion/deletion alleles
+_INDEL_CODES = ("I", "D")
+
+
+def reverse_complement(allele: str) -> str:
+    """Return the allele as read on the opposite strand."""
+    return allele.translate(_COMPLEMENT)[::-1]
+
+
+@lru_cache(maxsize=16384)
+def split_genotype(genotype: str, known: Tuple[str, ...] = ()) -> Optional[Tuple[str, str]]:
+    """Split a genotype string into its two alleles.
+
+    Single-letter genotypes (haploid calls) count twice. VCF genotypes of
+    multi-base alleles are concatenated ("AAT" for A/AT) and are split
+    using the known alleles.
+
+    Returns:
+        The two alleles, or None for a no-call or an unsplittable genotype
+    """
+    genotype = (genotype or "").strip().upper()
+    if not genotype or any(c in _NO_CALL for c in genotype):
+        return None
+    if len(genotype) == 1:
+        return genotype, genotype
+    if len(genotype) == 2:
+        return genotype[0], genotype[1]
+    for allele in known:
+        if genotype.startswith(allele) and genotype[len(allele):] in known:
+            return allele, genotype[len(allele):]
+    return None
+
+
+def _indel_code(allele: str, known: Tuple[str, ...]) -> Optional[str]:
+    """Map a sequence allele to the array's I/D code (None if not an indel)."""
+    if allele in _INDEL_CODES:
+        return allele
+    lengths = {len(a) for a in known}
+    if allele not in known or len(lengths) < 2:
+        return None
+    if len(allele) == max(lengths):
+        return "I"
+    if len(allele) == min(lengths):
+        return "D"
+    return None
+
+
+@lru_cache(maxsize=16384)
+def allele_dosage(genotype: str, allele: str, known: Tuple[str, ...] = ()) -> Optional[int]:
+    """Count the copies of ``allele`` in a genotype.
+
+    Args:
+        genotype: Genotype as parsed ("AG", "TT", "DI", "A", "--")
+        allele: Allele to count, as a sequence or an I/D code
+        known: Alleles of the site (e.g. REF and ALT) on the reference
+            strand; empty if unknown
+
+    Returns:
+        0, 1 or 2, or None if the genotype is a no-call or can't be
+        reconciled with the site's alleles on either strand
+    """
+    allele = allele.upper()
+    pair = split_genotype(genotype, known)
+    if pair is None or not allele:
+        return None
+
+    if pair[0] in _INDEL_CODES or pair[1] in _INDEL_CODES:
+        code = _indel_code(allele, known)
+        if code is None or any(a not in _INDEL_CODES for a in pair):
+            return None
+        return pair.count(code)
+    if allele in _INDEL_CODES:
+        return None
+
+    if known:
+        # Align the allele, then the genotype, to the strand of the known alleles
+        if allele not in known and reverse_complement(allele) in known:
+            allele = reverse_complement(allele)
+        if pair[0] in known and pair[1] in known:
+            return pair.count(allele)
+        flipped = (reverse_complement(pair[0]), reverse_complement(pair[1]))
+        if flipped[0] in known and flipped[1] in known:
+            return flipped.count(allele)
+        return None
+
+    # Unknown site alleles: trust the reported strand unless a heterozygous
+    # call lacking the allele can only be explained by the other one
+    if allele in pair:
+        return pair.count(allele)
+    if pair[0] == pair[1]:
+        return 0
+    flipped = (reverse_complement(pair[0]), reverse_complement(pair[1]))
+    if allele in flipped:
+        return flipped.count(allele)
+    return None
+
+
+def _site_alleles(clinvar_rows) -> Tuple[Tuple[str, str], ...]:
+    """(REF, ALT) pairs from the ``alleles`` column of ClinVar rows."""
+    pairs = []
+    for row in clinvar_rows:
+        for pair in (row.get("alleles") or "").split(","):
+            ref, sep, alt = pair.partition(">")
+            if sep and ref and alt:
+                pairs.append((ref.upper(), alt.upper()))
+    return tuple(pairs)
+
+
+def hit_dosage(data: Dict[str, Any], genotype: Optional[str]) -> Optional[int]:
+    """Copies of the reported alleles a genotype carries for one lookup row.
+
+    ClinVar rows count their ALT allele(s) and GWAS rows their risk
+    allele; the highest dosage any of them resolves wins.
+
+    Args:
+        data: Lookup row from lookup_rsids_batch (or a ResultCache hit)
+        genotype: The user's genotype at the rsID
+
+    Returns:
+        The dosage, or None if no allele of the row could be matched
+    """
+    if not genotype:
+        return None
+    pairs = _site_alleles(data["clinvar"])
+    known = tuple(sorted({allele for pair in pairs for allele in pair}))
+
+    best = None
+    for ref, alt in pairs:
+        dosage = allele_dosage(genotype, alt, (ref, alt))
+        if dosage is not None and (best is None or dosage > best):
+            best = dosage
+    for row in data["gwas"]:
+        if not row.get("risk_allele"):
+            continue
+        dosage = allele_dosage(genotype, row["risk_allele"], known)
+        if dosage is not None and (best is None or dosage > best):
+            best = dosage
+    return best
@@ -0,0 +1,447 @@
+"""Persistent cache of analysis results.
+
+Analyzing the same genotype file against an unchanged reference database
+gives the same hits, so ranked hits (see ``iter_ranked_hits``) are stored in
+a compact form — positional rows as zlib-compressed JSON — keyed by the
+file's SHA-256, the analysis options, and the database's ``data_version``.
+A cached entry replaces parsing, lookup and classification; ranking the
+top results from it is a single pass.
+
+Interned strings (ClinVar conditions, GWAS study titles) are stored as their
+text rather than as conditions_id/study_id: string ids are local to one
+store and are handed out again when annotations are reloaded or sharded,
+while the data version only tracks annotation content. Entries computed against another data version are never returned; they are
+kept so ``reanalyze`` can bring them up to date from the genome's stored
+rsIDs and the database's change log (see allelio.analysis.incremental).
+
+The cache holds genotypes, so callers only write to it when the user asks
+(``allelio analyze --save-for-reanalysis``); ``allelio cache clear`` empties it.
+
+Example:
+    cache = ResultCache()
+    cached = cache.get(hash_genome(path), db.data_version())
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Generator, Iterable, List, Optional, Tuple, Union
+
+from allelio.parsers.base import Variant
+
+
+CACHE_FORMAT = 3
+DEFAULT_MAX_ENTRIES = 64
+
+# Positional layout of cached ClinVar and GWAS rows
+_CLINVAR_FIELDS = ("rsid", "gene", "clinical_significance", "conditions", "review_status", "conditions_id",
+                   "alleles")
+_GWAS_FIELDS = ("rsid", "trait", "p_value", "odds_ratio", "mapped_gene", "study", "pubmed_id", "study_id",
+                "risk_allele")
+_NOT_ANNOTATIONS = ("clinvar", "gwas", "current_rsid")
+_RSID_NUMBER_RE = re.compile(r"^rs(\d+)$")
+
+
+def hash_genome(source: Union[str, Path, bytes]) -> str:
+    """Return the SHA-256 of a genotype file's content.
+
+    Args:
+        source: Path to the file, or its content as bytes
+    """
+    if isinstance(source, bytes):
+        return hashlib.sha256(source).hexdigest()
+    digest = hashlib.sha256()
+    with open(source, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _options_key(include_benign: bool, traits_only: bool) -> str:
+    return f"include_benign={int(include_benign)},traits_only={int(traits_only)}"
+
+
+def _parse_options(options: str) -> Dict[str, bool]:
+    return {key: value == "1" for key, _, value in (part.partition("=") for part in options.split(","))}
+
+
+def _encode_row(row: Dict[str, Any], fields: tuple, text: str, ref: str, strings: Any) -> list:
+    """Return a row's positional values with its interned string stored as text."""
+    values = [row.get(f) for f in fields]
+    if strings is not None and row.get(ref) is not None:
+        if row.get(text) is None:
+            values[fields.index(text)] = strings.resolve_string(row[ref])
+        values[fields.index(ref)] = None
+    return values
+
+
+def _encode_hit(hit: tuple, strings: Any = None) -> list:
+    """Encode a hit; ``strings`` (the store it came from) resolves interned string refs."""
+    rsid, data, variant, sig_rank, category = hit
+    return [
+        rsid,
+        getattr(variant, "chromosome", None),
+        getattr(variant, "position", None),
+        getattr(variant, "genotype", None),
+        sig_rank,
+        category,
+        [_encode_row(row, _CLINVAR_FIELDS, "conditions", "conditions_id", strings) for row in data["clinvar"]],
+        [_encode_row(row, _GWAS_FIELDS, "study", "study_id", strings) for row in data["gwas"]],
+        {name: rows for name, rows in data.items() if name not in _NOT_ANNOTATIONS and rows},
+    ]
+
+
+def _decode_hit(row: list) -> tuple:
+    rsid, chromosome, position, genotype, sig_rank, category, clinvar, gwas, annotations = row
+    data = {
+        "clinvar": [dict(zip(_CLINVAR_FIELDS, values)) for values in clinvar],
+        "gwas": [dict(zip(_GWAS_FIELDS, values)) for values in gwas],
+        **annotations,
+    }
+    return rsid, data, Variant(rsid, chromosome, position, genotype), sig_rank, category
+
+
+class ResultCache:
+    """SQLite-backed store of ranked hits per (genome, data version, options).
+
+    Safe to share between threads; keeps at most ``max_entries`` entries,
+    dropping the least recently used.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = DEFAULT_MAX_ENTRIES):
+        """Open (and create if needed) the cache database.
+
+        Args:
+            path: Cache file. Defaults to ~/.allelio/data/result_cache.db
+            max_entries: Entries kept before the least recently used are dropped
+        """
+        if path is None:
+            path = os.path.expanduser("~/.allelio/data/result_cache.db")
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                genome_hash TEXT NOT NULL,
+                options TEXT NOT NULL,
+                data_version TEXT NOT NULL,
+                variant_count INTEGER NOT NULL,
+                created_at TEXT,
+                last_used REAL,
+                payload BLOB NOT NULL,
+                PRIMARY KEY (genome_hash, options)
+            )
+        """)
+        # rsIDs and genotypes of analyzed genomes, for incremental re-analysis.
+        # Only numeric rsIDs are kept; others never match an annotation.
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS genomes (
+                genome_hash TEXT PRIMARY KEY,
+                name TEXT,
+                variant_count INTEGER NOT NULL,
+                stored_at TEXT
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS genome_variants (
+                genome_hash TEXT NOT NULL,
+                rsid INTEGER NOT NULL,
+                ordinal INTEGER NOT NULL,
+                chromosome TEXT,
+                position INTEGER,
+                genotype TEXT,
+                PRIMARY KEY (genome_hash, rsid)
+            ) WITHOUT ROWID
+        """)
+        self.conn.commit()
+
+    def get(
+        self,
+        genome_hash: str,
+        data_version: str,
+        include_benign: bool = False,
+        traits_only: bool = False,
+    ) -> Optional[Tuple[List[tuple], int]]:
+        """Return cached hits for a genome, or None on a miss.
+
+        Args:
+            genome_hash: hash_genome() of the genotype file
+            data_version: Current AllelioDB.data_version()
+            include_benign: Analysis option the hits were computed with
+            traits_only: Analysis option the hits were computed with
+
+        Returns:
+            (hits in input order, number of variants in the file), or None
+        """
+        entry = self.load(genome_hash, include_benign, traits_only)
+        if entry is None or entry[2] != data_version:
+            return None
+        with self._lock:
+            self.conn.execute(
+                "UPDATE results SET last_used = ? WHERE genome_hash = ? AND options = ?",
+                (time.time(), genome_hash, _options_key(include_benign, traits_only)),
+            )
+            self.conn.commit()
+        return entry[0], entry[1]
+
+    def load(
+        self,
+        genome_hash: str,
+        include_benign: bool = False,
+        traits_only: bool = False,
+    ) -> Optional[Tuple[List[tuple], int, str]]:
+        """Return a genome's cached hits whatever data version they were computed against.
+
+        Returns:
+            (hits in input order, number of variants, data version), or None
+        """
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT payload, variant_count, data_version FROM results WHERE genome_hash = ? AND options = ?",
+                (genome_hash, _options_key(include_benign, traits_only)),
+            ).fetchone()
+        if row is None:
+            return None
+
+        document = json.loads(zlib.decompress(row[0]))
+        if document.get("format") != CACHE_FORMAT:
+            return None
+        return [_decode_hit(hit) for hit in document["hits"]], row[1], row[2]
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """List cached entries, most recently used first.
+
+        Returns:
+            Dicts with genome_hash, name (None unless the genome is stored),
+            include_benign, traits_only, data_version and variant_count
+        """
+        with self._lock:
+            rows = self.conn.execute("""
+                SELECT r.genome_hash, g.name, r.options, r.data_version, r.variant_count
+                FROM results r LEFT JOIN genomes g ON g.genome_hash = r.genome_hash
+                ORDER BY r.last_used DESC
+            """).fetchall()
+        return [
+            {"genome_hash": genome_hash, "name": name, **_parse_options(options),
+             "data_version": data_version, "variant_count": variant_count}
+            for genome_hash, name, options, data_version, variant_count in rows
+        ]
+
+    def put(
+        self,
+        genome_hash: str,
+        data_version: str,
+        hits: Iterable[tuple],
+        variant_count: int,
+        include_benign: bool = False,
+        traits_only: bool = False,
+        strings: Any = None,
+    ) -> None:
+        """Store the hits of one analysis (see get for the arguments).
+
+        ``strings`` is the AllelioDB the hits were looked up in; their
+        interned string references are resolved against it and stored as text.
+        """
+        self._store(genome_hash, data_version, [_encode_hit(hit, strings) for hit in hits],
+                    variant_count, include_benign, traits_only)
+
+    def record(
+        self,
+        hits: Iterable[tuple],
+        genome_hash: str,
+        data_version: str,
+        variant_count: int,
+        include_benign: bool = False,
+        traits_only: bool = False,
+        strings: Any = None,
+    ) -> Generator[tuple, None, None]:
+        """Pass hits through, storing them once the stream is fully consumed.
+
+        Only the compact encoding is kept meanwhile, so callers can stream
+        hits (e.g. into select_top_variants) and populate the cache in the
+        same pass. ``strings`` is as for put.
+        """
+        encoded = []
+        for hit in hits:
+            encoded.append(_encode_hit(hit, strings))
+            yield hit
+        self._store(genome_hash, data_version, encoded, variant_count, include_benign, traits_only)
+
+    def _store(self, genome_hash, data_version, encoded, variant_count, include_benign, traits_only) -> None:
+        payload = zlib.compress(
+            json.dumps({"format": CACHE_FORMAT, "hits": encoded}, separators=(",", ":")).encode("utf-8")
+        )
+        with self._lock:
+            self.conn.execute(
+                """INSERT OR REPLACE INTO results
+                   (genome_hash, options, data_version, variant_count, created_at, last_used, payload)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (genome_hash, _options_key(include_benign, traits_only), data_version, variant_count,
+                 datetime.now().isoformat(), time.time(), payload),
+            )
+            # Keep the most recently used entries
+            cursor = self.conn.execute(
+                """DELETE FROM results WHERE rowid NOT IN
+                   (SELECT rowid FROM results ORDER BY last_used DESC LIMIT ?)""",
+                (self.max_entries,),
+            )
+            if cursor.rowcount:
+                self._drop_orphan_genomes()
+            self.conn.commit()
+
+    def store_genome(self, genome_hash: str, variants: Iterable[Any], name: Optional[str] = None) -> bool:
+        """Keep a genome's rsIDs and genotypes for incremental re-analysis.
+
+        The first occurrence of an rsID sets its position in the genome and
+        the last one its genotype, as in iter_ranked_hits.
+
+        Args:
+            genome_hash: hash_genome() of the genotype file
+            variants: The file's parsed variants
+            name: Display name (e.g. the file name)
+
+        Returns:
+            False if the genome was already stored
+        """
+        with self._lock:
+            if self.conn.execute("SELECT 1 FROM genomes WHERE genome_hash = ?", (genome_hash,)).fetchone():
+                return False
+
+        rows = {}
+        count = 0
+        for count, variant in enumerate(variants, 1):
+            match = _RSID_NUMBER_RE.match(getattr(variant, "rsid", "") or "")
+            if match is None:
+                continue
+            number = int(match.group(1))
+            ordinal = rows[number][1] if number in rows else len(rows)
+            rows[number] = (genome_hash, ordinal, number, variant.chromosome, variant.position, variant.genotype)
+
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO genomes (genome_hash, name, variant_count, stored_at) VALUES (?, ?, ?, ?)",
+                (genome_hash, name, count, datetime.now().isoformat()),
+            )
+            self.conn.execute("DELETE FROM genome_variants WHERE genome_hash = ?", (genome_hash,))
+            self.conn.executemany(
+                """INSERT INTO genome_variants (genome_hash, ordinal, rsid, chromosome, position, genotype)
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                rows.values(),
+            )
+            self.conn.commit()
+        return True
+
+    def genome_info(self, genome_hash: str) -> Optional[Dict[str, Any]]:
+        """Return a stored genome's name, variant_count and stored_at, or None if not stored."""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT name, variant_count, stored_at FROM genomes WHERE genome_hash = ?", (genome_hash,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"name": row[0], "variant_count": row[1], "stored_at": row[2]}
+
+    def genome_variants(self, genome_hash: str, rsids: Optional[Iterable[str]] = None) -> List[Variant]:
+        """Return a stored genome's variants in file order.
+
+        Args:
+            genome_hash: hash_genome() of the genotype file
+            rsids: Only return variants with these rsIDs. The set is joined
+                against the genome's rsID index, so the cost follows its size
+                rather than the genome's.
+        """
+        query = """SELECT v.rsid, v.chromosome, v.position, v.genotype FROM genome_variants v
+                   WHERE v.genome_hash = ? ORDER BY v.ordinal"""
+        with self._lock:
+            if rsids is None:
+                rows = self.conn.execute(query, (genome_hash,)).fetchall()
+            else:
+                self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS selected_rsids (rsid INTEGER PRIMARY KEY)")
+                self.conn.execute("DELETE FROM temp.selected_rsids")
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO temp.selected_rsids (rsid) VALUES (?)",
+                    ((int(m.group(1)),) for m in map(_RSID_NUMBER_RE.match, rsids) if m),
+                )
+                rows = self.conn.execute(
+                    """SELECT v.rsid, v.chromosome, v.position, v.genotype
+                       FROM temp.selected_rsids s
+                       JOIN genome_variants v ON v.genome_hash = ? AND v.rsid = s.rsid
+                       ORDER BY v.ordinal""",
+                    (genome_hash,),
+                ).fetchall()
+                self.conn.execute("DELETE FROM temp.selected_rsids")
+        return [Variant(f"rs{rsid}", chromosome, position, genotype) for rsid, chromosome, position, genotype in rows]
+
+    def genome_ordinals(self, genome_hash: str, rsids: Iterable[str]) -> Dict[str, int]:
+        """Return the position in the stored genome of each given rsID."""
+        numbers = [int(m.group(1)) for m in map(_RSID_NUMBER_RE.match, rsids) if m]
+        ordinals = {}
+        with self._lock:
+            for i in range(0, len(numbers), 500):
+                chunk = numbers[i:i + 500]
+                rows = self.conn.execute(
+                    f"""SELECT rsid, ordinal FROM genome_variants
+                        WHERE genome_hash = ? AND rsid IN ({','.join('?' * len(chunk))})""",
+                    (genome_hash, *chunk),
+                ).fetchall()
+                ordinals.update((f"rs{rsid}", ordinal) for rsid, ordinal in rows)
+        return ordinals
+
+    def _drop_orphan_genomes(self) -> None:
+        """Delete stored genomes no cached entry refers to (caller holds the lock)."""
+        orphans = self.conn.execute(
+            "SELECT genome_hash FROM genomes WHERE genome_hash NOT IN (SELECT genome_hash FROM results)"
+        ).fetchall()
+        for (genome_hash,) in orphans:
+            self.conn.execute("DELETE FROM genome_variants WHERE genome_hash = ?", (genome_hash,))
+            self.conn.execute("DELETE FROM genomes WHERE genome_hash = ?", (genome_hash,))
+
+    def evict_stale(self, data_version: str) -> int:
+        """Delete entries computed against any other data version.
+
+        Returns:
+            Number of entries deleted
+        """
+        with self._lock:
+            cursor = self.conn.execute("DELETE FROM results WHERE data_version != ?", (data_version,))
+            self._drop_orphan_genomes()
+            self.conn.commit()
+            return cursor.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the number of entries, their total payload size in bytes and the stored genomes."""
+        with self._lock:
+            count, size = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(payload)), 0) FROM results"
+            ).fetchone()
+            genomes = self.conn.execute("SELECT COUNT(*) FROM genomes").fetchone()[0]
+        return {"entries": count, "bytes": size, "genomes": genomes}
+
+    def clear(self) -> None:
+        """Delete every entry and stored genome."""
+        with self._lock:
+            self.conn.execute("DELETE FROM results")
+            self.conn.execute("DELETE FROM genome_variants")
+            self.conn.execute("DELETE FROM genomes")
+            self.conn.commit()
+            # Rewrite the file so deleted genotypes don't linger in free pages
+            self.conn.execute("VACUUM")
+
+    def close(self) -> None:
+        """Close the cache database."""
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
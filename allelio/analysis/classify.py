@@ -0,0 +1,147 @@
+"""Compiled significance, review-status and category classification.
+
+ClinVar uses a few hundred distinct clinical-significance and review-status
+strings, and GWAS hits repeat the same trait names across studies, so each
+rule set is compiled once (keyword lists become one case-insensitive regex)
+and every distinct input string is classified once and memoized. Per-hit
+classification in analyze_variants and the report is then a cache lookup.
+"""
+
+import re
+from functools import lru_cache
+from typing import Iterable, Optional
+
+from allelio.database.clinvar import review_stars as _review_stars
+
+
+# Significance ranking for clinical significance strings (lower = more significant)
+SIGNIFICANCE_RANKS = {
+    "pathogenic": 1,
+    "likely pathogenic": 2,
+    "pathogenic/likely pathogenic": 2,
+    "risk factor": 3,
+    "association": 4,
+    "protective": 5,
+    "conflicting data": 6,
+    "conflicting interpretations": 6,
+    "uncertain significance": 7,
+    "likely benign": 8,
+    "benign": 10,
+    "benign/likely benign": 10,
+}
+
+UNRANKED = 999
+
+# Category names (values of analysis.lookup.VariantCategory)
+HEALTH_CONDITIONS = "Health Conditions"
+RISK_FACTORS = "Risk Factors"
+PHARMACOGENOMICS = "Pharmacogenomics"
+TRAITS = "Traits"
+CARRIER_STATUS = "Carrier Status"
+UNKNOWN = "Unknown"
+
+# ClinVar significance rules, checked in priority order
+_CLINVAR_CATEGORY_RULES = (
+    (re.compile(r"pathogenic", re.IGNORECASE), HEALTH_CONDITIONS),
+    (re.compile(r"risk[ _]factor|association", re.IGNORECASE), RISK_FACTORS),
+    (re.compile(r"benign", re.IGNORECASE), CARRIER_STATUS),
+)
+
+# GWAS trait rules, checked in priority order
+_TRAIT_CATEGORY_RULES = (
+    (re.compile(r"drug|pharmacogenom|medication|response", re.IGNORECASE), PHARMACOGENOMICS),
+    (re.compile(r"risk|association", re.IGNORECASE), RISK_FACTORS),
+)
+
+# Significance tiers shown in reports: (highest rank in tier, label)
+_SIGNIFICANCE_TIERS = ((2, "High"), (4, "Moderate"), (6, "Low"))
+
+
+@lru_cache(maxsize=4096)
+def significance_rank(clinical_significance: Optional[str]) -> int:
+    """Get numeric significance rank from clinical significance string.
+
+    Args:
+        clinical_significance: Clinical significance string
+
+    Returns:
+        Numeric rank (lower = more significant); 999 when unranked
+    """
+    if not clinical_significance:
+        return UNRANKED
+
+    sig_lower = clinical_significance.lower()
+
+    # Exact matches take priority
+    rank = SIGNIFICANCE_RANKS.get(sig_lower)
+    if rank is not None:
+        return rank
+
+    # Substring matches, in table order
+    for key, rank in SIGNIFICANCE_RANKS.items():
+        if key in sig_lower:
+            return rank
+
+    return UNRANKED
+
+
+@lru_cache(maxsize=4096)
+def review_stars(review_status: Optional[str]) -> int:
+    """Convert a ClinVar review status string to a 0-4 star rating (memoized)."""
+    return _review_stars(review_status)
+
+
+@lru_cache(maxsize=4096)
+def clinvar_category(clinical_significance: Optional[str]) -> Optional[str]:
+    """Category implied by a ClinVar significance, or None if it implies none."""
+    if not clinical_significance:
+        return None
+    for pattern, category in _CLINVAR_CATEGORY_RULES:
+        if pattern.search(clinical_significance):
+            return category
+    return None
+
+
+@lru_cache(maxsize=65536)
+def trait_category(trait: Optional[str]) -> Optional[str]:
+    """Category implied by a GWAS trait name, or None if it implies none."""
+    if not trait:
+        return None
+    for pattern, category in _TRAIT_CATEGORY_RULES:
+        if pattern.search(trait):
+            return category
+    return None
+
+
+def determine_category(clinical_significance: Optional[str], traits: Iterable[Optional[str]]) -> str:
+    """Determine a hit's category from its ClinVar significance and GWAS traits.
+
+    ClinVar significance decides first; otherwise the first GWAS trait that
+    implies a category wins, and GWAS-only hits default to Traits.
+
+    Args:
+        clinical_significance: ClinVar significance, or None without a ClinVar entry
+        traits: Trait names of the hit's GWAS entries
+
+    Returns:
+        Category string
+    """
+    category = clinvar_category(clinical_significance)
+    if category is not None:
+        return category
+
+    has_gwas = False
+    for trait in traits:
+        has_gwas = True
+        category = trait_category(trait)
+        if category is not None:
+            return category
+    return TRAITS if has_gwas else UNKNOWN
+
+
+def significance_tier(rank: float) -> str:
+    """Return the report tier ("High", "Moderate", "Low", "Minimal") for a rank."""
+    for upper, label in _SIGNIFICANCE_TIERS:
+        if rank <= upper:
+            return label
+    return "Minimal"
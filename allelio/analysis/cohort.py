@@ -0,0 +1,198 @@
+"""Cohort analysis: many genomes against one shared set of lookups.
+
+Genotyping arrays of the same family share most of their rsIDs, so
+analyzing N genomes one by one repeats nearly the same database lookups N
+times. ``analyze_cohort`` instead looks up the union of the cohort's rsIDs
+once, ranks and classifies each annotated rsID once, and then fans the
+shared annotations out to every sample's genotypes. Per-sample results are
+built on a process pool that receives the (small) table of annotated rsIDs
+once per worker.
+
+Example:
+    cohort = analyze_cohort({"alice": alice_variants, "bob": bob_variants}, db)
+    cohort.results["alice"]  # same as analyze_variants(alice_variants, db)
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Set, Tuple
+
+from allelio.database.store import AllelioDB
+from allelio.parsers.base import Variant
+
+from .alleles import hit_dosage
+from .lookup import (
+    LOOKUP_CHUNK_SIZE,
+    VariantResult,
+    _build_result,
+    _rank_hit,
+    select_top_variants,
+)
+
+
+# rsid -> (lookup row, significance_rank, category) for every rsID that matched
+_Annotations = Dict[str, Tuple[Dict[str, Any], float, str]]
+
+
+@dataclass
+class CohortAnalysis:
+    """Outcome of analyze_cohort."""
+    # Sample id -> results sorted by significance rank, as from analyze_variants
+    results: Dict[str, List[VariantResult]] = field(default_factory=dict)
+    # Distinct rsIDs across the cohort, each looked up once
+    unique_rsids: int = 0
+    # Of those, rsIDs with a (non-filtered) annotation
+    annotated_rsids: int = 0
+    lookup_seconds: float = 0.0
+    build_seconds: float = 0.0
+
+
+def _resolve_strings(data: Dict[str, Any], db: AllelioDB) -> None:
+    """Replace interned string references with their text, so rows need no database."""
+    for row in data["clinvar"]:
+        if row.get("conditions") is None and row.get("conditions_id") is not None:
+            row["conditions"] = db.resolve_string(row["conditions_id"])
+    for row in data["gwas"]:
+        if row.get("study") is None and row.get("study_id") is not None:
+            row["study"] = db.resolve_string(row["study_id"])
+
+
+def _shared_annotations(
+    rsids: List[str],
+    db: AllelioDB,
+    include_benign: bool,
+    categories: Optional[Set[str]],
+    chunk_size: int,
+) -> _Annotations:
+    """Look up, rank and filter each distinct rsID once."""
+    annotated = {}
+    for i in range(0, len(rsids), chunk_size):
+        for rsid, data in db.lookup_rsids_batch(rsids[i:i + chunk_size]).items():
+            ranked = _rank_hit(data)
+            if ranked is None:
+                continue
+            sig_rank, category = ranked
+            if not include_benign and sig_rank >= 8:
+                continue
+            if categories is not None and category not in categories:
+                continue
+            _resolve_strings(data, db)
+            annotated[rsid] = (data, sig_rank, category)
+    return annotated
+
+
+def _matched_variants(variants: Sequence[Any], annotated: _Annotations, carriers_only: bool) -> List[tuple]:
+    """A sample's annotated variants as plain tuples, deduplicated like iter_ranked_hits.
+
+    The first occurrence of an rsID sets its order and the last one its
+    genotype. With ``carriers_only``, variants whose genotype carries none
+    of the reported alleles are dropped.
+    """
+    matched = {}
+    for v in variants:
+        rsid = getattr(v, "rsid", str(v))
+        if rsid in annotated:
+            matched[rsid] = (
+                rsid,
+                getattr(v, "chromosome", None),
+                getattr(v, "position", None),
+                getattr(v, "genotype", None),
+            )
+    if carriers_only:
+        return [m for m in matched.values() if hit_dosage(annotated[m[0]][0], m[3]) != 0]
+    return list(matched.values())
+
+
+def _build_sample(
+    matched: List[tuple],
+    annotated: _Annotations,
+    top: Optional[int],
+) -> List[VariantResult]:
+    """Build one sample's sorted results from its matched variants."""
+    hits = (
+        (rsid, annotated[rsid][0], Variant(rsid, chromosome, position, genotype), *annotated[rsid][1:])
+        for rsid, chromosome, position, genotype in matched
+    )
+    if top is not None:
+        return select_top_variants(hits, None, top).top
+
+    results = [
+        _build_result(rsid, data, variant, category, sig_rank, None)
+        for rsid, data, variant, sig_rank, category in hits
+    ]
+    results.sort(key=lambda x: x.significance_rank)
+    return results
+
+
+# Shared annotations for pool workers, set once per process by _init_worker
+# so the table is not pickled with every sample
+_worker_annotations: Optional[_Annotations] = None
+
+
+def _init_worker(annotated: _Annotations) -> None:
+    """Process pool initializer for analyze_cohort."""
+    global _worker_annotations
+    _worker_annotations = annotated
+
+
+def _analyze_sample(matched: List[tuple], top: Optional[int]) -> List[VariantResult]:
+    return _build_sample(matched, _worker_annotations, top)
+
+
+def analyze_cohort(
+    genomes: Mapping[str, Sequence[Any]],
+    db: AllelioDB,
+    include_benign: bool = False,
+    categories: Optional[Set[str]] = None,
+    top: Optional[int] = None,
+    workers: Optional[int] = None,
+    chunk_size: int = LOOKUP_CHUNK_SIZE,
+    carriers_only: bool = True,
+) -> CohortAnalysis:
+    """Analyze many genomes with one lookup per distinct rsID.
+
+    Args:
+        genomes: Sample id -> parsed variants (Variant objects with rsid attribute)
+        db: AllelioDB (or ShardedAllelioDB) database instance
+        include_benign: Whether to include benign variants
+        categories: Only keep results in these categories
+        top: Keep only each sample's ``top`` most significant results
+        workers: Worker processes building per-sample results. 1 builds
+            in-process; None or 0 uses one per CPU.
+        chunk_size: rsIDs looked up per batch
+        carriers_only: Drop each sample's hits whose genotype carries none
+            of the reported alleles
+
+    Returns:
+        CohortAnalysis with per-sample results in the order of ``genomes``
+    """
+    cohort = CohortAnalysis()
+    if not genomes:
+        return cohort
+
+    start = time.perf_counter()
+    rsids = list(dict.fromkeys(
+        rsid
+        for variants in genomes.values()
+        for rsid in (getattr(v, "rsid", str(v)) for v in variants)
+        if rsid
+    ))
+    annotated = _shared_annotations(rsids, db, include_benign, categories, chunk_size)
+    cohort.unique_rsids = len(rsids)
+    cohort.annotated_rsids = len(annotated)
+    cohort.lookup_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    samples = list(genomes)
+    matched = [_matched_variants(genomes[sample], annotated, carriers_only) for sample in samples]
+    workers = min(workers or os.cpu_count() or 1, len(samples))
+    if workers == 1:
+        built = [_build_sample(m, annotated, top) for m in matched]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(annotated,)) as pool:
+            built = list(pool.map(_analyze_sample, matched, [top] * len(matched)))
+    cohort.results = dict(zip(samples, built))
+    cohort.build_seconds = time.perf_counter() - start
+    return cohort
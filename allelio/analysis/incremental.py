@@ -0,0 +1,207 @@
+"""Incremental re-analysis of cached genomes after a database update.
+
+Every data version records which rsIDs it added, changed or removed
+(``AllelioDB.changes_since``), and the result cache keeps each analyzed
+genome's rsIDs (``ResultCache.store_genome``). Bringing a cached analysis
+up to date therefore only needs the rsIDs in both sets: they are looked up
+again, their hits replace the old ones, and the differences are reported
+as a "what changed for you" diff. A weekly refresh of many genomes costs
+in proportion to the update, not to the genomes' size.
+
+Example:
+    with ResultCache() as cache:
+        for diff in reanalyze_cached(cache, db):
+            print(diff.name, len(diff.changes))
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from allelio.database.store import AllelioDB
+
+from .cache import ResultCache, _encode_hit
+from .lookup import VariantResult, _build_result, iter_ranked_hits
+
+
+# FindingChange.change values
+NEW = "new"
+REMOVED = "removed"
+CHANGED = "changed"
+
+
+@dataclass
+class FindingChange:
+    """One finding that differs between two data versions."""
+    rsid: str
+    change: str
+    before: Optional[VariantResult] = None
+    after: Optional[VariantResult] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize for JSON output."""
+        def summary(result):
+            if result is None:
+                return None
+            clinvar = result.clinvar_entries[0] if result.clinvar_entries else None
+            return {
+                "category": result.category,
+                "significance_rank": result.significance_rank,
+                "clinical_significance": clinvar.clinical_significance if clinvar else None,
+                "gene": clinvar.gene if clinvar else None,
+                "traits": [entry.trait for entry in result.gwas_entries],
+            }
+
+        return {"rsid": self.rsid, "change": self.change,
+                "before": summary(self.before), "after": summary(self.after)}
+
+
+@dataclass
+class GenomeDiff:
+    """The result of bringing one cached analysis up to the current data version."""
+    genome_hash: str
+    name: Optional[str]
+    from_version: str
+    to_version: str
+    include_benign: bool = False
+    traits_only: bool = False
+    # rsIDs of the genome that were looked up again
+    rechecked: int = 0
+    # The change log did not reach back to from_version, so every rsID was rechecked
+    full: bool = False
+    changes: List[FindingChange] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize for JSON output."""
+        return {
+            "genome_hash": self.genome_hash,
+            "name": self.name,
+            "from_version": self.from_version,
+            "to_version": self.to_version,
+            "include_benign": self.include_benign,
+            "traits_only": self.traits_only,
+            "rechecked": self.rechecked,
+            "full": self.full,
+            "changes": [change.to_dict() for change in self.changes],
+        }
+
+
+def reanalyze_genome(
+    cache: ResultCache,
+    db: AllelioDB,
+    genome_hash: str,
+    include_benign: bool = False,
+    traits_only: bool = False,
+    full: bool = False,
+) -> Optional[GenomeDiff]:
+    """Bring one cached analysis up to the database's current data version.
+
+    Args:
+        cache: ResultCache holding the analysis and the genome's rsIDs
+        db: AllelioDB at the new data version
+        genome_hash: hash_genome() of the genotype file
+        include_benign: Analysis option of the cached entry
+        traits_only: Analysis option of the cached entry
+        full: Recheck every rsID even if the change log covers the update
+
+    Returns:
+        The diff, or None if there is no cached entry or stored genome
+    """
+    entry = cache.load(genome_hash, include_benign, traits_only)
+    genome = cache.genome_info(genome_hash)
+    if entry is None or genome is None:
+        return None
+    old_hits, variant_count, from_version = entry
+    to_version = db.data_version()
+
+    changed = None if full else db.changes_since(from_version)
+    affected = cache.genome_variants(genome_hash, rsids=changed)
+    affected_rsids = {variant.rsid for variant in affected}
+    new_hits = list(iter_ranked_hits(
+        affected,
+        db,
+        include_benign=include_benign,
+        categories={"Traits"} if traits_only else None,
+    ))
+
+    diff = GenomeDiff(
+        genome_hash=genome_hash,
+        name=genome["name"],
+        from_version=from_version,
+        to_version=to_version,
+        include_benign=include_benign,
+        traits_only=traits_only,
+        rechecked=len(affected),
+        full=changed is None,
+    )
+    before = {hit[0]: hit for hit in old_hits if hit[0] in affected_rsids}
+    after = {hit[0]: hit for hit in new_hits}
+    for variant in affected:
+        old, new = before.get(variant.rsid), after.get(variant.rsid)
+        if old is None and new is None:
+            continue
+        if old is not None and new is not None and _encode_hit(old, db) == _encode_hit(new, db):
+            continue
+        diff.changes.append(FindingChange(
+            rsid=variant.rsid,
+            change=NEW if old is None else REMOVED if new is None else CHANGED,
+            before=_result(old, db),
+            after=_result(new, db),
+        ))
+
+    # Unaffected hits are kept; all hits stay in file order so ties rank as before
+    hits = [hit for hit in old_hits if hit[0] not in affected_rsids] + new_hits
+    ordinals = cache.genome_ordinals(genome_hash, [hit[0] for hit in hits])
+    hits.sort(key=lambda hit: ordinals.get(hit[0], -1))
+    cache.put(genome_hash, to_version, hits, variant_count,
+              include_benign=include_benign, traits_only=traits_only, strings=db)
+    return diff
+
+
+def reanalyze_cached(
+    cache: ResultCache,
+    db: AllelioDB,
+    full: bool = False,
+    log: Optional[Callable[[str], None]] = None,
+) -> List[GenomeDiff]:
+    """Bring every stale cached analysis up to the current data version.
+
+    Entries whose genome's rsIDs were not stored can't be refreshed and are
+    evicted.
+
+    Args:
+        cache: ResultCache to refresh
+        db: AllelioDB at the new data version
+        full: Recheck every rsID instead of only the changed ones
+        log: Optional function to print status messages
+
+    Returns:
+        One GenomeDiff per refreshed entry
+    """
+    current = db.data_version()
+    diffs = []
+    for entry in cache.entries():
+        if entry["data_version"] == current:
+            continue
+        diff = reanalyze_genome(
+            cache,
+            db,
+            entry["genome_hash"],
+            include_benign=entry["include_benign"],
+            traits_only=entry["traits_only"],
+            full=full,
+        )
+        if diff is None:
+            continue
+        if log:
+            log(f"{diff.name or diff.genome_hash[:12]}: rechecked {diff.rechecked:,} rsIDs, "
+                f"{len(diff.changes)} findings changed")
+        diffs.append(diff)
+    cache.evict_stale(current)
+    return diffs
+
+
+def _result(hit: Optional[tuple], db: AllelioDB) -> Optional[VariantResult]:
+    if hit is None:
+        return None
+    rsid, data, variant, sig_rank, category = hit
+    return _build_result(rsid, data, variant, category, sig_rank, db)
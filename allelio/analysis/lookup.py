@@ -1,69 +1,21 @@
 """Variant lookup and analysis engine."""
 
+import heapq
 from dataclasses import dataclass, field
-from typing import List, Dict, Any, Optional
+from typing import Any, Dict, Generator, Iterable, List, Optional, Set
 from enum import Enum
 
+from allelio.database.clinvar import REVIEW_STATUS_STARS
 from allelio.database.store import AllelioDB
+from .alleles import hit_dosage
+from .classify import (
+    SIGNIFICANCE_RANKS,
+    determine_category,
+    review_stars as _get_review_stars,
+    significance_rank as _get_significance_rank,
+)
 
 
-# ClinVar review status to star rating mapping (0-4 stars)
-# See: https://www.ncbi.nlm.nih.gov/clinvar/docs/review_status/
-REVIEW_STATUS_STARS = {
-    "practice guideline": 4,
-    "reviewed by expert panel": 3,
-    "criteria provided, multiple submitters, no conflicts": 2,
-    "criteria provided, multiple submitters": 2,
-    "criteria provided, conflicting interpretations": 1,
-    "criteria provided, single submitter": 1,
-    "no assertion for the individual variant": 0,
-    "no assertion criteria provided": 0,
-    "no assertion provided": 0,
-}
-
-
-def _get_review_stars(review_status: Optional[str]) -> int:
-    """Convert ClinVar review status string to a 0-4 star rating.
-
-    Args:
-        review_status: ClinVar review status string
-
-    Returns:
-        Integer star rating from 0 (lowest confidence) to 4 (highest)
-    """
-    if not review_status:
-        return 0
-
-    status_lower = review_status.lower().strip()
-
-    # Exact match first
-    if status_lower in REVIEW_STATUS_STARS:
-        return REVIEW_STATUS_STARS[status_lower]
-
-    # Substring match for variations in formatting
-    for key, stars in REVIEW_STATUS_STARS.items():
-        if key in status_lower:
-            return stars
-
-    return 0
-
-
-# Significance ranking for clinical significance strings
-SIGNIFICANCE_RANKS = {
-    "pathogenic": 1,
-    "likely pathogenic": 2,
-    "pathogenic/likely pathogenic": 2,
-    "risk factor": 3,
-    "association": 4,
-    "protective": 5,
-    "conflicting data": 6,
-    "conflicting interpretations": 6,
-    "uncertain significance": 7,
-    "likely benign": 8,
-    "benign": 10,
-    "benign/likely benign": 10,
-}
-
 # High-impact genes requiring special attention
 HIGH_IMPACT_GENES = {
     "BRCA1", "BRCA2", "APOE", "TP53", "MLH1", "MSH2", "MSH6", "PMS2",
@@ -83,6 +35,28 @@ class VariantCategory(str, Enum):
     UNKNOWN = "Unknown"
 
 
+def _lazy_string(name: str) -> property:
+    """Build a property that resolves an interned string on first access.
+
+    The entry stores the integer reference in ``<name>_ref`` and the store
+    to resolve it against in ``strings``; the text is only fetched for
+    entries that are actually rendered.
+    """
+    attr = "_" + name
+
+    def getter(self):
+        value = self.__dict__.get(attr)
+        if value is None and self.__dict__.get(f"{name}_ref") is not None and self.strings is not None:
+            value = self.strings.resolve_string(self.__dict__[f"{name}_ref"])
+            self.__dict__[attr] = value
+        return value
+
+    def setter(self, value):
+        self.__dict__[attr] = value
+
+    return property(getter, setter)
+
+
 @dataclass
 class ClinVarEntry:
     """ClinVar variant entry."""
@@ -92,6 +66,10 @@ class ClinVarEntry:
     conditions: Optional[str] = None
     review_status: Optional[str] = None
     review_stars: int = 0
+    # Reported "REF>ALT" allele pairs, comma-separated
+    alleles: Optional[str] = None
+    conditions_ref: Optional[int] = None
+    strings: Any = field(default=None, repr=False, compare=False)
 
 
 @dataclass
@@ -104,6 +82,14 @@ class GWASEntry:
     mapped_gene: Optional[str] = None
     study: Optional[str] = None
     pubmed_id: Optional[str] = None
+    risk_allele: Optional[str] = None
+    study_ref: Optional[int] = None
+    strings: Any = field(default=None, repr=False, compare=False)
+
+
+# Installed after @dataclass so the generated __init__ assigns through them
+ClinVarEntry.conditions = _lazy_string("conditions")
+GWASEntry.study = _lazy_string("study")
 
 
 @dataclass
@@ -117,6 +103,10 @@ class VariantResult:
     gwas_entries: List[GWASEntry] = field(default_factory=list)
     category: str = VariantCategory.UNKNOWN.value
     significance_rank: float = 999
+    # Copies of the reported allele the genotype carries (None if unresolved)
+    dosage: Optional[int] = None
+    # Rows from annotation-source plugins (e.g. "pharmgkb"), by source name
+    annotations: Dict[str, List[Dict[str, Any]]] = field(default_factory=dict)
 
 
 def _determine_category(clinvar_entry: Optional[ClinVarEntry], gwas_entries: List[GWASEntry]) -> str:
@@ -129,69 +119,172 @@ def _determine_category(clinvar_entry: Optional[ClinVarEntry], gwas_entries: Lis
     Returns:
         Category string
     """
-    if clinvar_entry:
-        sig = (clinvar_entry.clinical_significance or "").lower()
-
-        # Check for health conditions (pathogenic/likely pathogenic)
-        if any(x in sig for x in ["pathogenic", "likely pathogenic"]):
-            return VariantCategory.HEALTH_CONDITIONS.value
+    return determine_category(
+        clinvar_entry.clinical_significance if clinvar_entry else None,
+        (entry.trait for entry in gwas_entries),
+    )
 
-        # Check for risk factors
-        if any(x in sig for x in ["risk factor", "risk_factor", "association"]):
-            return VariantCategory.RISK_FACTORS.value
 
-        # Check for carrier status / benign
-        if "likely benign" in sig or "benign" in sig:
-            return VariantCategory.CARRIER_STATUS.value
-    
-    # Check GWAS for pharmacogenomics
-    if gwas_entries:
-        for entry in gwas_entries:
-            trait = (entry.trait or "").lower()
-            if any(x in trait for x in ["drug", "pharmacogenom", "medication", "response"]):
-                return VariantCategory.PHARMACOGENOMICS.value
-            
-            # Check for risk factor
-            if "risk" in trait or "association" in trait:
-                return VariantCategory.RISK_FACTORS.value
-        
-        # Default to traits if only GWAS data
-        return VariantCategory.TRAITS.value
-    
-    return VariantCategory.UNKNOWN.value
+# rsIDs passed to each lookup_rsids_batch call when streaming results
+LOOKUP_CHUNK_SIZE = 5000
 
 
-def _get_significance_rank(clinical_significance: Optional[str]) -> int:
-    """Get numeric significance rank from clinical significance string.
-    
-    Args:
-        clinical_significance: Clinical significance string
+def _rank_hit(data: Dict[str, Any]) -> Optional[tuple]:
+    """Rank and categorize a lookup row straight from its stored values.
     
     Returns:
-        Numeric rank (lower = more significant)
+        (significance_rank, category), or None if the row has no ClinVar
+        or GWAS data
     """
-    if not clinical_significance:
-        return 999
+    clinvar = data["clinvar"][0] if data["clinvar"] else None
+    if clinvar is None and not data["gwas"]:
+        return None
+    
+    significance = clinvar.get("clinical_significance") if clinvar else None
+    category = determine_category(significance, (row.get("trait") for row in data["gwas"]))
+    
+    # Get significance rank from ClinVar, weighted by review quality
+    sig_rank = 999.0
+    if significance:
+        # Weight by review stars: higher stars lower the rank (more significant)
+        # Max adjustment is 0.4 (4 stars * 0.1), so ranks never cross tiers
+        sig_rank = _get_significance_rank(significance) - (_get_review_stars(clinvar.get("review_status")) * 0.1)
+    elif data["gwas"]:
+        # For GWAS-only variants, use a default rank
+        sig_rank = float(SIGNIFICANCE_RANKS.get("association", 4))
+    return sig_rank, category
+
+
+def _build_result(
+    rsid: str,
+    data: Dict[str, Any],
+    variant: Any,
+    category: str,
+    sig_rank: float,
+    db: AllelioDB,
+) -> VariantResult:
+    """Build the VariantResult (with its entries) for one ranked lookup row."""
+    # Create ClinVar entry
+    clinvar_entry = None
+    if data["clinvar"]:
+        cv_data = data["clinvar"][0]
+        review_status = cv_data.get("review_status")
+        clinvar_entry = ClinVarEntry(
+            rsid=cv_data.get("rsid"),
+            gene=cv_data.get("gene"),
+            clinical_significance=cv_data.get("clinical_significance"),
+            conditions=cv_data.get("conditions"),
+            review_status=review_status,
+            review_stars=_get_review_stars(review_status),
+            alleles=cv_data.get("alleles"),
+            conditions_ref=cv_data.get("conditions_id"),
+            strings=db,
+        )
+    
+    # Create GWAS entries
+    gwas_entries = []
+    for gw_data in data["gwas"]:
+        gwas_entries.append(GWASEntry(
+            rsid=gw_data.get("rsid"),
+            trait=gw_data.get("trait"),
+            p_value=gw_data.get("p_value"),
+            odds_ratio=gw_data.get("odds_ratio"),
+            mapped_gene=gw_data.get("mapped_gene"),
+            study=gw_data.get("study"),
+            pubmed_id=gw_data.get("pubmed_id"),
+            risk_allele=gw_data.get("risk_allele"),
+            study_ref=gw_data.get("study_id"),
+            strings=db,
+        ))
+    
+    return VariantResult(
+        rsid=rsid,
+        chromosome=getattr(variant, 'chromosome', None),
+        position=getattr(variant, 'position', None),
+        genotype=getattr(variant, 'genotype', None),
+        clinvar_entries=[clinvar_entry] if clinvar_entry else [],
+        gwas_entries=gwas_entries,
+        category=category,
+        significance_rank=sig_rank,
+        dosage=hit_dosage(data, getattr(variant, 'genotype', None)),
+        annotations={
+            name: rows for name, rows in data.items()
+            if name not in ("clinvar", "gwas", "current_rsid") and rows
+        },
+    )
+
+
+def iter_ranked_hits(
+    variants: List[Any],
+    db: AllelioDB,
+    include_benign: bool = False,
+    categories: Optional[Set[str]] = None,
+    chunk_size: int = LOOKUP_CHUNK_SIZE,
+    carriers_only: bool = True,
+) -> Generator[tuple, None, None]:
+    """Look variants up chunk by chunk and yield ranked hits in input order.
+    
+    Hits carry the raw lookup row; no VariantResult is built (see
+    results_from_hits and select_top_variants).
     
-    sig_lower = clinical_significance.lower()
+    Args:
+        variants: List of Variant objects with rsid attribute
+        db: AllelioDB database instance
+        include_benign: Whether to include benign variants
+        categories: Only yield hits in these categories
+        chunk_size: rsIDs looked up per batch
+        carriers_only: Skip hits whose genotype carries none of the reported
+            alleles (hits with an unresolved dosage are kept)
     
-    # Exact matches take priority
-    for key, rank in SIGNIFICANCE_RANKS.items():
-        if sig_lower == key:
-            return rank
+    Yields:
+        (rsid, lookup row, original variant, significance_rank, category)
+    """
+    # Map rsid to the original variant for metadata (first occurrence sets the order)
+    rsid_to_variant = {}
+    for v in variants:
+        rsid = getattr(v, 'rsid', str(v))
+        if rsid:
+            rsid_to_variant[rsid] = v
+    rsids = list(rsid_to_variant)
     
-    # Substring matches
-    for key, rank in SIGNIFICANCE_RANKS.items():
-        if key in sig_lower:
-            return rank
+    for i in range(0, len(rsids), chunk_size):
+        lookup_results = db.lookup_rsids_batch(rsids[i:i + chunk_size])
+        for rsid, data in lookup_results.items():
+            ranked = _rank_hit(data)
+            if ranked is None:
+                continue
+            sig_rank, category = ranked
+            # Skip benign variants unless requested
+            if not include_benign and sig_rank >= 8:
+                continue
+            if categories is not None and category not in categories:
+                continue
+            variant = rsid_to_variant.get(rsid)
+            if carriers_only and hit_dosage(data, getattr(variant, 'genotype', None)) == 0:
+                continue
+            yield rsid, data, variant, sig_rank, category
+
+
+def iter_variant_results(
+    variants: List[Any],
+    db: AllelioDB,
+    include_benign: bool = False,
+    chunk_size: int = LOOKUP_CHUNK_SIZE,
+) -> Generator[VariantResult, None, None]:
+    """Yield a VariantResult per annotated variant, in input order.
     
-    return 999
+    rsIDs are looked up ``chunk_size`` at a time, so results stream out
+    without the whole lookup being held in memory.
+    """
+    for rsid, data, variant, sig_rank, category in iter_ranked_hits(variants, db, include_benign, chunk_size=chunk_size):
+        yield _build_result(rsid, data, variant, category, sig_rank, db)
 
 
 def analyze_variants(
     variants: List[Any],
     db: AllelioDB,
-    include_benign: bool = False
+    include_benign: bool = False,
+    carriers_only: bool = True,
 ) -> List[VariantResult]:
     """Analyze variants against reference databases.
     
@@ -199,6 +292,7 @@ def analyze_variants(
         variants: List of Variant objects with rsid attribute
         db: AllelioDB database instance
         include_benign: Whether to include benign variants in results
+        carriers_only: Drop hits whose genotype carries none of the reported alleles
     
     Returns:
         List of VariantResult objects sorted by significance rank
@@ -206,94 +300,144 @@ def analyze_variants(
     if not variants:
         return []
     
-    # Extract rsIDs from variant objects
-    rsids = [getattr(v, 'rsid', str(v)) for v in variants]
-    rsids = [r for r in rsids if r]  # Filter empty rsids
+    return results_from_hits(iter_ranked_hits(variants, db, include_benign, carriers_only=carriers_only), db)
+
+
+def results_from_hits(hits: Iterable[tuple], db: AllelioDB) -> List[VariantResult]:
+    """Build and sort the VariantResults for ranked hits (see iter_ranked_hits).
     
-    if not rsids:
-        return []
+    Returns:
+        List of VariantResult objects sorted by significance rank
+    """
+    results = [
+        _build_result(rsid, data, variant, category, sig_rank, db)
+        for rsid, data, variant, sig_rank, category in hits
+    ]
     
-    # Create mapping of rsid to original variant for metadata
-    rsid_to_variant = {
-        getattr(v, 'rsid', str(v)): v for v in variants
-    }
+    # Sort by significance rank (lower = more significant)
+    results.sort(key=lambda x: x.significance_rank)
     
-    # Batch lookup from database
-    lookup_results = db.lookup_rsids_batch(rsids)
+    return results
+
+
+class _BoundedHeap:
+    """Keep the k lowest-ranked items seen.
     
-    # Build results
-    results = []
+    Among equal ranks the earlier item wins, so the kept items match the
+    first k of a stable sort by rank.
+    """
     
-    for rsid, data in lookup_results.items():
-        if not data["clinvar"] and not data["gwas"]:
-            continue
-        
-        # Create ClinVar entry
-        clinvar_entry = None
-        if data["clinvar"]:
-            cv_data = data["clinvar"][0]
-            review_status = cv_data.get("review_status")
-            clinvar_entry = ClinVarEntry(
-                rsid=cv_data.get("rsid"),
-                gene=cv_data.get("gene"),
-                clinical_significance=cv_data.get("clinical_significance"),
-                conditions=cv_data.get("conditions"),
-                review_status=review_status,
-                review_stars=_get_review_stars(review_status),
-            )
-        
-        # Create GWAS entries
-        gwas_entries = []
-        for gw_data in data["gwas"]:
-            gwas_entries.append(GWASEntry(
-                rsid=gw_data.get("rsid"),
-                trait=gw_data.get("trait"),
-                p_value=gw_data.get("p_value"),
-                odds_ratio=gw_data.get("odds_ratio"),
-                mapped_gene=gw_data.get("mapped_gene"),
-                study=gw_data.get("study"),
-                pubmed_id=gw_data.get("pubmed_id")
-            ))
-        
-        # Determine category
-        category = _determine_category(clinvar_entry, gwas_entries)
-        
-        # Get significance rank from ClinVar, weighted by review quality
-        sig_rank = 999.0
-        if clinvar_entry and clinvar_entry.clinical_significance:
-            base_rank = _get_significance_rank(clinvar_entry.clinical_significance)
-            # Weight by review stars: higher stars lower the rank (more significant)
-            # Max adjustment is 0.4 (4 stars * 0.1), so ranks never cross tiers
-            sig_rank = base_rank - (clinvar_entry.review_stars * 0.1)
-        elif gwas_entries:
-            # For GWAS-only variants, use a default rank
-            sig_rank = float(SIGNIFICANCE_RANKS.get("association", 4))
+    def __init__(self, k: int):
+        self.k = k
+        # (-rank, -seq, item): the root is the worst item kept
+        self._heap = []
+    
+    def accepts(self, rank: float, seq: int) -> bool:
+        """Whether an item with this rank and sequence number would be kept."""
+        if len(self._heap) < self.k:
+            return True
+        return self.k > 0 and (-rank, -seq) > self._heap[0][:2]
+    
+    def push(self, rank: float, seq: int, item: Any) -> None:
+        """Add an item that accepts() approved, evicting the worst if full."""
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, (-rank, -seq, item))
+        else:
+            heapq.heapreplace(self._heap, (-rank, -seq, item))
+    
+    def sorted(self) -> List[Any]:
+        """Return the kept items, most significant first."""
+        return [entry[2] for entry in sorted(self._heap, key=lambda entry: (-entry[0], -entry[1]))]
+
+
+@dataclass
+class TopVariants:
+    """Outcome of a top-K streaming analysis."""
+    # Most significant results overall, sorted by significance rank
+    top: List[VariantResult]
+    # Most significant results of each category (up to per_category each), sorted
+    by_category: Dict[str, List[VariantResult]]
+    # Matching results per category (all of them, not just the kept ones)
+    category_counts: Dict[str, int]
+    # Matching results, and those with significance rank <= 4
+    total: int = 0
+    significant: int = 0
+
+
+def analyze_top_variants(
+    variants: List[Any],
+    db: AllelioDB,
+    top: int,
+    include_benign: bool = False,
+    categories: Optional[Set[str]] = None,
+    per_category: int = 0,
+    chunk_size: int = LOOKUP_CHUNK_SIZE,
+) -> TopVariants:
+    """Stream the analysis and keep only the most significant results.
+    
+    Lookup rows are ranked from their stored values and a VariantResult is
+    only built for rows that enter one of the bounded heaps, so memory and
+    work beyond the lookup itself depend on ``top`` and ``per_category``,
+    not on how many variants matched.
+    
+    Args:
+        variants: List of Variant objects with rsid attribute
+        db: AllelioDB database instance
+        top: Number of most significant results to keep overall
+        include_benign: Whether to include benign variants
+        categories: Only count and keep results in these categories
+        per_category: Also keep this many most significant results per category
+        chunk_size: rsIDs looked up per batch
+    
+    Returns:
+        TopVariants with the kept results and per-category counters
+    """
+    hits = iter_ranked_hits(variants, db, include_benign, categories, chunk_size)
+    return select_top_variants(hits, db, top, per_category)
+
+
+def select_top_variants(hits: Iterable[tuple], db: AllelioDB, top: int, per_category: int = 0) -> TopVariants:
+    """Keep the most significant of a stream of ranked hits (see analyze_top_variants).
+    
+    Args:
+        hits: (rsid, lookup row, variant, significance_rank, category) tuples
+            in input order, as produced by iter_ranked_hits or a ResultCache
+        db: Store that string references in the rows resolve against
+        top: Number of most significant results to keep overall
+        per_category: Also keep this many most significant results per category
+    
+    Returns:
+        TopVariants with the kept results and per-category counters
+    """
+    overall = _BoundedHeap(top)
+    per_category_heaps: Dict[str, _BoundedHeap] = {}
+    counts: Dict[str, int] = {}
+    total = significant = 0
+    
+    for seq, (rsid, data, variant, sig_rank, category) in enumerate(hits):
+        total += 1
+        counts[category] = counts.get(category, 0) + 1
+        if sig_rank <= 4:
+            significant += 1
         
-        # Skip benign variants unless requested
-        if not include_benign and sig_rank >= 8:
+        category_heap = per_category_heaps.get(category)
+        if category_heap is None:
+            category_heap = per_category_heaps[category] = _BoundedHeap(per_category)
+        keep_overall = overall.accepts(sig_rank, seq)
+        keep_category = category_heap.accepts(sig_rank, seq)
+        if not (keep_overall or keep_category):
             continue
         
-        # Get variant metadata
-        original_variant = rsid_to_variant.get(rsid)
-        chromosome = getattr(original_variant, 'chromosome', None)
-        position = getattr(original_variant, 'position', None)
-        genotype = getattr(original_variant, 'genotype', None)
-        
-        # Create result
-        result = VariantResult(
-            rsid=rsid,
-            chromosome=chromosome,
-            position=position,
-            genotype=genotype,
-            clinvar_entries=[clinvar_entry] if clinvar_entry else [],
-            gwas_entries=gwas_entries,
-            category=category,
-            significance_rank=sig_rank
-        )
-        
-        results.append(result)
+        result = _build_result(rsid, data, variant, category, sig_rank, db)
+        if keep_overall:
+            overall.push(sig_rank, seq, result)
+        if keep_category:
+            category_heap.push(sig_rank, seq, result)
     
-    # Sort by significance rank (lower = more significant)
-    results.sort(key=lambda x: x.significance_rank)
-    
-    return results
+    return TopVariants(
+        top=overall.sorted(),
+        by_category={category: heap.sorted() for category, heap in per_category_heaps.items() if heap.k},
+        category_counts=counts,
+        total=total,
+        significant=significant,
+    )
@@ -0,0 +1,370 @@
+"""Pharmacogenomic star-allele calling from allele-definition tables.
+
+A pharmacogene's haplotypes ("star alleles") are defined in CPIC/PharmVar
+allele definition tables: one column per variant position (with its rsID),
+a reference row, and one row per star allele giving its allele at each
+position it differs from the reference. ``StarAlleleCaller`` loads any
+number of such tables once into precomputed indexes:
+
+- rsID -> (gene, variant bit, allele, site alleles) for every defining
+  variant, so a genome is read in a single pass with one dict lookup per
+  genotype;
+- per gene, each star allele as an integer bit mask over the gene's
+  defining variants, and every unordered pair of alleles (the candidate
+  diplotypes) as its (shared, one-copy) masks.
+
+Calling a genome then fills three masks per gene (called, heterozygous,
+homozygous) and keeps the diplotypes whose two alleles add up to exactly
+the observed dosage at every called variant. Genotypes are unphased, so the
+best match is the one explaining the most called variants with its
+alleles (the most specific definition); remaining ties are reported as
+alternatives. Defining variants that are not genotyped can't rule a
+diplotype in or out and are listed as missing.
+
+Tables are read tab-separated (comma-separated for .csv files), e.g. the
+CPIC ``*_allele_definition_table.xlsx`` sheets saved as text. Deletions and
+insertions ("delTGT", "insA") match array I/D calls; cells holding IUPAC
+ambiguity codes or several alleles can't be matched, and star alleles that
+use them are skipped.
+
+Example:
+    caller = StarAlleleCaller()
+    caller.add_file("CYP2C19_allele_definition_table.tsv")
+    for call in caller.call(variants).values():
+        print(call.gene, call.diplotype, call.missing)
+"""
+
+import csv
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from allelio.database.sources import _normalize_rsid, _open_text
+
+from .alleles import allele_dosage
+
+try:
+    _popcount = int.bit_count
+except AttributeError:  # Python < 3.10
+    def _popcount(value: int) -> int:
+        return bin(value).count("1")
+
+
+# Suffixes read as definition tables when a directory is given
+DEFINITION_SUFFIXES = (".tsv", ".txt", ".csv")
+
+_BASES_RE = re.compile(r"^[ACGT]+$")
+_GENE_RE = re.compile(r"^GENE:\s*(\S+)", re.IGNORECASE)
+
+
+@dataclass
+class DiplotypeCall:
+    """The diplotype called for one gene of one genome."""
+    gene: str
+    # Best-matching diplotype ("*1/*17"), or None if no pair of defined
+    # alleles explains the genotypes
+    diplotype: Optional[str] = None
+    # Equally good diplotypes (only possible through missing variants or
+    # alleles with identical definitions)
+    alternatives: List[str] = field(default_factory=list)
+    # Defining variants of the gene
+    variants: int = 0
+    # Defining variants genotyped with a resolvable dosage
+    called: int = 0
+    # rsIDs of defining variants not genotyped, no-calls or unresolvable
+    missing: List[str] = field(default_factory=list)
+
+    @property
+    def alleles(self) -> Tuple[str, ...]:
+        """The two star alleles of the call (empty if there is none)."""
+        return tuple(self.diplotype.split("/")) if self.diplotype else ()
+
+    @property
+    def ambiguous(self) -> bool:
+        return bool(self.alternatives)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize for JSON output."""
+        return {
+            "gene": self.gene,
+            "diplotype": self.diplotype,
+            "alternatives": self.alternatives,
+            "variants": self.variants,
+            "called": self.called,
+            "missing": self.missing,
+        }
+
+
+@dataclass
+class GeneDefinition:
+    """Star alleles of one gene, as parsed from its definition table."""
+    gene: str
+    reference: str
+    # Defining variants: (rsID, reference allele, variant allele)
+    variants: List[Tuple[str, str, str]]
+    # Star allele name -> indices into ``variants`` it carries
+    alleles: Dict[str, Tuple[int, ...]]
+    # Star alleles left out: (name, reason)
+    skipped: List[Tuple[str, str]] = field(default_factory=list)
+
+
+def _split_row(line: str, delimiter: str) -> List[str]:
+    if delimiter == "\t":
+        return [cell.strip() for cell in line.rstrip("\r\n").split("\t")]
+    return [cell.strip() for cell in next(csv.reader([line]), [])]
+
+
+def _cell_allele(cell: str) -> Optional[str]:
+    """Normalize a table cell to a sequence allele or I/D code (None if unsupported)."""
+    cell = cell.upper().replace(" ", "")
+    if _BASES_RE.match(cell):
+        return cell
+    if cell.startswith("DEL") and _BASES_RE.match(cell[3:] or "A"):
+        return "D"
+    if cell.startswith("INS") and _BASES_RE.match(cell[3:] or "A"):
+        return "I"
+    return None
+
+
+def parse_definition_lines(lines: Iterable[str], name: str = "definition table",
+                           delimiter: str = "\t") -> GeneDefinition:
+    """Parse an allele definition table (CPIC/PharmVar layout).
+
+    The gene comes from a ``GENE: <symbol>`` row, else from the file name
+    prefix. The row labelled ``rsID`` gives each column's variant; the first
+    later row with alleles is the reference and every following row a star
+    allele, whose blank cells mean the reference allele. Columns without an
+    rsID are ignored.
+
+    Raises:
+        ValueError: If the table has no rsID row or no allele rows
+    """
+    gene = None
+    rsids: Optional[List[Optional[str]]] = None
+    reference = None
+    ref_alleles: List[Optional[str]] = []
+    rows: List[Tuple[str, List[str]]] = []
+
+    for line in lines:
+        cells = _split_row(line, delimiter)
+        if not cells or not any(cells):
+            continue
+        label = cells[0].lstrip("\ufeff")
+        match = _GENE_RE.match(label)
+        if match:
+            gene = match.group(1)
+            continue
+        if rsids is None:
+            if label.lower() == "rsid":
+                rsids = [_normalize_rsid(cell) for cell in cells[1:]]
+            continue
+        values = cells[1:len(rsids) + 1]
+        if not label or not any(values):
+            continue
+        if reference is None:
+            reference = label
+            ref_alleles = [_cell_allele(cell) for cell in values]
+            ref_alleles += [None] * (len(rsids) - len(ref_alleles))
+        else:
+            rows.append((label, values))
+
+    if rsids is None or reference is None:
+        raise ValueError(f"{name} is not an allele definition table")
+    gene = gene or name.split("_")[0].split(".")[0]
+
+    definition = GeneDefinition(gene=gene, reference=reference, variants=[], alleles={})
+    variant_index: Dict[Tuple[str, str], int] = {}
+    for label, values in rows:
+        carried = []
+        reason = None
+        for column, cell in enumerate(values):
+            if not cell or rsids[column] is None:
+                continue
+            allele, ref = _cell_allele(cell), ref_alleles[column]
+            if allele is None or ref is None:
+                reason = f"unsupported allele {cell!r} at {rsids[column]}"
+                break
+            if allele == ref:
+                continue
+            if allele in ("D", "I"):
+                ref = "I" if allele == "D" else "D"
+            key = (rsids[column], allele)
+            if key not in variant_index:
+                variant_index[key] = len(definition.variants)
+                definition.variants.append((rsids[column], ref, allele))
+            carried.append(variant_index[key])
+        if reason is None and not carried:
+            reason = "no rsID-defined variant"
+        if reason is not None:
+            definition.skipped.append((label, reason))
+        elif label not in definition.alleles:
+            definition.alleles[label] = tuple(carried)
+    return definition
+
+
+def load_definition_file(path: Union[str, Path]) -> GeneDefinition:
+    """Parse an allele definition table file (optionally .gz/.bz2)."""
+    path = Path(path)
+    if not path.exists():
+        raise FileNotFoundError(f"File not found: {path}")
+    delimiter = "," if ".csv" in path.suffixes else "\t"
+    with _open_text(path) as f:
+        return parse_definition_lines(f, path.name, delimiter)
+
+
+class _Gene:
+    """Precomputed masks of one gene's star alleles and their pairs."""
+
+    __slots__ = ("name", "rsids", "names", "masks", "pairs")
+
+    def __init__(self, definition: GeneDefinition):
+        self.name = definition.gene
+        self.rsids = [rsid for rsid, _, _ in definition.variants]
+        self.names = [definition.reference] + list(definition.alleles)
+        self.masks = [0] + [sum(1 << bit for bit in set(bits)) for bits in definition.alleles.values()]
+        # (first allele, second allele, variants on both, variants on one);
+        # the reference comes first so ties list the plainest diplotype first
+        self.pairs = [
+            (i, j, self.masks[i] & self.masks[j], self.masks[i] ^ self.masks[j])
+            for i in range(len(self.masks)) for j in range(i, len(self.masks))
+        ]
+
+
+class StarAlleleCaller:
+    """Diplotype caller for any number of pharmacogenes, run in one genome pass."""
+
+    def __init__(self):
+        self._genes: List[_Gene] = []
+        self._by_name: Dict[str, int] = {}
+        # rsID -> [(gene index, variant bit, variant allele, site alleles)]
+        self._index: Dict[str, List[Tuple[int, int, str, Tuple[str, ...]]]] = {}
+        self.definitions: Dict[str, GeneDefinition] = {}
+
+    def __len__(self) -> int:
+        return len(self._genes)
+
+    @property
+    def genes(self) -> List[str]:
+        return [gene.name for gene in self._genes]
+
+    @property
+    def rsids(self) -> frozenset:
+        """Every rsID that defines a star allele of a loaded gene."""
+        return frozenset(self._index)
+
+    def add_definition(self, definition: GeneDefinition) -> str:
+        """Add (or replace) a gene's star-allele definitions.
+
+        Returns:
+            The gene symbol
+        """
+        if definition.gene in self._by_name:
+            self._genes[self._by_name[definition.gene]] = _Gene(definition)
+            self._rebuild_index()
+        else:
+            self._by_name[definition.gene] = len(self._genes)
+            self._genes.append(_Gene(definition))
+            self._index_gene(len(self._genes) - 1, definition)
+        self.definitions[definition.gene] = definition
+        return definition.gene
+
+    def _index_gene(self, number: int, definition: GeneDefinition) -> None:
+        # All alleles seen at an rsID, so multi-allelic sites resolve strand
+        site_alleles: Dict[str, set] = {}
+        for rsid, ref, alt in definition.variants:
+            site_alleles.setdefault(rsid, set()).update((ref, alt))
+        for bit, (rsid, ref, alt) in enumerate(definition.variants):
+            known = () if alt in ("D", "I") else tuple(sorted(site_alleles[rsid] - {"D", "I"}))
+            self._index.setdefault(rsid, []).append((number, bit, alt, known))
+
+    def _rebuild_index(self) -> None:
+        self._index = {}
+        for gene in self._genes:
+            self._index_gene(self._by_name[gene.name], self.definitions[gene.name])
+
+    def add_file(self, path: Union[str, Path]) -> str:
+        """Load an allele definition table file.
+
+        Returns:
+            The gene symbol
+        """
+        return self.add_definition(load_definition_file(path))
+
+    @classmethod
+    def from_paths(cls, paths: Sequence[Union[str, Path]]) -> "StarAlleleCaller":
+        """Load definition tables from files and directories of them."""
+        caller = cls()
+        for path in paths:
+            path = Path(path)
+            if path.is_dir():
+                for child in sorted(path.iterdir()):
+                    if any(suffix in DEFINITION_SUFFIXES for suffix in child.suffixes):
+                        caller.add_file(child)
+            else:
+                caller.add_file(path)
+        return caller
+
+    def call(self, variants: Iterable[Any]) -> Dict[str, DiplotypeCall]:
+        """Call a diplotype for every loaded gene.
+
+        Args:
+            variants: Parsed genome (objects with ``rsid`` and ``genotype``)
+
+        Returns:
+            gene -> DiplotypeCall, in load order
+        """
+        called = [0] * len(self._genes)
+        het = [0] * len(self._genes)
+        hom = [0] * len(self._genes)
+        index = self._index
+        for variant in variants:
+            entries = index.get(variant.rsid)
+            if entries is None:
+                continue
+            for gene, bit, allele, known in entries:
+                dosage = allele_dosage(variant.genotype, allele, known)
+                if dosage is None:
+                    continue
+                called[gene] |= 1 << bit
+                if dosage == 1:
+                    het[gene] |= 1 << bit
+                elif dosage == 2:
+                    hom[gene] |= 1 << bit
+
+        return {
+            gene.name: self._diplotype(gene, called[number], het[number], hom[number])
+            for number, gene in enumerate(self._genes)
+        }
+
+    @staticmethod
+    def _diplotype(gene: _Gene, called: int, het: int, hom: int) -> DiplotypeCall:
+        result = DiplotypeCall(
+            gene=gene.name,
+            variants=len(gene.rsids),
+            called=_popcount(called),
+            missing=list(dict.fromkeys(rsid for bit, rsid in enumerate(gene.rsids) if not called >> bit & 1)),
+        )
+        matches = []
+        best_score = -1
+        for i, j, both, either in gene.pairs:
+            if both & called != hom or either & called != het:
+                continue
+            mask_i, mask_j = gene.masks[i], gene.masks[j]
+            score = _popcount(mask_i & called) + _popcount(mask_j & called)
+            if score < best_score:
+                continue
+            if score > best_score:
+                matches, best_score = [], score
+            uncalled = _popcount(mask_i & ~called) + _popcount(mask_j & ~called)
+            matches.append((uncalled, i, j))
+        # Ties differ only in uncalled variants: the one relying on fewest leads
+        names = [f"{gene.names[i]}/{gene.names[j]}" for _, i, j in sorted(matches)]
+        if names:
+            result.diplotype, result.alternatives = names[0], names[1:]
+        return result
+
+
+def call_diplotypes(paths: Sequence[Union[str, Path]], variants: Iterable[Any]) -> List[DiplotypeCall]:
+    """Load definition tables and call one genome (convenience wrapper)."""
+    return list(StarAlleleCaller.from_paths(paths).call(variants).values())
@@ -0,0 +1,361 @@
+"""Polygenic risk scores over compact weight arrays.
+
+A PGS Catalog scoring file lists an effect allele and weight per variant,
+from a few dozen to millions of rows. ``ScoreSet`` loads any number of
+scores into flat arrays: each distinct (variant, effect allele) becomes a
+slot shared by every score that weights it, and each score is a pair of
+``array`` columns (slot indices, weights). ``ScoreSet.compute`` then makes
+a single pass over the genome to fill a dosage per slot, and every score is
+a gather plus a multiply-and-sum over its arrays, all run by C-level
+``map``/``sum`` rather than per-row Python code.
+
+Variants join by rsID; rows without one (or every row, with
+``join="position"``) join by chromosome and position, which requires the
+scoring file to be harmonized to the genome's build (``hm_chr``/``hm_pos``).
+Missing and unresolved variants contribute nothing and are counted.
+
+Scoring files too large to hold use ``stream_scores``, which indexes the
+genome once and accumulates each file row by row.
+
+Example:
+    scores = ScoreSet()
+    scores.add_file("PGS000001.txt.gz")
+    scores.add_file("PGS000018.txt.gz")
+    for result in scores.compute(variants).values():
+        print(result.pgs_id, result.score, result.coverage)
+"""
+
+from array import array
+from dataclasses import dataclass
+from operator import mul
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+from allelio.database.sources import _normalize_rsid, _open_text
+
+from .alleles import allele_dosage
+
+
+# Slot states in ScoreSet.compute
+_ABSENT, _MATCHED, _UNRESOLVED = 0, 1, 2
+
+# (rsid, chromosome, position, effect_allele, other_allele, effect_weight)
+ScoreRow = Tuple[Optional[str], Optional[str], Optional[int], Optional[str], Optional[str], float]
+
+
+@dataclass
+class PRSResult:
+    """One polygenic score of one genome."""
+    pgs_id: str
+    score: float = 0.0
+    # Weighted variants in the score
+    variants: int = 0
+    # Variants genotyped with a resolvable effect-allele dosage
+    matched: int = 0
+    # Variants genotyped, but a no-call or not reconcilable with the score's alleles
+    unresolved: int = 0
+
+    @property
+    def coverage(self) -> float:
+        """Fraction of the score's variants that contributed."""
+        return self.matched / self.variants if self.variants else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize for JSON output."""
+        return {
+            "pgs_id": self.pgs_id,
+            "score": self.score,
+            "variants": self.variants,
+            "matched": self.matched,
+            "unresolved": self.unresolved,
+        }
+
+
+def _chromosome(value: Any) -> str:
+    value = str(value).strip().upper()
+    return value[3:] if value.startswith("CHR") else value
+
+
+def _allele(value: Optional[str]) -> Optional[str]:
+    value = (value or "").strip().upper()
+    return value if value and value not in ("-", "NA") else None
+
+
+def scoring_file_id(path: Union[str, Path]) -> str:
+    """Return the score ID of a scoring file: its ``#pgs_id=`` header, else the file name."""
+    path = Path(path)
+    with _open_text(path) as f:
+        for line in f:
+            if not line.startswith("#"):
+                break
+            key, _, value = line.lstrip("#").strip().partition("=")
+            if key == "pgs_id" and value:
+                return value
+    return path.name.split(".")[0]
+
+
+def parse_scoring_lines(lines: Iterable[str], name: str = "scoring file") -> Iterator[ScoreRow]:
+    """Parse PGS Catalog scoring-file lines into score rows.
+
+    Harmonized columns (hm_rsID, hm_chr, hm_pos, hm_inferOtherAllele) are
+    preferred over the author-reported ones. Rows without a weight or
+    without both an rsID and a position are skipped.
+
+    Raises:
+        ValueError: If the header has no effect_allele or effect_weight column
+    """
+    header = None
+    for line in lines:
+        if line.startswith("#") or not line.strip():
+            continue
+        fields = line.rstrip("\n").split("\t")
+        if header is None:
+            header = {column: i for i, column in enumerate(fields)}
+            if "effect_allele" not in header or "effect_weight" not in header:
+                raise ValueError(f"{name} is not a PGS Catalog scoring file")
+            rsid_col = header.get("hm_rsID", header.get("rsID"))
+            chrom_col = header.get("hm_chr", header.get("chr_name"))
+            pos_col = header.get("hm_pos", header.get("chr_position"))
+            other_col = header.get("other_allele", header.get("hm_inferOtherAllele"))
+            effect_col, weight_col = header["effect_allele"], header["effect_weight"]
+            continue
+
+        try:
+            weight = float(fields[weight_col])
+        except (IndexError, ValueError):
+            continue
+        rsid = _normalize_rsid(fields[rsid_col]) if rsid_col is not None and rsid_col < len(fields) else None
+        chromosome = position = None
+        if chrom_col is not None and pos_col is not None and pos_col < len(fields):
+            try:
+                chromosome, position = _chromosome(fields[chrom_col]), int(fields[pos_col])
+            except ValueError:
+                pass
+        if rsid is None and position is None:
+            continue
+        other = fields[other_col] if other_col is not None and other_col < len(fields) else None
+        yield rsid, chromosome, position, _allele(fields[effect_col]), _allele(other), weight
+
+
+def _variant_keys(variant: Any) -> Tuple[Optional[str], Optional[Tuple[str, int]]]:
+    """(rsID key, position key) of a parsed genome variant."""
+    position = getattr(variant, "position", None)
+    chromosome = getattr(variant, "chromosome", None)
+    locus = (_chromosome(chromosome), int(position)) if position is not None and chromosome else None
+    return getattr(variant, "rsid", None), locus
+
+
+class ScoreSet:
+    """Many polygenic scores held as flat weight arrays, computed in one genome pass.
+
+    Args:
+        join: "rsid" keys score rows by rsID and falls back to position for
+            rows without one; "position" keys rows by chromosome and
+            position (harmonized files) and falls back to rsID
+    """
+
+    def __init__(self, join: str = "rsid"):
+        if join not in ("rsid", "position"):
+            raise ValueError(f"join must be 'rsid' or 'position', got {join!r}")
+        self.join = join
+        # Variant key (rsID or (chromosome, position)) -> first slot; further
+        # slots of the same variant (other effect alleles) chain through _next
+        self._head: Dict[Any, int] = {}
+        self._next = array("l")
+        self._effect: List[Optional[str]] = []
+        self._known: List[Tuple[str, ...]] = []
+        self._by_position = False
+        # pgs_id -> (slot indices, weights)
+        self._scores: Dict[str, Tuple[array, array]] = {}
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    @property
+    def score_ids(self) -> List[str]:
+        return list(self._scores)
+
+    @property
+    def slot_count(self) -> int:
+        """Distinct (variant, effect allele) pairs across all scores."""
+        return len(self._effect)
+
+    def _slot(self, key: Any, effect: Optional[str], other: Optional[str]) -> int:
+        known = (effect, other) if effect and other else ()
+        slot = self._head.get(key, -1)
+        last = -1
+        while slot >= 0:
+            if self._effect[slot] == effect and self._known[slot] == known:
+                return slot
+            last, slot = slot, self._next[slot]
+        slot = len(self._effect)
+        self._effect.append(effect)
+        self._known.append(known)
+        self._next.append(-1)
+        if last < 0:
+            self._head[key] = slot
+        else:
+            self._next[last] = slot
+        return slot
+
+    def add_rows(self, pgs_id: str, rows: Iterable[ScoreRow]) -> int:
+        """Add (or replace) a score from a stream of rows.
+
+        A variant weighted twice in one score (e.g. on separate lines per
+        allele) keeps both weights.
+
+        Returns:
+            Number of weights loaded
+        """
+        slots, weights = array("l"), array("d")
+        for rsid, chromosome, position, effect, other, weight in rows:
+            locus = (chromosome, position) if position is not None and chromosome else None
+            if self.join == "position":
+                key = locus if locus is not None else rsid
+            else:
+                key = rsid if rsid is not None else locus
+            if key is None:
+                continue
+            if isinstance(key, tuple):
+                self._by_position = True
+            slots.append(self._slot(key, effect, other))
+            weights.append(weight)
+        self._scores[pgs_id] = (slots, weights)
+        return len(weights)
+
+    def add_file(self, path: Union[str, Path], pgs_id: Optional[str] = None) -> str:
+        """Stream a (optionally .gz/.bz2) PGS Catalog scoring file into the set.
+
+        Returns:
+            The score ID
+        """
+        path = Path(path)
+        if not path.exists():
+            raise FileNotFoundError(f"File not found: {path}")
+        pgs_id = pgs_id or scoring_file_id(path)
+        with _open_text(path) as f:
+            self.add_rows(pgs_id, parse_scoring_lines(f, path.name))
+        return pgs_id
+
+    @classmethod
+    def from_db(cls, db, pgs_ids: Optional[Sequence[str]] = None, batch_size: int = 50000) -> "ScoreSet":
+        """Load the scores in the database's ``pgs_weights`` table.
+
+        Args:
+            db: AllelioDB (or ShardedAllelioDB) with a PGS Catalog source loaded
+            pgs_ids: Only load these scores (default: all)
+            batch_size: Rows read per batch
+        """
+        wanted = set(pgs_ids) if pgs_ids is not None else None
+        table = db.source_tables().get("pgs")
+        rows: Dict[str, List[ScoreRow]] = {}
+        if table is not None:
+            for batch in db.iter_records(table, batch_size):
+                for row in batch:
+                    if wanted is not None and row["pgs_id"] not in wanted:
+                        continue
+                    rows.setdefault(row["pgs_id"], []).append((
+                        row["rsid"], None, None, _allele(row["effect_allele"]),
+                        _allele(row["other_allele"]), row["effect_weight"],
+                    ))
+        scores = cls()
+        for pgs_id, score_rows in rows.items():
+            scores.add_rows(pgs_id, score_rows)
+        return scores
+
+    def dosages(self, variants: Iterable[Any]) -> Tuple[array, bytearray]:
+        """Resolve the effect-allele dosage of every slot in one pass over the genome.
+
+        Returns:
+            (dosage per slot, state per slot: 0 absent, 1 matched, 2 unresolved)
+        """
+        count = len(self._effect)
+        dosage = array("d", bytes(8 * count))
+        state = bytearray(count)
+        head, following, effect, known = self._head, self._next, self._effect, self._known
+        by_position = self._by_position
+        for variant in variants:
+            rsid, locus = _variant_keys(variant) if by_position else (getattr(variant, "rsid", None), None)
+            slot = head.get(rsid, -1) if rsid else -1
+            if slot < 0 and locus is not None:
+                slot = head.get(locus, -1)
+            if slot < 0:
+                continue
+            genotype = getattr(variant, "genotype", None)
+            # A variant listed twice takes its last genotype, as in iter_ranked_hits
+            while slot >= 0:
+                value = allele_dosage(genotype, effect[slot], known[slot]) if genotype and effect[slot] else None
+                if value is None:
+                    state[slot] = _UNRESOLVED
+                    dosage[slot] = 0.0
+                else:
+                    state[slot] = _MATCHED
+                    dosage[slot] = value
+                slot = following[slot]
+        return dosage, state
+
+    def compute(self, variants: Iterable[Any]) -> Dict[str, PRSResult]:
+        """Compute every score of the set for one genome.
+
+        Args:
+            variants: Parsed genome (Variant objects with rsid, chromosome,
+                position and genotype)
+
+        Returns:
+            pgs_id -> PRSResult, in the order the scores were added
+        """
+        dosage, state = self.dosages(variants)
+        results = {}
+        for pgs_id, (slots, weights) in self._scores.items():
+            states = bytes(map(state.__getitem__, slots))
+            results[pgs_id] = PRSResult(
+                pgs_id=pgs_id,
+                score=sum(map(mul, weights, map(dosage.__getitem__, slots))),
+                variants=len(slots),
+                matched=states.count(_MATCHED),
+                unresolved=states.count(_UNRESOLVED),
+            )
+        return results
+
+
+def stream_scores(paths: Iterable[Union[str, Path]], variants: Iterable[Any]) -> List[PRSResult]:
+    """Compute scores from files too large to load, one streamed row at a time.
+
+    The genome is indexed once (by rsID and by position); each scoring file
+    is then read row by row and accumulated, so memory does not grow with
+    the number of weights.
+
+    Returns:
+        One PRSResult per file, in order
+    """
+    by_rsid: Dict[str, str] = {}
+    by_locus: Dict[Tuple[str, int], str] = {}
+    for variant in variants:
+        rsid, locus = _variant_keys(variant)
+        genotype = getattr(variant, "genotype", None)
+        if rsid:
+            by_rsid[rsid] = genotype
+        if locus is not None:
+            by_locus[locus] = genotype
+
+    results = []
+    for path in paths:
+        path = Path(path)
+        result = PRSResult(pgs_id=scoring_file_id(path))
+        with _open_text(path) as f:
+            for rsid, chromosome, position, effect, other, weight in parse_scoring_lines(f, path.name):
+                result.variants += 1
+                if rsid in by_rsid:
+                    genotype = by_rsid[rsid]
+                elif position is not None and (chromosome, position) in by_locus:
+                    genotype = by_locus[chromosome, position]
+                else:
+                    continue
+                value = allele_dosage(genotype, effect, (effect, other) if other else ()) if genotype and effect else None
+                if value is None:
+                    result.unresolved += 1
+                else:
+                    result.matched += 1
+                    result.score += value * weight
+        results.append(result)
+    return results
@@ -0,0 +1,317 @@
+"""Pairwise genome comparison for family and relatedness checks.
+
+Genotypes of the autosomal biallelic SNPs shared across the uploaded
+genomes are encoded as 2-bit codes (0, 1 or 2 copies of the site's second
+allele, or missing) and packed into two bit-planes per genome, held as
+Python integers. Identity-by-state counts for a pair are then a handful of
+whole-genome bitwise operations and popcounts:
+
+    IBS0  opposite homozygotes (AA vs BB)
+    IBS1  one allele shared (one heterozygote)
+    IBS2  identical genotypes
+
+Kinship is KING-robust's estimate from heterozygote sharing,
+(N_het,het - 2 * N_IBS0) / (N_het(a) + N_het(b)), which is 0.5 for
+duplicates, 0.25 for first-degree relatives and halves with each further
+degree. Parent-child pairs share at least one allele everywhere, which
+tells them apart from full siblings.
+
+Sites whose calls disagree on strand or show more than two alleles across
+the genomes, A/T and C/G SNPs (strand-ambiguous between chips) and sites
+with a single allele are left out.
+
+Example:
+    for pair in compare_genomes({"mother": mother, "child": child}):
+        print(pair.sample_a, pair.sample_b, pair.kinship, pair.relationship)
+"""
+
+import itertools
+import operator
+from array import array
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Mapping, Sequence, Tuple
+
+from .alleles import reverse_complement
+
+
+# Pairs sharing fewer called sites get no relationship call
+MIN_SHARED_SITES = 1000
+# Kinship lower bounds per degree (powers of 2^-1.5 around each expected value)
+KINSHIP_THRESHOLDS = (
+    (0.354, "duplicate or identical twin"),
+    (0.177, "first-degree"),
+    (0.0884, "second-degree"),
+    (0.0442, "third-degree"),
+)
+# First-degree pairs with fewer opposite homozygotes than this are parent-child
+PARENT_CHILD_MAX_IBS0 = 0.005
+
+_AUTOSOMES = frozenset(str(n) for n in range(1, 23))
+_VALID_GENOTYPES = frozenset(a + b for a in "ACGTID" for b in "ACGTID")
+# Sorted allele letters -> the genotypes made of them; _EXCLUDED sites cover everything
+_EXCLUDED = "*"
+_COVERS = {
+    "".join(letters): frozenset(a + b for a in letters for b in letters)
+    for size in range(7)
+    for letters in itertools.combinations("ACDGIT", size)
+}
+_COVERS[_EXCLUDED] = _VALID_GENOTYPES
+_RSID = operator.attrgetter("rsid")
+_GENOTYPE = operator.attrgetter("genotype")
+# 2-bit codes: low bit = carries the second allele, high bit = homozygous for it;
+# "missing" is the otherwise unused high-only pattern
+_HOM_FIRST, _HET, _MISSING, _HOM_SECOND = 0, 1, 2, 3
+# Per-code ASCII digits of each plane, for packing with int(..., 2)
+_LOW_DIGITS = bytes(0x31 if code & 1 else 0x30 for code in range(256))
+_HIGH_DIGITS = bytes(0x31 if code & 2 else 0x30 for code in range(256))
+
+try:
+    _popcount = int.bit_count
+except AttributeError:  # Python < 3.10
+    def _popcount(value: int) -> int:
+        return bin(value).count("1")
+
+
+def _chromosome(value: Any) -> str:
+    value = str(value or "").strip().upper()
+    return value[3:] if value.startswith("CHR") else value
+
+
+def _code_table(first: str, second: str) -> Dict[str, int]:
+    """Genotype string -> 2-bit code for a site with alleles (first, second)."""
+    return {
+        first + first: _HOM_FIRST,
+        first + second: _HET,
+        second + first: _HET,
+        second + second: _HOM_SECOND,
+    }
+
+
+@dataclass
+class PairComparison:
+    """Identity-by-state sharing between two genomes."""
+    sample_a: str
+    sample_b: str
+    # Sites called in both genomes, split by alleles shared
+    sites: int = 0
+    ibs0: int = 0
+    ibs1: int = 0
+    ibs2: int = 0
+    # Sites where both are heterozygous, and each genome's heterozygous sites
+    het_het: int = 0
+    het_a: int = 0
+    het_b: int = 0
+
+    def _fraction(self, count: int) -> float:
+        return count / self.sites if self.sites else 0.0
+
+    @property
+    def ibs0_fraction(self) -> float:
+        return self._fraction(self.ibs0)
+
+    @property
+    def ibs1_fraction(self) -> float:
+        return self._fraction(self.ibs1)
+
+    @property
+    def ibs2_fraction(self) -> float:
+        return self._fraction(self.ibs2)
+
+    @property
+    def kinship(self) -> float:
+        """KING-robust kinship coefficient (0.5 duplicate, 0.25 first-degree, ...)."""
+        hets = self.het_a + self.het_b
+        return (self.het_het - 2 * self.ibs0) / hets if hets else 0.0
+
+    @property
+    def relationship(self) -> str:
+        """Relationship implied by kinship and IBS0 sharing."""
+        if self.sites < MIN_SHARED_SITES:
+            return "too few shared sites"
+        kinship = self.kinship
+        for threshold, label in KINSHIP_THRESHOLDS:
+            if kinship > threshold:
+                if label == "first-degree":
+                    return "parent-child" if self.ibs0_fraction < PARENT_CHILD_MAX_IBS0 else "full siblings"
+                return label
+        return "unrelated"
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize for JSON output."""
+        return {
+            "sample_a": self.sample_a,
+            "sample_b": self.sample_b,
+            "sites": self.sites,
+            "ibs0": self.ibs0,
+            "ibs1": self.ibs1,
+            "ibs2": self.ibs2,
+            "kinship": round(self.kinship, 4),
+            "relationship": self.relationship,
+        }
+
+
+@dataclass
+class PackedGenomes:
+    """Genomes encoded as 2-bit genotype codes over a common site list."""
+    samples: List[str]
+    # rsIDs of the encoded sites, in bit order
+    sites: List[str]
+    # Per sample: (low plane, high plane), one bit per site
+    planes: List[Tuple[int, int]] = field(default_factory=list)
+
+    def compare(self, a: int, b: int) -> PairComparison:
+        """Compare the samples at indexes a and b."""
+        low_a, high_a = self.planes[a]
+        low_b, high_b = self.planes[b]
+        # Complements have infinite leading ones; masking by called keeps counts finite
+        called = ((1 << len(self.sites)) - 1) & ~((high_a & ~low_a) | (high_b & ~low_b))
+        het_a = low_a & ~high_a & called
+        het_b = low_b & ~high_b & called
+        hom_first_a, hom_second_a = ~(low_a | high_a), low_a & high_a
+        hom_first_b, hom_second_b = ~(low_b | high_b), low_b & high_b
+
+        sites = _popcount(called)
+        ibs0 = _popcount(((hom_first_a & hom_second_b) | (hom_second_a & hom_first_b)) & called)
+        ibs2 = _popcount(~((low_a ^ low_b) | (high_a ^ high_b)) & called)
+        return PairComparison(
+            sample_a=self.samples[a],
+            sample_b=self.samples[b],
+            sites=sites,
+            ibs0=ibs0,
+            ibs1=sites - ibs0 - ibs2,
+            ibs2=ibs2,
+            het_het=_popcount(het_a & het_b),
+            het_a=_popcount(het_a),
+            het_b=_popcount(het_b),
+        )
+
+    def all_pairs(self) -> List[PairComparison]:
+        """Compare every pair of samples, in sample order."""
+        return [self.compare(a, b) for a, b in itertools.combinations(range(len(self.samples)), 2)]
+
+
+def _site_numbers(rsids: List[str], index: Dict[str, int]) -> array:
+    """Number each rsID of a genome, giving unseen ones the next free numbers."""
+    numbers = list(map(index.get, rsids))
+    for i, number in enumerate(numbers):
+        if number is None:
+            numbers[i] = index.setdefault(rsids[i], len(index))
+    return array("l", numbers)
+
+
+def pack_genomes(genomes: Mapping[str, Sequence[Any]], autosomes_only: bool = True) -> PackedGenomes:
+    """Encode genomes over their shared biallelic sites as 2-bit bit-planes.
+
+    Every rsID is hashed once per genome, into a cohort-wide site number;
+    allele discovery, call counting and the code scatter then work on
+    those numbers through lists and C-level map passes. Genomes from the
+    same chip as the first one (same rsIDs in the same order) skip the
+    hashing and the scatter.
+
+    Args:
+        genomes: Sample id -> parsed variants (Variant objects)
+        autosomes_only: Only use chromosomes 1-22 (X calls differ by sex)
+
+    Returns:
+        PackedGenomes with one (low, high) plane pair per sample
+    """
+    index: Dict[str, int] = {}
+    # Per site number: sorted alleles seen (_EXCLUDED if off the autosomes), genomes calling it
+    letters: List[str] = []
+    called: List[int] = []
+    autosomal: Dict[Any, bool] = {}
+    numbered = []
+    layout_rsids = layout = None
+    for variants in genomes.values():
+        rsids = list(map(_RSID, variants))
+        if rsids == layout_rsids:
+            numbers = layout
+        else:
+            numbers = _site_numbers(rsids, index)
+            if layout is None:
+                layout_rsids, layout = rsids, numbers
+        if len(index) > len(letters):
+            letters.extend([""] * (len(index) - len(letters)))
+            called.extend([0] * (len(index) - len(called)))
+        numbered.append(numbers)
+
+        genotypes = list(map(_GENOTYPE, variants))
+        valid = list(map(_VALID_GENOTYPES.__contains__, genotypes))
+        for number in itertools.compress(numbers, valid):
+            called[number] += 1
+        covered = map(frozenset.__contains__, map(_COVERS.__getitem__, map(letters.__getitem__, numbers)), genotypes)
+        for position in itertools.compress(range(len(numbers)), map(operator.not_, covered)):
+            genotype, number = genotypes[position], numbers[position]
+            if genotype not in _VALID_GENOTYPES:
+                continue
+            if autosomes_only and not letters[number]:
+                chromosome = variants[position].chromosome
+                if chromosome not in autosomal:
+                    autosomal[chromosome] = _chromosome(chromosome) in _AUTOSOMES
+                if not autosomal[chromosome]:
+                    letters[number] = _EXCLUDED
+                    continue
+            letters[number] = "".join(sorted(set(letters[number] + genotype)))
+
+    # Bit of each site number (the last slot collects dropped sites) and its code table
+    rsids = list(index)
+    sequential = layout is not None and layout == array("l", range(len(layout)))
+    tables: Dict[str, Dict[str, int]] = {}
+    site_tables: List[Dict[str, int]] = []
+    sites = []
+    bits = array("l", [0]) * len(letters)
+    for number, seen in enumerate(letters):
+        if called[number] < 2 or len(seen) != 2 or reverse_complement(seen[0]) == seen[1]:
+            bits[number] = -1
+            site_tables.append({})
+            continue
+        table = tables.get(seen)
+        if table is None:
+            table = tables[seen] = _code_table(seen[0], seen[1])
+        bits[number] = len(sites)
+        site_tables.append(table)
+        sites.append(rsids[number])
+    for number in range(len(bits)):
+        if bits[number] < 0:
+            bits[number] = len(sites)
+
+    if sequential:
+        # The first genome's sites come first in bit order
+        kept = [bit < len(sites) for bit in bits[:len(layout)]]
+        layout_bits = sum(kept)
+
+    packed = PackedGenomes(samples=list(genomes), sites=sites)
+    for variants, numbers in zip(genomes.values(), numbered):
+        genotypes = map(_GENOTYPE, variants)
+        if sequential and numbers is layout:
+            buffer = bytearray(itertools.compress(
+                map(dict.get, site_tables, genotypes, itertools.repeat(_MISSING)), kept
+            ))
+            buffer += bytes([_MISSING]) * (len(sites) - layout_bits)
+        else:
+            codes = map(dict.get, map(site_tables.__getitem__, numbers), genotypes, itertools.repeat(_MISSING))
+            buffer = bytearray([_MISSING]) * (len(sites) + 1)
+            # Repeated rsIDs keep their last call
+            for bit, code in zip(map(bits.__getitem__, numbers), codes):
+                buffer[bit] = code
+            del buffer[-1]
+        # Site i is bit i, so the digit strings run from the last site to the first
+        buffer.reverse()
+        packed.planes.append((
+            int(buffer.translate(_LOW_DIGITS) or b"0", 2),
+            int(buffer.translate(_HIGH_DIGITS) or b"0", 2),
+        ))
+    return packed
+
+
+def compare_genomes(genomes: Mapping[str, Sequence[Any]], autosomes_only: bool = True) -> List[PairComparison]:
+    """Compute IBS sharing and kinship for every pair of genomes.
+
+    Args:
+        genomes: Sample id -> parsed variants
+        autosomes_only: Only use chromosomes 1-22
+
+    Returns:
+        One PairComparison per pair, in sample order
+    """
+    return pack_genomes(genomes, autosomes_only).all_pairs()
@@ -0,0 +1,434 @@
+"""In-memory analysis sessions for interactive follow-up queries.
+
+Parsing a genotype file and looking its rsIDs up takes seconds; the
+questions asked afterwards ("only Health Conditions", "anything in BRCA2?",
+"next page") don't need either again. An ``AnalysisSession`` keeps the
+parsed genome as an rsID index and the ranked hits (see
+``iter_ranked_hits``) sorted by significance, with precomputed postings per
+category and gene plus flat review-star and p-value columns. A query picks
+the smallest posting list that applies, filters it on the columns and
+slices a page; the selection is memoized per filter, so paging through it
+is a list slice. VariantResults are built only for hits on a returned page,
+once each.
+
+``SessionPool`` holds the sessions of a long-running process (the web app)
+under a memory budget: sessions idle longer than ``idle_timeout`` are
+dropped, then the least recently used ones until the estimated total fits.
+
+Example:
+    session = AnalysisSession.from_file("genome.txt")
+    page = session.query(category="Health Conditions", min_stars=2, limit=20)
+    for result in page.results:
+        print(result.rsid, result.significance_rank)
+    session.lookup("rs429358")
+"""
+
+import re
+import secrets
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass
+from itertools import islice
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from allelio.database.store import AllelioDB
+from allelio.database.shards import open_database
+from allelio.parsers import parse_genotype_file
+
+from .cache import ResultCache, hash_genome
+from .classify import review_stars
+from .lookup import VariantResult, _build_result, iter_ranked_hits
+
+
+# SessionPool defaults: estimated bytes held across sessions, seconds idle
+DEFAULT_MEMORY_BUDGET = 512 * 1024 * 1024
+DEFAULT_IDLE_TIMEOUT = 30 * 60
+
+# Memoized selections kept per session
+QUERY_CACHE_SIZE = 64
+
+# Separators in ClinVar gene and GWAS mapped_gene fields ("BRCA1, NBR2", "A - B")
+_GENE_SPLIT_RE = re.compile(r"\s*[,;|/]\s*|\s+-\s+|\s+")
+
+
+def _genes(data: Dict[str, Any]) -> List[str]:
+    """Gene symbols of a lookup row (ClinVar genes, then GWAS mapped genes)."""
+    genes = []
+    for value in [row.get("gene") for row in data["clinvar"]] + [row.get("mapped_gene") for row in data["gwas"]]:
+        for gene in _GENE_SPLIT_RE.split(value or ""):
+            gene = gene.upper()
+            if gene and gene not in genes:
+                genes.append(gene)
+    return genes
+
+
+def _best_p_value(data: Dict[str, Any]) -> float:
+    """Smallest GWAS p-value of a lookup row (infinity without one)."""
+    best = float("inf")
+    for row in data["gwas"]:
+        try:
+            p_value = float(row.get("p_value"))
+        except (TypeError, ValueError):
+            continue
+        if p_value < best:
+            best = p_value
+    return best
+
+
+def _sample_size(items: List[Any], sample: int = 64) -> int:
+    """Estimate the deep size of a list of tuples/objects from a sample."""
+    if not items:
+        return sys.getsizeof(items)
+    step = max(1, len(items) // sample)
+    sampled = items[::step][:sample]
+
+    def size(obj, depth=0):
+        total = sys.getsizeof(obj)
+        if depth > 4:
+            return total
+        if isinstance(obj, dict):
+            total += sum(size(k, depth + 1) + size(v, depth + 1) for k, v in obj.items())
+        elif isinstance(obj, (list, tuple)):
+            total += sum(size(v, depth + 1) for v in obj)
+        elif hasattr(obj, "__dict__"):
+            # Attribute names are shared by all instances
+            attributes = vars(obj)
+            total += sys.getsizeof(attributes) + sum(size(v, depth + 1) for v in attributes.values())
+        return total
+
+    return sys.getsizeof(items) + sum(size(item) for item in sampled) * len(items) // len(sampled)
+
+
+@dataclass
+class ResultPage:
+    """One page of a session query."""
+    results: List[VariantResult]
+    # Hits matching the filters (all pages)
+    total: int = 0
+    offset: int = 0
+    limit: int = 0
+
+    @property
+    def has_more(self) -> bool:
+        return self.offset + len(self.results) < self.total
+
+
+class AnalysisSession:
+    """A parsed genome and its ranked hits, held for repeated queries.
+
+    Args:
+        variants: The parsed genome
+        hits: Ranked hits (rsid, lookup row, variant, significance_rank,
+            category), as produced by iter_ranked_hits or a ResultCache
+        db: Store that string references in the rows resolve against
+        name: Display name (e.g. the file name)
+        genome_hash: hash_genome() of the genotype file, if known
+        owns_db: Close ``db`` with the session
+    """
+
+    def __init__(
+        self,
+        variants: Iterable[Any],
+        hits: Iterable[tuple],
+        db: AllelioDB,
+        name: Optional[str] = None,
+        genome_hash: Optional[str] = None,
+        owns_db: bool = False,
+    ):
+        self.db = db
+        self.name = name
+        self.genome_hash = genome_hash
+        self._owns_db = owns_db
+        self._lock = threading.Lock()
+        self.created = self.last_used = time.monotonic()
+
+        # The last occurrence of an rsID wins, as in iter_ranked_hits
+        self.genotypes: Dict[str, Any] = {}
+        for variant in variants:
+            rsid = getattr(variant, "rsid", None)
+            if rsid:
+                self.genotypes[rsid] = variant
+        self.variant_count = len(self.genotypes)
+
+        # Stable sort: equal ranks keep input order, as in results_from_hits
+        self._hits: List[tuple] = sorted(hits, key=lambda hit: hit[3])
+        self._by_rsid: Dict[str, int] = {}
+        self._by_category: Dict[str, List[int]] = {}
+        self._by_gene: Dict[str, List[int]] = {}
+        self._stars = bytearray(len(self._hits))
+        self._p_values = array("d", bytes(8 * len(self._hits)))
+        for position, (rsid, data, _, _, category) in enumerate(self._hits):
+            self._by_rsid.setdefault(rsid, position)
+            self._by_category.setdefault(category, []).append(position)
+            for gene in _genes(data):
+                self._by_gene.setdefault(gene, []).append(position)
+            if data["clinvar"]:
+                self._stars[position] = review_stars(data["clinvar"][0].get("review_status"))
+            self._p_values[position] = _best_p_value(data)
+
+        self._results: Dict[int, VariantResult] = {}
+        self._selections: "OrderedDict[tuple, List[int]]" = OrderedDict()
+        self.memory_bytes = (
+            _sample_size(list(self.genotypes.values()))
+            + sys.getsizeof(self.genotypes)
+            + _sample_size(self._hits)
+            + sum(sys.getsizeof(postings) for postings in self._by_gene.values())
+            + sum(sys.getsizeof(postings) for postings in self._by_category.values())
+            + sys.getsizeof(self._by_rsid)
+            + len(self._hits) * 9
+        )
+
+    @classmethod
+    def from_file(
+        cls,
+        path: Union[str, Path],
+        db: Optional[AllelioDB] = None,
+        include_benign: bool = False,
+        carriers_only: bool = True,
+        cache: Optional[ResultCache] = None,
+    ) -> "AnalysisSession":
+        """Parse and analyze a genotype file into a session.
+
+        Args:
+            path: Genotype file (VCF, 23andMe, or custom format)
+            db: Reference database (default: the configured database, owned by the
+                session, usable from any thread)
+            include_benign: Whether to include benign variants
+            carriers_only: Drop hits whose genotype carries none of the reported alleles
+            cache: Reuse and record hits in this ResultCache (carrier-filtered
+                analyses only)
+
+        Raises:
+            ValueError: If the file has no genotype data
+        """
+        owns_db = db is None
+        if db is None:
+            db = open_database(check_same_thread=False)
+        path = Path(path)
+        try:
+            variants = parse_genotype_file(str(path))
+            if not variants:
+                raise ValueError(f"No genotype data found in {path.name}")
+
+            genome_hash = hash_genome(path)
+            hits = None
+            if cache is not None and carriers_only:
+                data_version = db.data_version()
+                cached = cache.get(genome_hash, data_version, include_benign=include_benign)
+                if cached is not None:
+                    hits = cached[0]
+                else:
+                    cache.store_genome(genome_hash, variants, name=path.name)
+                    hits = cache.record(iter_ranked_hits(variants, db, include_benign), genome_hash,
+                                        data_version, len(variants), include_benign=include_benign,
+                                        strings=db)
+            if hits is None:
+                hits = iter_ranked_hits(variants, db, include_benign, carriers_only=carriers_only)
+            return cls(variants, hits, db, name=path.name, genome_hash=genome_hash, owns_db=owns_db)
+        except BaseException:
+            if owns_db:
+                db.close()
+            raise
+
+    def __len__(self) -> int:
+        return len(self._hits)
+
+    @property
+    def categories(self) -> Dict[str, int]:
+        """Hits per category."""
+        return {category: len(postings) for category, postings in self._by_category.items()}
+
+    @property
+    def genes(self) -> List[str]:
+        """Genes with at least one hit."""
+        return sorted(self._by_gene)
+
+    def touch(self) -> None:
+        """Mark the session as used now."""
+        self.last_used = time.monotonic()
+
+    def genotype(self, rsid: str) -> Optional[str]:
+        """The genome's genotype at an rsID (None if not genotyped)."""
+        self.last_used = time.monotonic()
+        variant = self.genotypes.get(rsid.strip().lower())
+        return getattr(variant, "genotype", None) if variant is not None else None
+
+    def lookup(self, rsid: str) -> Optional[VariantResult]:
+        """The analysis result for an rsID, or None if it has no hit."""
+        self.last_used = time.monotonic()
+        position = self._by_rsid.get(rsid.strip().lower())
+        if position is None:
+            return None
+        with self._lock:
+            return self._result(position)
+
+    def _result(self, position: int) -> VariantResult:
+        result = self._results.get(position)
+        if result is None:
+            rsid, data, variant, sig_rank, category = self._hits[position]
+            result = _build_result(rsid, data, variant, category, sig_rank, self.db)
+            # Resolve interned strings now, while access to db is serialized
+            for entry in result.clinvar_entries:
+                entry.conditions
+            for entry in result.gwas_entries:
+                entry.study
+            self._results[position] = result
+        return result
+
+    def _select(self, category, gene, min_stars, max_p_value) -> List[int]:
+        key = (category, gene, min_stars, max_p_value)
+        selection = self._selections.get(key)
+        if selection is not None:
+            self._selections.move_to_end(key)
+            return selection
+
+        if gene is not None:
+            selection = self._by_gene.get(gene, [])
+            if category is not None:
+                selection = [p for p in selection if self._hits[p][4] == category]
+        elif category is not None:
+            selection = self._by_category.get(category, [])
+        else:
+            selection = range(len(self._hits))
+        if min_stars:
+            stars = self._stars
+            selection = [p for p in selection if stars[p] >= min_stars]
+        if max_p_value is not None:
+            p_values = self._p_values
+            selection = [p for p in selection if p_values[p] <= max_p_value]
+
+        self._selections[key] = selection
+        if len(self._selections) > QUERY_CACHE_SIZE:
+            self._selections.popitem(last=False)
+        return selection
+
+    def query(
+        self,
+        category: Optional[str] = None,
+        gene: Optional[str] = None,
+        min_stars: int = 0,
+        max_p_value: Optional[float] = None,
+        offset: int = 0,
+        limit: int = 50,
+    ) -> ResultPage:
+        """Return a page of hits, most significant first.
+
+        Args:
+            category: Only hits in this category
+            gene: Only hits annotated to this gene (ClinVar gene or GWAS mapped gene)
+            min_stars: Only hits whose ClinVar review status has at least this many stars
+            max_p_value: Only hits with a GWAS association at or below this p-value
+            offset: Matching hits to skip
+            limit: Page size
+
+        Returns:
+            ResultPage with the page's results and the total number of matches
+        """
+        self.last_used = time.monotonic()
+        gene = gene.strip().upper() if gene else None
+        offset, limit = max(0, offset), max(0, limit)
+        with self._lock:
+            selection = self._select(category, gene, min_stars, max_p_value)
+            results = [self._result(p) for p in islice(selection, offset, offset + limit)]
+        return ResultPage(results=results, total=len(selection), offset=offset, limit=limit)
+
+    def close(self) -> None:
+        """Drop the held data (and close the database if the session owns it)."""
+        with self._lock:
+            self._results.clear()
+            self._selections.clear()
+            if self._owns_db and self.db is not None:
+                self.db.close()
+                self.db = None
+
+
+class SessionPool:
+    """Sessions of a long-running process, evicted by idle time and a memory budget.
+
+    Args:
+        max_bytes: Budget for the sessions' estimated memory
+        idle_timeout: Seconds after which an unused session is dropped
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MEMORY_BUDGET, idle_timeout: float = DEFAULT_IDLE_TIMEOUT):
+        self.max_bytes = max_bytes
+        self.idle_timeout = idle_timeout
+        self._sessions: Dict[str, AnalysisSession] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    @property
+    def memory_bytes(self) -> int:
+        """Estimated memory held by all sessions."""
+        return sum(session.memory_bytes for session in self._sessions.values())
+
+    def add(self, session: AnalysisSession) -> str:
+        """Hold a session and evict others if needed.
+
+        Returns:
+            The new session's ID
+        """
+        session_id = secrets.token_urlsafe(16)
+        session.touch()
+        with self._lock:
+            self._sessions[session_id] = session
+        self.evict()
+        return session_id
+
+    def get(self, session_id: str) -> Optional[AnalysisSession]:
+        """Return a held session (marking it used), or None if unknown or evicted."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None and time.monotonic() - session.last_used > self.idle_timeout:
+                del self._sessions[session_id]
+                expired, session = session, None
+            else:
+                expired = None
+        if expired is not None:
+            expired.close()
+        if session is not None:
+            session.touch()
+        return session
+
+    def remove(self, session_id: str) -> bool:
+        """Close and drop a session. Returns False if it was not held."""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is None:
+            return False
+        session.close()
+        return True
+
+    def evict(self) -> List[str]:
+        """Drop idle sessions, then least recently used ones over the budget.
+
+        The most recently used session is kept even if it alone exceeds the
+        budget.
+
+        Returns:
+            IDs of the evicted sessions
+        """
+        now = time.monotonic()
+        evicted: List[Tuple[str, AnalysisSession]] = []
+        with self._lock:
+            by_use = sorted(self._sessions.items(), key=lambda item: item[1].last_used)
+            total = sum(session.memory_bytes for _, session in by_use)
+            for i, (session_id, session) in enumerate(by_use):
+                idle = now - session.last_used > self.idle_timeout
+                if not idle and (total <= self.max_bytes or i == len(by_use) - 1):
+                    continue
+                del self._sessions[session_id]
+                total -= session.memory_bytes
+                evicted.append((session_id, session))
+        for _, session in evicted:
+            session.close()
+        return [session_id for session_id, _ in evicted]
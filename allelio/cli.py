@@ -1,6 +1,7 @@
 """Allelio CLI interface using Click and Rich for user interaction."""
 
 import asyncio
+import json
 import os
 from pathlib import Path
 from typing import Optional
@@ -11,27 +12,102 @@ from rich.panel import Panel
 from rich.progress import Progress, SpinnerColumn, TextColumn
 from rich.table import Table
 
-from allelio.analysis.lookup import analyze_variants
-from allelio.database import AllelioDB, setup_database
+from allelio.analysis.cache import ResultCache, hash_genome
+from allelio.analysis.incremental import reanalyze_cached
+from allelio.analysis.lookup import analyze_variants, iter_ranked_hits, select_top_variants
+from allelio.analysis.pgx import StarAlleleCaller
+from allelio.analysis.prs import ScoreSet, stream_scores
+from allelio.analysis.relatedness import pack_genomes
+from allelio.database import (
+    AllelioDB,
+    QueryProfiler,
+    ShardedAllelioDB,
+    default_sources,
+    export_snapshot,
+    import_snapshot,
+    load_merge_history,
+    load_target_rsids,
+    open_database,
+    rebuild_shard,
+    setup_database,
+    shard_database,
+    source_from_spec,
+)
+from allelio.database.shards import MANIFEST_NAME
 from allelio.parsers import parse_genotype_file
-from allelio.report import generate_html_report
+from allelio.report import MAX_CARDS_PER_CATEGORY, generate_html_report
 
 console = Console()
 
 
 @click.group()
 @click.version_option()
-def allelio():
+@click.option(
+    "--db",
+    "db_location",
+    envvar="ALLELIO_DB",
+    type=click.Path(),
+    help="Database file or shard directory to use (default: ~/.allelio/data/allelio.db, env: ALLELIO_DB)",
+)
+def allelio(db_location: Optional[str]):
     """Allelio - Advanced genomic variant analysis and interpretation tool.
     
     Analyze your genetic variants against ClinVar and GWAS databases,
     with AI-powered explanations and interactive reporting.
     """
-    pass
+    if db_location:
+        # Exported so the web app started by `serve` opens the same database
+        os.environ["ALLELIO_DB"] = os.path.expanduser(db_location)
 
 
 @allelio.command()
-def setup():
+@click.option(
+    "--from-snapshot",
+    "snapshot",
+    default=None,
+    type=click.Path(exists=True, dir_okay=False),
+    help="Restore a prebuilt database snapshot instead of downloading",
+)
+@click.option(
+    "--targets",
+    multiple=True,
+    type=click.Path(exists=True, dir_okay=False),
+    help="Slim profile: only keep annotations for rsIDs in this chip manifest or genotype file (repeatable)",
+)
+@click.option(
+    "--workers",
+    default=0,
+    type=click.IntRange(0),
+    help="Worker processes for ClinVar parsing (default: 0 = one per CPU, 1 = in-process)",
+)
+@click.option(
+    "--stream",
+    is_flag=True,
+    default=False,
+    help="Parse downloads as they arrive instead of saving them to ~/.allelio/data first",
+)
+@click.option(
+    "--report",
+    "report_path",
+    default=None,
+    type=click.Path(dir_okay=False),
+    help="Write the JSON ingest report here (default: ~/.allelio/data/ingest_report.json)",
+)
+@click.option(
+    "--annotations",
+    "annotations",
+    multiple=True,
+    metavar="KIND=PATH",
+    help="Also load a local annotation file, e.g. pharmgkb=clinical_annotations.tsv or pgs=PGS000001.txt.gz (repeatable)",
+)
+def setup(
+    snapshot: Optional[str],
+    targets: tuple,
+    workers: int,
+    stream: bool,
+    report_path: Optional[str],
+    annotations: tuple,
+):
     """Download and index ClinVar and GWAS databases.
     
     This command initializes the Allelio database by downloading
@@ -40,11 +116,33 @@ def setup():
     console.print("\n[bold cyan]Allelio Database Setup[/bold cyan]\n")
     
     try:
-        db_path = os.path.expanduser("~/.allelio/data/allelio.db")
+        db_path = os.path.expanduser(os.environ.get("ALLELIO_DB") or "~/.allelio/data/allelio.db")
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
-        db = AllelioDB(db_path)
 
-        setup_database(db, log=lambda msg: console.print(f"  {msg}"))
+        if snapshot:
+            if Path(db_path).is_dir():
+                raise ValueError("Snapshots restore into a single-file database, not a shard directory")
+            import_snapshot(snapshot, db_path, log=lambda msg: console.print(f"  {msg}"))
+            console.print("\n[bold green]✓[/bold green] Database restored from snapshot\n")
+            return
+
+        target_rsids = None
+        if targets:
+            target_rsids = load_target_rsids(targets)
+            if not target_rsids:
+                raise ValueError("No rsIDs found in the --targets files")
+
+        db = open_database(db_path)
+
+        setup_database(
+            db,
+            log=lambda msg: console.print(f"  {msg}"),
+            target_rsids=target_rsids,
+            workers=workers,
+            stream=stream,
+            report_path=report_path,
+            sources=default_sources() + [source_from_spec(spec) for spec in annotations],
+        )
 
         console.print("\n[bold green]✓[/bold green] Database initialized successfully\n")
     except Exception as e:
@@ -90,6 +188,25 @@ def setup():
     default=False,
     help="Only show trait associations — exclude health conditions and risk factors",
 )
+@click.option(
+    "--save-for-reanalysis",
+    is_flag=True,
+    default=False,
+    help="Save this file's rsIDs, genotypes and findings to ~/.allelio/data/result_cache.db "
+         "so repeat runs are instant and `allelio reanalyze` can update them (clear with `allelio cache clear`)",
+)
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    default=False,
+    help="Analyze from scratch instead of reusing results saved for this file",
+)
+@click.option(
+    "--include-non-carriers",
+    is_flag=True,
+    default=False,
+    help="Also report variants whose genotype carries none of the reported alleles",
+)
 def analyze(
     file: str,
     output: str,
@@ -98,6 +215,9 @@ def analyze(
     model: str,
     top: int,
     traits_only: bool,
+    save_for_reanalysis: bool,
+    no_cache: bool,
+    include_non_carriers: bool,
 ):
     """Analyze a genotype file for significant variants.
     
@@ -105,11 +225,13 @@ def analyze(
     
     Parses genetic variants, checks against ClinVar and GWAS databases,
     optionally generates AI explanations, and produces an HTML report.
+    Nothing about the file is written to disk unless --save-for-reanalysis
+    is given.
     """
     console.print("\n[bold cyan]Allelio Variant Analysis[/bold cyan]\n")
     
     # Check if database exists
-    db = AllelioDB()
+    db = open_database()
     if not db.is_initialized():
         console.print(
             Panel(
@@ -121,19 +243,59 @@ def analyze(
         )
         raise click.Abort()
     
-    # Parse genotype file
-    try:
-        with Progress(
-            SpinnerColumn(),
-            TextColumn("[progress.description]{task.description}"),
-            console=console,
-        ) as progress:
-            task = progress.add_task("Parsing genotype file...", total=None)
-            variants = parse_genotype_file(file)
-            progress.update(task, description=f"✓ Parsed {len(variants)} variants")
-    except Exception as e:
-        console.print(f"\n[bold red]✗[/bold red] Failed to parse file: {e}\n", style="red")
-        raise click.Abort()
+    # With --save-for-reanalysis, reuse and save hits for this file content,
+    # database version and options
+    cache = None
+    cached = None
+    data_version = db.data_version()
+    if save_for_reanalysis and include_non_carriers:
+        # Saved hits are carrier-filtered, so the unfiltered view is never saved
+        console.print("  [yellow]⚠[/yellow] Analyses with --include-non-carriers are not saved for re-analysis.")
+    elif save_for_reanalysis:
+        try:
+            genome_hash = hash_genome(file)
+            cache = ResultCache()
+            if not no_cache:
+                cached = cache.get(genome_hash, data_version, include_benign=include_benign, traits_only=traits_only)
+        except Exception as e:
+            console.print(f"  [yellow]⚠[/yellow] Result cache unavailable ({e}) — analyzing without saving.")
+            cache = None
+    
+    if cached is not None:
+        hits, variant_count = cached
+        console.print(f"  [bold green]✓[/bold green] Using saved analysis of {variant_count} variants")
+    else:
+        # Parse genotype file
+        try:
+            with Progress(
+                SpinnerColumn(),
+                TextColumn("[progress.description]{task.description}"),
+                console=console,
+            ) as progress:
+                task = progress.add_task("Parsing genotype file...", total=None)
+                variants = parse_genotype_file(file)
+                progress.update(task, description=f"✓ Parsed {len(variants)} variants")
+        except Exception as e:
+            console.print(f"\n[bold red]✗[/bold red] Failed to parse file: {e}\n", style="red")
+            raise click.Abort()
+        
+        variant_count = len(variants)
+        if cache is not None:
+            # Kept so `allelio reanalyze` can update this analysis after a database update
+            try:
+                cache.store_genome(genome_hash, variants, name=Path(file).name)
+            except Exception as e:
+                console.print(f"  [yellow]⚠[/yellow] Could not save the genome for re-analysis: {e}")
+        hits = iter_ranked_hits(
+            variants,
+            db,
+            include_benign=include_benign,
+            categories={"Traits"} if traits_only else None,
+            carriers_only=not include_non_carriers,
+        )
+        if cache is not None:
+            hits = cache.record(hits, genome_hash, data_version, variant_count,
+                                include_benign=include_benign, traits_only=traits_only, strings=db)
     
     # Run analysis
     try:
@@ -143,28 +305,25 @@ def analyze(
             console=console,
         ) as progress:
             task = progress.add_task("Analyzing variants...", total=None)
-            results = analyze_variants(
-                variants,
-                db=db,
-                include_benign=include_benign,
-            )
-            # Filter to traits only if requested
-            if traits_only:
-                results = [r for r in results if r.category == "Traits"]
-            significant = [r for r in results if r.significance_rank <= 4]
+            # Only the top results are explained and listed, and only the top
+            # of each category is reported, so keep bounded heaps instead of
+            # materializing and sorting every match
+            analysis = select_top_variants(hits, db, top=top, per_category=MAX_CARDS_PER_CATEGORY)
+            results = analysis.top
             mode_label = "trait associations" if traits_only else "significant variants"
-            progress.update(task, description=f"✓ Found {len(results)} {mode_label}")
+            progress.update(task, description=f"✓ Found {analysis.total} {mode_label}")
     except Exception as e:
         console.print(f"\n[bold red]✗[/bold red] Analysis failed: {e}\n", style="red")
         raise click.Abort()
+    if cache is not None:
+        console.print(f"  Saved for re-analysis in {cache.path} (remove with [bold]allelio cache clear[/bold])")
+        cache.close()
     
     # Generate AI explanations if enabled
     explanations = {}
     if not no_ai:
-        # Sort by significance and take top N
-        top_variants = sorted(
-            results, key=lambda x: x.significance_rank
-        )[:top]
+        # Already the top N, most significant first
+        top_variants = results
 
         try:
             from allelio.ai.engine import AIEngine
@@ -199,7 +358,7 @@ def analyze(
     table.add_column("Significance", width=12)
     table.add_column("Genotype", width=12)
     
-    for result in sorted(results, key=lambda x: x.significance_rank)[:top]:
+    for result in results:
         # Extract gene name from clinvar or gwas entries
         gene = "-"
         if result.clinvar_entries:
@@ -231,23 +390,24 @@ def analyze(
     # Generate HTML report
     try:
         if traits_only:
-            summary = f"Traits-only analysis of {len(variants):,} variants found {len(results)} trait associations."
+            summary = f"Traits-only analysis of {variant_count:,} variants found {analysis.total} trait associations."
         else:
-            summary = f"Analysis of {len(variants):,} variants found {len(significant)} significant findings."
+            summary = f"Analysis of {variant_count:,} variants found {analysis.significant} significant findings."
         metadata = {
             "generated_at": __import__("datetime").datetime.now().isoformat(),
             "db_version": db.version(),
             "model_used": model if not no_ai else "none",
             "file_analyzed": Path(file).name,
-            "total_variants": len(variants),
-            "significant_variants": len(significant),
+            "total_variants": variant_count,
+            "significant_variants": analysis.significant,
         }
         
         html_content = generate_html_report(
-            results=results,
+            results=[r for kept in analysis.by_category.values() for r in kept],
             explanations=explanations,
             summary=summary,
             metadata=metadata,
+            category_counts=analysis.category_counts,
         )
         
         output_path = Path(output)
@@ -296,25 +456,653 @@ def serve(port: int, host: str):
 
 
 @allelio.command()
-def update():
+@click.option(
+    "--workers",
+    default=0,
+    type=click.IntRange(0),
+    help="Worker processes for ClinVar parsing (default: 0 = one per CPU, 1 = in-process)",
+)
+@click.option(
+    "--stream",
+    is_flag=True,
+    default=False,
+    help="Parse downloads as they arrive instead of saving them to ~/.allelio/data first",
+)
+@click.option(
+    "--report",
+    "report_path",
+    default=None,
+    type=click.Path(dir_okay=False),
+    help="Write the JSON ingest report here (default: ~/.allelio/data/ingest_report.json)",
+)
+@click.option(
+    "--annotations",
+    "annotations",
+    multiple=True,
+    metavar="KIND=PATH",
+    help="Also load a local annotation file, e.g. pharmgkb=clinical_annotations.tsv or pgs=PGS000001.txt.gz (repeatable)",
+)
+@click.option(
+    "--reanalyze",
+    is_flag=True,
+    default=False,
+    help="Update saved analyses afterwards and show what changed (see allelio reanalyze)",
+)
+@click.option(
+    "--targets",
+    multiple=True,
+    type=click.Path(exists=True, dir_okay=False),
+    help="Slim profile: replace the stored target rsIDs with those in this manifest or genotype file (repeatable)",
+)
+@click.option(
+    "--full",
+    is_flag=True,
+    default=False,
+    help="Switch a slim database to the full profile (load every annotation)",
+)
+def update(
+    workers: int,
+    stream: bool,
+    report_path: Optional[str],
+    annotations: tuple,
+    reanalyze: bool,
+    targets: tuple,
+    full: bool,
+):
     """Re-download and re-index all databases.
     
     Fetches the latest variant annotations from ClinVar and GWAS catalogs.
+    A slim database (setup --targets) keeps its profile and target rsIDs.
     """
     console.print("\n[bold cyan]Allelio Database Update[/bold cyan]\n")
 
     try:
-        db_path = os.path.expanduser("~/.allelio/data/allelio.db")
-        os.makedirs(os.path.dirname(db_path), exist_ok=True)
-        db = AllelioDB(db_path)
+        db = open_database()
+        db.initialize()
 
-        setup_database(db, log=lambda msg: console.print(f"  {msg}"))
+        target_rsids = None
+        if targets:
+            target_rsids = load_target_rsids(targets)
+            if not target_rsids:
+                raise ValueError("No rsIDs found in the --targets files")
+        elif not full and db.get_metadata("profile") == "slim":
+            target_rsids = db.get_target_rsids()
+            if target_rsids is None:
+                raise ValueError(
+                    "This slim database has no stored target rsIDs. Pass --targets FILE to keep "
+                    "the slim profile, or --full to load every annotation"
+                )
+            console.print(f"  Keeping the slim profile ({len(target_rsids):,} target rsIDs)")
+
+        setup_database(
+            db,
+            log=lambda msg: console.print(f"  {msg}"),
+            target_rsids=target_rsids,
+            workers=workers,
+            stream=stream,
+            report_path=report_path,
+            sources=default_sources() + [source_from_spec(spec) for spec in annotations],
+        )
 
         console.print("\n[bold green]✓[/bold green] Databases updated successfully\n")
     except Exception as e:
         console.print(f"\n[bold red]✗[/bold red] Update failed: {e}\n", style="red")
         raise click.Abort()
 
+    if reanalyze:
+        _reanalyze_saved(db, full=False, output=None)
+        return
+    try:
+        with ResultCache() as cache:
+            stale = sum(1 for entry in cache.entries() if entry["data_version"] != db.data_version())
+    except Exception:
+        stale = 0
+    if stale:
+        console.print(
+            f"  {stale} saved analyses predate this update — run [bold]allelio reanalyze[/bold] "
+            "to see what changed for them\n"
+        )
+
+
+@allelio.command()
+@click.option(
+    "--full",
+    is_flag=True,
+    default=False,
+    help="Look up every rsID of each genome again, not only those the updates changed",
+)
+@click.option(
+    "--output",
+    "-o",
+    default=None,
+    type=click.Path(dir_okay=False),
+    help="Also write the changes as JSON to this file",
+)
+def reanalyze(full: bool, output: Optional[str]):
+    """Update saved analyses after a database update and show what changed.
+    
+    Only rsIDs that the updates since each analysis added, changed or
+    removed are looked up again. Analyses are saved with
+    analyze --save-for-reanalysis.
+    """
+    console.print("\n[bold cyan]Allelio Re-analysis[/bold cyan]\n")
+    db = open_database()
+    if not db.is_initialized():
+        console.print(
+            "[bold red]✗[/bold red] Database not initialized. Run [bold]allelio setup[/bold] first.",
+            style="red",
+        )
+        raise click.Abort()
+    _reanalyze_saved(db, full=full, output=output)
+
+
+def _reanalyze_saved(db: AllelioDB, full: bool, output: Optional[str]) -> None:
+    """Refresh stale cached analyses and print their "what changed for you" diffs."""
+    try:
+        with ResultCache() as cache:
+            diffs = reanalyze_cached(cache, db, full=full)
+    except Exception as e:
+        console.print(f"\n[bold red]✗[/bold red] Re-analysis failed: {e}\n", style="red")
+        raise click.Abort()
+    
+    if not diffs:
+        console.print("  No saved analyses to update. Save one with [bold]allelio analyze FILE --save-for-reanalysis[/bold].\n")
+        return
+    
+    for diff in diffs:
+        label = diff.name or diff.genome_hash[:12]
+        scope = "all" if diff.full else "changed"
+        console.print(
+            f"[bold]{label}[/bold] — rechecked {diff.rechecked:,} {scope} rsIDs, "
+            f"{len(diff.changes)} findings changed"
+        )
+        if not diff.changes:
+            continue
+        table = Table(show_header=True, header_style="bold cyan")
+        table.add_column("rsID", style="cyan")
+        table.add_column("Change")
+        table.add_column("Before")
+        table.add_column("After")
+        for change in diff.changes:
+            table.add_row(change.rsid, change.change, _finding_label(change.before), _finding_label(change.after))
+        console.print(table)
+    
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump([diff.to_dict() for diff in diffs], f, indent=2)
+        console.print(f"\n  Changes written to {output}")
+    console.print()
+
+
+def _finding_label(result) -> str:
+    """One-line summary of a finding for the re-analysis table."""
+    if result is None:
+        return "—"
+    if result.clinvar_entries:
+        detail = result.clinvar_entries[0].clinical_significance or ""
+    else:
+        detail = ", ".join(entry.trait for entry in result.gwas_entries[:2] if entry.trait)
+    return f"{result.category}: {detail}" if detail else result.category
+
+
+@allelio.command()
+@click.argument("file", type=click.Path(exists=True))
+@click.option(
+    "--score",
+    "-s",
+    "score_files",
+    multiple=True,
+    type=click.Path(exists=True, dir_okay=False),
+    help="PGS Catalog scoring file (repeatable; default: scores loaded with --annotations pgs=PATH)",
+)
+@click.option(
+    "--join",
+    type=click.Choice(["rsid", "position"]),
+    default="rsid",
+    help="Match score variants by rsID or by harmonized chromosome and position",
+)
+@click.option(
+    "--stream",
+    is_flag=True,
+    default=False,
+    help="Read scoring files row by row instead of loading their weights",
+)
+@click.option(
+    "--output",
+    "-o",
+    default=None,
+    type=click.Path(dir_okay=False),
+    help="Also write the scores as JSON to this file",
+)
+def prs(file: str, score_files: tuple, join: str, stream: bool, output: Optional[str]):
+    """Compute polygenic risk scores for a genotype file.
+    
+    FILE: Path to genotype file (VCF, 23andMe, or custom format)
+    """
+    console.print("\n[bold cyan]Allelio Polygenic Scores[/bold cyan]\n")
+    try:
+        variants = parse_genotype_file(file)
+    except Exception as e:
+        console.print(f"\n[bold red]✗[/bold red] Failed to parse file: {e}\n", style="red")
+        raise click.Abort()
+    
+    try:
+        if stream and score_files:
+            results = stream_scores(score_files, variants)
+        else:
+            if score_files:
+                scores = ScoreSet(join=join)
+                for path in score_files:
+                    scores.add_file(path)
+            else:
+                db = open_database()
+                if not db.is_initialized():
+                    console.print(
+                        "[bold red]✗[/bold red] No --score files given and the database is not initialized.",
+                        style="red",
+                    )
+                    raise click.Abort()
+                scores = ScoreSet.from_db(db)
+                db.close()
+            results = list(scores.compute(variants).values())
+    except (OSError, ValueError) as e:
+        console.print(f"\n[bold red]✗[/bold red] Scoring failed: {e}\n", style="red")
+        raise click.Abort()
+    
+    if not results:
+        console.print("  No scores to compute. Pass --score FILE or load one with --annotations pgs=PATH.\n")
+        return
+    
+    table = Table(show_header=True, header_style="bold cyan")
+    table.add_column("Score", style="cyan")
+    table.add_column("Value", justify="right")
+    table.add_column("Variants used", justify="right")
+    table.add_column("Coverage", justify="right")
+    for result in results:
+        table.add_row(
+            result.pgs_id,
+            f"{result.score:.6g}",
+            f"{result.matched:,} / {result.variants:,}",
+            f"{result.coverage:.1%}",
+        )
+    console.print(table)
+    
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump([result.to_dict() for result in results], f, indent=2)
+        console.print(f"\n  Scores written to {output}")
+    console.print()
+
+
+@allelio.command()
+@click.argument("file", type=click.Path(exists=True))
+@click.option(
+    "--definitions",
+    "-d",
+    "definition_paths",
+    multiple=True,
+    required=True,
+    type=click.Path(exists=True),
+    help="Allele definition table, or a directory of them, e.g. CYP2C19_allele_definition_table.tsv (repeatable)",
+)
+@click.option(
+    "--output",
+    "-o",
+    default=None,
+    type=click.Path(dir_okay=False),
+    help="Also write the calls as JSON to this file",
+)
+def pgx(file: str, definition_paths: tuple, output: Optional[str]):
+    """Call pharmacogene star-allele diplotypes for a genotype file.
+    
+    FILE: Path to genotype file (VCF, 23andMe, or custom format)
+    """
+    console.print("\n[bold cyan]Allelio Pharmacogenomics[/bold cyan]\n")
+    try:
+        caller = StarAlleleCaller.from_paths(definition_paths)
+    except (OSError, ValueError) as e:
+        console.print(f"\n[bold red]✗[/bold red] Failed to load allele definitions: {e}\n", style="red")
+        raise click.Abort()
+    if not caller.genes:
+        console.print("  No allele definition tables found.\n")
+        return
+    
+    try:
+        variants = parse_genotype_file(file)
+    except Exception as e:
+        console.print(f"\n[bold red]✗[/bold red] Failed to parse file: {e}\n", style="red")
+        raise click.Abort()
+    
+    results = list(caller.call(variants).values())
+    table = Table(show_header=True, header_style="bold cyan")
+    table.add_column("Gene", style="cyan")
+    table.add_column("Diplotype")
+    table.add_column("Also possible")
+    table.add_column("Variants typed", justify="right")
+    for result in results:
+        table.add_row(
+            result.gene,
+            result.diplotype or "[yellow]no match[/yellow]",
+            ", ".join(result.alternatives) or "-",
+            f"{result.called:,} / {result.variants:,}",
+        )
+    console.print(table)
+    
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump([result.to_dict() for result in results], f, indent=2)
+        console.print(f"\n  Calls written to {output}")
+    console.print()
+
+
+@allelio.command()
+@click.argument("files", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--include-sex-chromosomes",
+    is_flag=True,
+    default=False,
+    help="Also compare X, Y and MT calls (skewed between sexes)",
+)
+@click.option(
+    "--output",
+    "-o",
+    default=None,
+    type=click.Path(dir_okay=False),
+    help="Also write the pairwise results as JSON to this file",
+)
+def relatedness(files: tuple, include_sex_chromosomes: bool, output: Optional[str]):
+    """Compare genotype files pairwise for family relationships.
+    
+    FILES: Two or more genotype files (VCF, 23andMe, or custom format)
+    
+    Reports identity-by-state sharing (IBS0/IBS1/IBS2), a kinship
+    estimate and the implied relationship for every pair.
+    """
+    console.print("\n[bold cyan]Allelio Relatedness[/bold cyan]\n")
+    if len(files) < 2:
+        console.print("[bold red]✗[/bold red] Give at least two genotype files to compare.", style="red")
+        raise click.Abort()
+    
+    genomes = {}
+    for file in files:
+        name = Path(file).name
+        if name in genomes:
+            name = f"{name} ({len(genomes) + 1})"
+        try:
+            genomes[name] = parse_genotype_file(file)
+        except Exception as e:
+            console.print(f"\n[bold red]✗[/bold red] Failed to parse {file}: {e}\n", style="red")
+            raise click.Abort()
+        console.print(f"  [bold green]✓[/bold green] Parsed {len(genomes[name]):,} variants from {name}")
+    
+    packed = pack_genomes(genomes, autosomes_only=not include_sex_chromosomes)
+    pairs = packed.all_pairs()
+    console.print(f"  Compared {len(pairs)} pairs over {len(packed.sites):,} shared biallelic SNPs\n")
+    
+    table = Table(show_header=True, header_style="bold cyan")
+    table.add_column("Pair", style="cyan")
+    table.add_column("Sites", justify="right")
+    table.add_column("IBS0", justify="right")
+    table.add_column("IBS1", justify="right")
+    table.add_column("IBS2", justify="right")
+    table.add_column("Kinship", justify="right")
+    table.add_column("Relationship")
+    for pair in pairs:
+        table.add_row(
+            f"{pair.sample_a} — {pair.sample_b}",
+            f"{pair.sites:,}",
+            f"{pair.ibs0_fraction:.1%}",
+            f"{pair.ibs1_fraction:.1%}",
+            f"{pair.ibs2_fraction:.1%}",
+            f"{pair.kinship:.3f}",
+            pair.relationship,
+        )
+    console.print(table)
+    
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump([pair.to_dict() for pair in pairs], f, indent=2)
+        console.print(f"\n  Results written to {output}")
+    console.print()
+
+
+@allelio.group("cache")
+def cache_group():
+    """Manage analyses saved with analyze --save-for-reanalysis."""
+    pass
+
+
+@cache_group.command("info")
+def cache_info():
+    """Show where saved analyses are kept and how many there are."""
+    try:
+        with ResultCache() as cache:
+            stats = cache.stats()
+            entries = cache.entries()
+            path = cache.path
+    except Exception as e:
+        console.print(f"\n[bold red]✗[/bold red] Reading the result cache failed: {e}\n", style="red")
+        raise click.Abort()
+
+    console.print(f"\n  Location: [cyan]{path}[/cyan]")
+    console.print(f"  {stats['entries']} saved analyses, {stats['genomes']} stored genomes ({stats['bytes']:,} bytes)")
+    for name in sorted({entry["name"] for entry in entries if entry["name"]}):
+        console.print(f"    {name}")
+    console.print()
+
+
+@cache_group.command("clear")
+def cache_clear():
+    """Delete every saved analysis and stored genome."""
+    try:
+        with ResultCache() as cache:
+            genomes = cache.stats()["genomes"]
+            cache.clear()
+            path = cache.path
+    except Exception as e:
+        console.print(f"\n[bold red]✗[/bold red] Clearing the result cache failed: {e}\n", style="red")
+        raise click.Abort()
+
+    console.print(f"\n[bold green]✓[/bold green] Deleted {genomes} stored genomes from [cyan]{path}[/cyan]\n")
+
+
+@allelio.group()
+def db():
+    """Manage the local reference database."""
+    pass
+
+
+@db.command("export")
+@click.argument("output", type=click.Path(dir_okay=False))
+@click.option(
+    "--level",
+    default=6,
+    type=click.IntRange(1, 9),
+    help="gzip compression level (default: 6)",
+)
+def db_export(output: str, level: int):
+    """Write a compressed, checksummed snapshot of the database.
+
+    OUTPUT: Path of the snapshot file to create
+
+    Restore it on another machine with: allelio setup --from-snapshot OUTPUT
+    """
+    console.print("\n[bold cyan]Allelio Database Export[/bold cyan]\n")
+
+    try:
+        with open_database() as database:
+            if isinstance(database, ShardedAllelioDB):
+                raise ValueError("Snapshots are exported from a single-file database, not a shard directory")
+            manifest = export_snapshot(
+                database,
+                output,
+                compresslevel=level,
+                log=lambda msg: console.print(f"  {msg}"),
+            )
+
+        snapshot_mb = Path(output).stat().st_size / (1024 * 1024)
+        console.print(
+            f"\n[bold green]✓[/bold green] Snapshot saved to: [cyan]{Path(output).absolute()}[/cyan] "
+            f"({snapshot_mb:.0f} MB, sha256 {manifest['sha256'][:12]}…)\n"
+        )
+    except Exception as e:
+        console.print(f"\n[bold red]✗[/bold red] Export failed: {e}\n", style="red")
+        raise click.Abort()
+
+
+@db.command("shard")
+@click.argument("output_dir", type=click.Path(file_okay=False))
+@click.option(
+    "--shards",
+    default=16,
+    type=click.IntRange(1, 256),
+    help="Number of rsID hash-range shards (default: 16)",
+)
+@click.option(
+    "--only",
+    multiple=True,
+    type=click.IntRange(0),
+    help="Rebuild only this shard of an existing OUTPUT_DIR (repeatable)",
+)
+def db_shard(output_dir: str, shards: int, only: tuple):
+    """Split the database into shards for parallel batch lookups.
+
+    OUTPUT_DIR: Empty directory to write the shard files to, or an existing
+    shard directory when --only is given
+    """
+    console.print("\n[bold cyan]Allelio Database Sharding[/bold cyan]\n")
+
+    try:
+        if only:
+            if not (Path(output_dir) / MANIFEST_NAME).exists():
+                raise ValueError(f"{output_dir} is not a sharded database")
+        elif Path(output_dir).exists() and any(Path(output_dir).iterdir()):
+            raise ValueError(f"{output_dir} is not empty")
+
+        with open_database() as database:
+            if isinstance(database, ShardedAllelioDB):
+                raise ValueError("The database is already sharded")
+            if only:
+                # The shard count comes from the existing manifest
+                with ShardedAllelioDB(output_dir) as sharded:
+                    for index in sorted(set(only)):
+                        rebuild_shard(database, sharded, index, log=lambda msg: console.print(f"  {msg}"))
+            else:
+                sharded = shard_database(
+                    database,
+                    output_dir,
+                    shard_count=shards,
+                    log=lambda msg: console.print(f"  {msg}"),
+                )
+                sharded.close()
+
+        console.print(f"\n[bold green]✓[/bold green] Shards saved to: [cyan]{Path(output_dir).absolute()}[/cyan]")
+        console.print(f"  Use them with: [bold]allelio --db {output_dir} analyze FILE[/bold] (or set ALLELIO_DB)\n")
+    except Exception as e:
+        console.print(f"\n[bold red]✗[/bold red] Sharding failed: {e}\n", style="red")
+        raise click.Abort()
+
+
+@db.command("merges")
+@click.argument("file", type=click.Path(exists=True, dir_okay=False))
+def db_merges(file: str):
+    """Load a dbSNP merge history so retired rsIDs are remapped on lookup.
+
+    FILE: RsMergeArch.bcp, refsnp-merged.json (optionally .gz/.bz2) or a
+    two-column "old current" list
+    """
+    console.print("\n[bold cyan]Allelio Merge History[/bold cyan]\n")
+
+    try:
+        with open_database() as database:
+            count = load_merge_history(
+                database,
+                file,
+                log=lambda msg: console.print(f"  {msg}"),
+            )
+            database.set_metadata("merge_history", Path(file).name)
+
+        console.print(f"\n[bold green]✓[/bold green] {count:,} retired rsIDs will be remapped on lookup\n")
+    except Exception as e:
+        console.print(f"\n[bold red]✗[/bold red] Loading merge history failed: {e}\n", style="red")
+        raise click.Abort()
+
+
+@db.command("profile")
+@click.argument("file", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--threshold-ms",
+    default=50.0,
+    type=float,
+    help="Capture EXPLAIN QUERY PLAN for statements slower than this (default: 50)",
+)
+@click.option(
+    "--log",
+    "log_path",
+    default=None,
+    type=click.Path(dir_okay=False),
+    help="Append slow statements to this JSON-lines file",
+)
+@click.option(
+    "--json",
+    "json_path",
+    default=None,
+    type=click.Path(dir_okay=False),
+    help="Also write the per-query summary to this JSON file",
+)
+def db_profile(file: str, threshold_ms: float, log_path: Optional[str], json_path: Optional[str]):
+    """Profile the database queries an analysis of FILE issues.
+
+    FILE: Path to genotype file to analyze
+
+    Prints time, calls and rows per query shape, with the query plan of any
+    statement slower than the threshold. Full table scans are flagged.
+    """
+    console.print("\n[bold cyan]Allelio Query Profile[/bold cyan]\n")
+
+    try:
+        variants = parse_genotype_file(file)
+        profiler = QueryProfiler(threshold_ms=threshold_ms, log_path=log_path)
+        with open_database(profiler=profiler) as database:
+            if not database.is_initialized():
+                raise RuntimeError("Database not found — run allelio setup first")
+            profiler.reset()
+            results = analyze_variants(variants, db=database, include_benign=True)
+    except Exception as e:
+        console.print(f"\n[bold red]✗[/bold red] Profiling failed: {e}\n", style="red")
+        raise click.Abort()
+
+    summary = profiler.summary()
+    console.print(f"  Analyzed {len(variants):,} variants ({len(results):,} annotated)\n")
+
+    table = Table(show_header=True, header_style="bold cyan")
+    table.add_column("Query", overflow="fold")
+    table.add_column("Calls", justify="right")
+    table.add_column("Total ms", justify="right")
+    table.add_column("Max ms", justify="right")
+    table.add_column("Rows", justify="right")
+    table.add_column("Plan", overflow="fold")
+
+    for row in summary:
+        plan = "; ".join(row["plan"]) if row["plan"] else "-"
+        table.add_row(
+            row["shape"],
+            f"{row['calls']:,}",
+            f"{row['total_ms']:.1f}",
+            f"{row['max_ms']:.1f}",
+            f"{row['rows']:,}",
+            plan,
+            style="bold red" if row["full_scan"] else "",
+        )
+    console.print(table)
+
+    if any(row["full_scan"] for row in summary):
+        console.print("\n[bold red]⚠[/bold red] Full table scan detected — an index may be missing\n")
+
+    if json_path:
+        profiler.write_summary(json_path)
+        console.print(f"\n  Summary saved to: [cyan]{Path(json_path).absolute()}[/cyan]\n")
+
 
 @allelio.command()
 def info():
@@ -325,7 +1113,7 @@ def info():
     console.print("\n[bold cyan]Allelio System Information[/bold cyan]\n")
     
     try:
-        db = AllelioDB()
+        db = open_database()
         
         if db.is_initialized():
             info_table = Table(show_header=False)
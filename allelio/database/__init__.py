@@ -1,14 +1,50 @@
 """Allelio database module."""
 
 from .store import AllelioDB
-from .downloader import download_file, setup_database
-from .clinvar import parse_clinvar
-from .gwas import parse_gwas
+from .downloader import default_sources, download_file, setup_database
+from .clinvar import parse_clinvar, parse_clinvar_lines, parse_clinvar_parallel
+from .gwas import parse_gwas, parse_gwas_lines
+from .snapshot import export_snapshot, import_snapshot, read_snapshot_manifest
+from .targets import load_target_rsids
+from .shards import ShardedAllelioDB, open_database, rebuild_shard, shard_database
+from .profiling import QueryProfiler
+from .telemetry import IngestTelemetry
+from .merges import load_merge_history, parse_merge_history
+from .sources import (
+    AnnotationSource,
+    LocalFileSource,
+    PGSScoringSource,
+    PharmGKBSource,
+    register_source_type,
+    source_from_spec,
+)
 
 __all__ = [
     "AllelioDB",
     "download_file",
     "setup_database",
     "parse_clinvar",
+    "parse_clinvar_lines",
+    "parse_clinvar_parallel",
     "parse_gwas",
+    "parse_gwas_lines",
+    "export_snapshot",
+    "import_snapshot",
+    "read_snapshot_manifest",
+    "load_target_rsids",
+    "ShardedAllelioDB",
+    "open_database",
+    "rebuild_shard",
+    "shard_database",
+    "QueryProfiler",
+    "IngestTelemetry",
+    "load_merge_history",
+    "parse_merge_history",
+    "default_sources",
+    "AnnotationSource",
+    "LocalFileSource",
+    "PharmGKBSource",
+    "PGSScoringSource",
+    "register_source_type",
+    "source_from_spec",
 ]
@@ -1,9 +1,23 @@
 """ClinVar reference database parser."""
 
 import gzip
-from typing import Generator, Dict, Any, Optional
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import groupby
+from operator import itemgetter
+from typing import Generator, Dict, Any, Iterable, List, Optional, Set, Tuple
 from pathlib import Path
 
+from .telemetry import (
+    SKIP_MALFORMED,
+    SKIP_NO_RSID,
+    SKIP_NOT_TARGETED,
+    SKIP_WRONG_ASSEMBLY,
+    count_skip,
+)
+
 
 # ClinVar variant_summary.txt column indices
 CLINVAR_COLUMNS = {
@@ -44,14 +58,152 @@ CLINVAR_COLUMNS = {
 }
 
 
-def parse_clinvar(filepath: str) -> Generator[Dict[str, Any], None, None]:
+# ClinVar review status to star rating mapping (0-4 stars)
+# See: https://www.ncbi.nlm.nih.gov/clinvar/docs/review_status/
+REVIEW_STATUS_STARS = {
+    "practice guideline": 4,
+    "reviewed by expert panel": 3,
+    "criteria provided, multiple submitters, no conflicts": 2,
+    "criteria provided, multiple submitters": 2,
+    "criteria provided, conflicting interpretations": 1,
+    "criteria provided, single submitter": 1,
+    "no assertion for the individual variant": 0,
+    "no assertion criteria provided": 0,
+    "no assertion provided": 0,
+}
+
+
+def review_stars(review_status: Optional[str]) -> int:
+    """Convert ClinVar review status string to a 0-4 star rating.
+
+    Args:
+        review_status: ClinVar review status string
+
+    Returns:
+        Integer star rating from 0 (lowest confidence) to 4 (highest)
+    """
+    if not review_status:
+        return 0
+
+    status_lower = review_status.lower().strip()
+
+    # Exact match first
+    if status_lower in REVIEW_STATUS_STARS:
+        return REVIEW_STATUS_STARS[status_lower]
+
+    # Substring match for variations in formatting
+    for key, stars in REVIEW_STATUS_STARS.items():
+        if key in status_lower:
+            return stars
+
+    return 0
+
+
+# Placeholder phenotypes dropped when a variant also has real conditions
+_PLACEHOLDER_CONDITIONS = {"not provided", "not specified"}
+
+
+def _allele(fields: List[str]) -> Optional[str]:
+    """Return "REF>ALT" for a row, preferring the VCF-normalized columns."""
+    for ref_col, alt_col in (("ReferenceAlleleVCF", "AlternateAlleleVCF"),
+                             ("ReferenceAllele", "AlternateAllele")):
+        ref_idx, alt_idx = CLINVAR_COLUMNS[ref_col], CLINVAR_COLUMNS[alt_col]
+        if alt_idx >= len(fields):
+            continue
+        ref, alt = fields[ref_idx].strip(), fields[alt_idx].strip()
+        if ref and alt and ref not in ("na", "-") and alt not in ("na", "-"):
+            return f"{ref}>{alt}"
+    return None
+
+
+def parse_clinvar_line(
+    line: str,
+    rsids: Optional[Set[str]] = None,
+    skipped: Optional[Dict[str, int]] = None,
+) -> Optional[Dict[str, Any]]:
+    """Parse one variant_summary.txt line into a ClinVar record.
+    
+    Args:
+        line: A single tab-delimited line from variant_summary.txt
+        rsids: Optional set of target rsIDs; rows for other rsIDs are skipped
+        skipped: Optional dict counting dropped rows by reason (no_rsid,
+            wrong_assembly, malformed, not_targeted); updated in place
+    
+    Returns:
+        Record dict, or None if the line is a header, malformed, or filtered out
+    """
+    # Skip header line
+    if line.startswith("#AlleleID"):
+        return None
+    
+    # Strip whitespace and split on tabs
+    fields = line.rstrip('\n').split('\t')
+    
+    # Ensure we have enough fields
+    if len(fields) <= CLINVAR_COLUMNS["ReviewStatus"]:
+        count_skip(skipped, SKIP_MALFORMED)
+        return None
+    
+    try:
+        # Extract fields
+        rs_num = fields[CLINVAR_COLUMNS["RS#"]].strip()
+        gene_symbol = fields[CLINVAR_COLUMNS["GeneSymbol"]].strip()
+        clinical_sig = fields[CLINVAR_COLUMNS["ClinicalSignificance"]].strip()
+        phenotype_list = fields[CLINVAR_COLUMNS["PhenotypeList"]].strip()
+        review_status = fields[CLINVAR_COLUMNS["ReviewStatus"]].strip()
+        last_evaluated = fields[CLINVAR_COLUMNS["LastEvaluated"]].strip()
+        assembly = fields[CLINVAR_COLUMNS["Assembly"]].strip()
+        
+        # Filter: must have an rsID (not "-1")
+        if rs_num == "-1" or not rs_num:
+            count_skip(skipped, SKIP_NO_RSID)
+            return None
+        
+        # Filter: only GRCh37 or GRCh38
+        if assembly not in ("GRCh37", "GRCh38"):
+            count_skip(skipped, SKIP_WRONG_ASSEMBLY)
+            return None
+        
+        # Convert rsID
+        rsid = "rs" + rs_num if not rs_num.startswith("rs") else rs_num
+        
+        # Filter: slim profile keeps only target rsIDs
+        if rsids is not None and rsid not in rsids:
+            count_skip(skipped, SKIP_NOT_TARGETED)
+            return None
+        
+        # Create record
+        return {
+            "rsid": rsid,
+            "gene": gene_symbol if gene_symbol else None,
+            "clinical_significance": clinical_sig if clinical_sig else None,
+            "conditions": phenotype_list if phenotype_list else None,
+            "review_status": review_status if review_status else None,
+            "last_evaluated": last_evaluated if last_evaluated else None,
+            "alleles": _allele(fields),
+        }
+        
+    except (IndexError, ValueError):
+        # Skip malformed lines
+        count_skip(skipped, SKIP_MALFORMED)
+        return None
+
+
+def parse_clinvar(
+    filepath: str,
+    rsids: Optional[Set[str]] = None,
+    skipped: Optional[Dict[str, int]] = None,
+) -> Generator[Dict[str, Any], None, None]:
     """Parse ClinVar variant_summary.txt.gz file.
     
     Args:
         filepath: Path to variant_summary.txt.gz file
+        rsids: Optional set of target rsIDs; rows for other rsIDs are skipped
+        skipped: Optional dict counting dropped rows by reason (see parse_clinvar_line)
     
     Yields:
-        Dict with keys: rsid, gene, clinical_significance, conditions, review_status, last_evaluated
+        Dict with keys: rsid, gene, clinical_significance, conditions, review_status,
+        last_evaluated, alleles ("REF>ALT")
     """
     path = Path(filepath)
     
@@ -60,51 +212,195 @@ def parse_clinvar(filepath: str) -> Generator[Dict[str, Any], None, None]:
     mode = 'rt' if filepath.endswith('.gz') else 'r'
     
     with open_func(path, mode, encoding='utf-8') as f:
-        for line_num, line in enumerate(f, 1):
-            # Skip header line
-            if line.startswith("#AlleleID"):
-                continue
-            
-            # Strip whitespace and split on tabs
-            fields = line.rstrip('\n').split('\t')
-            
-            # Ensure we have enough fields
-            if len(fields) <= CLINVAR_COLUMNS["ReviewStatus"]:
-                continue
-            
-            try:
-                # Extract fields
-                rs_num = fields[CLINVAR_COLUMNS["RS#"]].strip()
-                gene_symbol = fields[CLINVAR_COLUMNS["GeneSymbol"]].strip()
-                clinical_sig = fields[CLINVAR_COLUMNS["ClinicalSignificance"]].strip()
-                phenotype_list = fields[CLINVAR_COLUMNS["PhenotypeList"]].strip()
-                review_status = fields[CLINVAR_COLUMNS["ReviewStatus"]].strip()
-                last_evaluated = fields[CLINVAR_COLUMNS["LastEvaluated"]].strip()
-                assembly = fields[CLINVAR_COLUMNS["Assembly"]].strip()
-                
-                # Filter: must have an rsID (not "-1")
-                if rs_num == "-1" or not rs_num:
-                    continue
-                
-                # Filter: only GRCh37 or GRCh38
-                if assembly not in ("GRCh37", "GRCh38"):
-                    continue
-                
-                # Convert rsID
-                rsid = "rs" + rs_num if not rs_num.startswith("rs") else rs_num
-                
-                # Create record
-                record = {
-                    "rsid": rsid,
-                    "gene": gene_symbol if gene_symbol else None,
-                    "clinical_significance": clinical_sig if clinical_sig else None,
-                    "conditions": phenotype_list if phenotype_list else None,
-                    "review_status": review_status if review_status else None,
-                    "last_evaluated": last_evaluated if last_evaluated else None,
-                }
-                
-                yield record
-                
-            except (IndexError, ValueError):
-                # Skip malformed lines
+        yield from parse_clinvar_lines(f, rsids, skipped)
+
+
+def parse_clinvar_lines(
+    lines: Iterable[str],
+    rsids: Optional[Set[str]] = None,
+    skipped: Optional[Dict[str, int]] = None,
+) -> Generator[Dict[str, Any], None, None]:
+    """Parse ClinVar records from an iterable of variant_summary.txt lines.
+    
+    Args:
+        lines: Iterable of text lines (an open file or a streamed line source)
+        rsids: Optional set of target rsIDs; rows for other rsIDs are skipped
+        skipped: Optional dict counting dropped rows by reason (see parse_clinvar_line)
+    
+    Yields:
+        Dict with keys: rsid, gene, clinical_significance, conditions, review_status,
+        last_evaluated, alleles ("REF>ALT")
+    """
+    for line in lines:
+        record = parse_clinvar_line(line, rsids, skipped)
+        if record is not None:
+            yield record
+
+
+# Target rsIDs for pool workers, set once per process by _init_worker so the
+# (possibly large) set is not pickled with every block
+_worker_rsids: Optional[Set[str]] = None
+
+
+def _init_worker(rsids: Optional[Set[str]]) -> None:
+    """Process pool initializer for parse_clinvar_parallel."""
+    global _worker_rsids
+    _worker_rsids = rsids
+
+
+def _parse_block(block: bytes) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """Decode a line-aligned block of variant_summary.txt and parse its lines.
+    
+    Returns:
+        The block's records and its skipped-row counts by reason
+    """
+    records = []
+    skipped = {}
+    for line in block.decode('utf-8').split('\n'):
+        record = parse_clinvar_line(line, _worker_rsids, skipped)
+        if record is not None:
+            records.append(record)
+    return records, skipped
+
+
+def _read_blocks(filepath: str, block_size: int) -> Generator[bytes, None, None]:
+    """Decompress a file and cut it into blocks that end on a line boundary."""
+    open_func = gzip.open if filepath.endswith('.gz') else open
+    
+    with open_func(filepath, 'rb') as f:
+        remainder = b""
+        while True:
+            chunk = f.read(block_size)
+            if not chunk:
+                break
+            chunk = remainder + chunk
+            cut = chunk.rfind(b"\n")
+            if cut == -1:
+                remainder = chunk
                 continue
+            remainder = chunk[cut + 1:]
+            yield chunk[:cut]
+        if remainder:
+            yield remainder
+
+
+def parse_clinvar_parallel(
+    filepath: str,
+    rsids: Optional[Set[str]] = None,
+    workers: Optional[int] = None,
+    block_size: int = 4 * 1024 * 1024,
+    skipped: Optional[Dict[str, int]] = None,
+) -> Generator[List[Dict[str, Any]], None, None]:
+    """Parse variant_summary.txt.gz on a pool of worker processes.
+    
+    The calling process decompresses the file and cuts it into line-aligned
+    blocks; workers split, filter and extract fields; parsed blocks are
+    yielded in file order so a single writer can insert them. At most
+    ``2 * workers`` blocks are in flight to bound memory.
+    
+    Args:
+        filepath: Path to variant_summary.txt.gz file
+        rsids: Optional set of target rsIDs; rows for other rsIDs are skipped
+        workers: Number of worker processes. Defaults to the CPU count.
+        block_size: Decompressed bytes per block handed to a worker
+        skipped: Optional dict counting dropped rows by reason (see parse_clinvar_line)
+    
+    Yields:
+        Lists of record dicts (same keys as parse_clinvar), one per block
+    """
+    workers = workers or os.cpu_count() or 1
+    
+    def collect(future):
+        records, block_skipped = future.result()
+        if skipped is not None:
+            for reason, count in block_skipped.items():
+                skipped[reason] = skipped.get(reason, 0) + count
+        return records
+    
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(rsids,)) as pool:
+        pending = deque()
+        for block in _read_blocks(filepath, block_size):
+            pending.append(pool.submit(_parse_block, block))
+            if len(pending) >= 2 * workers:
+                yield collect(pending.popleft())
+        while pending:
+            yield collect(pending.popleft())
+
+
+def _evaluated_date(last_evaluated: Optional[str]) -> str:
+    """Return LastEvaluated ("Jun 29, 2015") as a sortable ISO date ("" if unknown)."""
+    if not last_evaluated:
+        return ""
+    try:
+        return datetime.strptime(last_evaluated, "%b %d, %Y").date().isoformat()
+    except ValueError:
+        return ""
+
+
+def _record_rank(record: Dict[str, Any]) -> tuple:
+    """Sort key for picking the best ClinVar record of an rsID (higher is better).
+    
+    Review stars win, then the most recent evaluation, then having a
+    significance at all; the remaining fields only break ties so the choice
+    does not depend on input order.
+    """
+    return (
+        review_stars(record.get("review_status")),
+        _evaluated_date(record.get("last_evaluated")),
+        record.get("clinical_significance") is not None,
+        tuple(record.get(key) or "" for key in
+              ("clinical_significance", "review_status", "gene", "conditions", "alleles")),
+    )
+
+
+def merge_clinvar_records(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Collapse all ClinVar records of one rsID into a single record.
+    
+    The best-reviewed record supplies significance, review status and date;
+    conditions from every record are merged (placeholders such as "not
+    provided" are dropped when real conditions exist) and the alleles of all
+    records are kept as a sorted, comma-separated set.
+    
+    Args:
+        records: Records sharing one rsid (as yielded by parse_clinvar)
+    
+    Returns:
+        One record with the same keys
+    """
+    ranked = sorted(records, key=_record_rank, reverse=True)
+    best = ranked[0]
+    
+    conditions = []
+    alleles = set()
+    for record in ranked:
+        for condition in (record.get("conditions") or "").split("|"):
+            condition = condition.strip()
+            if condition and condition not in conditions:
+                conditions.append(condition)
+        if record.get("alleles"):
+            alleles.update(record["alleles"].split(","))
+    if any(c.lower() not in _PLACEHOLDER_CONDITIONS for c in conditions):
+        conditions = [c for c in conditions if c.lower() not in _PLACEHOLDER_CONDITIONS]
+    
+    return {
+        "rsid": best["rsid"],
+        "gene": best.get("gene") or next((r["gene"] for r in ranked if r.get("gene")), None),
+        "clinical_significance": best.get("clinical_significance"),
+        "conditions": "|".join(conditions) or None,
+        "review_status": best.get("review_status"),
+        "last_evaluated": best.get("last_evaluated"),
+        "alleles": ",".join(sorted(alleles)) or None,
+    }
+
+
+def merge_clinvar_groups(records: Iterable[Dict[str, Any]]) -> Generator[Dict[str, Any], None, None]:
+    """Merge a stream of records sorted by rsid into one record per rsID.
+    
+    Args:
+        records: Records ordered by rsid (e.g. AllelioDB.iter_staged_clinvar())
+    
+    Yields:
+        One merged record per rsID (see merge_clinvar_records)
+    """
+    for _, group in groupby(records, key=itemgetter("rsid")):
+        yield merge_clinvar_records(list(group))
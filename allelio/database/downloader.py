@@ -1,9 +1,16 @@
 """Download and parse reference databases."""
 
+import hashlib
+import json
 import os
+import queue
+import re
+import threading
+import time
 import zipfile
+from contextlib import closing
 from pathlib import Path
-from typing import Optional, Callable
+from typing import Any, Callable, Dict, Generator, Iterable, List, Optional, Set
 from datetime import datetime
 
 try:
@@ -12,11 +19,15 @@ except ImportError:
     httpx = None
 
 from .store import AllelioDB
-from .clinvar import parse_clinvar
-from .gwas import parse_gwas
+from .clinvar import merge_clinvar_groups, parse_clinvar, parse_clinvar_lines, parse_clinvar_parallel
+from .gwas import parse_gwas, parse_gwas_lines
+from .sources import AnnotationSource, SourceContext, batched as _batched
+from .streaming import iter_gzip_lines, iter_zip_lines, prefetch, stream_url
+from .telemetry import IngestTelemetry, PhaseStats, format_eta
 
 
 CLINVAR_URL = "https://ftp.ncbi.nlm.nih.gov/pub/clinvar/tab_delimited/variant_summary.txt.gz"
+CLINVAR_MD5_URL = CLINVAR_URL + ".md5"
 
 # GWAS URL — verified from https://www.ebi.ac.uk/gwas/docs/file-downloads (Feb 2026)
 # This returns a zip file containing the associations TSV
@@ -24,23 +35,108 @@ GWAS_URL = "https://www.ebi.ac.uk/gwas/api/search/downloads/associations/v1.0?sp
 
 BATCH_SIZE = 10000
 
+_MD5_RE = re.compile(r"\b[0-9a-fA-F]{32}\b")
 
-def download_file(url: str, dest_path: str, progress_callback: Optional[Callable] = None, log: Optional[Callable] = None, max_retries: int = 3) -> None:
-    """Download file from URL with progress reporting and retry logic.
+
+def _gwas_member(zip_path: Path) -> str:
+    """Return the name of the associations TSV inside the GWAS Catalog zip.
+
+    Raises:
+        ValueError: If the archive has no .tsv member
+        zipfile.BadZipFile: If the file is not a valid zip archive
+    """
+    with zipfile.ZipFile(str(zip_path)) as zf:
+        tsv_files = [name for name in zf.namelist() if name.endswith('.tsv')]
+    if not tsv_files:
+        raise ValueError(f"No .tsv file found in {zip_path.name}")
+    return tsv_files[0]
+
+
+def _meta_path(dest_path: Path) -> Path:
+    """Sidecar file holding HTTP validators and checksum for a download."""
+    return dest_path.with_name(dest_path.name + ".meta.json")
+
+
+def _load_meta(dest_path: Path) -> Dict[str, Any]:
+    try:
+        return json.loads(_meta_path(dest_path).read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_meta(dest_path: Path, meta: Dict[str, Any]) -> None:
+    _meta_path(dest_path).write_text(json.dumps(meta, indent=2))
+
+
+def _validator(meta: Dict[str, Any]) -> Optional[str]:
+    """Return the strongest cache validator recorded in meta (ETag, else Last-Modified)."""
+    etag = meta.get("etag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return meta.get("last_modified")
+
+
+def fetch_md5(url: str) -> str:
+    """Fetch a published ``.md5`` file and return the hex digest it lists.
+
+    Accepts both ``md5sum`` output ("<digest>  <name>") and BSD style
+    ("MD5 (<name>) = <digest>").
+
+    Raises:
+        ImportError: If httpx is not installed
+        ValueError: If no digest is found
+    """
+    if httpx is None:
+        raise ImportError("httpx is required for downloading. Install with: pip install httpx")
+
+    response = httpx.get(url, follow_redirects=True, timeout=30.0)
+    response.raise_for_status()
+    match = _MD5_RE.search(response.text)
+    if not match:
+        raise ValueError(f"No MD5 digest found at {url}")
+    return match.group(0).lower()
+
+
+def download_file(
+    url: str,
+    dest_path: str,
+    progress_callback: Optional[Callable] = None,
+    log: Optional[Callable] = None,
+    max_retries: int = 3,
+    expected_md5: Optional[str] = None,
+    backoff: float = 2.0,
+    log_progress: bool = True,
+) -> bool:
+    """Download file from URL with progress reporting, resume and retry logic.
+
+    Bytes are written to ``<dest>.partial`` and moved into place only when
+    complete. A dropped connection resumes from the partial file with an HTTP
+    Range request (guarded by If-Range, so a changed upstream file restarts
+    from zero). When dest_path already exists, the request is conditional on
+    the ETag/Last-Modified recorded in ``<dest>.meta.json`` and an unchanged
+    release is not fetched again.
 
     Args:
         url: URL to download from
         dest_path: Path to save file to
         progress_callback: Optional callback function(downloaded_bytes, total_bytes)
         log: Optional function to print status messages
-        max_retries: Number of times to retry on failure
+        max_retries: Number of consecutive failed attempts (attempts that
+            made no progress) before giving up
+        expected_md5: Optional hex MD5 digest, verified while streaming
+        backoff: Base delay in seconds between retries, doubled per failure
+            and capped at 60s
+        log_progress: Log a line every 10%. Turn off when progress_callback
+            already reports it (e.g. a combined view of several downloads)
+
+    Returns:
+        True if a new copy was downloaded, False if the server reported the
+        existing file unchanged
 
     Raises:
         ImportError: If httpx is not installed
         RuntimeError: If download fails after all retries
     """
-    import time
-
     if httpx is None:
         raise ImportError("httpx is required for downloading. Install with: pip install httpx")
 
@@ -50,26 +146,79 @@ def download_file(url: str, dest_path: str, progress_callback: Optional[Callable
 
     dest_path = Path(dest_path)
     dest_path.parent.mkdir(parents=True, exist_ok=True)
-
-    for attempt in range(1, max_retries + 1):
+    partial_path = dest_path.with_name(dest_path.name + ".partial")
+
+    meta = _load_meta(dest_path)
+    if meta.get("url") != url:
+        meta = {"url": url}
+    if expected_md5 and meta.get("md5") and meta["md5"] != expected_md5.lower():
+        # Upstream published a new checksum: the cached copy is stale
+        meta.pop("complete", None)
+
+    failures = 0
+    furthest = 0
+    while True:
+        offset = partial_path.stat().st_size if partial_path.exists() else 0
+        headers = {}
+        partial_meta = meta.get("partial") or {}
+        if offset and _validator(partial_meta):
+            headers["Range"] = f"bytes={offset}-"
+            headers["If-Range"] = _validator(partial_meta)
+        else:
+            offset = 0
+            if dest_path.exists() and meta.get("complete"):
+                if meta.get("etag"):
+                    headers["If-None-Match"] = meta["etag"]
+                if meta.get("last_modified"):
+                    headers["If-Modified-Since"] = meta["last_modified"]
+
+        downloaded = offset
         try:
             timeout = httpx.Timeout(30.0, read=300.0)
-            with httpx.stream("GET", url, follow_redirects=True, timeout=timeout) as response:
+            with httpx.stream("GET", url, headers=headers, follow_redirects=True, timeout=timeout) as response:
+                if response.status_code == 304:
+                    _log("       Not modified since last download — using cached copy.")
+                    return False
+                if response.status_code == 416:
+                    # Range no longer satisfiable (file shrank upstream): start over
+                    partial_path.unlink(missing_ok=True)
+                    meta.pop("partial", None)
+                    continue
                 response.raise_for_status()
-                total_bytes = int(response.headers.get("content-length", 0))
+
+                if response.status_code == 206:
+                    total_bytes = int(response.headers.get("content-range", "*/0").rsplit("/", 1)[-1] or 0)
+                    _log(f"       Resuming download at {offset / (1024 * 1024):.0f} MB")
+                else:
+                    offset = 0
+                    total_bytes = int(response.headers.get("content-length", 0))
                 total_mb = total_bytes / (1024 * 1024) if total_bytes else 0
 
-                downloaded = 0
+                meta["partial"] = {
+                    "etag": response.headers.get("etag"),
+                    "last_modified": response.headers.get("last-modified"),
+                }
+                _save_meta(dest_path, meta)
+
+                digest = hashlib.md5()
+                if offset:
+                    # Fold the bytes already on disk into the running checksum
+                    with open(partial_path, "rb") as f:
+                        for block in iter(lambda: f.read(1 << 20), b""):
+                            digest.update(block)
+
+                downloaded = offset
                 last_pct = -1
-                with open(dest_path, "wb") as f:
+                with open(partial_path, "ab" if offset else "wb") as f:
                     for chunk in response.iter_bytes(chunk_size=65536):
                         if chunk:
                             f.write(chunk)
+                            digest.update(chunk)
                             downloaded += len(chunk)
                             if progress_callback:
                                 progress_callback(downloaded, total_bytes)
                             # Print progress every 10%
-                            if total_bytes > 0:
+                            if log_progress and total_bytes > 0:
                                 pct = int(downloaded * 100 / total_bytes) // 10 * 10
                                 if pct > last_pct:
                                     last_pct = pct
@@ -77,34 +226,404 @@ def download_file(url: str, dest_path: str, progress_callback: Optional[Callable
                                     _log(f"       ... {dl_mb:.0f} MB / {total_mb:.0f} MB ({pct}%)")
 
             # Verify complete download
-            actual_size = dest_path.stat().st_size
-            if total_bytes > 0 and actual_size < total_bytes:
-                raise RuntimeError(f"Incomplete download: got {actual_size:,} of {total_bytes:,} bytes")
-
-            return  # Success
+            if total_bytes > 0 and downloaded < total_bytes:
+                raise RuntimeError(f"Incomplete download: got {downloaded:,} of {total_bytes:,} bytes")
+
+            md5 = digest.hexdigest()
+            if expected_md5 and md5 != expected_md5.lower():
+                partial_path.unlink(missing_ok=True)
+                meta.pop("partial", None)
+                downloaded = 0  # a corrupt copy is a failed attempt, not progress
+                raise RuntimeError(f"Checksum mismatch: expected MD5 {expected_md5}, got {md5}")
+
+            os.replace(partial_path, dest_path)
+            partial_meta = meta.pop("partial")
+            meta.update(
+                etag=partial_meta["etag"],
+                last_modified=partial_meta["last_modified"],
+                size=downloaded,
+                md5=md5,
+                complete=True,
+            )
+            _save_meta(dest_path, meta)
+            return True  # Success
 
         except Exception as e:
-            if attempt < max_retries:
-                wait = attempt * 10
-                _log(f"       Download interrupted ({e}). Retrying in {wait}s... (attempt {attempt + 1}/{max_retries})")
-                time.sleep(wait)
-            else:
+            if downloaded > furthest:
+                # The partial file grew: resume straight away
+                furthest = downloaded
+                failures = 0
+                _log(f"       Download interrupted ({e}). Resuming...")
+                continue
+            failures += 1
+            if failures >= max_retries:
                 raise RuntimeError(f"Download failed after {max_retries} attempts: {e}")
+            wait = min(backoff * 2 ** (failures - 1), 60.0)
+            _log(f"       Download interrupted ({e}). Retrying in {wait:.0f}s... (attempt {failures + 1}/{max_retries})")
+            time.sleep(wait)
+
+
+class _CombinedProgress:
+    """Merge byte progress from concurrent downloads into one view."""
+
+    def __init__(self, progress_callback: Optional[Callable], log: Callable, telemetry: IngestTelemetry):
+        self._progress_callback = progress_callback
+        self._log = log
+        self._telemetry = telemetry
+        self._sources: Dict[str, tuple] = {}
+        self._last_pct = -1
+        self._lock = threading.Lock()
+
+    def callback(self, name: str) -> Callable[[int, int], None]:
+        """Return a progress_callback(downloaded, total) for one source."""
+        def update(downloaded: int, total: int) -> None:
+            self._telemetry.update_bytes(f"download:{name.lower()}", downloaded, total)
+            with self._lock:
+                self._sources[name] = (downloaded, total)
+                done = sum(d for d, _ in self._sources.values())
+                total_bytes = sum(t for _, t in self._sources.values())
+                if self._progress_callback:
+                    self._progress_callback(done, total_bytes)
+                if not total_bytes:
+                    return
+                # Print progress every 10% of the combined total
+                pct = int(done * 100 / total_bytes) // 10 * 10
+                if pct <= self._last_pct:
+                    return
+                self._last_pct = pct
+                parts = ", ".join(
+                    f"{source} {int(d * 100 / t) if t else 0}%"
+                    for source, (d, t) in self._sources.items()
+                )
+                self._log(
+                    f"       ... {done / (1024 * 1024):.0f} MB / {total_bytes / (1024 * 1024):.0f} MB "
+                    f"({pct}%) — {parts}, ETA {format_eta(self._telemetry.eta_seconds())}"
+                )
+
+        return update
+
+
+def _clinvar_batches(
+    data_dir: Path,
+    stream: bool,
+    workers: int,
+    target_rsids: Optional[Set[str]],
+    progress: _CombinedProgress,
+    telemetry: IngestTelemetry,
+    _log: Callable,
+) -> Iterable[List[Dict[str, Any]]]:
+    """Fetch ClinVar and yield parsed record batches as soon as they are ready."""
+    download = telemetry.phase("download:clinvar")
+    skipped = telemetry.phase("ingest:clinvar").skipped
+    if stream:
+        # ClinVar: HTTP chunks -> gunzip -> line parser -> batched inserts
+        _log("[2/6] Streaming ClinVar from NIH (~400 MB) straight into the database...")
+        chunks = prefetch(stream_url(CLINVAR_URL, progress_callback=progress.callback("ClinVar")))
+        _log("[3/6] Parsing ClinVar variants as they arrive...")
+        records = parse_clinvar_lines(iter_gzip_lines(chunks), rsids=target_rsids, skipped=skipped)
+        yield from _batched(records, BATCH_SIZE)
+        download.finish()
+        return
+
+    # Download ClinVar (conditional on the cached copy's ETag/Last-Modified)
+    clinvar_path = data_dir / "variant_summary.txt.gz"
+    _log("[2/6] Downloading ClinVar from NIH (~400 MB)... this may take a few minutes")
+    download.start()
+    try:
+        expected_md5 = fetch_md5(CLINVAR_MD5_URL)
+    except Exception as e:
+        _log(f"       ClinVar checksum unavailable ({e}) — skipping verification.")
+        expected_md5 = None
+    try:
+        if download_file(CLINVAR_URL, str(clinvar_path), progress.callback("ClinVar"), log=_log,
+                         expected_md5=expected_md5, log_progress=False):
+            _log("[2/6] ClinVar download complete.")
+        else:
+            _log("[2/6] ClinVar unchanged since last download — skipping download.")
+    except Exception as e:
+        if not clinvar_path.exists():
+            raise
+        _log(f"       ClinVar download failed ({e}) — using the previously downloaded copy.")
+    download.finish()
+
+    # Parse ClinVar
+    _log("[3/6] Parsing ClinVar variants... (this takes 1-2 minutes)")
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        yield from _batched(parse_clinvar(str(clinvar_path), rsids=target_rsids, skipped=skipped), BATCH_SIZE)
+    else:
+        yield from parse_clinvar_parallel(str(clinvar_path), rsids=target_rsids, workers=workers, skipped=skipped)
+
+
+def _gwas_batches(
+    data_dir: Path,
+    stream: bool,
+    target_rsids: Optional[Set[str]],
+    progress: _CombinedProgress,
+    telemetry: IngestTelemetry,
+    _log: Callable,
+) -> Iterable[List[Dict[str, Any]]]:
+    """Fetch the GWAS Catalog and yield parsed record batches as soon as they are ready."""
+    download = telemetry.phase("download:gwas")
+    skipped = telemetry.phase("ingest:gwas").skipped
+    if stream:
+        # GWAS: HTTP chunks -> streaming unzip of the TSV member -> line parser
+        _log("[4/6] Streaming GWAS Catalog from EBI straight into the database...")
+        chunks = prefetch(stream_url(GWAS_URL, progress_callback=progress.callback("GWAS")))
+        _log("[5/6] Parsing GWAS associations as they arrive...")
+        lines = iter_zip_lines(chunks, member_suffix=".tsv", errors="ignore")
+        yield from _batched(parse_gwas_lines(lines, rsids=target_rsids, skipped=skipped), BATCH_SIZE)
+        download.finish()
+        return
+
+    # Download GWAS (conditional on the cached archive's validators).
+    # The zip is kept as-is and parsed straight from its TSV member.
+    gwas_zip_path = data_dir / "gwas_associations.zip"
+    _log("[4/6] Downloading GWAS Catalog from EBI... this may take a few minutes")
+    download.start()
+    try:
+        if download_file(GWAS_URL, str(gwas_zip_path), progress.callback("GWAS"), log=_log,
+                         log_progress=False):
+            _log("[4/6] GWAS Catalog download complete.")
+        else:
+            _log("[4/6] GWAS Catalog unchanged since last download — skipping download.")
+    except Exception as e:
+        if not gwas_zip_path.exists():
+            raise
+        _log(f"       GWAS download failed ({e}) — using the previously downloaded copy.")
+    download.finish()
+    try:
+        gwas_member = _gwas_member(gwas_zip_path)
+    except Exception:
+        gwas_zip_path.unlink(missing_ok=True)
+        raise
+
+    # Parse GWAS without extracting it
+    _log(f"[5/6] Parsing GWAS associations from {gwas_member}...")
+    with zipfile.ZipFile(str(gwas_zip_path)) as zf, zf.open(gwas_member) as src:
+        yield from _batched(parse_gwas(src, rsids=target_rsids, skipped=skipped), BATCH_SIZE)
+
+
+def _merge_staged_clinvar(db: AllelioDB, stats: PhaseStats) -> int:
+    """Write one best-record row per staged rsID into the clinvar table.
+
+    Rows of rsIDs that are not staged (dropped by ClinVar since the last
+    load) are deleted first.
+
+    Returns:
+        Number of rsIDs written
+    """
+    stats.start()
+    db.delete_unstaged_clinvar()
+    staged = (record for batch in db.iter_staged_clinvar(BATCH_SIZE) for record in batch)
+    for records in _batched(merge_clinvar_groups(staged), BATCH_SIZE):
+        start = time.perf_counter()
+        db.insert_clinvar_batch(records)
+        stats.insert_seconds += time.perf_counter() - start
+        stats.rows += len(records)
+    stats.finish()
+    return stats.rows
+
+
+class ClinVarSource(AnnotationSource):
+    """ClinVar variant_summary from NIH, merged to one row per rsID.
+
+    Rows are staged while parsing and merged once the source finishes.
+    A failure aborts setup.
+    """
+
+    name = "clinvar"
+    label = "ClinVar"
+    table = "clinvar"
+    required = True
+    report_every = 500000
+
+    def prepare(self, db) -> None:
+        # Table created by AllelioDB.initialize; merged rows replace old ones
+        # and rows ClinVar dropped are deleted once the load has succeeded
+        pass
+
+    def batches(self, context: SourceContext) -> Iterable[List[Dict[str, Any]]]:
+        return _clinvar_batches(context.data_dir, context.stream, context.workers, context.target_rsids,
+                                context.progress, context.telemetry, context.log)
+
+    def insert(self, db, batch: List[Dict[str, Any]]) -> None:
+        db.stage_clinvar_batch(batch)
+
+    def finish(self, db, context: SourceContext, parsed: int) -> int:
+        rsids = _merge_staged_clinvar(db, context.telemetry.phase("merge:clinvar"))
+        context.log(f"[3/6] ClinVar complete: {parsed:,} records parsed, {rsids:,} rsIDs loaded.")
+        return rsids
+
+
+def _swap_staged_gwas(db: AllelioDB) -> None:
+    """Replace the gwas table with the staged catalog."""
+    db.clear_annotations(tables=("gwas",))
+    for batch in db.iter_staged_gwas(BATCH_SIZE):
+        db.insert_gwas_batch(batch)
+
+
+class GWASSource(AnnotationSource):
+    """The GWAS Catalog associations from EBI, one row per associated rsID.
+
+    Rows are staged while parsing and replace the previous catalog once the
+    source finishes. Optional: if it fails, ClinVar is still loaded, the
+    staged rows are dropped and the previous catalog is kept.
+    """
+
+    name = "gwas"
+    label = "GWAS"
+    table = "gwas"
+
+    def prepare(self, db) -> None:
+        # Table created by AllelioDB.initialize
+        db.discard_staged_gwas()
+
+    def batches(self, context: SourceContext) -> Iterable[List[Dict[str, Any]]]:
+        return _gwas_batches(context.data_dir, context.stream, context.target_rsids,
+                             context.progress, context.telemetry, context.log)
+
+    def insert(self, db, batch: List[Dict[str, Any]]) -> None:
+        db.stage_gwas_batch(batch)
+
+    def finish(self, db, context: SourceContext, parsed: int) -> int:
+        _swap_staged_gwas(db)
+        context.log(f"[5/6] GWAS complete: {parsed:,} records loaded.")
+        return parsed
+
+    def fail(self, db, context: SourceContext, error: BaseException, parsed: int) -> None:
+        context.log(f"       GWAS download failed: {error}")
+        # Drop the partial load; the previous catalog stays in place
+        db.discard_staged_gwas()
+        context.log("[4/6] ⚠ GWAS Catalog download failed from all sources.")
+        context.log("[5/6] Skipping GWAS parsing — ClinVar data is still available.")
+        context.log("       You can retry later with: allelio update")
+
+
+def default_sources() -> List[AnnotationSource]:
+    """Return the built-in sources: ClinVar and the GWAS Catalog."""
+    return [ClinVarSource(), GWASSource()]
+
+
+def _timed(batches: Iterable[List[Dict[str, Any]]], stats: PhaseStats) -> Generator[List[Dict[str, Any]], None, None]:
+    """Yield batches, adding the time spent producing each to stats.parse_seconds.
+
+    For downloaded files this is parse time; when streaming it also includes
+    waiting on the network.
+    """
+    stats.start()
+    batches = iter(batches)
+    try:
+        while True:
+            start = time.perf_counter()
+            batch = next(batches, None)
+            stats.parse_seconds += time.perf_counter() - start
+            if batch is None:
+                return
+            yield batch
+    finally:
+        if hasattr(batches, "close"):
+            batches.close()
+
+
+def _ingest_concurrently(
+    sources: Dict[str, Callable[[], Iterable[List[Dict[str, Any]]]]],
+    max_batches: int = 8,
+) -> Generator[tuple, None, None]:
+    """Run each source's batch generator on its own thread and merge the output.
+
+    Yields ``(name, batch)`` in arrival order, then ``(name, None)`` when a
+    source finishes or ``(name, exception)`` if it fails. The shared queue is
+    bounded, so producers wait for the (single) consumer to keep up. Closing
+    the generator early stops the remaining producers.
+    """
+    results = queue.Queue(maxsize=max_batches)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce(name, make_batches):
+        batches = None
+        try:
+            batches = iter(make_batches())
+            for batch in batches:
+                if not put((name, batch)):
+                    return
+            put((name, None))
+        except BaseException as e:  # handed to the consumer
+            put((name, e))
+        finally:
+            if hasattr(batches, "close"):
+                batches.close()
+
+    threads = [
+        threading.Thread(target=produce, args=(name, make_batches), name=f"allelio-{name}", daemon=True)
+        for name, make_batches in sources.items()
+    ]
+    for thread in threads:
+        thread.start()
+
+    pending = len(threads)
+    try:
+        while pending:
+            name, item = results.get()
+            if item is None or isinstance(item, BaseException):
+                pending -= 1
+            yield name, item
+    finally:
+        stop.set()
 
 
 def setup_database(
     db: AllelioDB,
     data_dir: Optional[str] = None,
     progress_callback: Optional[Callable] = None,
-    log: Optional[Callable] = None
-) -> None:
+    log: Optional[Callable] = None,
+    target_rsids: Optional[Set[str]] = None,
+    workers: int = 1,
+    stream: bool = False,
+    telemetry: Optional[IngestTelemetry] = None,
+    report_path: Optional[str] = None,
+    sources: Optional[List[AnnotationSource]] = None,
+) -> Dict[str, Any]:
     """Orchestrate full download, parse, and index of reference databases.
 
+    All sources (ClinVar and the GWAS Catalog by default) are fetched
+    concurrently, each parsed as soon as its data is ready; all database
+    writes happen on the calling thread. Download progress from all sources
+    is merged into one view.
+
     Args:
         db: AllelioDB instance
         data_dir: Directory to store downloaded files. Defaults to ~/.allelio/data/
         progress_callback: Optional callback function for progress updates
         log: Optional function to print status messages (e.g. print or console.print)
+        target_rsids: Optional set of rsIDs for the slim "array-only" profile.
+            When given, existing annotations are cleared and only rows for
+            these rsIDs are loaded.
+        workers: Worker processes for ClinVar parsing. 1 parses in-process;
+            0 uses one per CPU.
+        stream: Parse and insert straight from the HTTP response while it
+            downloads, without writing ClinVar or GWAS files to data_dir.
+            ClinVar is then parsed in-process regardless of ``workers``.
+        telemetry: Optional IngestTelemetry to record into (a new one is
+            created otherwise)
+        report_path: Where to write the JSON ingest report. Defaults to
+            ingest_report.json in data_dir.
+        sources: AnnotationSource plugins to load. Defaults to
+            default_sources(); add e.g. PharmGKBSource(path) to load a local
+            file alongside them.
+
+    Returns:
+        The ingest report (per-phase wall time, bytes/s, rows/s, parse vs
+        insert time and filtered rows by reason)
 
     Raises:
         ImportError: If httpx is not installed
@@ -119,105 +638,143 @@ def setup_database(
 
     data_dir = Path(data_dir)
     data_dir.mkdir(parents=True, exist_ok=True)
+    if telemetry is None:
+        telemetry = IngestTelemetry()
 
     # Initialize database tables
     _log("[1/6] Creating database tables...")
+    initialize = telemetry.phase("initialize").start()
     db.initialize()
-
-    # Download ClinVar (skip if already downloaded and >100MB)
-    clinvar_path = data_dir / "variant_summary.txt.gz"
-    if clinvar_path.exists() and clinvar_path.stat().st_size > 100_000_000:
-        clinvar_mb = clinvar_path.stat().st_size / (1024 * 1024)
-        _log(f"[2/6] ClinVar already downloaded ({clinvar_mb:.0f} MB) — skipping download.")
-    else:
-        _log("[2/6] Downloading ClinVar from NIH (~400 MB)... this may take a few minutes")
-        download_file(CLINVAR_URL, str(clinvar_path), progress_callback, log=log)
-        _log("[2/6] ClinVar download complete.")
-
-    # Parse ClinVar
-    _log("[3/6] Parsing ClinVar variants... (this takes 1-2 minutes)")
-    clinvar_count = 0
-    clinvar_records = []
-    for record in parse_clinvar(str(clinvar_path)):
-        clinvar_records.append(record)
-        clinvar_count += 1
-        if len(clinvar_records) >= BATCH_SIZE:
-            db.insert_clinvar_batch(clinvar_records)
-            if clinvar_count % 500000 == 0:
-                _log(f"       ... {clinvar_count:,} ClinVar records processed")
-            clinvar_records = []
-
-    if clinvar_records:
-        db.insert_clinvar_batch(clinvar_records)
-    _log(f"[3/6] ClinVar complete: {clinvar_count:,} records loaded.")
-
-    # Download GWAS (skip if already downloaded and >10MB, otherwise try multiple URLs)
-    gwas_path = data_dir / "gwas_associations.tsv"
-    gwas_zip_path = data_dir / "gwas_associations.zip"
-    gwas_downloaded = False
-    if gwas_path.exists() and gwas_path.stat().st_size > 10_000_000:
-        gwas_mb = gwas_path.stat().st_size / (1024 * 1024)
-        _log(f"[4/6] GWAS Catalog already downloaded ({gwas_mb:.0f} MB) — skipping download.")
-        gwas_downloaded = True
-    else:
-        _log("[4/6] Downloading GWAS Catalog from EBI... this may take a few minutes")
-        try:
-            download_file(GWAS_URL, str(gwas_zip_path), progress_callback, log=log)
-            # The download is a zip file — extract the TSV from it
-            _log("       Extracting zip file...")
-            with zipfile.ZipFile(str(gwas_zip_path), 'r') as zf:
-                # Find the TSV file inside the zip
-                tsv_files = [f for f in zf.namelist() if f.endswith('.tsv')]
-                if tsv_files:
-                    # Extract the first TSV file and rename to our standard name
-                    with zf.open(tsv_files[0]) as src, open(str(gwas_path), 'wb') as dst:
-                        dst.write(src.read())
-                    _log(f"       Extracted: {tsv_files[0]}")
-                else:
-                    # No TSV found — maybe the zip contains the data directly
-                    zf.extractall(str(data_dir))
-                    _log(f"       Extracted {len(zf.namelist())} files")
-            # Clean up zip
-            gwas_zip_path.unlink(missing_ok=True)
-            gwas_downloaded = True
-            _log("[4/6] GWAS Catalog download complete.")
-        except Exception as e:
-            _log(f"       GWAS download failed: {e}")
-            gwas_zip_path.unlink(missing_ok=True)
-
-    # Parse GWAS (if downloaded)
-    gwas_count = 0
-    if gwas_downloaded:
-        _log("[5/6] Parsing GWAS associations...")
-        gwas_records = []
-        for record in parse_gwas(str(gwas_path)):
-            gwas_records.append(record)
-            gwas_count += 1
-            if len(gwas_records) >= BATCH_SIZE:
-                db.insert_gwas_batch(gwas_records)
-                if gwas_count % 100000 == 0:
-                    _log(f"       ... {gwas_count:,} GWAS records processed")
-                gwas_records = []
-
-        if gwas_records:
-            db.insert_gwas_batch(gwas_records)
-        _log(f"[5/6] GWAS complete: {gwas_count:,} records loaded.")
-    else:
-        _log("[4/6] ⚠ GWAS Catalog download failed from all sources.")
-        _log("[5/6] Skipping GWAS parsing — ClinVar data is still available.")
-        _log("       You can retry later with: allelio update")
+    if target_rsids is not None:
+        # Nothing is cleared up front: each source replaces its rows only once
+        # its data arrived, so a failed download keeps the previous load
+        _log(f"       Slim profile: keeping annotations for {len(target_rsids):,} target rsIDs")
+    if sources is None:
+        sources = default_sources()
+    # Sources may share a name (e.g. two PGS scoring files), so each
+    # instance gets its own key: the name, then name#2, name#3, ...
+    by_key = {}
+    for source in sources:
+        key, n = source.name, 1
+        while key in by_key:
+            n += 1
+            key = f"{source.name}#{n}"
+        by_key[key] = source
+    for source in sources:
+        source.prepare(db)
+    initialize.finish()
+
+    # Every source is fetched and parsed on its own thread; batches come
+    # back here so database writes stay on this thread, one at a time.
+    context = SourceContext(
+        data_dir=data_dir,
+        stream=stream,
+        workers=workers,
+        target_rsids=target_rsids,
+        telemetry=telemetry,
+        progress=_CombinedProgress(progress_callback, _log, telemetry),
+        log=_log,
+        phases={id(source): f"ingest:{key}" for key, source in by_key.items()},
+    )
+    producers = {
+        # Bind source per lambda; the threads call these later
+        key: (lambda source=source: _timed(source.batches(context), telemetry.phase(context.phase(source))))
+        for key, source in by_key.items()
+    }
+    counts = {key: 0 for key in by_key}
+    next_report = {key: source.report_every for key, source in by_key.items()}
+    loaded = {}
+    failed = {}
+
+    with closing(_ingest_concurrently(producers)) as batches:
+        for key, batch in batches:
+            source = by_key[key]
+            if isinstance(batch, BaseException):
+                if source.required:
+                    raise batch
+                failed[key] = batch
+                source.fail(db, context, batch, counts[key])
+                continue
+            if batch is None:
+                telemetry.phase(f"ingest:{key}").finish()
+                loaded[key] = source.finish(db, context, counts[key])
+                continue
+            stats = telemetry.phase(f"ingest:{key}")
+            start = time.perf_counter()
+            source.insert(db, batch)
+            stats.insert_seconds += time.perf_counter() - start
+            stats.rows += len(batch)
+            counts[key] += len(batch)
+            if counts[key] >= next_report[key]:
+                _log(f"       ... {counts[key]:,} {source.label} records processed")
+                next_report[key] += source.report_every
+
+    clinvar_count = loaded.get("clinvar", 0)
+    gwas_count = loaded.get("gwas", 0)
+    gwas_downloaded = "gwas" in loaded
 
     # Set metadata
     _log("[6/6] Finalizing database...")
+    finalize = telemetry.phase("finalize").start()
     db.set_metadata("last_update", datetime.now().isoformat())
-    db.set_metadata("clinvar_version", "latest")
-    if gwas_downloaded:
-        db.set_metadata("gwas_version", "latest")
+    db.prune_strings()
+    # Records the rsIDs this load changed and invalidates analysis results
+    # cached against the previous content
+    version = db.bump_data_version()
+    changes = db.change_counts(version)
+    versions = {}
+    for key, source in by_key.items():
+        versions.setdefault(source.name, []).append(source.version() if key in loaded else "unavailable")
+    for name, values in versions.items():
+        db.set_metadata(f"{name}_version", ", ".join(values))
+    # The target set is kept so later updates reload the same rsIDs
+    db.set_target_rsids(target_rsids)
+    if target_rsids is not None:
+        db.set_metadata("profile", "slim")
+        db.set_metadata("target_rsids", str(len(target_rsids)))
+        db.vacuum()
     else:
-        db.set_metadata("gwas_version", "unavailable")
-
-    if gwas_count > 0:
-        _log(f"Done! Database ready with {clinvar_count:,} ClinVar + {gwas_count:,} GWAS records.")
-    else:
-        _log(f"Done! Database ready with {clinvar_count:,} ClinVar records.")
+        db.set_metadata("profile", "full")
+    finalize.finish()
+
+    telemetry.finish()
+    telemetry.info.update(
+        profile="slim" if target_rsids is not None else "full",
+        stream=stream,
+        workers=workers,
+        clinvar_records=clinvar_count,
+        gwas_records=gwas_count,
+        gwas_available=gwas_downloaded,
+        sources={
+            key: {"records": loaded.get(key, 0), "available": key in loaded}
+            for key in by_key
+        },
+        changes=changes,
+    )
+    report_path = Path(report_path) if report_path else data_dir / "ingest_report.json"
+    telemetry.write_report(str(report_path))
+    for key, source in by_key.items():
+        stats = telemetry.phase(f"ingest:{key}").to_dict()
+        filtered = ", ".join(f"{reason} {n:,}" for reason, n in stats["filtered"].items()) or "none"
+        _log(
+            f"       {source.label}: {stats['rows']:,} rows in {stats['wall_seconds']:.1f}s "
+            f"({stats['rows_per_second']:,.0f} rows/s; parse {stats['parse_seconds']:.1f}s, "
+            f"insert {stats['insert_seconds']:.1f}s); filtered: {filtered}"
+        )
+    _log(f"       Ingest report written to {report_path}")
+
+    summary = " + ".join(
+        f"{loaded[key]:,} {source.label}"
+        for key, source in by_key.items()
+        if loaded.get(key) or source.required
+    )
+    _log(f"Done! Database ready with {summary or 'no'} records.")
+    if changes is not None:
+        _log(
+            f"       Since the previous version: {changes['added']:,} rsIDs added, "
+            f"{changes['changed']:,} changed, {changes['removed']:,} removed"
+        )
+    if "gwas" in by_key and gwas_count == 0:
         _log("       GWAS data can be added later with: allelio update")
+
+    return telemetry.report()
@@ -1,108 +1,233 @@
 """GWAS Catalog reference database parser."""
 
-from typing import Generator, Dict, Any, Optional
+import io
+import re
+from typing import IO, Generator, Dict, Any, Iterable, List, Optional, Set, Union
 from pathlib import Path
 
+from .telemetry import SKIP_MALFORMED, SKIP_NO_RSID, SKIP_NOT_TARGETED, count_skip
 
-def parse_gwas(filepath: str) -> Generator[Dict[str, Any], None, None]:
+
+# Separators between rsIDs in the SNPS column: "rs1; rs2", "rs1, rs2", "rs1 x rs2"
+_SNP_SEPARATOR_RE = re.compile(r"\s*[;,]\s*|\s+x\s+", re.IGNORECASE)
+_RSID_RE = re.compile(r"^(?:rs)?(\d+)$", re.IGNORECASE)
+# "rs429358-C" tokens of STRONGEST SNP-RISK ALLELE ("?" when not reported)
+_RISK_ALLELE_RE = re.compile(r"\b(rs\d+)-([ACGTID]+|\?)", re.IGNORECASE)
+
+# association_type values
+ASSOCIATION_SINGLE = "single"
+ASSOCIATION_HAPLOTYPE = "haplotype"
+ASSOCIATION_MULTI = "multi"
+ASSOCIATION_INTERACTION = "interaction"
+
+
+def _normalize_rsid(value: str) -> Optional[str]:
+    """Return "rs<digits>" for an rsID or bare dbSNP number, else None."""
+    match = _RSID_RE.match(value.strip())
+    return f"rs{match.group(1)}" if match else None
+
+
+def _split_snps(snps: str) -> List[str]:
+    """Split a SNPS field into its valid, distinct rsIDs (in order).
+    
+    Tokens that are not rsIDs (e.g. "chr6:32658079", "-") are dropped.
+    """
+    snp_ids = []
+    for token in _SNP_SEPARATOR_RE.split(snps):
+        rsid = _normalize_rsid(token)
+        if rsid and rsid not in snp_ids:
+            snp_ids.append(rsid)
+    return snp_ids
+
+
+def _risk_alleles(field: str) -> Dict[str, Optional[str]]:
+    """Map each rsID of a STRONGEST SNP-RISK ALLELE field to its allele (None if "?")."""
+    return {
+        rsid.lower(): None if allele == "?" else allele.upper()
+        for rsid, allele in _RISK_ALLELE_RE.findall(field)
+    }
+
+
+def _association_type(fields: List[str], col_indices: Dict[str, Optional[int]], snps: str) -> str:
+    """Classify a catalog row as single, haplotype, multi-SNP or interaction."""
+    def flag(col_name):
+        idx = col_indices[col_name]
+        return idx is not None and idx < len(fields) and fields[idx].strip() == "1"
+    
+    if flag("SNP_INTERACTION") or re.search(r"\sx\s", snps, re.IGNORECASE):
+        return ASSOCIATION_INTERACTION
+    if flag("MULTI_SNP_HAPLOTYPE"):
+        return ASSOCIATION_HAPLOTYPE
+    if len(_SNP_SEPARATOR_RE.split(snps)) > 1:
+        return ASSOCIATION_MULTI
+    return ASSOCIATION_SINGLE
+
+
+def parse_gwas(
+    source: Union[str, Path, IO],
+    rsids: Optional[Set[str]] = None,
+    skipped: Optional[Dict[str, int]] = None,
+) -> Generator[Dict[str, Any], None, None]:
     """Parse GWAS associations TSV file.
     
     Args:
-        filepath: Path to GWAS associations file
+        source: Path to GWAS associations file, or an open binary or text
+            stream (e.g. ``zipfile.ZipFile.open()`` on the downloaded archive).
+            Streams are read line by line and left open for the caller.
+        rsids: Optional set of target rsIDs; rows for other rsIDs are skipped
+        skipped: Optional dict counting dropped rows by reason (no_rsid,
+            malformed, not_targeted); updated in place
     
     Yields:
         Dict with keys: rsid, trait, p_value, odds_ratio, mapped_gene, study, pubmed_id, link
     """
-    path = Path(filepath)
+    if not hasattr(source, "read"):
+        with open(Path(source), 'r', encoding='utf-8', errors='ignore') as f:
+            yield from parse_gwas_lines(f, rsids, skipped)
+        return
+
+    if isinstance(source, io.TextIOBase):
+        yield from parse_gwas_lines(source, rsids, skipped)
+        return
+
+    text = io.TextIOWrapper(source, encoding='utf-8', errors='ignore')
+    try:
+        yield from parse_gwas_lines(text, rsids, skipped)
+    finally:
+        # Hand the binary stream back without closing it
+        text.detach()
+
+
+def parse_gwas_lines(
+    lines: Iterable[str],
+    rsids: Optional[Set[str]] = None,
+    skipped: Optional[Dict[str, int]] = None,
+) -> Generator[Dict[str, Any], None, None]:
+    """Parse GWAS associations from an iterable of TSV lines.
+    
+    The first line must be the header. Lines may or may not keep their
+    trailing newline, so this accepts open files and streamed line sources.
+    
+    Args:
+        lines: Iterable of text lines, header first
+        rsids: Optional set of target rsIDs; rows for other rsIDs are skipped
+        skipped: Optional dict counting dropped rows by reason (see parse_gwas)
     
-    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
-        # Read header
-        header = f.readline().rstrip('\n').split('\t')
-        
-        # Find column indices
-        col_indices = {}
-        for col_name in ["SNPS", "SNP_ID_CURRENT", "DISEASE/TRAIT", "P-VALUE", 
-                         "OR or BETA", "MAPPED_GENE", "STUDY", "PUBMEDID", "LINK"]:
-            try:
-                col_indices[col_name] = header.index(col_name)
-            except ValueError:
-                col_indices[col_name] = None
-        
-        # Parse data lines
-        for line_num, line in enumerate(f, 2):
-            fields = line.rstrip('\n').split('\t')
-            
-            # Ensure we have enough fields
-            if len(fields) < max(idx for idx in col_indices.values() if idx is not None):
+    Yields:
+        Dict with keys: rsid, trait, p_value, odds_ratio, mapped_gene, study, pubmed_id, link,
+        association_id, association_type, risk_allele (the rsID's STRONGEST
+        SNP-RISK ALLELE, None if unreported). Multi-SNP associations yield one
+        dict per rsID sharing the association_id (the row's line number).
+    """
+    # Read header
+    lines = iter(lines)
+    header_line = next(lines, None)
+    if header_line is None:
+        return
+    header = header_line.rstrip('\n').split('\t')
+
+    # Find column indices
+    col_indices = {}
+    for col_name in ["SNPS", "SNP_ID_CURRENT", "DISEASE/TRAIT", "P-VALUE", 
+                     "OR or BETA", "MAPPED_GENE", "STUDY", "PUBMEDID", "LINK",
+                     "MULTI_SNP_HAPLOTYPE", "SNP_INTERACTION", "STRONGEST SNP-RISK ALLELE"]:
+        try:
+            col_indices[col_name] = header.index(col_name)
+        except ValueError:
+            col_indices[col_name] = None
+
+    # Parse data lines
+    for line_num, line in enumerate(lines, 2):
+        fields = line.rstrip('\n').split('\t')
+
+        # Ensure we have enough fields
+        if len(fields) < max(idx for idx in col_indices.values() if idx is not None):
+            count_skip(skipped, SKIP_MALFORMED)
+            continue
+
+        try:
+            # Extract rsIDs - SNPS may list several ("rs1; rs2", "rs1 x rs2")
+            snps_field = ""
+            snp_ids = []
+            if col_indices["SNPS"] is not None:
+                snps_field = fields[col_indices["SNPS"]].strip()
+                snp_ids = _split_snps(snps_field)
+
+            # Single-SNP rows: prefer SNP_ID_CURRENT (follows dbSNP merges)
+            if len(snp_ids) <= 1 and col_indices["SNP_ID_CURRENT"] is not None:
+                current = _normalize_rsid(fields[col_indices["SNP_ID_CURRENT"]])
+                if current:
+                    snp_ids = [current]
+
+            # Skip if no valid rsID
+            if not snp_ids:
+                count_skip(skipped, SKIP_NO_RSID)
                 continue
-            
-            try:
-                # Extract rsID - prefer SNP_ID_CURRENT, fall back to SNPS
-                rsid = None
-                if col_indices["SNP_ID_CURRENT"] is not None:
-                    rsid_field = fields[col_indices["SNP_ID_CURRENT"]].strip()
-                    if rsid_field and rsid_field != "-":
-                        rsid = rsid_field
-                
-                if not rsid and col_indices["SNPS"] is not None:
-                    rsid_field = fields[col_indices["SNPS"]].strip()
-                    if rsid_field and rsid_field != "-":
-                        rsid = rsid_field
-                
-                # Skip if no valid rsID
-                if not rsid:
+
+            # Skip rsIDs outside the slim profile's target set
+            if rsids is not None:
+                snp_ids = [rsid for rsid in snp_ids if rsid in rsids]
+                if not snp_ids:
+                    count_skip(skipped, SKIP_NOT_TARGETED)
                     continue
-                
-                # Ensure rsID has "rs" prefix
-                if not rsid.startswith("rs"):
-                    rsid = "rs" + rsid
-                
-                # Extract other fields
-                trait = ""
-                if col_indices["DISEASE/TRAIT"] is not None:
-                    trait = fields[col_indices["DISEASE/TRAIT"]].strip()
-                
-                p_value = None
-                if col_indices["P-VALUE"] is not None:
-                    p_val_str = fields[col_indices["P-VALUE"]].strip()
-                    if p_val_str and p_val_str != "-":
-                        try:
-                            p_value = float(p_val_str)
-                        except ValueError:
-                            pass
-                
-                odds_ratio = None
-                if col_indices["OR or BETA"] is not None:
-                    odds_ratio = fields[col_indices["OR or BETA"]].strip()
-                    if not odds_ratio or odds_ratio == "-":
-                        odds_ratio = None
-                
-                mapped_gene = None
-                if col_indices["MAPPED_GENE"] is not None:
-                    mapped_gene = fields[col_indices["MAPPED_GENE"]].strip()
-                    if not mapped_gene or mapped_gene == "-":
-                        mapped_gene = None
-                
-                study = None
-                if col_indices["STUDY"] is not None:
-                    study = fields[col_indices["STUDY"]].strip()
-                    if not study or study == "-":
-                        study = None
-                
-                pubmed_id = None
-                if col_indices["PUBMEDID"] is not None:
-                    pubmed_id = fields[col_indices["PUBMEDID"]].strip()
-                    if not pubmed_id or pubmed_id == "-":
-                        pubmed_id = None
-                
-                link = None
-                if col_indices["LINK"] is not None:
-                    link = fields[col_indices["LINK"]].strip()
-                    if not link or link == "-":
-                        link = None
-                
-                # Create record
-                record = {
+
+            association_type = _association_type(fields, col_indices, snps_field)
+
+            # Extract other fields
+            trait = ""
+            if col_indices["DISEASE/TRAIT"] is not None:
+                trait = fields[col_indices["DISEASE/TRAIT"]].strip()
+
+            p_value = None
+            if col_indices["P-VALUE"] is not None:
+                p_val_str = fields[col_indices["P-VALUE"]].strip()
+                if p_val_str and p_val_str != "-":
+                    try:
+                        p_value = float(p_val_str)
+                    except ValueError:
+                        pass
+
+            odds_ratio = None
+            if col_indices["OR or BETA"] is not None:
+                odds_ratio = fields[col_indices["OR or BETA"]].strip()
+                if not odds_ratio or odds_ratio == "-":
+                    odds_ratio = None
+
+            mapped_gene = None
+            if col_indices["MAPPED_GENE"] is not None:
+                mapped_gene = fields[col_indices["MAPPED_GENE"]].strip()
+                if not mapped_gene or mapped_gene == "-":
+                    mapped_gene = None
+
+            study = None
+            if col_indices["STUDY"] is not None:
+                study = fields[col_indices["STUDY"]].strip()
+                if not study or study == "-":
+                    study = None
+
+            pubmed_id = None
+            if col_indices["PUBMEDID"] is not None:
+                pubmed_id = fields[col_indices["PUBMEDID"]].strip()
+                if not pubmed_id or pubmed_id == "-":
+                    pubmed_id = None
+
+            link = None
+            if col_indices["LINK"] is not None:
+                link = fields[col_indices["LINK"]].strip()
+                if not link or link == "-":
+                    link = None
+
+            risk_alleles = {}
+            if col_indices["STRONGEST SNP-RISK ALLELE"] is not None:
+                risk_alleles = _risk_alleles(fields[col_indices["STRONGEST SNP-RISK ALLELE"]])
+
+            # One record per rsID, linked by the catalog row's association ID
+            for rsid in snp_ids:
+                risk_allele = risk_alleles.get(rsid)
+                if risk_allele is None and len(snp_ids) == 1 and len(risk_alleles) == 1:
+                    # The allele may be listed under the rsID's pre-merge name
+                    risk_allele = next(iter(risk_alleles.values()))
+                yield {
                     "rsid": rsid,
                     "trait": trait if trait else None,
                     "p_value": p_value,
@@ -111,10 +236,12 @@ def parse_gwas(filepath: str) -> Generator[Dict[str, Any], None, None]:
                     "study": study,
                     "pubmed_id": pubmed_id,
                     "link": link,
+                    "association_id": line_num,
+                    "association_type": association_type,
+                    "risk_allele": risk_allele,
                 }
-                
-                yield record
-                
-            except (IndexError, ValueError):
-                # Skip malformed lines
-                continue
+
+        except (IndexError, ValueError):
+            # Skip malformed lines
+            count_skip(skipped, SKIP_MALFORMED)
+            continue
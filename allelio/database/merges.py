@@ -0,0 +1,134 @@
+"""dbSNP merge history: remapping retired rsIDs to current ones.
+
+When dbSNP merges two reference SNPs the higher rsID is retired in favour of
+the lower one. Raw data from older genotyping chips still reports retired
+IDs, which never match ClinVar or GWAS rows (keyed by current IDs). Loading
+a local merge-history file builds an integer ``rsid_merges`` index (old id →
+current id, one rowid-keyed table) that batch lookups use to resolve those
+IDs before querying annotations.
+
+Supported inputs (optionally .gz or .bz2 compressed):
+    - RsMergeArch.bcp: tab-delimited rsHigh, rsLow, ..., rsCurrent (column 7)
+    - refsnp-merged.json: one JSON object per line with ``refsnp_id`` and
+      ``merged_snapshot_data.merged_into``
+    - a plain two-column "old current" list (tab, comma or space separated,
+      with or without the "rs" prefix)
+"""
+
+import bz2
+import gzip
+import json
+import re
+from typing import Callable, Generator, Optional, Tuple
+
+
+_ID_RE = re.compile(r"^(?:rs)?(\d+)$", re.IGNORECASE)
+_SPLIT_RE = re.compile(r"[\t,\s]+")
+
+# RsMergeArch.bcp columns
+_RSMERGEARCH_HIGH = 0
+_RSMERGEARCH_LOW = 1
+_RSMERGEARCH_CURRENT = 6
+
+
+def _open_text(filepath: str):
+    if filepath.endswith(".gz"):
+        return gzip.open(filepath, "rt", encoding="utf-8", errors="replace")
+    if filepath.endswith(".bz2"):
+        return bz2.open(filepath, "rt", encoding="utf-8", errors="replace")
+    return open(filepath, "r", encoding="utf-8", errors="replace")
+
+
+def _rs_number(value: str) -> Optional[int]:
+    match = _ID_RE.match(value.strip().strip('"'))
+    return int(match.group(1)) if match else None
+
+
+def _parse_json_line(line: str) -> Optional[Tuple[int, int]]:
+    try:
+        entry = json.loads(line)
+        old = int(entry["refsnp_id"])
+        merged_into = entry["merged_snapshot_data"]["merged_into"]
+        return old, int(merged_into[0])
+    except (ValueError, KeyError, IndexError, TypeError):
+        return None
+
+
+def _parse_delimited_line(line: str) -> Optional[Tuple[int, int]]:
+    fields = _SPLIT_RE.split(line.strip()) if "\t" not in line else line.rstrip("\n").split("\t")
+    if len(fields) > _RSMERGEARCH_CURRENT:
+        # RsMergeArch: prefer rsCurrent (already follows merge chains), else rsLow
+        old = _rs_number(fields[_RSMERGEARCH_HIGH])
+        current = _rs_number(fields[_RSMERGEARCH_CURRENT]) or _rs_number(fields[_RSMERGEARCH_LOW])
+    elif len(fields) >= 2:
+        old, current = _rs_number(fields[0]), _rs_number(fields[1])
+    else:
+        return None
+    if old is None or current is None:
+        return None
+    return old, current
+
+
+def parse_merge_history(filepath: str) -> Generator[Tuple[int, int], None, None]:
+    """Parse a dbSNP merge-history file into (old, current) rs numbers.
+
+    Headers, comments and malformed lines are skipped, as are self-merges.
+
+    Args:
+        filepath: Path to RsMergeArch.bcp, refsnp-merged.json or a two-column list
+
+    Yields:
+        (old_rs_number, current_rs_number) tuples
+    """
+    with _open_text(filepath) as f:
+        for line in f:
+            if not line.strip() or line.startswith("#"):
+                continue
+            pair = _parse_json_line(line) if line.lstrip().startswith("{") else _parse_delimited_line(line)
+            if pair is not None and pair[0] != pair[1]:
+                yield pair
+
+
+def load_merge_history(
+    db,
+    filepath: str,
+    batch_size: int = 50000,
+    log: Optional[Callable] = None,
+) -> int:
+    """Load a dbSNP merge-history file into a database's remap index.
+
+    Existing entries for the same retired IDs are replaced. After loading,
+    merge chains (a → b, b → c) are collapsed so every entry points at the
+    current rsID.
+
+    Args:
+        db: AllelioDB or ShardedAllelioDB
+        filepath: Merge-history file (see parse_merge_history)
+        batch_size: Pairs inserted per batch
+        log: Optional function to print status messages
+
+    Returns:
+        Number of merge entries read
+    """
+    def _log(msg):
+        if log:
+            log(msg)
+
+    db.initialize()
+    count = 0
+    batch = []
+    for pair in parse_merge_history(filepath):
+        batch.append(pair)
+        if len(batch) >= batch_size:
+            db.insert_merges_batch(batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        db.insert_merges_batch(batch)
+        count += len(batch)
+
+    passes = db.flatten_merges()
+    # Remapped lookups can change analysis results
+    db.bump_data_version()
+    _log(f"Loaded {count:,} rsID merges ({passes} chain-collapsing passes)")
+    return count
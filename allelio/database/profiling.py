@@ -0,0 +1,225 @@
+"""Opt-in SQL instrumentation for the Allelio store.
+
+Attach a QueryProfiler to an AllelioDB to time every statement it issues,
+count the rows it returns or writes, and capture ``EXPLAIN QUERY PLAN`` for
+statements slower than a threshold. Statements are grouped by shape (the SQL
+with whitespace collapsed and ``IN (?,?,...)`` lists folded), so a summary
+shows where time goes and whether a hot query fell back to a full scan.
+
+Example:
+    profiler = QueryProfiler(threshold_ms=20, log_path="slow_queries.jsonl")
+    db = AllelioDB(profiler=profiler)
+    analyze_variants(variants, db)
+    for row in profiler.summary():
+        print(row["shape"], row["total_ms"], row["plan"])
+"""
+
+import json
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_PLACEHOLDER_LIST_RE = re.compile(r"\bIN \(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+
+
+def query_shape(sql: str) -> str:
+    """Normalize SQL text so statements differing only in batch size group together.
+
+    Args:
+        sql: SQL statement text
+
+    Returns:
+        Single-line SQL with ``IN (?, ?, ...)`` lists folded to ``IN (?, ...)``
+    """
+    shape = _WHITESPACE_RE.sub(" ", sql).strip()
+    return _PLACEHOLDER_LIST_RE.sub("IN (?, ...)", shape)
+
+
+class QueryProfiler:
+    """Collects per-shape timings, row counts and slow query plans."""
+
+    def __init__(self, threshold_ms: float = 50.0, log_path: Optional[str] = None):
+        """Create a profiler.
+
+        Args:
+            threshold_ms: Statements taking longer than this (execute plus
+                fetch) get their query plan captured and are logged as slow
+            log_path: Optional JSON-lines file to append slow statements to
+        """
+        self.threshold_ms = threshold_ms
+        self.log_path = Path(log_path) if log_path else None
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, shape: str, elapsed_ms: float, rows: int, calls: int = 0) -> Dict[str, Any]:
+        """Add time and rows to a statement shape.
+
+        Args:
+            shape: Normalized statement text
+            elapsed_ms: Time spent in this step
+            rows: Rows returned or written in this step
+            calls: 1 when the step is a new execution, 0 for follow-up fetches
+
+        Returns:
+            The shape's stats dict
+        """
+        with self._lock:
+            stats = self._stats.get(shape)
+            if stats is None:
+                stats = self._stats[shape] = {
+                    "shape": shape,
+                    "calls": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "rows": 0,
+                    "slow_calls": 0,
+                    "plan": None,
+                }
+            stats["calls"] += calls
+            stats["total_ms"] += elapsed_ms
+            stats["rows"] += rows
+            return stats
+
+    def finish_call(self, shape: str, call_ms: float, plan: Optional[List[str]]) -> None:
+        """Record the full duration of one execution and any captured plan."""
+        with self._lock:
+            stats = self._stats[shape]
+            stats["max_ms"] = max(stats["max_ms"], call_ms)
+            if plan is not None:
+                stats["slow_calls"] += 1
+                stats["plan"] = plan
+
+        if plan is not None and self.log_path:
+            entry = {
+                "at": datetime.now().isoformat(),
+                "shape": shape,
+                "elapsed_ms": round(call_ms, 3),
+                "plan": plan,
+            }
+            with self._lock, open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """Return per-shape statistics, slowest total first.
+
+        Each dict has: shape, calls, total_ms, mean_ms, max_ms, rows,
+        slow_calls, plan (list of plan lines or None) and full_scan (True if
+        the captured plan scans a table instead of using an index).
+        """
+        with self._lock:
+            rows = [dict(stats) for stats in self._stats.values()]
+
+        for stats in rows:
+            stats["mean_ms"] = stats["total_ms"] / stats["calls"] if stats["calls"] else 0.0
+            stats["full_scan"] = any(
+                line.startswith("SCAN") and "USING" not in line
+                for line in (stats["plan"] or [])
+            )
+        rows.sort(key=lambda s: s["total_ms"], reverse=True)
+        return rows
+
+    def write_summary(self, path: str) -> None:
+        """Write the summary as a JSON document."""
+        Path(path).write_text(json.dumps(self.summary(), indent=2))
+
+    def reset(self) -> None:
+        """Discard all collected statistics."""
+        with self._lock:
+            self._stats.clear()
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Cursor that reports execute and fetch timings to a QueryProfiler."""
+
+    profiler: QueryProfiler = None
+
+    def _begin(self, sql: str, elapsed_ms: float, rows: int, params: Any) -> None:
+        self._shape = query_shape(sql)
+        self._sql = sql
+        self._params = params
+        self._call_ms = elapsed_ms
+        self._planned = False
+        self.profiler.record(self._shape, elapsed_ms, rows, calls=1)
+        self._check_slow()
+
+    def _check_slow(self) -> None:
+        if self._planned or self._call_ms < self.profiler.threshold_ms:
+            return
+        self._planned = True
+        plan = None
+        try:
+            # A plain cursor, so capturing the plan is not itself profiled
+            explain = sqlite3.Cursor(self.connection)
+            explain.execute("EXPLAIN QUERY PLAN " + self._sql, self._params)
+            plan = [row[-1] for row in explain.fetchall()]
+        except sqlite3.Error:
+            plan = []
+        self.profiler.finish_call(self._shape, self._call_ms, plan)
+
+    def _after_fetch(self, elapsed_ms: float, rows: int) -> None:
+        if getattr(self, "_shape", None) is None:
+            return
+        self._call_ms += elapsed_ms
+        self.profiler.record(self._shape, elapsed_ms, rows)
+        self.profiler.finish_call(self._shape, self._call_ms, None)
+        self._check_slow()
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        result = super().execute(sql, parameters)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self._begin(sql, elapsed_ms, max(self.rowcount, 0), parameters)
+        self.profiler.finish_call(self._shape, self._call_ms, None)
+        return result
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        result = super().executemany(sql, seq_of_parameters)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        # Plans for executemany would need one parameter row; record without one
+        self._shape = query_shape(sql)
+        self.profiler.record(self._shape, elapsed_ms, max(self.rowcount, 0), calls=1)
+        self.profiler.finish_call(
+            self._shape, elapsed_ms, [] if elapsed_ms >= self.profiler.threshold_ms else None
+        )
+        self._shape = None
+        return result
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._after_fetch((time.perf_counter() - start) * 1000, 1 if row is not None else 0)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._after_fetch((time.perf_counter() - start) * 1000, len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._after_fetch((time.perf_counter() - start) * 1000, len(rows))
+        return rows
+
+
+def profiled_connection_factory(profiler: QueryProfiler):
+    """Build an sqlite3.Connection subclass whose cursors report to profiler.
+
+    Pass the result as ``factory=`` to sqlite3.connect. Connection.execute
+    goes through cursor(), so shortcut calls are profiled as well.
+    """
+    cursor_class = type("BoundProfiledCursor", (ProfiledCursor,), {"profiler": profiler})
+
+    class ProfiledConnection(sqlite3.Connection):
+        def cursor(self, factory=cursor_class):
+            return super().cursor(factory)
+
+    return ProfiledConnection
@@ -0,0 +1,601 @@
+"""Sharded annotation storage with parallel batch lookup.
+
+A sharded database is a directory of ordinary AllelioDB files, each holding
+the annotation rows (ClinVar, GWAS and plugin sources) for one rsID hash
+range, plus a small manifest. Batch lookups fan out across shards on a thread pool (sqlite3 releases the
+GIL while a query runs), and a single shard can be rebuilt from an updated
+single-file database without touching the others (rebuild_shard).
+
+ShardedAllelioDB exposes the same read/write methods as AllelioDB, so it can
+be passed anywhere an AllelioDB is expected (setup_database, analyze_variants).
+"""
+
+import json
+import os
+import threading
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+from .profiling import QueryProfiler
+from .sources import AnnotationSource
+from .store import AllelioDB
+
+
+MANIFEST_NAME = "shards.json"
+
+DEFAULT_SHARD_COUNT = 16
+
+
+def shard_index(rsid: str, shard_count: int) -> int:
+    """Return the shard number that holds an rsID.
+
+    Numeric rsIDs ("rs123") are sharded by their number so consecutive IDs
+    spread evenly; anything else falls back to a CRC32 of the string.
+
+    Args:
+        rsid: The rsID to place
+        shard_count: Total number of shards
+
+    Returns:
+        Shard number in the range [0, shard_count)
+    """
+    if rsid.startswith("rs") and rsid[2:].isdigit():
+        return int(rsid[2:]) % shard_count
+    return zlib.crc32(rsid.encode("utf-8")) % shard_count
+
+
+class ShardedAllelioDB:
+    """A directory of rsID-hash-range AllelioDB shards."""
+
+    def __init__(
+        self,
+        shard_dir: Optional[str] = None,
+        shard_count: Optional[int] = None,
+        max_workers: Optional[int] = None,
+        profiler: Optional[QueryProfiler] = None,
+    ):
+        """Open or create a sharded database.
+
+        Args:
+            shard_dir: Directory holding the shards. Defaults to ~/.allelio/data/shards
+            shard_count: Number of shards when creating a new layout. Ignored
+                (and checked) when the directory already has a manifest.
+            max_workers: Thread pool size for batch lookups. Defaults to
+                min(shard_count, CPU count).
+            profiler: Optional QueryProfiler shared by all shards
+
+        Raises:
+            ValueError: If shard_count conflicts with an existing manifest
+        """
+        if shard_dir is None:
+            shard_dir = os.path.expanduser("~/.allelio/data/shards")
+
+        self.shard_dir = Path(shard_dir)
+        self.shard_dir.mkdir(parents=True, exist_ok=True)
+
+        manifest_path = self.shard_dir / MANIFEST_NAME
+        if manifest_path.exists():
+            manifest = json.loads(manifest_path.read_text())
+            if shard_count is not None and shard_count != manifest["shard_count"]:
+                raise ValueError(
+                    f"{self.shard_dir} already has {manifest['shard_count']} shards, not {shard_count}"
+                )
+            shard_count = manifest["shard_count"]
+        else:
+            shard_count = shard_count or DEFAULT_SHARD_COUNT
+            manifest_path.write_text(json.dumps({"format": 1, "shard_count": shard_count}))
+
+        self.shard_count = shard_count
+        self.db_path = self.shard_dir
+        self.shards = [
+            AllelioDB(str(self.shard_path(i)), check_same_thread=False, profiler=profiler)
+            for i in range(shard_count)
+        ]
+        # One lock per shard: connections are shared across pool threads
+        self._locks = [threading.Lock() for _ in range(shard_count)]
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or min(shard_count, os.cpu_count() or 1),
+            thread_name_prefix="allelio-shard",
+        )
+
+    def shard_path(self, index: int) -> Path:
+        """Return the file path of one shard."""
+        return self.shard_dir / f"shard_{index:03d}.db"
+
+    def shard_for(self, rsid: str) -> AllelioDB:
+        """Return the shard that holds an rsID."""
+        return self.shards[shard_index(rsid, self.shard_count)]
+
+    def _partition(self, records: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """Split records into per-shard lists by their rsid key."""
+        parts = [[] for _ in range(self.shard_count)]
+        for record in records:
+            parts[shard_index(record["rsid"], self.shard_count)].append(record)
+        return parts
+
+    def _each_shard(self, fn: Callable[[int, AllelioDB], Any]) -> List[Any]:
+        """Run fn(index, shard) on every shard in parallel, holding its lock."""
+        def run(index):
+            with self._locks[index]:
+                return fn(index, self.shards[index])
+
+        return list(self._executor.map(run, range(self.shard_count)))
+
+    def initialize(self) -> None:
+        """Create tables and indexes in every shard."""
+        self._each_shard(lambda i, shard: shard.initialize())
+
+    def insert_clinvar_batch(self, records: List[Dict[str, Any]]) -> None:
+        """Route ClinVar records to their shards and insert them."""
+        parts = self._partition(records)
+        self._each_shard(lambda i, shard: shard.insert_clinvar_batch(parts[i]))
+
+    def insert_gwas_batch(self, records: List[Dict[str, Any]]) -> None:
+        """Route GWAS records to their shards and insert them."""
+        parts = self._partition(records)
+        self._each_shard(lambda i, shard: shard.insert_gwas_batch(parts[i]))
+
+    def stage_clinvar_batch(self, records: List[Dict[str, Any]]) -> None:
+        """Route raw ClinVar records to their shards' staging tables."""
+        parts = self._partition(records)
+        self._each_shard(lambda i, shard: shard.stage_clinvar_batch(parts[i]))
+
+    def stage_gwas_batch(self, records: List[Dict[str, Any]]) -> None:
+        """Route GWAS records to their shards' staging tables."""
+        parts = self._partition(records)
+        self._each_shard(lambda i, shard: shard.stage_gwas_batch(parts[i]))
+
+    def iter_staged_gwas(self, batch_size: int = 10000):
+        """Yield staged GWAS records shard by shard (see iter_staged_clinvar for locking)."""
+        for index, shard in enumerate(self.shards):
+            batches = shard.iter_staged_gwas(batch_size)
+            while True:
+                with self._locks[index]:
+                    batch = next(batches, None)
+                if batch is None:
+                    break
+                yield batch
+
+    def discard_staged_gwas(self) -> None:
+        """Drop staged GWAS rows in every shard."""
+        self._each_shard(lambda i, shard: shard.discard_staged_gwas())
+
+    def delete_unstaged_clinvar(self) -> int:
+        """Delete ClinVar rows missing from each shard's staging table."""
+        return sum(self._each_shard(lambda i, shard: shard.delete_unstaged_clinvar()))
+
+    def iter_staged_clinvar(self, batch_size: int = 10000):
+        """Yield staged ClinVar records shard by shard, ordered by rsID within each.
+
+        An rsID lives in exactly one shard, so its rows stay adjacent. The
+        shard lock is held only while a batch is read, so the caller may
+        insert between batches.
+        """
+        for index, shard in enumerate(self.shards):
+            batches = shard.iter_staged_clinvar(batch_size)
+            while True:
+                with self._locks[index]:
+                    batch = next(batches, None)
+                if batch is None:
+                    break
+                yield batch
+
+    def iter_records(self, table: str, batch_size: int = 10000):
+        """Yield batches of an annotation table's rows shard by shard (see AllelioDB.iter_records)."""
+        for index, shard in enumerate(self.shards):
+            batches = shard.iter_records(table, batch_size)
+            while True:
+                with self._locks[index]:
+                    batch = next(batches, None)
+                if batch is None:
+                    break
+                yield batch
+
+    def initialize_source(self, source) -> None:
+        """Create an annotation-source plugin's table in every shard."""
+        self._each_shard(lambda i, shard: shard.initialize_source(source))
+
+    def source_tables(self) -> Dict[str, str]:
+        """Return plugin source name -> table for every registered source."""
+        with self._locks[0]:
+            return self.shards[0].source_tables()
+
+    def insert_source_batch(self, source, records: List[Dict[str, Any]]) -> None:
+        """Route plugin source records to their shards and insert them."""
+        parts = self._partition(records)
+        self._each_shard(lambda i, shard: shard.insert_source_batch(source, parts[i]))
+
+    def clear_source(self, source, where: Optional[Dict[str, Any]] = None) -> None:
+        """Delete a plugin source's rows in every shard."""
+        self._each_shard(lambda i, shard: shard.clear_source(source, where))
+
+    def clear_annotations(self, tables: tuple = ("clinvar", "gwas")) -> None:
+        """Delete annotation rows in every shard."""
+        self._each_shard(lambda i, shard: shard.clear_annotations(tables))
+
+    def prune_strings(self) -> int:
+        """Delete unreferenced interned strings in every shard."""
+        return sum(self._each_shard(lambda i, shard: shard.prune_strings()))
+
+    def vacuum(self) -> None:
+        """Vacuum every shard."""
+        self._each_shard(lambda i, shard: shard.vacuum())
+
+    def _globalize_refs(self, index: int, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Rewrite shard-local string references so they name their shard.
+
+        Each shard interns strings independently, so a reference is encoded
+        as local_id * shard_count + shard_index to stay unambiguous.
+        """
+        for row in result["clinvar"]:
+            if row.get("conditions_id") is not None:
+                row["conditions_id"] = row["conditions_id"] * self.shard_count + index
+        for row in result["gwas"]:
+            if row.get("study_id") is not None:
+                row["study_id"] = row["study_id"] * self.shard_count + index
+        return result
+
+    def resolve_string(self, ref: Optional[int]) -> Optional[str]:
+        """Resolve a string reference returned by this store's lookups."""
+        if ref is None:
+            return None
+        index = ref % self.shard_count
+        with self._locks[index]:
+            return self.shards[index].resolve_string(ref // self.shard_count)
+
+    def lookup_rsid(self, rsid: str) -> Dict[str, Any]:
+        """Look up combined ClinVar and GWAS data for a single rsID."""
+        current = self.remap_rsids([rsid]).get(rsid)
+        index = shard_index(current or rsid, self.shard_count)
+        with self._locks[index]:
+            result = self._globalize_refs(index, self.shards[index].lookup_rsid(current or rsid))
+        if current is not None:
+            result["current_rsid"] = current
+        return result
+
+    def lookup_rsids_batch(self, rsids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Batch lookup fanned out across shards in parallel.
+
+        Args:
+            rsids: List of rsIDs to look up
+
+        Returns:
+            Dict mapping rsid -> {clinvar: [...], gwas: [...]}, in input order
+        """
+        if not rsids:
+            return {}
+
+        # Retired rsIDs are routed to the shard holding their current ID
+        remapped = self.remap_rsids(rsids)
+
+        parts = [[] for _ in range(self.shard_count)]
+        for rsid in dict.fromkeys(remapped.get(r, r) for r in rsids):
+            parts[shard_index(rsid, self.shard_count)].append(rsid)
+
+        def lookup(i, shard):
+            if not parts[i]:
+                return {}
+            found = shard.lookup_rsids_batch(parts[i])
+            for result in found.values():
+                self._globalize_refs(i, result)
+            return found
+
+        shard_results = self._each_shard(lookup)
+
+        merged = {}
+        for part in shard_results:
+            merged.update(part)
+        result = {}
+        for rsid in rsids:
+            current = remapped.get(rsid)
+            result[rsid] = merged[rsid] if current is None else {**merged[current], "current_rsid": current}
+        return result
+
+    def insert_merges_batch(self, pairs: List[tuple]) -> None:
+        """Add dbSNP merge entries to the remap index (stored in shard 0)."""
+        with self._locks[0]:
+            self.shards[0].insert_merges_batch(pairs)
+
+    def flatten_merges(self) -> int:
+        """Collapse merge chains in the remap index."""
+        with self._locks[0]:
+            return self.shards[0].flatten_merges()
+
+    def remap_rsids(self, rsids: List[str]) -> Dict[str, str]:
+        """Resolve retired rsIDs to current ones through the merge index."""
+        with self._locks[0]:
+            return self.shards[0].remap_rsids(rsids)
+
+    def lookup_association(self, association_id: int) -> List[Dict[str, Any]]:
+        """Return every GWAS row of one catalog association, across shards."""
+        def lookup(i, shard):
+            rows = shard.lookup_association(association_id)
+            return self._globalize_refs(i, {"clinvar": [], "gwas": rows})["gwas"]
+
+        rows = [row for part in self._each_shard(lookup) for row in part]
+        return sorted(rows, key=lambda row: row["rsid"])
+
+    def set_metadata(self, key: str, value: str) -> None:
+        """Set a metadata key-value pair (stored in shard 0)."""
+        with self._locks[0]:
+            self.shards[0].set_metadata(key, value)
+
+    def get_metadata(self, key: str) -> Optional[str]:
+        """Get a metadata value by key (stored in shard 0)."""
+        with self._locks[0]:
+            return self.shards[0].get_metadata(key)
+
+    def set_target_rsids(self, rsids: Optional[Iterable[str]]) -> None:
+        """Store the slim profile's target rsIDs (in shard 0)."""
+        with self._locks[0]:
+            self.shards[0].set_target_rsids(rsids)
+
+    def get_target_rsids(self) -> Optional[Set[str]]:
+        """Return the stored slim-profile target rsIDs (from shard 0)."""
+        with self._locks[0]:
+            return self.shards[0].get_target_rsids()
+
+    def data_version(self) -> str:
+        """Return the annotation data version (stored in shard 0)."""
+        with self._locks[0]:
+            return self.shards[0].data_version()
+
+    def bump_data_version(self) -> str:
+        """Assign a new annotation data version (stored in shard 0).
+
+        Every shard records the rsIDs it changed under the new version.
+        """
+        version = uuid.uuid4().hex
+        self._each_shard(lambda i, shard: shard.record_changes(version))
+        self.set_metadata("data_version", version)
+        return version
+
+    def change_counts(self, version: str) -> Optional[Dict[str, int]]:
+        """Return the added/changed/removed rsID counts of a data version, summed over shards."""
+        per_shard = self._each_shard(lambda i, shard: shard.change_counts(version))
+        if any(counts is None for counts in per_shard):
+            return None
+        return {kind: sum(counts[kind] for counts in per_shard) for kind in ("added", "changed", "removed")}
+
+    def merged_into(self, rsids) -> set:
+        """Return the retired rsIDs that resolve to any of the given rsIDs (merges live in shard 0)."""
+        with self._locks[0]:
+            return self.shards[0].merged_into(rsids)
+
+    def changes_since(self, version: str) -> Optional[set]:
+        """Return the rsIDs whose lookup results may differ from a data version's.
+
+        Returns:
+            Set of rsIDs, or None if any shard lacks the change sets since that version
+        """
+        per_shard = self._each_shard(lambda i, shard: shard._logged_changes(version))
+        if any(changed is None for changed in per_shard):
+            return None
+        changed = set().union(*per_shard)
+        return changed | self.merged_into(changed)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get database statistics summed across shards.
+
+        Returns:
+            Dict with counts and metadata
+        """
+        per_shard = self._each_shard(lambda i, shard: shard.get_stats())
+        clinvar_count = sum(s["clinvar_entries"] for s in per_shard)
+        gwas_count = sum(s["gwas_entries"] for s in per_shard)
+
+        return {
+            "clinvar_entries": clinvar_count,
+            "gwas_entries": gwas_count,
+            "variant_count": clinvar_count + gwas_count,
+            # Genes can span shards, so this is an upper bound
+            "gene_count": sum(s["gene_count"] for s in per_shard),
+            "last_update": self.get_metadata("last_update"),
+            "db_path": str(self.shard_dir),
+            "shard_count": self.shard_count,
+        }
+
+    def is_initialized(self) -> bool:
+        """Check whether any shard contains ClinVar data."""
+        return any(self._each_shard(lambda i, shard: shard.is_initialized()))
+
+    def version(self) -> str:
+        """Return a human-readable version/status string for the database."""
+        last_update = self.get_metadata("last_update") or "unknown"
+        return f"Updated: {last_update} ({self.shard_count} shards)"
+
+    def close(self) -> None:
+        """Close all shard connections and the lookup pool."""
+        self._executor.shutdown(wait=True)
+        for shard in self.shards:
+            shard.close()
+
+    def __enter__(self):
+        """Context manager entry."""
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Context manager exit."""
+        self.close()
+
+
+def open_database(
+    path: Optional[str] = None,
+    check_same_thread: bool = True,
+    profiler: Optional[QueryProfiler] = None,
+):
+    """Open the configured database, single-file or sharded.
+
+    Args:
+        path: Database file or shard directory. Defaults to the ALLELIO_DB
+            environment variable, then ~/.allelio/data/allelio.db
+        check_same_thread: Passed to AllelioDB (shards are always shareable)
+        profiler: Optional QueryProfiler
+
+    Returns:
+        A ShardedAllelioDB if path is a directory with a shard manifest,
+        otherwise an AllelioDB
+    """
+    path = path or os.environ.get("ALLELIO_DB")
+    if path:
+        path = os.path.expanduser(path)
+        if Path(path).is_dir():
+            if not (Path(path) / MANIFEST_NAME).exists():
+                raise ValueError(f"{path} is not a shard directory (no {MANIFEST_NAME})")
+            return ShardedAllelioDB(path, profiler=profiler)
+    return AllelioDB(path, check_same_thread=check_same_thread, profiler=profiler)
+
+
+def _stored_source(db: AllelioDB, name: str, table: str) -> AnnotationSource:
+    """Rebuild a registered plugin source's definition from its table in db."""
+    source = AnnotationSource()
+    source.name = name
+    source.table = table
+    source.label = db.conn.execute(
+        "SELECT label FROM annotation_sources WHERE name = ?", (name,)
+    ).fetchone()[0]
+    source.columns = {
+        row[1]: row[2]
+        for row in db.conn.execute(f"PRAGMA table_info({table})").fetchall()
+        if row[1] not in ("id", "rsid")
+    }
+    prefix = f"idx_{table}_"
+    source.indexes = tuple(
+        row[1][len(prefix):]
+        for row in db.conn.execute(f"PRAGMA index_list({table})").fetchall()
+        if row[1].startswith(prefix) and row[1][len(prefix):] in source.columns
+    )
+    return source
+
+
+def shard_database(
+    db: AllelioDB,
+    shard_dir: str,
+    shard_count: int = DEFAULT_SHARD_COUNT,
+    batch_size: int = 10000,
+    log: Optional[Callable] = None,
+) -> ShardedAllelioDB:
+    """Split an existing single-file database into a sharded layout.
+
+    Args:
+        db: Source AllelioDB
+        shard_dir: Empty directory to create the shards in
+        shard_count: Number of rsID hash-range shards
+        batch_size: Rows copied per insert batch
+        log: Optional function to print status messages
+
+    Returns:
+        The new ShardedAllelioDB (caller closes it)
+    """
+    def _log(msg):
+        if log:
+            log(msg)
+
+    sharded = ShardedAllelioDB(shard_dir, shard_count=shard_count)
+    sharded.initialize()
+
+    for table, insert in (("clinvar", sharded.insert_clinvar_batch),
+                          ("gwas", sharded.insert_gwas_batch)):
+        copied = 0
+        for batch in db.iter_records(table, batch_size):
+            insert(batch)
+            copied += len(batch)
+        _log(f"Copied {copied:,} {table} rows into {shard_count} shards")
+
+    for name, table in db.source_tables().items():
+        source = _stored_source(db, name, table)
+        sharded.initialize_source(source)
+        copied = 0
+        for batch in db.iter_records(table, batch_size):
+            sharded.insert_source_batch(source, batch)
+            copied += len(batch)
+        _log(f"Copied {copied:,} {source.label or name} rows into {shard_count} shards")
+
+    merges = 0
+    for batch in db.iter_merges(batch_size):
+        sharded.insert_merges_batch(batch)
+        merges += len(batch)
+    if merges:
+        _log(f"Copied {merges:,} rsID merges into shard 0")
+
+    for row in db.conn.execute("SELECT key, value FROM metadata").fetchall():
+        sharded.set_metadata(row[0], row[1])
+    # A slim database stays slim: `update` reloads the same target rsIDs
+    sharded.set_target_rsids(db.get_target_rsids())
+    # The shards intern strings under their own ids, so anything keyed by
+    # the source's data version (cached analyses) must not match them
+    sharded.bump_data_version()
+
+    return sharded
+
+
+def rebuild_shard(
+    db: AllelioDB,
+    sharded: ShardedAllelioDB,
+    index: int,
+    batch_size: int = 10000,
+    log: Optional[Callable] = None,
+) -> int:
+    """Reload one shard's annotation rows from a single-file database.
+
+    Only rows whose rsID hashes to the shard are copied and the other shards'
+    annotation rows are left alone (they just log an empty change set for
+    the new data version), so an updated single-file database can be pushed
+    out one shard at a time. Metadata and merge history are left as they are.
+
+    Args:
+        db: Source AllelioDB, e.g. freshly updated
+        sharded: Existing sharded database to update
+        index: Shard number to rebuild
+        batch_size: Rows read from db per batch
+        log: Optional function to print status messages
+
+    Returns:
+        Number of rows copied into the shard
+
+    Raises:
+        ValueError: If index is not a shard of sharded
+    """
+    def _log(msg):
+        if log:
+            log(msg)
+
+    if not 0 <= index < sharded.shard_count:
+        raise ValueError(f"Shard {index} out of range (0-{sharded.shard_count - 1})")
+
+    def owned(batch):
+        return [row for row in batch if shard_index(row["rsid"], sharded.shard_count) == index]
+
+    sources = [_stored_source(db, name, table) for name, table in db.source_tables().items()]
+    registered = sharded.source_tables()
+    for source in sources:
+        if registered.get(source.name) != source.table:
+            # A source new since sharding gets its (empty) table in every shard
+            sharded.initialize_source(source)
+
+    shard = sharded.shards[index]
+    copied = 0
+    with sharded._locks[index]:
+        shard.clear_annotations()
+        for name, table in shard.source_tables().items():
+            shard.clear_source(_stored_source(shard, name, table))
+
+        for table, insert in (("clinvar", shard.insert_clinvar_batch),
+                              ("gwas", shard.insert_gwas_batch)):
+            for batch in db.iter_records(table, batch_size):
+                rows = owned(batch)
+                insert(rows)
+                copied += len(rows)
+        for source in sources:
+            for batch in db.iter_records(source.table, batch_size):
+                rows = owned(batch)
+                shard.insert_source_batch(source, rows)
+                copied += len(rows)
+    _log(f"Copied {copied:,} rows into shard {index}")
+
+    # The shard's string ids changed, so cached analyses must not match
+    sharded.bump_data_version()
+    return copied
@@ -0,0 +1,205 @@
+"""Export and restore prebuilt database snapshots.
+
+A snapshot is a single file containing a compacted copy of a built Allelio
+database, so new machines can be provisioned without downloading and
+reparsing ClinVar and the GWAS Catalog.
+
+Snapshot layout:
+- Magic line: ``ALLELIO-SNAPSHOT 1``
+- Manifest line: JSON with the SHA-256 and size of the uncompressed database
+  plus the database metadata at export time
+- Payload: gzip-compressed SQLite database file
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from .store import AllelioDB
+
+
+SNAPSHOT_MAGIC = b"ALLELIO-SNAPSHOT 1\n"
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def _read_header(f) -> Dict[str, Any]:
+    """Read and validate the magic line and manifest from an open snapshot.
+
+    Args:
+        f: Binary file object positioned at the start of the snapshot
+
+    Returns:
+        Parsed manifest dict
+
+    Raises:
+        ValueError: If the file is not an Allelio snapshot
+    """
+    magic = f.readline()
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError("Not an Allelio database snapshot")
+
+    try:
+        return json.loads(f.readline().decode("utf-8"))
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Corrupt snapshot manifest: {e}")
+
+
+def export_snapshot(
+    db: AllelioDB,
+    dest_path: str,
+    compresslevel: int = 6,
+    log: Optional[Callable] = None,
+) -> Dict[str, Any]:
+    """Write a compressed, checksummed snapshot of a built database.
+
+    The database is first compacted with ``VACUUM INTO`` so the snapshot
+    is a consistent copy without free pages or WAL contents.
+
+    Args:
+        db: AllelioDB instance to export
+        dest_path: Path to write the snapshot file to
+        compresslevel: gzip compression level (1-9)
+        log: Optional function to print status messages
+
+    Returns:
+        The manifest written into the snapshot
+
+    Raises:
+        RuntimeError: If the database has not been set up
+    """
+    def _log(msg):
+        if log:
+            log(msg)
+
+    if not db.is_initialized():
+        raise RuntimeError("Database is not initialized — nothing to export")
+
+    dest_path = Path(dest_path)
+    dest_path.parent.mkdir(parents=True, exist_ok=True)
+
+    with tempfile.TemporaryDirectory(dir=str(dest_path.parent)) as tmp:
+        compact_path = Path(tmp) / "allelio.db"
+        _log("Compacting database...")
+        db.conn.commit()
+        db.cursor.execute("VACUUM INTO ?", (str(compact_path),))
+
+        # Hash the compacted file before writing so the manifest can lead
+        sha256 = hashlib.sha256()
+        with open(compact_path, "rb") as src:
+            for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                sha256.update(chunk)
+
+        cursor = db.conn.execute("SELECT key, value FROM metadata")
+        manifest = {
+            "format": 1,
+            "created_at": datetime.now().isoformat(),
+            "sha256": sha256.hexdigest(),
+            "size": compact_path.stat().st_size,
+            "metadata": {row[0]: row[1] for row in cursor.fetchall()},
+        }
+
+        _log(f"Compressing {manifest['size'] / (1024 * 1024):.0f} MB database...")
+        partial_path = dest_path.with_name(dest_path.name + ".partial")
+        with open(partial_path, "wb") as out:
+            out.write(SNAPSHOT_MAGIC)
+            out.write(json.dumps(manifest, sort_keys=True).encode("utf-8") + b"\n")
+            with open(compact_path, "rb") as src, \
+                    gzip.GzipFile(fileobj=out, mode="wb", compresslevel=compresslevel, mtime=0) as gz:
+                for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                    gz.write(chunk)
+        os.replace(partial_path, dest_path)
+
+    return manifest
+
+
+def read_snapshot_manifest(snapshot_path: str) -> Dict[str, Any]:
+    """Read the manifest of a snapshot without decompressing the payload.
+
+    Args:
+        snapshot_path: Path to the snapshot file
+
+    Returns:
+        Parsed manifest dict
+    """
+    with open(snapshot_path, "rb") as f:
+        return _read_header(f)
+
+
+def import_snapshot(
+    snapshot_path: str,
+    db_path: Optional[str] = None,
+    log: Optional[Callable] = None,
+) -> Dict[str, Any]:
+    """Restore a snapshot into place as the Allelio database.
+
+    The payload is decompressed in a single streaming pass into a temporary
+    file next to the destination while its checksum is computed. The file
+    only replaces the existing database once the checksum and an SQLite
+    integrity check have passed, so a bad snapshot never clobbers a working
+    database. Any open AllelioDB on ``db_path`` should be closed first.
+
+    Args:
+        snapshot_path: Path to the snapshot file
+        db_path: Destination database path. Defaults to ~/.allelio/data/allelio.db
+        log: Optional function to print status messages
+
+    Returns:
+        The snapshot manifest
+
+    Raises:
+        ValueError: If the snapshot is malformed or fails verification
+    """
+    def _log(msg):
+        if log:
+            log(msg)
+
+    if db_path is None:
+        db_path = os.path.expanduser("~/.allelio/data/allelio.db")
+
+    db_path = Path(db_path)
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = db_path.with_name(db_path.name + ".restore")
+
+    try:
+        with open(snapshot_path, "rb") as f:
+            manifest = _read_header(f)
+            _log(f"Restoring snapshot from {manifest.get('created_at', 'unknown date')}...")
+
+            sha256 = hashlib.sha256()
+            written = 0
+            with gzip.GzipFile(fileobj=f, mode="rb") as gz, open(tmp_path, "wb") as out:
+                for chunk in iter(lambda: gz.read(CHUNK_SIZE), b""):
+                    sha256.update(chunk)
+                    out.write(chunk)
+                    written += len(chunk)
+
+        if written != manifest.get("size") or sha256.hexdigest() != manifest.get("sha256"):
+            raise ValueError("Snapshot checksum mismatch — file is corrupt or truncated")
+
+        conn = sqlite3.connect(str(tmp_path))
+        try:
+            ok = conn.execute("PRAGMA quick_check").fetchone()[0] == "ok"
+        finally:
+            conn.close()
+        if not ok:
+            raise ValueError("Snapshot failed SQLite integrity check")
+
+        # Stale WAL/SHM files from the old database must not be replayed
+        # against the restored one
+        for suffix in ("-wal", "-shm"):
+            Path(str(db_path) + suffix).unlink(missing_ok=True)
+        os.replace(tmp_path, db_path)
+    except (OSError, EOFError, gzip.BadGzipFile) as e:
+        raise ValueError(f"Failed to read snapshot: {e}")
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+    _log(f"Restored {manifest['size'] / (1024 * 1024):.0f} MB database to {db_path}")
+    return manifest
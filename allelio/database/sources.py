@@ -0,0 +1,362 @@
+"""Annotation-source plugins for setup_database.
+
+Every reference source (ClinVar, the GWAS Catalog, local PharmGKB or PGS
+files, ...) is an AnnotationSource: it knows how to fetch and stream-parse
+its data into record batches, the schema of the table those records land
+in, and how that table is joined into rsID lookups. ``setup_database``
+runs each source's batch generator on its own thread and writes the
+batches from a single thread, so a new source plugs in without touching
+the orchestrator:
+
+    sources = default_sources() + [PharmGKBSource("clinical_annotations.tsv")]
+    setup_database(db, sources=sources)
+
+Plugin tables are recorded in the database's ``annotation_sources`` table;
+``AllelioDB.lookup_rsids_batch`` then returns their rows under the source
+name next to "clinvar" and "gwas".
+"""
+
+import bz2
+import gzip
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Generator, Iterable, Iterator, List, Optional, Set
+
+from .telemetry import SKIP_MALFORMED, SKIP_NO_RSID, SKIP_NOT_TARGETED, IngestTelemetry, count_skip
+
+
+BATCH_SIZE = 10000
+
+_RSID_RE = re.compile(r"^(?:rs)?(\d+)$", re.IGNORECASE)
+_RSID_TOKEN_RE = re.compile(r"\brs\d+\b", re.IGNORECASE)
+
+
+def batched(records: Iterable[Dict[str, Any]], size: int) -> Generator[List[Dict[str, Any]], None, None]:
+    """Group a record stream into lists of at most ``size`` records."""
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+@dataclass
+class SourceContext:
+    """Settings and shared services a source receives from setup_database."""
+    data_dir: Path
+    stream: bool = False
+    workers: int = 1
+    target_rsids: Optional[Set[str]] = None
+    telemetry: Optional[IngestTelemetry] = None
+    # Combined download progress (see downloader._CombinedProgress)
+    progress: Any = None
+    log: Callable[[str], None] = lambda msg: None
+    # id(source) -> ingest phase name, for sources sharing a name
+    phases: Dict[int, str] = field(default_factory=dict)
+
+    def phase(self, source: "AnnotationSource") -> str:
+        """Return the telemetry phase name of a source's ingest."""
+        return self.phases.get(id(source), f"ingest:{source.name}")
+
+    def skipped(self, source: "AnnotationSource") -> Dict[str, int]:
+        """Return the filtered-row counters of a source's ingest phase."""
+        if self.telemetry is None:
+            return {}
+        return self.telemetry.phase(self.phase(source)).skipped
+
+
+class AnnotationSource:
+    """Base class for a reference annotation source.
+
+    Subclasses set ``name`` (used for phase names, metadata keys and the
+    lookup result key; several instances may share one, e.g. two PGS files), ``label``, ``table`` and ``columns`` and
+    implement ``batches``. Records are dicts with an "rsid" key plus the
+    declared columns; missing columns are stored as NULL.
+    """
+
+    name = ""
+    label = ""
+    table = ""
+    # Column name -> SQLite type, besides the implicit id and rsid columns
+    columns: Dict[str, str] = {}
+    # Extra columns to index (rsid is always indexed)
+    indexes: tuple = ()
+    # A failure aborts setup instead of skipping this source
+    required = False
+    # Log a progress line every this many records
+    report_every = 100000
+
+    def schema(self) -> List[str]:
+        """Return the SQL statements creating this source's table and indexes."""
+        columns = "".join(f",\n                {column} {sql_type}" for column, sql_type in self.columns.items())
+        statements = [
+            f"""CREATE TABLE IF NOT EXISTS {self.table} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                rsid TEXT NOT NULL{columns}
+            )""",
+            f"CREATE INDEX IF NOT EXISTS idx_{self.table}_rsid ON {self.table}(rsid)",
+        ]
+        for column in self.indexes:
+            statements.append(
+                f"CREATE INDEX IF NOT EXISTS idx_{self.table}_{column} ON {self.table}({column})"
+            )
+        return statements
+
+    def batches(self, context: SourceContext) -> Iterable[List[Dict[str, Any]]]:
+        """Fetch and parse the source, yielding record batches as they are ready.
+
+        Called on a worker thread; must not touch the database.
+        """
+        raise NotImplementedError
+
+    def version(self) -> str:
+        """Version string recorded as ``<name>_version`` metadata."""
+        return "latest"
+
+    def prepare(self, db) -> None:
+        """Create this source's table and drop rows from a previous load."""
+        db.initialize_source(self)
+        db.clear_source(self)
+
+    def insert(self, db, batch: List[Dict[str, Any]]) -> None:
+        """Write one parsed batch (called on the setup_database thread)."""
+        db.insert_source_batch(self, batch)
+
+    def finish(self, db, context: SourceContext, parsed: int) -> int:
+        """Complete the load after the last batch.
+
+        Returns:
+            Number of records now in the database for this source
+        """
+        context.log(f"       {self.label} complete: {parsed:,} records loaded.")
+        return parsed
+
+    def fail(self, db, context: SourceContext, error: BaseException, parsed: int) -> None:
+        """Handle a failed optional source: log it and drop any partial rows."""
+        context.log(f"       {self.label} failed: {error} — skipped.")
+        if parsed:
+            db.clear_source(self)
+
+
+def _open_text(path: Path):
+    if path.suffix == ".gz":
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    if path.suffix == ".bz2":
+        return bz2.open(path, "rt", encoding="utf-8", errors="replace")
+    return open(path, "r", encoding="utf-8", errors="replace")
+
+
+def _normalize_rsid(value: str) -> Optional[str]:
+    match = _RSID_RE.match(value.strip())
+    return f"rs{match.group(1)}" if match else None
+
+
+def _field(value: str) -> Optional[str]:
+    value = value.strip()
+    return value if value and value != "-" else None
+
+
+class LocalFileSource(AnnotationSource):
+    """A source read line by line from a local (optionally .gz/.bz2) file."""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+
+    def version(self) -> str:
+        return self.path.name
+
+    def parse_lines(self, lines: Iterable[str], skipped: Dict[str, int]) -> Iterator[Dict[str, Any]]:
+        """Parse the file's lines into records."""
+        raise NotImplementedError
+
+    def batches(self, context: SourceContext) -> Iterable[List[Dict[str, Any]]]:
+        if not self.path.exists():
+            raise FileNotFoundError(f"File not found: {self.path}")
+        context.log(f"       Reading {self.label} from {self.path.name}...")
+        skipped = context.skipped(self)
+        with _open_text(self.path) as f:
+            records = self.parse_lines(f, skipped)
+            if context.target_rsids is not None:
+                records = self._targeted(records, context.target_rsids, skipped)
+            yield from batched(records, BATCH_SIZE)
+
+    @staticmethod
+    def _targeted(records, target_rsids, skipped):
+        for record in records:
+            if record["rsid"] in target_rsids:
+                yield record
+            else:
+                count_skip(skipped, SKIP_NOT_TARGETED)
+
+
+class PharmGKBSource(LocalFileSource):
+    """PharmGKB clinical annotations (clinical_annotations.tsv).
+
+    Annotations on star-allele haplotypes (e.g. "CYP2D6*4") have no rsID and
+    are skipped; an annotation listing several rsIDs yields one row per rsID.
+    """
+
+    name = "pharmgkb"
+    label = "PharmGKB"
+    table = "pharmgkb"
+    columns = {
+        "annotation_id": "TEXT",
+        "gene": "TEXT",
+        "evidence_level": "TEXT",
+        "phenotype_category": "TEXT",
+        "drugs": "TEXT",
+        "phenotypes": "TEXT",
+    }
+
+    _HEADER = {
+        "annotation_id": "Clinical Annotation ID",
+        "gene": "Gene",
+        "evidence_level": "Level of Evidence",
+        "phenotype_category": "Phenotype Category",
+        "drugs": "Drug(s)",
+        "phenotypes": "Phenotype(s)",
+    }
+
+    def parse_lines(self, lines, skipped):
+        lines = iter(lines)
+        header = next(lines, "").rstrip("\n").split("\t")
+        if "Variant/Haplotypes" not in header:
+            raise ValueError(f"{self.path.name} is not a PharmGKB clinical annotations file")
+        variant_col = header.index("Variant/Haplotypes")
+        col_indices = {key: header.index(title) if title in header else None
+                       for key, title in self._HEADER.items()}
+
+        for line in lines:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) <= variant_col:
+                count_skip(skipped, SKIP_MALFORMED)
+                continue
+            rsids = list(dict.fromkeys(token.lower() for token in _RSID_TOKEN_RE.findall(fields[variant_col])))
+            if not rsids:
+                count_skip(skipped, SKIP_NO_RSID)
+                continue
+            values = {
+                key: _field(fields[idx]) if idx is not None and idx < len(fields) else None
+                for key, idx in col_indices.items()
+            }
+            for rsid in rsids:
+                yield {"rsid": rsid, **values}
+
+
+class PGSScoringSource(LocalFileSource):
+    """A PGS Catalog scoring file (PGS000001.txt.gz and harmonized variants).
+
+    Rows without an rsID are skipped. The score ID comes from the
+    ``#pgs_id=`` header, falling back to the file name. Several scoring
+    files share the pgs_weights table; loading one replaces only the rows
+    of its own score.
+    """
+
+    name = "pgs"
+    label = "PGS Catalog"
+    table = "pgs_weights"
+    columns = {
+        "pgs_id": "TEXT",
+        "effect_allele": "TEXT",
+        "other_allele": "TEXT",
+        "effect_weight": "REAL",
+    }
+    indexes = ("pgs_id",)
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._pgs_id = None
+
+    @property
+    def pgs_id(self) -> str:
+        """The score ID, read from the file's header lines."""
+        if self._pgs_id is None:
+            self._pgs_id = self.path.name.split(".")[0]
+            if self.path.exists():
+                with _open_text(self.path) as f:
+                    for line in f:
+                        if not line.startswith("#"):
+                            break
+                        key, _, value = line.lstrip("#").strip().partition("=")
+                        if key == "pgs_id" and value:
+                            self._pgs_id = value
+        return self._pgs_id
+
+    def prepare(self, db) -> None:
+        """Create the weights table and drop this score's rows from a previous load."""
+        db.initialize_source(self)
+        db.clear_source(self, {"pgs_id": self.pgs_id})
+
+    def fail(self, db, context: SourceContext, error: BaseException, parsed: int) -> None:
+        context.log(f"       {self.label} {self.pgs_id} failed: {error} — skipped.")
+        if parsed:
+            db.clear_source(self, {"pgs_id": self.pgs_id})
+
+    def parse_lines(self, lines, skipped):
+        pgs_id = self.path.name.split(".")[0]
+        header = None
+        for line in lines:
+            if line.startswith("#"):
+                key, _, value = line.lstrip("#").strip().partition("=")
+                if key == "pgs_id" and value:
+                    pgs_id = value
+                continue
+            if not line.strip():
+                continue
+            fields = line.rstrip("\n").split("\t")
+            if header is None:
+                header = {column: i for i, column in enumerate(fields)}
+                rsid_col = header.get("hm_rsID", header.get("rsID"))
+                if rsid_col is None or "effect_weight" not in header:
+                    raise ValueError(f"{self.path.name} is not a PGS Catalog scoring file")
+                continue
+
+            try:
+                rsid = _normalize_rsid(fields[rsid_col])
+                if rsid is None:
+                    count_skip(skipped, SKIP_NO_RSID)
+                    continue
+                other = header.get("other_allele", header.get("hm_inferOtherAllele"))
+                yield {
+                    "rsid": rsid,
+                    "pgs_id": pgs_id,
+                    "effect_allele": _field(fields[header["effect_allele"]]) if "effect_allele" in header else None,
+                    "other_allele": _field(fields[other]) if other is not None and other < len(fields) else None,
+                    "effect_weight": float(fields[header["effect_weight"]]),
+                }
+            except (IndexError, ValueError):
+                count_skip(skipped, SKIP_MALFORMED)
+
+
+# Kinds accepted by source_from_spec / `allelio setup --annotations KIND=PATH`
+SOURCE_TYPES: Dict[str, Callable[[str], AnnotationSource]] = {
+    "pharmgkb": PharmGKBSource,
+    "pgs": PGSScoringSource,
+}
+
+
+def register_source_type(kind: str, factory: Callable[[str], AnnotationSource]) -> None:
+    """Make a local-file source available as ``--annotations kind=PATH``."""
+    SOURCE_TYPES[kind] = factory
+
+
+def source_from_spec(spec: str) -> AnnotationSource:
+    """Build a source from a "kind=path" string (e.g. "pharmgkb=annotations.tsv").
+
+    Raises:
+        ValueError: If the spec is malformed or the kind is unknown
+        FileNotFoundError: If the path does not exist
+    """
+    kind, sep, path = spec.partition("=")
+    if not sep or not path:
+        raise ValueError(f"Expected KIND=PATH, got {spec!r}")
+    factory = SOURCE_TYPES.get(kind.strip().lower())
+    if factory is None:
+        raise ValueError(f"Unknown annotation source {kind!r} (known: {', '.join(sorted(SOURCE_TYPES))})")
+    if not Path(path).exists():
+        raise FileNotFoundError(f"File not found: {path}")
+    return factory(path)
@@ -1,51 +1,111 @@
 """SQLite storage layer for Allelio reference databases."""
 
+import hashlib
 import sqlite3
 import os
+import re
+import uuid
 from pathlib import Path
-from typing import Optional, Dict, List, Any
+from typing import Optional, Dict, Iterable, List, Any, Set
 from datetime import datetime
 
+from .profiling import QueryProfiler, profiled_connection_factory
+
+
+# Plugin source names and table/column names are interpolated into SQL
+_IDENTIFIER_RE = re.compile(r"^[a-z][a-z0-9_]*$")
+_RESERVED_TABLES = {
+    "clinvar", "gwas", "strings", "metadata", "rsid_merges", "annotation_sources",
+    "rsid_digests", "data_versions", "rsid_changes", "target_rsids",
+}
+
+# Data versions whose rsID change sets are kept (see changes_since)
+CHANGE_LOG_VERSIONS = 26
+
+
+def _row_digest(*values) -> int:
+    """48-bit content hash of one annotation row, stable across processes.
+
+    Summed per rsID, so it can't overflow SQLite integers for any realistic
+    number of rows.
+    """
+    return int.from_bytes(hashlib.blake2b(repr(values).encode("utf-8"), digest_size=6).digest(), "big")
+
 
 class AllelioDB:
     """Manages SQLite database for ClinVar and GWAS data."""
 
-    def __init__(self, db_path: Optional[str] = None):
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        check_same_thread: bool = True,
+        profiler: Optional[QueryProfiler] = None,
+    ):
         """Initialize database connection.
         
         Args:
             db_path: Path to SQLite database file. Defaults to ~/.allelio/data/allelio.db
+            check_same_thread: Passed to sqlite3.connect. Set False only when the
+                caller serializes access from multiple threads itself.
+            profiler: Optional QueryProfiler that times every statement issued
         """
         if db_path is None:
             db_path = os.path.expanduser("~/.allelio/data/allelio.db")
         
         self.db_path = Path(db_path)
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.check_same_thread = check_same_thread
+        self.profiler = profiler
         self.conn = None
         self.cursor = None
+        # Interned string caches: value -> id for ingest, id -> value for lookups
+        self._string_ids = None
+        self._string_values = {}
+        # Whether rsid_merges has rows (None until checked)
+        self._has_merges = None
+        # Plugin source name -> table (None until read from annotation_sources)
+        self._source_tables = None
         self._connect()
     
     def _connect(self) -> None:
         """Establish database connection and enable WAL mode."""
-        self.conn = sqlite3.connect(str(self.db_path))
+        factory = profiled_connection_factory(self.profiler) if self.profiler else sqlite3.Connection
+        self.conn = sqlite3.connect(
+            str(self.db_path),
+            check_same_thread=self.check_same_thread,
+            factory=factory,
+        )
         self.conn.row_factory = sqlite3.Row
         self.cursor = self.conn.cursor()
         # Enable WAL mode for better concurrent read performance
         self.cursor.execute("PRAGMA journal_mode=WAL")
     
+    def _has_column(self, table: str, column: str) -> bool:
+        """Check whether an existing table has a column."""
+        self.cursor.execute(f"PRAGMA table_info({table})")
+        return any(row["name"] == column for row in self.cursor.fetchall())
+    
     def initialize(self) -> None:
-        """Create tables and indexes."""
+        """Create tables and indexes.
+        
+        Databases built before string interning stored conditions and study
+        titles inline; that text is moved into the strings table in place
+        (see _migrate_inline_strings), so no annotation rows are lost.
+        """
         # Create ClinVar table
         self.cursor.execute("""
             CREATE TABLE IF NOT EXISTS clinvar (
                 rsid TEXT PRIMARY KEY,
                 gene TEXT,
                 clinical_significance TEXT,
-                conditions TEXT,
+                conditions_id INTEGER,
                 review_status TEXT,
-                last_evaluated TEXT
+                last_evaluated TEXT,
+                alleles TEXT
             )
         """)
+        if not self._has_column("clinvar", "alleles"):
+            self.cursor.execute("ALTER TABLE clinvar ADD COLUMN alleles TEXT")
         
         # Create GWAS table
         self.cursor.execute("""
@@ -56,11 +116,28 @@ class AllelioDB:
                 p_value REAL,
                 odds_ratio TEXT,
                 mapped_gene TEXT,
-                study TEXT,
+                study_id INTEGER,
                 pubmed_id TEXT,
-                link TEXT
+                link TEXT,
+                association_id INTEGER,
+                association_type TEXT,
+                risk_allele TEXT
+            )
+        """)
+        for column, column_type in (("association_id", "INTEGER"), ("association_type", "TEXT"),
+                                    ("risk_allele", "TEXT")):
+            if not self._has_column("gwas", column):
+                self.cursor.execute(f"ALTER TABLE gwas ADD COLUMN {column} {column_type}")
+        
+        # Deduplicated long strings (ClinVar PhenotypeList, GWAS study titles),
+        # referenced by integer id from the annotation tables
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS strings (
+                id INTEGER PRIMARY KEY,
+                value TEXT NOT NULL
             )
         """)
+        self._migrate_inline_strings()
         
         # Create metadata table
         self.cursor.execute("""
@@ -70,6 +147,64 @@ class AllelioDB:
             )
         """)
         
+        # dbSNP merge history: retired rs number -> current rs number
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS rsid_merges (
+                old_id INTEGER PRIMARY KEY,
+                current_id INTEGER NOT NULL
+            )
+        """)
+        self._has_merges = None
+        
+        # Tables loaded by annotation-source plugins, joined into lookups
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS annotation_sources (
+                name TEXT PRIMARY KEY,
+                table_name TEXT NOT NULL,
+                label TEXT
+            )
+        """)
+        self._source_tables = None
+        
+        # Change tracking across data versions: a content digest per annotated
+        # rsID, and per version the rsIDs it added, changed or removed.
+        # NULL counts mark a version with no earlier digests to compare with.
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS rsid_digests (
+                rsid TEXT PRIMARY KEY,
+                digest INTEGER NOT NULL
+            ) WITHOUT ROWID
+        """)
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS data_versions (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                version TEXT UNIQUE NOT NULL,
+                created_at TEXT,
+                added INTEGER,
+                changed INTEGER,
+                removed INTEGER
+            )
+        """)
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS rsid_changes (
+                version TEXT NOT NULL,
+                rsid TEXT NOT NULL,
+                change TEXT NOT NULL,
+                PRIMARY KEY (version, rsid)
+            ) WITHOUT ROWID
+        """)
+        
+        # rsIDs kept by the slim profile, so `allelio update` reloads the same set
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS target_rsids (
+                rsid TEXT PRIMARY KEY
+            ) WITHOUT ROWID
+        """)
+        
+        # Leftovers from an interrupted ingest on this connection
+        self.cursor.execute("DROP TABLE IF EXISTS temp.clinvar_staging")
+        self.cursor.execute("DROP TABLE IF EXISTS temp.new_digests")
+        
         # Create indexes for better query performance
         self.cursor.execute("""
             CREATE INDEX IF NOT EXISTS idx_clinvar_rsid ON clinvar(rsid)
@@ -79,46 +214,362 @@ class AllelioDB:
             CREATE INDEX IF NOT EXISTS idx_gwas_rsid ON gwas(rsid)
         """)
         
+        # Rows of one multi-SNP association share an association_id
+        self.cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_gwas_association ON gwas(association_id)
+        """)
+        
         self.conn.commit()
     
+    def _migrate_inline_strings(self) -> None:
+        """Intern the inline conditions / study text of pre-interning databases.
+        
+        Each distinct text gets a strings row, the table's reference column
+        is filled from it, and the inline column is dropped (or emptied on
+        SQLite versions without DROP COLUMN, so re-running is a no-op).
+        """
+        migrated = False
+        for table, column, ref_column in (("clinvar", "conditions", "conditions_id"), ("gwas", "study", "study_id")):
+            if not self._has_column(table, column):
+                continue
+            migrated = True
+            if not self._has_column(table, ref_column):
+                self.cursor.execute(f"ALTER TABLE {table} ADD COLUMN {ref_column} INTEGER")
+            self.cursor.execute("CREATE INDEX IF NOT EXISTS temp_idx_strings_value ON strings(value)")
+            self.cursor.execute(f"""
+                INSERT INTO strings (value)
+                SELECT DISTINCT t.{column} FROM {table} t
+                WHERE t.{column} IS NOT NULL AND t.{column} != ''
+                  AND NOT EXISTS (SELECT 1 FROM strings s WHERE s.value = t.{column})
+            """)
+            self.cursor.execute(f"""
+                UPDATE {table}
+                SET {ref_column} = (SELECT MIN(s.id) FROM strings s WHERE s.value = {table}.{column}),
+                    {column} = NULL
+                WHERE {column} IS NOT NULL
+            """)
+            try:
+                self.cursor.execute(f"ALTER TABLE {table} DROP COLUMN {column}")
+            except sqlite3.OperationalError:
+                pass
+        if migrated:
+            self.cursor.execute("DROP INDEX IF EXISTS temp_idx_strings_value")
+            self._string_ids = None
+    
     def insert_clinvar_batch(self, records: List[Dict[str, Any]]) -> None:
         """Bulk insert ClinVar records.
         
         Args:
             records: List of dicts with keys: rsid, gene, clinical_significance, 
-                    conditions, review_status, last_evaluated
+                    conditions, review_status, last_evaluated and optionally alleles
         """
         if not records:
             return
         
+        rows = [
+            {**record, "conditions_id": self._intern(record.get("conditions")),
+             "alleles": record.get("alleles")}
+            for record in records
+        ]
         self.cursor.executemany(
             """INSERT OR REPLACE INTO clinvar 
-               (rsid, gene, clinical_significance, conditions, review_status, last_evaluated)
-               VALUES (:rsid, :gene, :clinical_significance, :conditions, :review_status, :last_evaluated)
+               (rsid, gene, clinical_significance, conditions_id, review_status, last_evaluated, alleles)
+               VALUES (:rsid, :gene, :clinical_significance, :conditions_id, :review_status,
+                       :last_evaluated, :alleles)
+            """,
+            rows
+        )
+        self.conn.commit()
+    
+    def stage_clinvar_batch(self, records: List[Dict[str, Any]]) -> None:
+        """Append raw ClinVar records to a temporary staging table.
+        
+        Staged rows are plain appends (no key, no index); iter_staged_clinvar
+        later returns them grouped by rsID so each rsID can be merged and
+        written to the clinvar table exactly once.
+        
+        Args:
+            records: Records as yielded by parse_clinvar
+        """
+        self.cursor.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS clinvar_staging (
+                rsid TEXT NOT NULL,
+                gene TEXT,
+                clinical_significance TEXT,
+                conditions TEXT,
+                review_status TEXT,
+                last_evaluated TEXT,
+                alleles TEXT
+            )
+        """)
+        if not records:
+            return
+        
+        self.cursor.executemany(
+            """INSERT INTO clinvar_staging
+               (rsid, gene, clinical_significance, conditions, review_status, last_evaluated, alleles)
+               VALUES (:rsid, :gene, :clinical_significance, :conditions, :review_status,
+                       :last_evaluated, :alleles)
+            """,
+            [{"alleles": None, **record} for record in records]
+        )
+        self.conn.commit()
+    
+    def iter_staged_clinvar(self, batch_size: int = 10000):
+        """Yield batches of staged ClinVar records ordered by rsID, then drop the staging table.
+        
+        Args:
+            batch_size: Rows per yielded batch
+        
+        Yields:
+            Lists of record dicts; all rows of one rsID are adjacent
+        """
+        self.stage_clinvar_batch([])
+        cursor = self.conn.execute("SELECT * FROM clinvar_staging ORDER BY rsid")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield [dict(row) for row in rows]
+        cursor.close()
+        self.cursor.execute("DROP TABLE temp.clinvar_staging")
+        self.conn.commit()
+    
+    def delete_unstaged_clinvar(self) -> int:
+        """Delete ClinVar rows whose rsID is not in the staging table.
+        
+        Call once a complete ClinVar load is staged, so rsIDs that ClinVar no
+        longer lists are removed rather than kept from an earlier load.
+        
+        Returns:
+            Number of rows deleted
+        """
+        self.stage_clinvar_batch([])
+        self.cursor.execute(
+            "DELETE FROM clinvar WHERE rsid NOT IN (SELECT rsid FROM temp.clinvar_staging)"
+        )
+        deleted = self.cursor.rowcount
+        self.conn.commit()
+        return deleted
+    
+    def stage_gwas_batch(self, records: List[Dict[str, Any]]) -> None:
+        """Append GWAS records to a temporary staging table.
+        
+        The gwas table is only replaced from the staged rows (see
+        iter_staged_gwas) once the whole catalog has been read, so a failed
+        download leaves the previous catalog in place.
+        
+        Args:
+            records: Records as yielded by parse_gwas
+        """
+        self.cursor.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS gwas_staging (
+                rsid TEXT NOT NULL,
+                trait TEXT,
+                p_value REAL,
+                odds_ratio REAL,
+                mapped_gene TEXT,
+                study TEXT,
+                pubmed_id TEXT,
+                link TEXT,
+                association_id INTEGER,
+                association_type TEXT,
+                risk_allele TEXT
+            )
+        """)
+        if not records:
+            return
+        
+        self.cursor.executemany(
+            """INSERT INTO gwas_staging
+               (rsid, trait, p_value, odds_ratio, mapped_gene, study, pubmed_id, link,
+                association_id, association_type, risk_allele)
+               VALUES (:rsid, :trait, :p_value, :odds_ratio, :mapped_gene, :study, :pubmed_id, :link,
+                       :association_id, :association_type, :risk_allele)
             """,
-            records
+            [{"association_id": None, "association_type": None, "risk_allele": None, **record}
+             for record in records]
         )
         self.conn.commit()
     
+    def iter_staged_gwas(self, batch_size: int = 10000):
+        """Yield batches of staged GWAS records in staging order, then drop the staging table.
+        
+        Args:
+            batch_size: Rows per yielded batch
+        
+        Yields:
+            Lists of record dicts for insert_gwas_batch
+        """
+        self.stage_gwas_batch([])
+        cursor = self.conn.execute("SELECT * FROM gwas_staging ORDER BY rowid")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield [dict(row) for row in rows]
+        cursor.close()
+        self.discard_staged_gwas()
+    
+    def discard_staged_gwas(self) -> None:
+        """Drop any staged GWAS rows without touching the gwas table."""
+        self.cursor.execute("DROP TABLE IF EXISTS temp.gwas_staging")
+        self.conn.commit()
+    
     def insert_gwas_batch(self, records: List[Dict[str, Any]]) -> None:
         """Bulk insert GWAS records.
         
         Args:
             records: List of dicts with keys: rsid, trait, p_value, odds_ratio, 
-                    mapped_gene, study, pubmed_id, link
+                    mapped_gene, study, pubmed_id, link and optionally
+                    association_id, association_type, risk_allele
         """
         if not records:
             return
         
+        rows = [
+            {"association_id": None, "association_type": None, "risk_allele": None, **record,
+             "study_id": self._intern(record.get("study"))}
+            for record in records
+        ]
         self.cursor.executemany(
             """INSERT INTO gwas 
-               (rsid, trait, p_value, odds_ratio, mapped_gene, study, pubmed_id, link)
-               VALUES (:rsid, :trait, :p_value, :odds_ratio, :mapped_gene, :study, :pubmed_id, :link)
+               (rsid, trait, p_value, odds_ratio, mapped_gene, study_id, pubmed_id, link,
+                association_id, association_type, risk_allele)
+               VALUES (:rsid, :trait, :p_value, :odds_ratio, :mapped_gene, :study_id, :pubmed_id, :link,
+                       :association_id, :association_type, :risk_allele)
             """,
-            records
+            rows
         )
         self.conn.commit()
     
+    def _intern(self, value: Optional[str]) -> Optional[int]:
+        """Return the strings-table id for a value, adding it if new.
+        
+        Args:
+            value: String to intern
+        
+        Returns:
+            Integer reference, or None for empty values
+        """
+        if not value:
+            return None
+        
+        if self._string_ids is None:
+            self.cursor.execute("SELECT id, value FROM strings")
+            self._string_ids = {row[1]: row[0] for row in self.cursor.fetchall()}
+        
+        ref = self._string_ids.get(value)
+        if ref is None:
+            self.cursor.execute("INSERT INTO strings (value) VALUES (?)", (value,))
+            ref = self.cursor.lastrowid
+            self._string_ids[value] = ref
+        return ref
+    
+    def prune_strings(self) -> int:
+        """Delete interned strings no ClinVar or GWAS row refers to any more.
+        
+        Returns:
+            Number of strings deleted
+        """
+        self.cursor.execute("""
+            DELETE FROM strings
+            WHERE id NOT IN (SELECT conditions_id FROM clinvar WHERE conditions_id IS NOT NULL)
+              AND id NOT IN (SELECT study_id FROM gwas WHERE study_id IS NOT NULL)
+        """)
+        deleted = self.cursor.rowcount
+        self.conn.commit()
+        if deleted:
+            self._string_ids = None
+            self._string_values = {}
+        return deleted
+    
+    def resolve_string(self, ref: Optional[int]) -> Optional[str]:
+        """Resolve an interned string reference back to its text.
+        
+        Args:
+            ref: Integer reference from a conditions_id or study_id column
+        
+        Returns:
+            The string, or None if ref is None or unknown
+        """
+        if ref is None:
+            return None
+        
+        if ref not in self._string_values:
+            row = self.conn.execute("SELECT value FROM strings WHERE id = ?", (ref,)).fetchone()
+            self._string_values[ref] = row[0] if row else None
+        return self._string_values[ref]
+    
+    def iter_records(self, table: str, batch_size: int = 10000):
+        """Yield batches of rows from an annotation table in ingest format.
+        
+        Interned strings are joined back in, so the batches can be passed
+        straight to insert_clinvar_batch / insert_gwas_batch of another store.
+        
+        Args:
+            table: "clinvar", "gwas" or a registered plugin source's table
+            batch_size: Rows per yielded batch
+        
+        Yields:
+            Lists of record dicts
+        """
+        if table == "clinvar":
+            query = """SELECT c.*, s.value AS conditions FROM clinvar c
+                       LEFT JOIN strings s ON s.id = c.conditions_id"""
+        elif table == "gwas":
+            query = """SELECT g.*, s.value AS study FROM gwas g
+                       LEFT JOIN strings s ON s.id = g.study_id"""
+        elif table in self.source_tables().values():
+            query = f"SELECT * FROM {table}"
+        else:
+            raise ValueError(f"Unknown annotation table: {table}")
+        
+        cursor = self.conn.execute(query)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield [dict(row) for row in rows]
+    
+    def clear_annotations(self, tables: tuple = ("clinvar", "gwas")) -> None:
+        """Delete annotation rows, keeping the schema and metadata.
+        
+        Args:
+            tables: Annotation tables to empty. Interned strings are dropped
+                too when both tables are cleared.
+        """
+        for table in tables:
+            if table not in ("clinvar", "gwas"):
+                raise ValueError(f"Unknown annotation table: {table}")
+            self.cursor.execute(f"DELETE FROM {table}")
+        if {"clinvar", "gwas"} <= set(tables):
+            self.cursor.execute("DELETE FROM strings")
+            self._string_ids = None
+            self._string_values = {}
+        self.conn.commit()
+    
+    def set_target_rsids(self, rsids: Optional[Iterable[str]]) -> None:
+        """Store the slim profile's target rsIDs (None clears them for a full profile)."""
+        self.cursor.execute("DELETE FROM target_rsids")
+        if rsids is not None:
+            self.cursor.executemany("INSERT OR IGNORE INTO target_rsids (rsid) VALUES (?)",
+                                    ((rsid,) for rsid in rsids))
+        self.conn.commit()
+    
+    def get_target_rsids(self) -> Optional[Set[str]]:
+        """Return the stored slim-profile target rsIDs, or None if none are stored."""
+        try:
+            rows = self.conn.execute("SELECT rsid FROM target_rsids").fetchall()
+        except sqlite3.OperationalError:
+            return None
+        return {row[0] for row in rows} or None
+    
+    def vacuum(self) -> None:
+        """Rebuild the database file to release free pages back to the OS."""
+        self.conn.commit()
+        self.cursor.execute("VACUUM")
+    
     def lookup_rsid(self, rsid: str) -> Dict[str, Any]:
         """Look up combined ClinVar and GWAS data for a single rsID.
         
@@ -130,6 +581,12 @@ class AllelioDB:
         """
         result = {"clinvar": [], "gwas": []}
         
+        # A retired rsID is looked up under its current ID
+        current = self.remap_rsids([rsid]).get(rsid)
+        if current is not None:
+            result["current_rsid"] = current
+            rsid = current
+        
         # Query ClinVar
         self.cursor.execute("SELECT * FROM clinvar WHERE rsid = ?", (rsid,))
         clinvar_row = self.cursor.fetchone()
@@ -141,6 +598,11 @@ class AllelioDB:
         gwas_rows = self.cursor.fetchall()
         result["gwas"] = [dict(row) for row in gwas_rows]
         
+        # Query plugin sources
+        for name, table in self.source_tables().items():
+            self.cursor.execute(f"SELECT * FROM {table} WHERE rsid = ?", (rsid,))
+            result[name] = [dict(row) for row in self.cursor.fetchall()]
+        
         return result
     
     def lookup_rsids_batch(self, rsids: List[str]) -> Dict[str, Dict[str, Any]]:
@@ -149,22 +611,33 @@ class AllelioDB:
         Args:
             rsids: List of rsIDs to look up
 
+        Retired rsIDs found in the merge index are resolved in bulk first and
+        queried under their current ID; their entries carry ``current_rsid``.
+
         Returns:
-            Dict mapping rsid -> {clinvar: [...], gwas: [...]}
+            Dict mapping rsid -> {clinvar: [...], gwas: [...]}, plus one list
+            per plugin source (see initialize_source)
         """
         result = {}
 
         if not rsids:
             return result
 
+        remapped = self.remap_rsids(rsids)
+        query_ids = list(dict.fromkeys(remapped.get(r, r) for r in rsids)) if remapped else rsids
+
+        sources = self.source_tables()
+
         # Initialize result dict with all rsids
-        for rsid in rsids:
+        for rsid in query_ids:
             result[rsid] = {"clinvar": [], "gwas": []}
+            for name in sources:
+                result[rsid][name] = []
 
         # SQLite has a variable limit — process in chunks of 500
         chunk_size = 500
-        for i in range(0, len(rsids), chunk_size):
-            chunk = rsids[i:i + chunk_size]
+        for i in range(0, len(query_ids), chunk_size):
+            chunk = query_ids[i:i + chunk_size]
             placeholders = ",".join("?" * len(chunk))
 
             # Query ClinVar
@@ -181,8 +654,188 @@ class AllelioDB:
                 rsid = row["rsid"]
                 result[rsid]["gwas"].append(dict(row))
 
+            # Query plugin sources
+            for name, table in sources.items():
+                self.cursor.execute(f"SELECT * FROM {table} WHERE rsid IN ({placeholders})", chunk)
+                for row in self.cursor.fetchall():
+                    result[row["rsid"]][name].append(dict(row))
+
+        if remapped:
+            found = result
+            result = {}
+            for rsid in rsids:
+                current = remapped.get(rsid)
+                result[rsid] = found[rsid] if current is None else {**found[current], "current_rsid": current}
+
         return result
     
+    def insert_merges_batch(self, pairs: List[tuple]) -> None:
+        """Add dbSNP merge entries to the remap index.
+        
+        Args:
+            pairs: (old_rs_number, current_rs_number) integer tuples
+        """
+        if not pairs:
+            return
+        self.cursor.executemany(
+            "INSERT OR REPLACE INTO rsid_merges (old_id, current_id) VALUES (?, ?)", pairs
+        )
+        self.conn.commit()
+        self._has_merges = True
+    
+    def flatten_merges(self, max_passes: int = 32) -> int:
+        """Point every merge entry at the end of its chain (a -> b -> c becomes a -> c).
+        
+        Returns:
+            Number of passes that changed rows
+        """
+        passes = 0
+        while passes < max_passes:
+            self.cursor.execute("""
+                UPDATE rsid_merges
+                SET current_id = (SELECT m.current_id FROM rsid_merges m
+                                  WHERE m.old_id = rsid_merges.current_id)
+                WHERE current_id IN (SELECT old_id FROM rsid_merges)
+            """)
+            if self.cursor.rowcount <= 0:
+                break
+            passes += 1
+        self.conn.commit()
+        return passes
+    
+    def _merges_present(self) -> bool:
+        """Whether the merge index has any rows (cached)."""
+        if self._has_merges is None:
+            try:
+                row = self.conn.execute("SELECT EXISTS (SELECT 1 FROM rsid_merges)").fetchone()
+                self._has_merges = bool(row[0])
+            except sqlite3.OperationalError:
+                # Database created before merge support and not yet initialized
+                self._has_merges = False
+        return self._has_merges
+    
+    def remap_rsids(self, rsids: List[str]) -> Dict[str, str]:
+        """Resolve retired rsIDs to current ones through the merge index.
+        
+        Args:
+            rsids: rsIDs to check
+        
+        Returns:
+            Dict of retired rsid -> current rsid, for the inputs that were merged
+        """
+        if not self._merges_present():
+            return {}
+        
+        numbers = list({int(r[2:]) for r in rsids if r.startswith("rs") and r[2:].isdigit()})
+        remapped = {}
+        chunk_size = 500
+        for i in range(0, len(numbers), chunk_size):
+            chunk = numbers[i:i + chunk_size]
+            placeholders = ",".join("?" * len(chunk))
+            self.cursor.execute(
+                f"SELECT old_id, current_id FROM rsid_merges WHERE old_id IN ({placeholders})", chunk
+            )
+            for old_id, current_id in self.cursor.fetchall():
+                remapped[f"rs{old_id}"] = f"rs{current_id}"
+        return remapped
+    
+    def iter_merges(self, batch_size: int = 50000):
+        """Yield batches of (old_rs_number, current_rs_number) merge entries."""
+        cursor = self.conn.execute("SELECT old_id, current_id FROM rsid_merges")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield [tuple(row) for row in rows]
+    
+    def initialize_source(self, source) -> None:
+        """Create an annotation-source plugin's table and register it for lookups.
+        
+        Args:
+            source: AnnotationSource whose name, table and columns are plain
+                lowercase SQL identifiers
+        
+        Raises:
+            ValueError: If a name is not a valid identifier or the table is reserved
+        """
+        for identifier in (source.name, source.table, *source.columns):
+            if not _IDENTIFIER_RE.match(identifier):
+                raise ValueError(f"Invalid annotation source identifier: {identifier!r}")
+        if source.table in _RESERVED_TABLES or source.name in ("clinvar", "gwas", "current_rsid"):
+            raise ValueError(f"Annotation source {source.name!r} cannot use table {source.table!r}")
+        
+        for statement in source.schema():
+            self.cursor.execute(statement)
+        self.cursor.execute(
+            "INSERT OR REPLACE INTO annotation_sources (name, table_name, label) VALUES (?, ?, ?)",
+            (source.name, source.table, source.label),
+        )
+        self.conn.commit()
+        self._source_tables = None
+    
+    def source_tables(self) -> Dict[str, str]:
+        """Return plugin source name -> table for every registered source."""
+        if self._source_tables is None:
+            try:
+                rows = self.conn.execute("SELECT name, table_name FROM annotation_sources ORDER BY name").fetchall()
+            except sqlite3.OperationalError:
+                # Database created before source plugins and not yet initialized
+                rows = []
+            self._source_tables = {row[0]: row[1] for row in rows}
+        return self._source_tables
+    
+    def insert_source_batch(self, source, records: List[Dict[str, Any]]) -> None:
+        """Bulk insert records into a plugin source's table.
+        
+        Args:
+            source: AnnotationSource the records belong to
+            records: Dicts with an rsid key plus the source's columns
+        """
+        if not records:
+            return
+        
+        columns = ["rsid", *source.columns]
+        self.cursor.executemany(
+            f"INSERT INTO {source.table} ({', '.join(columns)}) "
+            f"VALUES ({', '.join(':' + column for column in columns)})",
+            [{column: record.get(column) for column in columns} for record in records]
+        )
+        self.conn.commit()
+    
+    def clear_source(self, source, where: Optional[Dict[str, Any]] = None) -> None:
+        """Delete the rows of a plugin source's table.
+        
+        Args:
+            source: AnnotationSource whose table to clear
+            where: Only delete rows whose columns equal these values
+                (default: every row)
+        """
+        if source.table not in self.source_tables().values():
+            raise ValueError(f"Unknown annotation source table: {source.table}")
+        where = where or {}
+        for column in where:
+            if column not in source.columns:
+                raise ValueError(f"Unknown column for {source.name}: {column!r}")
+        condition = " AND ".join(f"{column} = :{column}" for column in where)
+        self.cursor.execute(
+            f"DELETE FROM {source.table}" + (f" WHERE {condition}" if condition else ""), where
+        )
+        self.conn.commit()
+    
+    def lookup_association(self, association_id: int) -> List[Dict[str, Any]]:
+        """Return every GWAS row of one catalog association (all its rsIDs).
+        
+        Args:
+            association_id: Value of a GWAS row's association_id
+        
+        Returns:
+            List of GWAS row dicts, ordered by rsID
+        """
+        self.cursor.execute(
+            "SELECT * FROM gwas WHERE association_id = ? ORDER BY rsid", (association_id,)
+        )
+        return [dict(row) for row in self.cursor.fetchall()]
+    
     def set_metadata(self, key: str, value: str) -> None:
         """Set metadata key-value pair.
         
@@ -209,6 +862,185 @@ class AllelioDB:
         row = self.cursor.fetchone()
         return row[0] if row else None
     
+    def data_version(self) -> str:
+        """Return an identifier that changes whenever annotation content changes.
+        
+        Analysis results computed against one data version stay valid until
+        the next setup, update or merge-history load (see bump_data_version).
+        Databases built before versioning fall back to their last_update.
+        """
+        return self.get_metadata("data_version") or self.get_metadata("last_update") or "unversioned"
+    
+    def bump_data_version(self) -> str:
+        """Assign a new data version after changing annotation content.
+        
+        The rsIDs whose annotations changed since the previous version are
+        recorded with it (see record_changes).
+        
+        Returns:
+            The new version
+        """
+        version = uuid.uuid4().hex
+        self.record_changes(version)
+        self.set_metadata("data_version", version)
+        return version
+    
+    def _digest_selects(self) -> List[str]:
+        """SELECTs yielding (rsid, row digest) for every annotation row.
+        
+        Interned strings are digested by value and ingest-assigned ids
+        (row ids, association_id) are left out, so reloading identical data
+        gives identical digests. A retired rsID's digest covers its merge target.
+        """
+        selects = [
+            """SELECT rsid, allelio_row_digest('clinvar', gene, clinical_significance,
+                      (SELECT value FROM strings WHERE id = conditions_id),
+                      review_status, last_evaluated, alleles) AS digest FROM clinvar""",
+            """SELECT rsid, allelio_row_digest('gwas', trait, p_value, odds_ratio, mapped_gene,
+                      (SELECT value FROM strings WHERE id = study_id),
+                      pubmed_id, link, association_type, risk_allele) AS digest FROM gwas""",
+            "SELECT 'rs' || old_id AS rsid, allelio_row_digest('rsid_merges', current_id) AS digest FROM rsid_merges",
+        ]
+        for name, table in self.source_tables().items():
+            self.cursor.execute(f"PRAGMA table_info({table})")
+            columns = [row["name"] for row in self.cursor.fetchall() if row["name"] not in ("id", "rsid")]
+            selects.append(f"SELECT rsid, allelio_row_digest('{name}', {', '.join(columns)}) AS digest FROM {table}")
+        return selects
+    
+    def record_changes(self, version: str) -> Optional[Dict[str, int]]:
+        """Record which rsIDs were added, changed or removed under a data version.
+        
+        Every annotated rsID gets a digest of its ClinVar, GWAS, plugin-source
+        and merge rows; the digests are compared with those stored by the
+        previous version, and the differences logged in rsid_changes. Only the
+        last CHANGE_LOG_VERSIONS versions keep their change sets.
+        
+        Args:
+            version: The new data version
+        
+        Returns:
+            Counts by change kind ("added", "changed", "removed"), or None if
+            there was no previous version to compare with
+        """
+        self.conn.create_function("allelio_row_digest", -1, _row_digest, deterministic=True)
+        self.cursor.execute("DROP TABLE IF EXISTS temp.new_digests")
+        self.cursor.execute("""
+            CREATE TEMP TABLE new_digests (
+                rsid TEXT PRIMARY KEY,
+                digest INTEGER NOT NULL
+            ) WITHOUT ROWID
+        """)
+        self.cursor.execute(
+            "INSERT INTO temp.new_digests (rsid, digest) SELECT rsid, SUM(digest) FROM ("
+            + " UNION ALL ".join(self._digest_selects())
+            + ") GROUP BY rsid"
+        )
+        
+        counts = None
+        if self.conn.execute("SELECT 1 FROM data_versions LIMIT 1").fetchone():
+            self.cursor.execute("""
+                INSERT INTO rsid_changes (version, rsid, change)
+                SELECT ?, n.rsid, CASE WHEN o.rsid IS NULL THEN 'added' ELSE 'changed' END
+                FROM temp.new_digests n LEFT JOIN rsid_digests o ON o.rsid = n.rsid
+                WHERE o.digest IS NOT n.digest
+            """, (version,))
+            self.cursor.execute("""
+                INSERT INTO rsid_changes (version, rsid, change)
+                SELECT ?, o.rsid, 'removed' FROM rsid_digests o
+                WHERE NOT EXISTS (SELECT 1 FROM temp.new_digests n WHERE n.rsid = o.rsid)
+            """, (version,))
+            counts = {"added": 0, "changed": 0, "removed": 0}
+            self.cursor.execute(
+                "SELECT change, COUNT(*) FROM rsid_changes WHERE version = ? GROUP BY change", (version,)
+            )
+            counts.update({row[0]: row[1] for row in self.cursor.fetchall()})
+        
+        self.cursor.execute(
+            "INSERT INTO data_versions (version, created_at, added, changed, removed) VALUES (?, ?, ?, ?, ?)",
+            (version, datetime.now().isoformat(),
+             *((counts[kind] for kind in ("added", "changed", "removed")) if counts else (None,) * 3)),
+        )
+        self.cursor.execute("DELETE FROM rsid_digests")
+        self.cursor.execute("INSERT INTO rsid_digests SELECT rsid, digest FROM temp.new_digests")
+        self.cursor.execute("DROP TABLE temp.new_digests")
+        
+        # Older change sets are dropped; genomes analyzed before them are
+        # re-analyzed in full
+        self.cursor.execute(
+            "DELETE FROM rsid_changes WHERE version IN "
+            "(SELECT version FROM data_versions WHERE seq <= (SELECT MAX(seq) FROM data_versions) - ?)",
+            (CHANGE_LOG_VERSIONS,),
+        )
+        self.cursor.execute(
+            "DELETE FROM data_versions WHERE seq <= (SELECT MAX(seq) FROM data_versions) - ?",
+            (CHANGE_LOG_VERSIONS,),
+        )
+        self.conn.commit()
+        return counts
+    
+    def change_counts(self, version: str) -> Optional[Dict[str, int]]:
+        """Return the added/changed/removed rsID counts recorded for a data version.
+        
+        Returns:
+            Counts by change kind, or None if the version has no change set
+        """
+        row = self.conn.execute(
+            "SELECT added, changed, removed FROM data_versions WHERE version = ?", (version,)
+        ).fetchone()
+        if row is None or row["added"] is None:
+            return None
+        return {"added": row["added"], "changed": row["changed"], "removed": row["removed"]}
+    
+    def _logged_changes(self, version: str) -> Optional[set]:
+        """rsIDs recorded as changed by every data version after ``version``."""
+        row = self.conn.execute("SELECT seq FROM data_versions WHERE version = ?", (version,)).fetchone()
+        if row is None:
+            return None
+        later = self.conn.execute(
+            "SELECT version, added FROM data_versions WHERE seq > ? ORDER BY seq", (row["seq"],)
+        ).fetchall()
+        if any(entry["added"] is None for entry in later):
+            return None
+        
+        changed = set()
+        for entry in later:
+            self.cursor.execute("SELECT rsid FROM rsid_changes WHERE version = ?", (entry["version"],))
+            changed.update(r[0] for r in self.cursor.fetchall())
+        return changed
+    
+    def merged_into(self, rsids) -> set:
+        """Return the retired rsIDs that resolve to any of the given rsIDs."""
+        if not self._merges_present():
+            return set()
+        
+        numbers = [int(rsid[2:]) for rsid in rsids if rsid.startswith("rs") and rsid[2:].isdigit()]
+        retired = set()
+        for i in range(0, len(numbers), 500):
+            chunk = numbers[i:i + 500]
+            self.cursor.execute(
+                f"SELECT old_id FROM rsid_merges WHERE current_id IN ({','.join('?' * len(chunk))})", chunk
+            )
+            retired.update(f"rs{row[0]}" for row in self.cursor.fetchall())
+        return retired
+    
+    def changes_since(self, version: str) -> Optional[set]:
+        """Return the rsIDs whose lookup results may differ from a data version's.
+        
+        That is every rsID added, changed or removed by later versions, plus
+        retired rsIDs merged into one of them.
+        
+        Args:
+            version: A data version that results were computed against
+        
+        Returns:
+            Set of rsIDs (empty for the current version), or None if the
+            change sets since that version are unknown
+        """
+        changed = self._logged_changes(version)
+        if changed is None:
+            return None
+        return changed | self.merged_into(changed)
+    
     def get_stats(self) -> Dict[str, Any]:
         """Get database statistics.
 
@@ -0,0 +1,278 @@
+"""Streaming download-to-database building blocks.
+
+These helpers let ``setup_database`` ingest reference data without writing
+intermediate files: HTTP chunks are pulled on a background thread, fed
+through incremental gzip or zip decompression, and split into text lines
+that the ClinVar and GWAS line parsers consume directly.
+
+Everything except ``stream_url`` works on plain iterables of bytes, so the
+pipeline can be driven from a local file or an in-memory buffer in tests.
+"""
+
+import queue
+import struct
+import threading
+import zlib
+from typing import Callable, Generator, Iterable, Optional
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+CHUNK_SIZE = 65536
+
+_ZIP_LOCAL_HEADER = b"PK\x03\x04"
+_ZIP_DATA_DESCRIPTOR = b"PK\x07\x08"
+
+
+def stream_url(
+    url: str,
+    chunk_size: int = CHUNK_SIZE,
+    progress_callback: Optional[Callable] = None,
+    log: Optional[Callable] = None,
+) -> Generator[bytes, None, None]:
+    """Yield the body of an HTTP GET as it arrives.
+
+    Args:
+        url: URL to fetch
+        chunk_size: Bytes per yielded chunk
+        progress_callback: Optional callback function(downloaded_bytes, total_bytes)
+        log: Optional function to print status messages
+
+    Yields:
+        Raw (still compressed) body chunks
+
+    Raises:
+        ImportError: If httpx is not installed
+        RuntimeError: If the connection ends before Content-Length bytes arrive
+    """
+    if httpx is None:
+        raise ImportError("httpx is required for downloading. Install with: pip install httpx")
+
+    def _log(msg):
+        if log:
+            log(msg)
+
+    timeout = httpx.Timeout(30.0, read=300.0)
+    with httpx.stream("GET", url, follow_redirects=True, timeout=timeout) as response:
+        response.raise_for_status()
+        total_bytes = int(response.headers.get("content-length", 0))
+        total_mb = total_bytes / (1024 * 1024) if total_bytes else 0
+
+        downloaded = 0
+        last_pct = -1
+        for chunk in response.iter_bytes(chunk_size=chunk_size):
+            if not chunk:
+                continue
+            downloaded += len(chunk)
+            if progress_callback:
+                progress_callback(downloaded, total_bytes)
+            if total_bytes > 0:
+                pct = int(downloaded * 100 / total_bytes) // 10 * 10
+                if pct > last_pct:
+                    last_pct = pct
+                    _log(f"       ... {downloaded / (1024 * 1024):.0f} MB / {total_mb:.0f} MB ({pct}%)")
+            yield chunk
+
+    if total_bytes > 0 and downloaded < total_bytes:
+        raise RuntimeError(f"Incomplete download: got {downloaded:,} of {total_bytes:,} bytes")
+
+
+def prefetch(chunks: Iterable[bytes], max_chunks: int = 64) -> Generator[bytes, None, None]:
+    """Pull chunks from a source on a background thread.
+
+    Network reads then overlap with decompression, parsing and database
+    inserts on the consuming thread. The queue is bounded, so a slow
+    consumer applies backpressure instead of buffering the whole download.
+    Exceptions raised by the source are re-raised in the consumer.
+
+    Args:
+        chunks: Source iterable (e.g. stream_url(...))
+        max_chunks: Maximum chunks buffered between the threads
+
+    Yields:
+        The source's chunks, in order
+    """
+    buffer = queue.Queue(maxsize=max_chunks)
+    done = object()
+    stop = threading.Event()
+
+    def producer():
+        source = iter(chunks)
+        try:
+            for chunk in source:
+                while not stop.is_set():
+                    try:
+                        buffer.put(chunk, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+            buffer.put(done)
+        except BaseException as e:  # re-raised on the consumer side
+            buffer.put(e)
+        finally:
+            # Release the HTTP connection held by a generator source
+            if hasattr(source, "close"):
+                source.close()
+
+    thread = threading.Thread(target=producer, name="allelio-prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        # Consumer stopped early (error or close): let the producer exit
+        stop.set()
+
+
+def _split_lines(data: Iterable[bytes], errors: str) -> Generator[str, None, None]:
+    """Split a stream of decompressed bytes into decoded lines (without newlines)."""
+    remainder = b""
+    for piece in data:
+        if not piece:
+            continue
+        piece = remainder + piece
+        lines = piece.split(b"\n")
+        remainder = lines.pop()
+        for line in lines:
+            yield line.decode("utf-8", errors)
+    if remainder:
+        yield remainder.decode("utf-8", errors)
+
+
+def _gunzip(chunks: Iterable[bytes]) -> Generator[bytes, None, None]:
+    """Incrementally decompress a (possibly multi-member) gzip stream."""
+    decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        while chunk:
+            yield decompressor.decompress(chunk)
+            if not decompressor.eof:
+                break
+            # Concatenated gzip members: restart on the leftover bytes
+            chunk = decompressor.unused_data
+            decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+    yield decompressor.flush()
+
+
+def iter_gzip_lines(chunks: Iterable[bytes], errors: str = "strict") -> Generator[str, None, None]:
+    """Decompress gzip chunks and yield text lines as they become available.
+
+    Args:
+        chunks: gzip-compressed byte chunks
+        errors: UTF-8 decoding error handler
+
+    Yields:
+        Decoded lines without trailing newlines
+    """
+    yield from _split_lines(_gunzip(chunks), errors)
+
+
+class _ByteReader:
+    """Pull exact byte counts from a chunk iterator (for zip headers)."""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self.buffer = bytearray()
+
+    def fill(self, n: int) -> bool:
+        """Buffer at least n bytes; False if the stream ends first."""
+        while len(self.buffer) < n:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return False
+            self.buffer += chunk
+        return True
+
+    def take(self, n: int) -> bytes:
+        if not self.fill(n):
+            raise ValueError("Zip stream ended unexpectedly")
+        data = bytes(self.buffer[:n])
+        del self.buffer[:n]
+        return data
+
+    def chunks(self) -> Generator[bytes, None, None]:
+        """Yield the buffered bytes, then the rest of the source."""
+        if self.buffer:
+            data = bytes(self.buffer)
+            self.buffer.clear()
+            yield data
+        # A plain loop (not yield from) so abandoning this generator mid-member
+        # does not close the shared source
+        for chunk in self._chunks:
+            yield chunk
+
+
+def _inflate_member(reader: _ByteReader) -> Generator[bytes, None, None]:
+    """Inflate one deflate-compressed zip member, leaving trailing bytes buffered."""
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+    for chunk in reader.chunks():
+        yield decompressor.decompress(chunk)
+        if decompressor.eof:
+            reader.buffer[:0] = decompressor.unused_data
+            return
+    raise ValueError("Zip stream ended inside a compressed member")
+
+
+def iter_zip_lines(
+    chunks: Iterable[bytes],
+    member_suffix: str = ".tsv",
+    errors: str = "strict",
+) -> Generator[str, None, None]:
+    """Yield text lines of the first matching member of a streamed zip archive.
+
+    Zip archives keep their directory at the end, so this walks local file
+    headers instead. Deflate members are self-terminating, which lets
+    archives written with data descriptors (unknown sizes up front) stream
+    as well. Stored members are supported only when their size is in the
+    local header.
+
+    Args:
+        chunks: Zip archive byte chunks
+        member_suffix: Name suffix of the member to read (first match wins)
+        errors: UTF-8 decoding error handler
+
+    Yields:
+        Decoded lines without trailing newlines
+
+    Raises:
+        ValueError: If no member matches or the archive cannot be streamed
+    """
+    reader = _ByteReader(chunks)
+
+    while reader.fill(4) and bytes(reader.buffer[:4]) == _ZIP_LOCAL_HEADER:
+        header = reader.take(30)
+        flags, method = struct.unpack("<HH", header[6:10])
+        compressed_size = struct.unpack("<I", header[18:22])[0]
+        name_len, extra_len = struct.unpack("<HH", header[26:30])
+        name = reader.take(name_len).decode("utf-8", "replace")
+        reader.take(extra_len)
+
+        has_descriptor = bool(flags & 0x08)
+        if method == 8:
+            data = _inflate_member(reader)
+        elif method == 0 and not has_descriptor:
+            data = iter([reader.take(compressed_size)])
+        else:
+            raise ValueError(f"Cannot stream zip member {name!r} (compression method {method})")
+
+        if name.endswith(member_suffix):
+            yield from _split_lines(data, errors)
+            return
+
+        # Not the member we want: drain it, then skip its data descriptor
+        for _ in data:
+            pass
+        if has_descriptor:
+            reader.fill(4)
+            reader.take(16 if bytes(reader.buffer[:4]) == _ZIP_DATA_DESCRIPTOR else 12)
+
+    raise ValueError(f"No *{member_suffix} member found in zip stream")
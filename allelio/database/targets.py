@@ -0,0 +1,79 @@
+"""Target rsID sets for the slim "array-only" database profile.
+
+Consumer genotyping arrays only assay a fixed set of rsIDs, so annotations
+for any other variant can never match. A target set collected from chip
+manifests or sample genotype files lets ``setup_database`` keep only the
+rows a user could ever look up.
+"""
+
+import gzip
+import re
+from pathlib import Path
+from typing import Iterable, Set
+
+from allelio.parsers import parse_genotype_file
+
+
+_RSID_RE = re.compile(r"^rs\d+$")
+_SPLIT_RE = re.compile(r"[\t,\s]")
+
+
+def _read_manifest(filepath: str) -> Set[str]:
+    """Read rsIDs from a plain manifest file.
+
+    Accepts one rsID per line, or delimited rows whose first column is an
+    rsID (tab, comma, or whitespace separated). Comment lines starting with
+    '#' and rows without an rsID (headers, section markers) are skipped.
+
+    Args:
+        filepath: Path to the manifest file (can be gzipped)
+
+    Returns:
+        Set of rsIDs found in the file
+    """
+    file_opener = gzip.open if filepath.endswith('.gz') else open
+
+    rsids = set()
+    with file_opener(filepath, 'rt', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            if not line.strip() or line.startswith('#'):
+                continue
+            first = _SPLIT_RE.split(line.strip(), 1)[0].strip('"').lower()
+            if _RSID_RE.match(first):
+                rsids.add(first)
+    return rsids
+
+
+def load_target_rsids(paths: Iterable[str]) -> Set[str]:
+    """Collect the union of rsIDs from manifests and genotype files.
+
+    Each path is first tried as a genotype file (23andMe, AncestryDNA, VCF).
+    Files that are not recognized, or that yield no variants, are read as
+    plain rsID manifests.
+
+    Args:
+        paths: Paths to chip manifests or sample genotype files
+
+    Returns:
+        Set of target rsIDs
+
+    Raises:
+        FileNotFoundError: If a path does not exist
+    """
+    targets = set()
+    for filepath in paths:
+        filepath = str(filepath)
+        if not Path(filepath).exists():
+            raise FileNotFoundError(f"File not found: {filepath}")
+
+        try:
+            variants = parse_genotype_file(filepath)
+        except ValueError:
+            variants = []
+
+        found = {v.rsid for v in variants if v.rsid.startswith('rs')}
+        if not found:
+            found = _read_manifest(filepath)
+        targets |= found
+
+    return targets
@@ -0,0 +1,154 @@
+"""Structured telemetry for reference database ingest.
+
+setup_database records one PhaseStats per phase (downloads, per-source
+ingest, finalize) into an IngestTelemetry: wall time, bytes and rows moved,
+time spent producing parsed batches versus inserting them, and rows the
+parsers dropped, by reason. The result is written as a JSON report so ingest
+performance can be compared across releases.
+
+Example:
+    telemetry = IngestTelemetry()
+    setup_database(db, telemetry=telemetry)
+    print(telemetry.report()["phases"]["ingest:clinvar"]["rows_per_second"])
+"""
+
+import json
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+
+REPORT_FORMAT = 1
+
+# Reasons parsers give for dropping a row
+SKIP_NO_RSID = "no_rsid"
+SKIP_WRONG_ASSEMBLY = "wrong_assembly"
+SKIP_MALFORMED = "malformed"
+SKIP_NOT_TARGETED = "not_targeted"
+
+
+def count_skip(skipped: Optional[Dict[str, int]], reason: str) -> None:
+    """Increment a parser's skip counter, if the caller asked for one."""
+    if skipped is not None:
+        skipped[reason] = skipped.get(reason, 0) + 1
+
+
+def format_eta(seconds: Optional[float]) -> str:
+    """Format an ETA in seconds as e.g. '2m 05s' ('?' when unknown)."""
+    if seconds is None:
+        return "?"
+    minutes, secs = divmod(int(seconds), 60)
+    return f"{minutes}m {secs:02d}s" if minutes else f"{secs}s"
+
+
+class PhaseStats:
+    """Counters for one ingest phase."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started: Optional[float] = None
+        self.ended: Optional[float] = None
+        self.bytes = 0
+        self.total_bytes = 0
+        self.rows = 0
+        self.parse_seconds = 0.0
+        self.insert_seconds = 0.0
+        # Filled in place by the parsers (see count_skip)
+        self.skipped: Dict[str, int] = {}
+
+    def start(self) -> "PhaseStats":
+        """Mark the phase as started (first call wins)."""
+        if self.started is None:
+            self.started = time.perf_counter()
+        return self
+
+    def finish(self) -> None:
+        """Mark the phase as finished."""
+        self.start()
+        self.ended = time.perf_counter()
+
+    @property
+    def wall_seconds(self) -> float:
+        if self.started is None:
+            return 0.0
+        return (self.ended or time.perf_counter()) - self.started
+
+    def eta_seconds(self) -> Optional[float]:
+        """Estimate seconds until bytes reach total_bytes at the current rate."""
+        if self.ended is not None:
+            return 0.0
+        if not self.total_bytes or not self.bytes or not self.wall_seconds:
+            return None
+        rate = self.bytes / self.wall_seconds
+        return max(self.total_bytes - self.bytes, 0) / rate
+
+    def to_dict(self) -> Dict[str, Any]:
+        wall = self.wall_seconds
+        return {
+            "wall_seconds": round(wall, 3),
+            "bytes": self.bytes,
+            "total_bytes": self.total_bytes,
+            "bytes_per_second": round(self.bytes / wall, 1) if wall else 0.0,
+            "rows": self.rows,
+            "rows_per_second": round(self.rows / wall, 1) if wall else 0.0,
+            "parse_seconds": round(self.parse_seconds, 3),
+            "insert_seconds": round(self.insert_seconds, 3),
+            "rows_filtered": sum(self.skipped.values()),
+            "filtered": dict(sorted(self.skipped.items())),
+            "complete": self.ended is not None,
+        }
+
+
+class IngestTelemetry:
+    """Collects PhaseStats for one setup/update run."""
+
+    def __init__(self):
+        self.started_at = datetime.now()
+        self._started = time.perf_counter()
+        self._ended: Optional[float] = None
+        self.phases: Dict[str, PhaseStats] = {}
+        self.info: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def phase(self, name: str) -> PhaseStats:
+        """Return the named phase, creating it on first use."""
+        with self._lock:
+            stats = self.phases.get(name)
+            if stats is None:
+                stats = self.phases[name] = PhaseStats(name)
+            return stats
+
+    def update_bytes(self, name: str, downloaded: int, total: int) -> None:
+        """Record absolute download progress for a phase."""
+        stats = self.phase(name).start()
+        stats.bytes = downloaded
+        stats.total_bytes = total
+
+    def eta_seconds(self) -> Optional[float]:
+        """Longest ETA across the downloads still running (None if unknown)."""
+        running = [s for s in self.phases.values() if s.total_bytes and s.ended is None]
+        etas = [s.eta_seconds() for s in running]
+        if not running or any(eta is None for eta in etas):
+            return None
+        return max(etas)
+
+    def finish(self) -> None:
+        """Mark the whole run as finished."""
+        self._ended = time.perf_counter()
+
+    def report(self) -> Dict[str, Any]:
+        """Return the run as a JSON-serializable dict."""
+        wall = (self._ended or time.perf_counter()) - self._started
+        return {
+            "format": REPORT_FORMAT,
+            "started_at": self.started_at.isoformat(),
+            "wall_seconds": round(wall, 3),
+            **self.info,
+            "phases": {name: stats.to_dict() for name, stats in self.phases.items()},
+        }
+
+    def write_report(self, path: str) -> None:
+        """Write the report as a JSON document."""
+        Path(path).write_text(json.dumps(self.report(), indent=2))
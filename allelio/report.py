@@ -4,7 +4,11 @@ from datetime import datetime
 from typing import Any, Dict, List, Optional
 import html as html_escape
 
-from allelio.analysis.lookup import _get_review_stars
+from allelio.analysis.classify import review_stars, significance_tier
+
+
+# Variant cards shown per category section
+MAX_CARDS_PER_CATEGORY = 100
 
 
 def _get_gene(variant) -> str:
@@ -45,7 +49,9 @@ def _get_review_stars_html(variant) -> str:
     if not variant.clinvar_entries:
         return ""
     entry = variant.clinvar_entries[0]
-    stars = getattr(entry, 'review_stars', 0)
+    stars = getattr(entry, 'review_stars', None)
+    if stars is None:
+        stars = review_stars(getattr(entry, 'review_status', None))
     filled = "\u2605" * stars        # ★
     empty = "\u2606" * (4 - stars)   # ☆
     if stars >= 3:
@@ -77,6 +83,7 @@ def generate_html_report(
     explanations: Dict[str, str],
     summary: str,
     metadata: Dict[str, Any],
+    category_counts: Optional[Dict[str, int]] = None,
 ) -> str:
     """Generate a professional HTML report for variant analysis results.
 
@@ -86,6 +93,9 @@ def generate_html_report(
         summary: Executive summary string
         metadata: Dict with keys: generated_at, db_version, model_used,
                   file_analyzed, total_variants, significant_variants
+        category_counts: Total matches per category, when ``results`` only
+            holds the most significant ones (see analyze_top_variants);
+            section counts default to the number of results given
 
     Returns:
         Complete HTML report as a string
@@ -99,13 +109,16 @@ def generate_html_report(
     total_variants = metadata.get("total_variants", 0)
     significant_variants = metadata.get("significant_variants", 0)
 
-    # Categorize results using actual VariantCategory values
-    health_conditions = [r for r in results if r.category == "Health Conditions"]
-    risk_factors = [r for r in results if r.category == "Risk Factors"]
-    pharma = [r for r in results if r.category == "Pharmacogenomics"]
-    traits = [r for r in results if r.category == "Traits"]
-    carrier = [r for r in results if r.category == "Carrier Status"]
-    other = [r for r in results if r.category in ("Unknown",)]
+    # Categorize results using actual VariantCategory values (one pass)
+    by_category = {}
+    for r in results:
+        by_category.setdefault(r.category, []).append(r)
+    health_conditions = by_category.get("Health Conditions", [])
+    risk_factors = by_category.get("Risk Factors", [])
+    pharma = by_category.get("Pharmacogenomics", [])
+    traits = by_category.get("Traits", [])
+    carrier = by_category.get("Carrier Status", [])
+    other = by_category.get("Unknown", [])
 
     def generate_variant_card(variant, explanation=None):
         """Generate HTML for a single variant card."""
@@ -117,6 +130,12 @@ def generate_html_report(
             "Carrier Status": "#16a34a",
             "Unknown": "#6b7280",
         }
+        tier_colors = {
+            "High": "#dc2626",
+            "Moderate": "#ea580c",
+            "Low": "#eab308",
+            "Minimal": "#6b7280",
+        }
         color = category_colors.get(variant.category, "#6b7280")
 
         gene = _get_gene(variant)
@@ -129,19 +148,8 @@ def generate_html_report(
         pubmed_url = f"https://pubmed.ncbi.nlm.nih.gov/?term={gene}+{variant.rsid}" if gene != "Unknown" else "#"
 
         # Rank label
-        rank = variant.significance_rank
-        if rank <= 2:
-            rank_label = "High"
-            rank_color = "#dc2626"
-        elif rank <= 4:
-            rank_label = "Moderate"
-            rank_color = "#ea580c"
-        elif rank <= 6:
-            rank_label = "Low"
-            rank_color = "#eab308"
-        else:
-            rank_label = "Minimal"
-            rank_color = "#6b7280"
+        rank_label = significance_tier(variant.significance_rank)
+        rank_color = tier_colors[rank_label]
 
         card_html = f'''
         <div class="variant-card" style="border-left: 5px solid {color};">
@@ -211,13 +219,18 @@ def generate_html_report(
         (carrier, "Carrier Status", "#16a34a", "carrier-status", "Benign or carrier-status variants."),
     ]
 
+    def section_count(variant_list):
+        if category_counts is None:
+            return len(variant_list)
+        return category_counts.get(variant_list[0].category, len(variant_list))
+
     # Build tab navigation — only for sections that have results
     active_sections = [(vl, t, c, sid, d) for vl, t, c, sid, d in sections if vl]
     tab_nav_html = ""
     if len(active_sections) > 1:
         tab_nav_html = '<nav class="tab-nav" id="tab-nav">\n'
         for _, title, color, section_id, _ in active_sections:
-            count = len([vl for vl, t, c, sid, d in active_sections if sid == section_id][0])
+            count = section_count([vl for vl, t, c, sid, d in active_sections if sid == section_id][0])
             tab_nav_html += f'  <a href="#{section_id}" class="tab-link" style="--tab-color: {color};">{title} <span class="tab-count">{count}</span></a>\n'
         tab_nav_html += '</nav>\n'
 
@@ -225,9 +238,9 @@ def generate_html_report(
         if not variant_list:
             continue
         # Show up to 100 per category
-        display_list = sorted(variant_list, key=lambda x: x.significance_rank)[:100]
+        display_list = sorted(variant_list, key=lambda x: x.significance_rank)[:MAX_CARDS_PER_CATEGORY]
         categories_html += f'<section class="category-section" id="{section_id}">\n'
-        categories_html += f'<h2 class="category-title" style="color: {color}; border-color: {color};">{title} ({len(variant_list)})</h2>\n'
+        categories_html += f'<h2 class="category-title" style="color: {color}; border-color: {color};">{title} ({section_count(variant_list)})</h2>\n'
         categories_html += f'<p class="category-desc">{description}</p>\n'
         categories_html += '<div class="variants-grid">\n'
         for variant in display_list:
@@ -241,7 +254,7 @@ def generate_html_report(
         categories_html = '<section class="category-section">\n'
         categories_html += '<h2 class="category-title">All Findings</h2>\n'
         categories_html += '<div class="variants-grid">\n'
-        for variant in sorted(results, key=lambda x: x.significance_rank)[:100]:
+        for variant in sorted(results, key=lambda x: x.significance_rank)[:MAX_CARDS_PER_CATEGORY]:
             explanation = explanations.get(variant.rsid)
             categories_html += generate_variant_card(variant, explanation)
         categories_html += '</div>\n</section>\n'
@@ -11,14 +11,19 @@ from starlette.concurrency import run_in_executor
 
 from allelio import __version__
 from allelio.parsers import parse_genotype_file
-from allelio.database.store import AllelioDB
-from allelio.analysis.lookup import analyze_variants, VariantResult
+from allelio.database import AllelioDB, open_database
+from allelio.analysis.cache import ResultCache, hash_genome
+from allelio.analysis.lookup import iter_ranked_hits, results_from_hits, VariantResult
+from allelio.analysis.session import AnalysisSession, SessionPool
 from allelio.ai.engine import AIEngine
 from allelio.ai.safety import get_variant_warnings
 from allelio.web.app import templates
 
 router = APIRouter()
 
+# Analyses kept in memory for follow-up queries (see /api/sessions)
+sessions = SessionPool()
+
 
 @router.get("/", response_class=HTMLResponse)
 async def read_root(request: Request) -> str:
@@ -48,7 +53,7 @@ async def get_status() -> Dict[str, Any]:
     }
 
     try:
-        db = AllelioDB()
+        db = open_database()
         db_ready = db.is_initialized()
         if db_ready:
             stats = db.get_statistics()
@@ -69,11 +74,12 @@ async def get_status() -> Dict[str, Any]:
 
 
 @router.post("/api/analyze")
-async def analyze_file(file: UploadFile = File(...)) -> Dict[str, Any]:
+async def analyze_file(file: UploadFile = File(...), save: bool = False) -> Dict[str, Any]:
     """
     Analyze uploaded genotype file.
     
-    Returns analysis results with AI explanations.
+    Returns analysis results with AI explanations. The file's genotypes and
+    findings are saved to the result cache only with ?save=true.
     """
     temp_file_path = None
     try:
@@ -92,31 +98,26 @@ async def analyze_file(file: UploadFile = File(...)) -> Dict[str, Any]:
         with open(temp_file_path, "wb") as f:
             f.write(content)
 
-        # Parse genotype file
-        loop = asyncio.get_event_loop()
-        genotypes = await loop.run_in_executor(
-            None, parse_genotype_file, str(temp_file_path)
-        )
-        
-        if not genotypes:
-            raise HTTPException(
-                status_code=400, 
-                detail="No valid genotype data found in file"
-            )
-
-        # Open database and run analysis
-        db = AllelioDB()
+        # Open database
+        db = open_database()
         if not db.is_initialized():
             raise HTTPException(
                 status_code=503,
                 detail="Database is not initialized. Please run 'allelio setup-db' first."
             )
 
-        # Analyze variants
+        # Parse and analyze, or reuse the cached analysis of this file
+        loop = asyncio.get_event_loop()
         analysis_results = await loop.run_in_executor(
-            None, analyze_variants, genotypes, db
+            None, _analyze_cached, str(temp_file_path), content, db, save
         )
 
+        if analysis_results is None:
+            raise HTTPException(
+                status_code=400, 
+                detail="No valid genotype data found in file"
+            )
+
         if not analysis_results:
             raise HTTPException(
                 status_code=400,
@@ -210,6 +211,99 @@ async def analyze_file(file: UploadFile = File(...)) -> Dict[str, Any]:
                 pass
 
 
+@router.post("/api/sessions")
+async def create_session(file: UploadFile = File(...), save: bool = False) -> Dict[str, Any]:
+    """
+    Parse and analyze an uploaded genotype file once and keep it in memory.
+    
+    Returns a session ID for /api/sessions/{session_id}/... queries. Nothing
+    is written to disk unless ?save=true.
+    """
+    if not file.filename:
+        raise HTTPException(status_code=400, detail="No filename provided")
+    content = await file.read()
+    if not content:
+        raise HTTPException(status_code=400, detail="Uploaded file is empty")
+
+    db = open_database()
+    ready = db.is_initialized()
+    db.close()
+    if not ready:
+        raise HTTPException(
+            status_code=503,
+            detail="Database is not initialized. Please run 'allelio setup' first."
+        )
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_file_path = Path(temp_dir) / Path(file.filename).name
+        temp_file_path.write_bytes(content)
+        loop = asyncio.get_event_loop()
+        try:
+            session = await loop.run_in_executor(None, _open_session, temp_file_path, save)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+
+    session_id = sessions.add(session)
+    return {
+        "session_id": session_id,
+        "name": session.name,
+        "total_variants": session.variant_count,
+        "total_hits": len(session),
+        "categories": session.categories,
+    }
+
+
+@router.get("/api/sessions/{session_id}/results")
+async def query_session(
+    session_id: str,
+    category: Optional[str] = None,
+    gene: Optional[str] = None,
+    min_stars: int = 0,
+    max_p_value: Optional[float] = None,
+    offset: int = 0,
+    limit: int = 50,
+) -> Dict[str, Any]:
+    """Page through a session's results, most significant first, with optional filters."""
+    session = _get_session(session_id)
+    page = session.query(
+        category=category,
+        gene=gene,
+        min_stars=min_stars,
+        max_p_value=max_p_value,
+        offset=offset,
+        limit=min(limit, 500),
+    )
+    return {
+        "results": [_session_result(result) for result in page.results],
+        "total": page.total,
+        "offset": page.offset,
+        "limit": page.limit,
+        "has_more": page.has_more,
+    }
+
+
+@router.get("/api/sessions/{session_id}/variants/{rsid}")
+async def lookup_session_variant(session_id: str, rsid: str) -> Dict[str, Any]:
+    """Return a session's genotype and analysis result for one rsID."""
+    session = _get_session(session_id)
+    result = session.lookup(rsid)
+    return {
+        "rsid": rsid.strip().lower(),
+        "genotype": session.genotype(rsid),
+        "result": _session_result(result) if result is not None else None,
+    }
+
+
+@router.delete("/api/sessions/{session_id}")
+async def close_session(session_id: str) -> Dict[str, Any]:
+    """Drop a session and free its memory."""
+    if not sessions.remove(session_id):
+        raise HTTPException(status_code=404, detail="Unknown or expired session")
+    return {"closed": session_id}
+
+
 @router.post("/api/export")
 async def export_report(analysis_data: Dict[str, Any]) -> FileResponse:
     """
@@ -246,6 +340,102 @@ async def export_report(analysis_data: Dict[str, Any]) -> FileResponse:
         )
 
 
+def _analyze_cached(path: str, content: bytes, db: AllelioDB, save: bool = False) -> Optional[List[VariantResult]]:
+    """Analyze a genotype file, reusing cached hits for identical uploads.
+
+    Args:
+        save: Save the genome and its hits to the result cache (and reuse
+            hits saved earlier); otherwise nothing is written to disk
+
+    Returns:
+        Analysis results, or None if the file has no genotype data
+    """
+    data_version = db.data_version()
+    genome_hash = hash_genome(content)
+    cache = None
+    if save:
+        try:
+            cache = ResultCache()
+        except Exception:
+            cache = None
+
+    cached = cache.get(genome_hash, data_version) if cache is not None else None
+    if cached is not None:
+        hits, _ = cached
+    else:
+        genotypes = parse_genotype_file(path)
+        if not genotypes:
+            return None
+        hits = iter_ranked_hits(genotypes, db)
+        if cache is not None:
+            cache.store_genome(genome_hash, genotypes, name=Path(path).name)
+            hits = cache.record(hits, genome_hash, data_version, len(genotypes), strings=db)
+
+    try:
+        return results_from_hits(hits, db)
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+def _open_session(path: Path, save: bool = False) -> AnalysisSession:
+    """Build a session for an uploaded file, saving it to the result cache if asked."""
+    if not save:
+        return AnalysisSession.from_file(path)
+    try:
+        cache = ResultCache()
+    except Exception:
+        cache = None
+    try:
+        return AnalysisSession.from_file(path, cache=cache)
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+def _get_session(session_id: str) -> AnalysisSession:
+    session = sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired session")
+    return session
+
+
+def _session_result(result: VariantResult) -> Dict[str, Any]:
+    """Serialize a session result for JSON responses."""
+    return {
+        "rsid": result.rsid,
+        "chromosome": result.chromosome,
+        "position": result.position,
+        "genotype": result.genotype,
+        "category": result.category,
+        "significance_rank": result.significance_rank,
+        "dosage": result.dosage,
+        "clinvar": [
+            {
+                "gene": entry.gene,
+                "clinical_significance": entry.clinical_significance,
+                "conditions": entry.conditions,
+                "review_status": entry.review_status,
+                "review_stars": entry.review_stars,
+            }
+            for entry in result.clinvar_entries
+        ],
+        "gwas": [
+            {
+                "trait": entry.trait,
+                "p_value": entry.p_value,
+                "odds_ratio": entry.odds_ratio,
+                "mapped_gene": entry.mapped_gene,
+                "study": entry.study,
+                "pubmed_id": entry.pubmed_id,
+            }
+            for entry in result.gwas_entries
+        ],
+        "annotations": result.annotations,
+        "warnings": get_variant_warnings(result),
+    }
+
+
 def _get_top_categories(results: List[VariantResult]) -> List[str]:
     """Extract top categories from analysis results."""
     categories = {}
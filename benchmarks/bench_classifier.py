@@ -0,0 +1,141 @@
+"""Benchmark per-hit classification: keyword scans vs. the compiled classifier.
+
+Usage:
+    python benchmarks/bench_classifier.py [--hits N]
+
+Synthetic hits reuse realistic ClinVar significance / review-status strings
+and GWAS trait names. The baseline is the previous implementation (ordered
+substring scans over SIGNIFICANCE_RANKS and REVIEW_STATUS_STARS, any()
+keyword checks per trait); the compiled run uses allelio.analysis.classify.
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from allelio.analysis import classify  # noqa: E402
+from allelio.database.clinvar import REVIEW_STATUS_STARS  # noqa: E402
+
+
+SIGNIFICANCES = [
+    "Pathogenic", "Likely pathogenic", "Pathogenic/Likely pathogenic", "Uncertain significance",
+    "Benign", "Likely benign", "Benign/Likely benign", "risk factor", "drug response",
+    "Conflicting interpretations of pathogenicity", "Pathogenic; risk factor", "association",
+    "Uncertain significance/Uncertain risk allele", "protective", "not provided",
+]
+REVIEWS = [
+    "criteria provided, single submitter", "criteria provided, multiple submitters, no conflicts",
+    "reviewed by expert panel", "no assertion criteria provided", "practice guideline",
+    "criteria provided, conflicting classifications",
+]
+TRAITS = [
+    "Height", "Body mass index", "Type 2 diabetes", "Response to statin therapy", "Alzheimer's disease",
+    "Breast cancer", "Eye color", "Coronary artery disease", "LDL cholesterol levels",
+    "Warfarin maintenance dose", "Schizophrenia", "Educational attainment",
+]
+
+
+def _legacy_rank(clinical_significance):
+    if not clinical_significance:
+        return 999
+    sig_lower = clinical_significance.lower()
+    for key, rank in classify.SIGNIFICANCE_RANKS.items():
+        if sig_lower == key:
+            return rank
+    for key, rank in classify.SIGNIFICANCE_RANKS.items():
+        if key in sig_lower:
+            return rank
+    return 999
+
+
+def _legacy_stars(review_status):
+    if not review_status:
+        return 0
+    status_lower = review_status.lower().strip()
+    if status_lower in REVIEW_STATUS_STARS:
+        return REVIEW_STATUS_STARS[status_lower]
+    for key, stars in REVIEW_STATUS_STARS.items():
+        if key in status_lower:
+            return stars
+    return 0
+
+
+def _legacy_category(significance, traits):
+    if significance is not None:
+        sig = significance.lower()
+        if any(x in sig for x in ["pathogenic", "likely pathogenic"]):
+            return "Health Conditions"
+        if any(x in sig for x in ["risk factor", "risk_factor", "association"]):
+            return "Risk Factors"
+        if "likely benign" in sig or "benign" in sig:
+            return "Carrier Status"
+    if traits:
+        for trait in traits:
+            trait = trait.lower()
+            if any(x in trait for x in ["drug", "pharmacogenom", "medication", "response"]):
+                return "Pharmacogenomics"
+            if "risk" in trait or "association" in trait:
+                return "Risk Factors"
+        return "Traits"
+    return "Unknown"
+
+
+def make_hits(count):
+    rng = random.Random(0)
+    hits = []
+    for _ in range(count):
+        has_clinvar = rng.random() < 0.6
+        hits.append((
+            rng.choice(SIGNIFICANCES) if has_clinvar else None,
+            rng.choice(REVIEWS) if has_clinvar else None,
+            [rng.choice(TRAITS) for _ in range(rng.randrange(0 if has_clinvar else 1, 6))],
+        ))
+    return hits
+
+
+def legacy(hits):
+    out = []
+    for significance, review, traits in hits:
+        rank = _legacy_rank(significance) - _legacy_stars(review) * 0.1 if significance else 4.0
+        out.append((rank, _legacy_category(significance, traits)))
+    return out
+
+
+def compiled(hits):
+    out = []
+    for significance, review, traits in hits:
+        if significance:
+            rank = classify.significance_rank(significance) - classify.review_stars(review) * 0.1
+        else:
+            rank = 4.0
+        out.append((rank, classify.determine_category(significance, traits)))
+    return out
+
+
+def run(label, fn, hits):
+    start = time.perf_counter()
+    out = fn(hits)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<10} {len(hits):>10,} hits  {elapsed:7.3f} s  {elapsed / len(hits) * 1e9:8.0f} ns/hit")
+    return elapsed, out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hits", type=int, default=500_000, help="synthetic hits (default: 500000)")
+    args = parser.parse_args()
+
+    hits = make_hits(args.hits)
+    before, expected = run("before", legacy, hits)
+    after, actual = run("after", compiled, hits)
+    if actual != expected:
+        raise SystemExit("compiled classifier disagrees with the baseline")
+    print(f"speedup: {before / after:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
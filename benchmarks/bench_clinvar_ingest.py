@@ -0,0 +1,89 @@
+"""Benchmark ClinVar ingest: sequential parse loop vs. multi-process pipeline.
+
+Usage:
+    python benchmarks/bench_clinvar_ingest.py [variant_summary.txt.gz] [--rows N] [--workers N]
+
+Without a file argument a synthetic variant_summary.txt.gz with --rows lines
+is generated. Both runs insert into a fresh temporary database through the
+same single writer, so the difference is parse throughput.
+"""
+
+import argparse
+import gzip
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from allelio.database.clinvar import parse_clinvar, parse_clinvar_parallel  # noqa: E402
+from allelio.database.downloader import BATCH_SIZE, _batched  # noqa: E402
+from allelio.database.store import AllelioDB  # noqa: E402
+
+
+SIGNIFICANCES = ["Pathogenic", "Likely pathogenic", "Uncertain significance", "Benign", "risk factor"]
+REVIEWS = ["criteria provided, single submitter", "reviewed by expert panel", "no assertion criteria provided"]
+PHENOTYPES = ["not provided", "Hereditary cancer-predisposing syndrome", "Cardiomyopathy|not specified"]
+
+
+def write_synthetic(path: Path, rows: int) -> None:
+    """Write a synthetic variant_summary.txt.gz with ``rows`` data lines."""
+    rng = random.Random(0)
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        f.write("#AlleleID\t" + "\t".join(f"col{i}" for i in range(1, 34)) + "\n")
+        for i in range(rows):
+            fields = [""] * 34
+            fields[0] = str(i)
+            fields[4] = f"GENE{rng.randrange(5000)}"
+            fields[6] = rng.choice(SIGNIFICANCES)
+            fields[8] = "Jan 01, 2020"
+            fields[9] = str(rng.randrange(1, 10_000_000)) if rng.random() < 0.7 else "-1"
+            fields[13] = rng.choice(PHENOTYPES)
+            fields[16] = "GRCh37" if i % 2 else "GRCh38"
+            fields[24] = rng.choice(REVIEWS)
+            f.write("\t".join(fields) + "\n")
+
+
+def run(label: str, batches, db_path: Path, size_mb: float) -> float:
+    """Insert all batches into a fresh database and print throughput."""
+    db = AllelioDB(str(db_path))
+    db.initialize()
+    start = time.perf_counter()
+    rows = 0
+    for batch in batches:
+        db.insert_clinvar_batch(batch)
+        rows += len(batch)
+    elapsed = time.perf_counter() - start
+    db.close()
+    print(f"{label:<28} {rows:>10,} rows  {elapsed:7.2f} s  "
+          f"{rows / elapsed:>10,.0f} rows/s  {size_mb / elapsed:6.1f} MB/s (compressed)")
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("file", nargs="?", help="variant_summary.txt.gz (default: synthetic)")
+    parser.add_argument("--rows", type=int, default=500_000, help="synthetic rows (default: 500000)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        source = Path(args.file) if args.file else tmp / "variant_summary.txt.gz"
+        if not args.file:
+            print(f"Generating {args.rows:,} synthetic rows...")
+            write_synthetic(source, args.rows)
+        size_mb = source.stat().st_size / (1024 * 1024)
+
+        sequential = run("sequential (setup loop)",
+                         _batched(parse_clinvar(str(source)), BATCH_SIZE), tmp / "seq.db", size_mb)
+        parallel = run(f"parallel ({args.workers} workers)",
+                       parse_clinvar_parallel(str(source), workers=args.workers), tmp / "par.db", size_mb)
+        print(f"speedup: {sequential / parallel:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Benchmark cohort analysis: per-sample analyze_variants vs. analyze_cohort.
+
+Usage:
+    python benchmarks/bench_cohort.py [--samples N] [--variants N] [--annotated N] [--workers N]
+
+A synthetic database annotates --annotated rsIDs (ClinVar and GWAS rows)
+out of an array of --variants rsIDs. Each sample genotypes the array with
+about 2% of its rsIDs swapped for sample-specific ones, like chips of the
+same family. Throughput is reported in samples per minute.
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from allelio.analysis.cohort import analyze_cohort  # noqa: E402
+from allelio.analysis.lookup import analyze_variants  # noqa: E402
+from allelio.database.store import AllelioDB  # noqa: E402
+from allelio.parsers.base import Variant  # noqa: E402
+
+
+SIGNIFICANCES = ["Pathogenic", "Likely pathogenic", "Uncertain significance", "Benign", "risk factor", "association"]
+TRAITS = ["Height", "Body mass index", "Type 2 diabetes", "Response to statin therapy", "Eye color"]
+GENOTYPES = ["AA", "AG", "GG", "CC", "CT", "TT"]
+
+
+def build_db(path: Path, array: list, annotated: int) -> AllelioDB:
+    """Create a database annotating ``annotated`` rsIDs of the array."""
+    rng = random.Random(0)
+    db = AllelioDB(str(path))
+    db.initialize()
+    rsids = rng.sample(array, annotated)
+    db.insert_clinvar_batch([
+        {"rsid": rsid, "gene": f"GENE{rng.randrange(2000)}", "clinical_significance": rng.choice(SIGNIFICANCES),
+         "conditions": f"Condition {rng.randrange(500)}", "review_status": "criteria provided, single submitter",
+         "last_evaluated": "2020-01-01"}
+        for rsid in rsids[: annotated // 2]
+    ])
+    db.insert_gwas_batch([
+        {"rsid": rsid, "trait": rng.choice(TRAITS), "p_value": 1e-8, "odds_ratio": "1.2", "mapped_gene": None,
+         "study": f"Study {rng.randrange(300)}", "pubmed_id": None, "link": None}
+        for rsid in rsids[annotated // 3:]
+    ])
+    return db
+
+
+def make_samples(array: list, count: int) -> dict:
+    rng = random.Random(1)
+    samples = {}
+    for s in range(count):
+        variants = []
+        for i, rsid in enumerate(array):
+            if rng.random() < 0.02:
+                rsid = f"rs{50_000_000 + s * len(array) + i}"
+            variants.append(Variant(rsid, str(i % 22 + 1), i, rng.choice(GENOTYPES)))
+        samples[f"sample{s}"] = variants
+    return samples
+
+
+def report(label: str, samples: int, elapsed: float) -> None:
+    print(f"{label:<28} {samples:>5} samples  {elapsed:7.2f} s  {samples / elapsed * 60:10,.0f} samples/min")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=50, help="genomes in the cohort (default: 50)")
+    parser.add_argument("--variants", type=int, default=100_000, help="rsIDs per genome (default: 100000)")
+    parser.add_argument("--annotated", type=int, default=20_000, help="annotated rsIDs (default: 20000)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    args = parser.parse_args()
+
+    array = [f"rs{1_000_000 + i * 7}" for i in range(args.variants)]
+    with tempfile.TemporaryDirectory() as tmp:
+        db = build_db(Path(tmp) / "bench.db", array, args.annotated)
+        print(f"Generating {args.samples} samples of {args.variants:,} variants...")
+        samples = make_samples(array, args.samples)
+
+        start = time.perf_counter()
+        baseline = {sample: analyze_variants(variants, db) for sample, variants in samples.items()}
+        before = time.perf_counter() - start
+        report("per-sample analyze_variants", args.samples, before)
+
+        for workers in sorted({1, args.workers}):
+            start = time.perf_counter()
+            cohort = analyze_cohort(samples, db, workers=workers)
+            elapsed = time.perf_counter() - start
+            report(f"analyze_cohort ({workers} workers)", args.samples, elapsed)
+            print(f"{'':<28} lookup {cohort.lookup_seconds:.2f} s for {cohort.unique_rsids:,} distinct rsIDs, "
+                  f"build {cohort.build_seconds:.2f} s; speedup {before / elapsed:.2f}x")
+            for sample, results in baseline.items():
+                if [r.rsid for r in cohort.results[sample]] != [r.rsid for r in results]:
+                    raise SystemExit(f"cohort results differ for {sample}")
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
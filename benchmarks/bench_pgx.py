@@ -0,0 +1,147 @@
+"""Benchmark star-allele calling: per-diplotype rescans vs. StarAlleleCaller.
+
+Usage:
+    python benchmarks/bench_pgx.py [--genes N] [--alleles N] [--variants N] [--genomes N]
+
+Synthetic allele definition tables give each gene --alleles star alleles
+over a pool of defining SNPs; each genome is a --variants SNP chip carrying
+two random haplotypes per gene, some reported on the minus strand and some
+defining SNPs left untyped. The baseline builds a genotype dict and, for
+every candidate diplotype, re-resolves the dosage of each defining variant;
+StarAlleleCaller loads the tables once and calls every gene in one pass
+over the genome. Throughput is reported in genomes per second.
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from allelio.analysis.alleles import allele_dosage  # noqa: E402
+from allelio.analysis.pgx import StarAlleleCaller, load_definition_file  # noqa: E402
+from allelio.parsers.base import Variant  # noqa: E402
+
+
+PAIRS = [("A", "G"), ("C", "T"), ("A", "C"), ("G", "T")]
+FLIP = str.maketrans("ACGT", "TGCA")
+
+
+def write_tables(directory: Path, genes: int, alleles: int) -> dict:
+    """Write one definition table per gene; return gene -> {allele: {rsid: alt}}."""
+    rng = random.Random(0)
+    definitions = {}
+    for g in range(genes):
+        gene = f"GENE{g}"
+        sites = [(f"rs{10_000_000 + g * 1000 + i}", rng.choice(PAIRS)) for i in range(alleles * 2)]
+        stars = {}
+        for a in range(2, alleles + 2):
+            chosen = rng.sample(range(len(sites)), rng.randint(1, 3))
+            stars[f"*{a}"] = {sites[i][0]: sites[i][1][1] for i in chosen}
+        with open(directory / f"{gene}_allele_definition_table.tsv", "w") as f:
+            f.write(f"GENE: {gene}\n")
+            f.write("rsID\t" + "\t".join(rsid for rsid, _ in sites) + "\n")
+            f.write("*1\t" + "\t".join(pair[0] for _, pair in sites) + "\n")
+            for name, carried in stars.items():
+                f.write(name + "\t" + "\t".join(carried.get(rsid, "") for rsid, _ in sites) + "\n")
+        definitions[gene] = (sites, stars)
+    return definitions
+
+
+def make_genomes(definitions: dict, variants: int, count: int) -> list:
+    rng = random.Random(1)
+    genomes = []
+    for n in range(count):
+        genome = []
+        for sites, stars in definitions.values():
+            first, second = rng.choice(list(stars.values()) + [{}]), rng.choice(list(stars.values()) + [{}])
+            for rsid, (ref, _) in sites:
+                if rng.random() < 0.05:
+                    continue
+                genotype = first.get(rsid, ref) + second.get(rsid, ref)
+                if rng.random() < 0.1:
+                    genotype = genotype.translate(FLIP)
+                genome.append(Variant(rsid, "1", len(genome), genotype))
+        filler = variants - len(genome)
+        genome += [Variant(f"rs{n}_{i}", "2", i, rng.choice(["AA", "AG", "GG"])) for i in range(filler)]
+        rng.shuffle(genome)
+        genomes.append(genome)
+    return genomes
+
+
+def baseline(definitions: list, genome: list) -> dict:
+    """Re-resolve every defining variant for every candidate diplotype."""
+    genotypes = {v.rsid: v.genotype for v in genome}
+    calls = {}
+    for definition in definitions:
+        site_alleles = {}
+        for rsid, ref, alt in definition.variants:
+            site_alleles.setdefault(rsid, set()).update((ref, alt))
+        names = [definition.reference] + list(definition.alleles)
+        carried = [set()] + [set(bits) for bits in definition.alleles.values()]
+        matches = []
+        best = -1
+        for i in range(len(names)):
+            for j in range(i, len(names)):
+                score = uncalled = 0
+                for bit, (rsid, ref, alt) in enumerate(definition.variants):
+                    dosage = None
+                    if rsid in genotypes:
+                        dosage = allele_dosage(genotypes[rsid], alt, tuple(sorted(site_alleles[rsid])))
+                    expected = (bit in carried[i]) + (bit in carried[j])
+                    if dosage is None:
+                        uncalled += expected
+                    elif dosage != expected:
+                        break
+                    else:
+                        score += expected
+                else:
+                    if score > best:
+                        matches, best = [], score
+                    if score == best:
+                        matches.append((uncalled, i, j))
+        matches.sort()
+        calls[definition.gene] = f"{names[matches[0][1]]}/{names[matches[0][2]]}" if matches else None
+    return calls
+
+
+def report(label: str, genomes: int, elapsed: float) -> None:
+    print(f"{label:<34} {genomes:>6} genomes  {elapsed:7.2f} s  {genomes / elapsed:10,.1f} genomes/s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--genes", type=int, default=15, help="pharmacogenes (default: 15)")
+    parser.add_argument("--alleles", type=int, default=30, help="star alleles per gene (default: 30)")
+    parser.add_argument("--variants", type=int, default=600_000, help="genotyped SNPs per genome (default: 600000)")
+    parser.add_argument("--genomes", type=int, default=5, help="genomes called (default: 5)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        definitions = write_tables(Path(tmp), args.genes, args.alleles)
+        genomes = make_genomes(definitions, args.variants, args.genomes)
+
+        start = time.perf_counter()
+        parsed = [load_definition_file(path) for path in sorted(Path(tmp).iterdir())]
+        expected = [baseline(parsed, genome) for genome in genomes]
+        report("per-diplotype baseline", len(genomes), time.perf_counter() - start)
+
+        start = time.perf_counter()
+        caller = StarAlleleCaller.from_paths([tmp])
+        load = time.perf_counter() - start
+        start = time.perf_counter()
+        called = [caller.call(genome) for genome in genomes]
+        report("StarAlleleCaller.call (one pass)", len(genomes), time.perf_counter() - start)
+        print(f"{'':<34} load {load:.2f} s for {len(caller.rsids):,} defining rsIDs in {len(caller)} genes")
+
+        for want, got in zip(expected, called):
+            for gene, diplotype in want.items():
+                if got[gene].diplotype != diplotype:
+                    raise SystemExit(f"diplotype mismatch for {gene}: {got[gene].diplotype} != {diplotype}")
+
+
+if __name__ == "__main__":
+    main()
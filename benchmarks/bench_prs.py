@@ -0,0 +1,128 @@
+"""Benchmark polygenic scoring: per-row loop vs. ScoreSet arrays vs. streaming.
+
+Usage:
+    python benchmarks/bench_prs.py [--scores N] [--weights N] [--variants N] [--genomes N]
+
+Synthetic scoring files each weight --weights rsIDs drawn from a pool
+shared by all scores (genome-wide scores overlap heavily); a genome
+genotypes --variants rsIDs of that pool, some of them on the minus strand.
+The baseline scores each row with a dict lookup and allele_dosage; ScoreSet
+loads the files once and computes every score per genome in one pass;
+stream_scores re-reads the files for each genome. Throughput is reported
+in scores per second.
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from allelio.analysis.alleles import allele_dosage  # noqa: E402
+from allelio.analysis.prs import ScoreSet, stream_scores  # noqa: E402
+from allelio.parsers.base import Variant  # noqa: E402
+
+
+PAIRS = [("A", "G"), ("C", "T"), ("A", "C"), ("G", "T")]
+FLIP = str.maketrans("ACGT", "TGCA")
+
+
+def write_scores(directory: Path, count: int, weights: int, pool: list) -> list:
+    rng = random.Random(0)
+    paths = []
+    for s in range(count):
+        path = directory / f"PGS{s:06d}.txt"
+        with open(path, "w") as f:
+            f.write(f"#pgs_id=PGS{s:06d}\n#weight_type=beta\n")
+            f.write("rsID\tchr_name\tchr_position\teffect_allele\tother_allele\teffect_weight\n")
+            for i in sorted(rng.sample(range(len(pool)), weights)):
+                rsid, chromosome, position, (ref, alt) = pool[i]
+                effect, other = (alt, ref) if rng.random() < 0.5 else (ref, alt)
+                f.write(f"{rsid}\t{chromosome}\t{position}\t{effect}\t{other}\t{rng.gauss(0, 0.05):.6f}\n")
+        paths.append(path)
+    return paths
+
+
+def make_genomes(pool: list, variants: int, count: int) -> list:
+    rng = random.Random(1)
+    genomes = []
+    for _ in range(count):
+        genome = []
+        for rsid, chromosome, position, pair in rng.sample(pool, variants):
+            genotype = "".join(rng.choice(pair) for _ in range(2))
+            if rng.random() < 0.1:
+                genotype = genotype.translate(FLIP)
+            genome.append(Variant(rsid, chromosome, position, genotype))
+        genomes.append(genome)
+    return genomes
+
+
+def baseline(paths: list, genome: list) -> list:
+    """Score each file row by row against a genotype dict."""
+    genotypes = {v.rsid: v.genotype for v in genome}
+    totals = []
+    for path in paths:
+        total = 0.0
+        with open(path) as f:
+            rows = [line.rstrip("\n").split("\t") for line in f if not line.startswith("#")][1:]
+        for rsid, _, _, effect, other, weight in rows:
+            genotype = genotypes.get(rsid)
+            if genotype:
+                dosage = allele_dosage(genotype, effect, (effect, other))
+                if dosage:
+                    total += dosage * float(weight)
+        totals.append(total)
+    return totals
+
+
+def report(label: str, scores: int, elapsed: float) -> None:
+    print(f"{label:<34} {scores:>6} scores  {elapsed:7.2f} s  {scores / elapsed:10,.1f} scores/s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scores", type=int, default=20, help="scoring files (default: 20)")
+    parser.add_argument("--weights", type=int, default=100_000, help="weights per score (default: 100000)")
+    parser.add_argument("--variants", type=int, default=300_000, help="genotyped rsIDs per genome (default: 300000)")
+    parser.add_argument("--genomes", type=int, default=3, help="genomes scored (default: 3)")
+    args = parser.parse_args()
+
+    rng = random.Random(2)
+    pool_size = max(args.weights, args.variants) * 2
+    pool = [(f"rs{1_000_000 + i * 3}", str(i % 22 + 1), 10_000 + i * 50, rng.choice(PAIRS)) for i in range(pool_size)]
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"Writing {args.scores} scoring files of {args.weights:,} weights...")
+        paths = write_scores(Path(tmp), args.scores, args.weights, pool)
+        genomes = make_genomes(pool, args.variants, args.genomes)
+        total = args.scores * args.genomes
+
+        start = time.perf_counter()
+        expected = [baseline(paths, genome) for genome in genomes]
+        report("row-by-row baseline", total, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        scores = ScoreSet()
+        for path in paths:
+            scores.add_file(path)
+        load = time.perf_counter() - start
+        start = time.perf_counter()
+        computed = [scores.compute(genome) for genome in genomes]
+        elapsed = time.perf_counter() - start
+        report("ScoreSet.compute (one pass)", total, elapsed)
+        print(f"{'':<34} load {load:.2f} s for {scores.slot_count:,} distinct variants")
+
+        start = time.perf_counter()
+        streamed = [stream_scores(paths, genome) for genome in genomes]
+        report("stream_scores", total, time.perf_counter() - start)
+
+        for want, got, rows in zip(expected, computed, streamed):
+            for value, result, row in zip(want, got.values(), rows):
+                if abs(value - result.score) > 1e-6 or abs(value - row.score) > 1e-6:
+                    raise SystemExit(f"score mismatch for {result.pgs_id}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Benchmark all-pairs relatedness on 2-bit packed genomes.
+
+Usage:
+    python benchmarks/bench_relatedness.py [--genomes N] [--snps N]
+
+A synthetic family (two parents, two children) plus unrelated genomes
+genotype the same --snps biallelic SNPs, as from one chip. Packing and the
+all-pairs comparison are timed separately; the naive baseline compares one
+pair site by site for scale.
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from allelio.analysis.relatedness import pack_genomes  # noqa: E402
+from allelio.parsers.base import Variant  # noqa: E402
+
+
+PAIRS = [("A", "G"), ("C", "T"), ("A", "C"), ("G", "T")]
+
+
+def make_genomes(count: int, snps: int) -> dict:
+    rng = random.Random(0)
+    sites = [(f"rs{1_000_000 + i}", str(i % 22 + 1), 10_000 + i * 50, rng.choice(PAIRS), rng.uniform(0.05, 0.5))
+             for i in range(snps)]
+
+    def haplotype():
+        return [pair[1] if rng.random() < freq else pair[0] for _, _, _, pair, freq in sites]
+
+    def transmit(parent):
+        return [rng.choice(alleles) for alleles in zip(*parent)]
+
+    def genome(first, second):
+        return [Variant(rsid, chromosome, position, a + b)
+                for (rsid, chromosome, position, _, _), a, b in zip(sites, first, second)]
+
+    mother, father = (haplotype(), haplotype()), (haplotype(), haplotype())
+    haplotypes = {"mother": mother, "father": father}
+    for child in ("child1", "child2"):
+        haplotypes[child] = (transmit(mother), transmit(father))
+    for i in range(count - len(haplotypes)):
+        haplotypes[f"unrelated{i}"] = (haplotype(), haplotype())
+    return {name: genome(*pair) for name, pair in haplotypes.items()}
+
+
+def naive_ibs(a: list, b: list, sites: set) -> tuple:
+    """IBS counts for one pair, site by site over the packed sites."""
+    calls = {v.rsid: v.genotype for v in b}
+    counts = [0, 0, 0]
+    for variant in a:
+        other = calls.get(variant.rsid)
+        if other is None or variant.rsid not in sites:
+            continue
+        if sorted(variant.genotype) == sorted(other):
+            counts[2] += 1
+        elif variant.genotype[0] == variant.genotype[1] and other[0] == other[1]:
+            counts[0] += 1
+        else:
+            counts[1] += 1
+    return tuple(counts)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--genomes", type=int, default=24, help="genomes, including a family of four (default: 24)")
+    parser.add_argument("--snps", type=int, default=600_000, help="SNPs per genome (default: 600000)")
+    args = parser.parse_args()
+
+    print(f"Generating {args.genomes} genomes of {args.snps:,} SNPs...")
+    genomes = make_genomes(max(args.genomes, 4), args.snps)
+
+    start = time.perf_counter()
+    packed = pack_genomes(genomes)
+    pack_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    pairs = packed.all_pairs()
+    pair_seconds = time.perf_counter() - start
+    print(f"pack      {len(genomes):>4} genomes  {pack_seconds:7.2f} s  {len(packed.sites):,} sites")
+    print(f"all pairs {len(pairs):>4} pairs    {pair_seconds:7.2f} s  {len(pairs) / pair_seconds:10,.0f} pairs/s")
+
+    start = time.perf_counter()
+    expected = naive_ibs(genomes["mother"], genomes["child1"], set(packed.sites))
+    naive_seconds = time.perf_counter() - start
+    print(f"naive        1 pair     {naive_seconds:7.2f} s  {1 / naive_seconds:10,.1f} pairs/s")
+
+    found = next(p for p in pairs if (p.sample_a, p.sample_b) == ("mother", "child1"))
+    if (found.ibs0, found.ibs1, found.ibs2) != expected:
+        raise SystemExit(f"IBS mismatch: {found} vs {expected}")
+    for pair in pairs:
+        if pair.relationship != "unrelated":
+            print(f"  {pair.sample_a} — {pair.sample_b}: kinship {pair.kinship:.3f}, {pair.relationship}")
+
+
+if __name__ == "__main__":
+    main()
@@ -271,3 +271,64 @@ def sample_db(tmp_dir) -> AllelioDB:
     db.insert_gwas_batch(gwas_records)
     
     return db
+
+
+def _clinvar_line(allele_id, rs_num, gene, significance, phenotypes, review_status,
+                  assembly="GRCh37", chromosome="1", start="100", ref="A", alt="G"):
+    """Build one tab-delimited variant_summary.txt row (34 columns)."""
+    fields = [""] * 34
+    fields[0] = str(allele_id)
+    fields[1] = "single nucleotide variant"
+    fields[4] = gene
+    fields[6] = significance
+    fields[8] = "Jan 01, 2020"
+    fields[9] = rs_num
+    fields[13] = phenotypes
+    fields[16] = assembly
+    fields[18] = chromosome
+    fields[19] = start
+    fields[21] = ref
+    fields[22] = alt
+    fields[24] = review_status
+    fields[31] = start
+    fields[32] = ref
+    fields[33] = alt
+    return "\t".join(fields)
+
+
+@pytest.fixture
+def sample_clinvar_file(tmp_dir) -> str:
+    """Create a small gzipped ClinVar variant_summary.txt file.
+
+    Includes GRCh37 and GRCh38 rows for the same variant, a row without an
+    rsID, and a row on an unsupported assembly.
+
+    Args:
+        tmp_dir: Temporary directory fixture
+
+    Returns:
+        Path to the synthetic variant_summary.txt.gz file
+    """
+    import gzip
+
+    file_path = Path(tmp_dir) / "variant_summary.txt.gz"
+    header = "#AlleleID\tType\tName\tGeneID\tGeneSymbol\tHGNC_ID\tClinicalSignificance\tClinSigSimple\tLastEvaluated\tRS# (dbSNP)\tnsv/esv (dbVar)\tRCVaccession\tPhenotypeIDS\tPhenotypeList\tOrigin\tOriginSimple\tAssembly\tChromosomeAccession\tChromosome\tStart\tStop\tReferenceAllele\tAlternateAllele\tCytogenetic\tReviewStatus\tNumberSubmitters\tGuidelines\tTestedInGTR\tOtherIDs\tSubmitterCategories\tVariationID\tPositionVCF\tReferenceAlleleVCF\tAlternateAlleleVCF"
+    lines = [
+        header,
+        _clinvar_line(1, "429358", "APOE", "risk factor", "Alzheimer disease",
+                      "criteria provided, single submitter", "GRCh37", "19", "45411941", "T", "C"),
+        _clinvar_line(1, "429358", "APOE", "risk factor", "Alzheimer disease",
+                      "criteria provided, single submitter", "GRCh38", "19", "44908684", "T", "C"),
+        _clinvar_line(2, "762551", "CYP1A2", "Pathogenic", "Caffeine sensitivity",
+                      "criteria provided, multiple submitters, no conflicts", "GRCh37", "15", "75041917", "C", "A"),
+        _clinvar_line(3, "-1", "BRCA1", "Pathogenic", "Breast cancer",
+                      "reviewed by expert panel", "GRCh37", "17", "41245466", "G", "A"),
+        _clinvar_line(4, "80357906", "BRCA1", "Pathogenic", "Hereditary breast and ovarian cancer syndrome",
+                      "reviewed by expert panel", "NCBI36", "17", "38498993", "C", "T"),
+        _clinvar_line(5, "12913832", "HERC2", "Benign", "Eye color",
+                      "no assertion criteria provided", "GRCh37", "15", "28365618", "A", "G"),
+    ]
+
+    with gzip.open(file_path, "wt", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    return str(file_path)
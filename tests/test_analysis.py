@@ -594,3 +594,759 @@ class TestWeightedSignificanceRanking:
         # rs_a (4 stars) should come before rs_b (0 stars)
         assert results[0].rsid == "rs_a"
         assert results[1].rsid == "rs_b"
+
+
+class TestLazyStrings:
+    """Tests for lazily resolved condition and study text on entries."""
+
+    def test_conditions_resolved_on_access(self, sample_db):
+        """Test that ClinVar conditions resolve through the store reference."""
+        variants = [
+            Variant(rsid="rs429358", chromosome="19", position=45411941, genotype="CT"),
+        ]
+        results = analyze_variants(variants, sample_db)
+
+        entry = results[0].clinvar_entries[0]
+        assert entry.conditions_ref is not None
+        assert entry.__dict__.get("_conditions") is None
+        assert entry.conditions == "Alzheimer disease"
+
+    def test_study_resolved_on_access(self, sample_db):
+        """Test that GWAS study titles resolve through the store reference."""
+        variants = [
+            Variant(rsid="rs4988235", chromosome="2", position=135951944, genotype="CC"),
+        ]
+        results = analyze_variants(variants, sample_db)
+
+        assert results[0].gwas_entries[0].study == "Itan et al. 2010"
+
+    def test_inline_values_still_supported(self):
+        """Test that entries built with inline text need no store."""
+        entry = ClinVarEntry(rsid="rs1", conditions="Test condition")
+        gwas = GWASEntry(rsid="rs1", study="Test study")
+
+        assert entry.conditions == "Test condition"
+        assert gwas.study == "Test study"
+        assert entry == ClinVarEntry(rsid="rs1", conditions="Test condition")
+
+
+class TestClassifier:
+    """Tests for the compiled significance/category classifier."""
+
+    def test_significance_rank_substring_order(self):
+        """Test that substring matches keep SIGNIFICANCE_RANKS order."""
+        from allelio.analysis.classify import significance_rank
+
+        assert significance_rank("Pathogenic/Likely pathogenic") == 2
+        assert significance_rank("Conflicting interpretations of pathogenicity") == 1
+        assert significance_rank("Likely benign; other") == 8
+        assert significance_rank(None) == 999
+
+    def test_category_priority(self):
+        """Test that ClinVar decides first, then the first categorizing trait."""
+        from allelio.analysis.classify import determine_category
+
+        assert determine_category("Benign/Pathogenic", []) == VariantCategory.HEALTH_CONDITIONS.value
+        assert determine_category("risk_factor", []) == VariantCategory.RISK_FACTORS.value
+        assert determine_category(None, ["Height", "Risk of drug response"]) == VariantCategory.PHARMACOGENOMICS.value
+        assert determine_category("Uncertain significance", ["Height"]) == VariantCategory.TRAITS.value
+        assert determine_category(None, []) == VariantCategory.UNKNOWN.value
+
+    def test_memoized(self):
+        """Test that repeated strings are served from the cache."""
+        from allelio.analysis.classify import trait_category
+
+        trait_category.cache_clear()
+        for _ in range(3):
+            trait_category("Warfarin maintenance dose")
+        assert trait_category.cache_info().hits == 2
+
+    def test_significance_tier(self):
+        """Test report tiers for weighted ranks."""
+        from allelio.analysis.classify import significance_tier
+
+        assert [significance_tier(r) for r in (0.6, 2.9, 4.0, 7, 999)] == [
+            "High", "Moderate", "Moderate", "Minimal", "Minimal",
+        ]
+
+
+class TestTopVariants:
+    """Tests for top-K streaming analysis."""
+
+    VARIANTS = [
+        Variant(rsid=rsid, chromosome="1", position=i, genotype="AG")
+        for i, rsid in enumerate(["rs429358", "rs7412", "rs12913832", "rs4988235", "rs762551", "rs999"])
+    ]
+
+    def test_matches_full_sort(self, sample_db):
+        """Test that the kept results equal the head of the fully sorted list."""
+        from collections import Counter
+        from allelio.analysis.lookup import analyze_top_variants
+
+        full = analyze_variants(self.VARIANTS, sample_db, include_benign=True)
+        for k in range(len(full) + 1):
+            top = analyze_top_variants(self.VARIANTS, sample_db, top=k, include_benign=True, chunk_size=2)
+            assert [r.rsid for r in top.top] == [r.rsid for r in full[:k]]
+
+        assert top.total == len(full)
+        assert top.category_counts == dict(Counter(r.category for r in full))
+        assert top.significant == sum(1 for r in full if r.significance_rank <= 4)
+
+    def test_per_category_and_filter(self, sample_db):
+        """Test per-category heaps, counters and the category filter."""
+        from allelio.analysis.lookup import analyze_top_variants
+
+        full = analyze_variants(self.VARIANTS, sample_db)
+        top = analyze_top_variants(self.VARIANTS, sample_db, top=1, per_category=1)
+        for category, kept in top.by_category.items():
+            expected = [r.rsid for r in full if r.category == category][:1]
+            assert [r.rsid for r in kept] == expected
+
+        traits = analyze_top_variants(self.VARIANTS, sample_db, top=10, categories={"Traits"})
+        assert traits.total == sum(1 for r in full if r.category == "Traits")
+        assert all(r.category == "Traits" for r in traits.top)
+        assert traits.by_category == {}
+
+    def test_bounded_heap_keeps_earliest_ties(self):
+        """Test that ties keep the earlier items, like a stable sort."""
+        from allelio.analysis.lookup import _BoundedHeap
+
+        heap = _BoundedHeap(2)
+        for seq, (rank, name) in enumerate([(4.0, "a"), (1.0, "b"), (4.0, "c"), (1.0, "d"), (0.5, "e")]):
+            if heap.accepts(rank, seq):
+                heap.push(rank, seq, name)
+        assert heap.sorted() == ["e", "b"]
+
+
+class TestResultCache:
+    """Tests for the persistent analysis-result cache."""
+
+    VARIANTS = TestTopVariants.VARIANTS
+
+    def _cache(self, tmp_dir, **kwargs):
+        import os
+        from allelio.analysis.cache import ResultCache
+
+        return ResultCache(os.path.join(tmp_dir, "cache.db"), **kwargs)
+
+    def test_round_trip(self, sample_db, tmp_dir):
+        """Test that cached hits give the same results as a fresh analysis."""
+        from allelio.analysis.lookup import iter_ranked_hits, select_top_variants
+
+        version = sample_db.data_version()
+        with self._cache(tmp_dir) as cache:
+            assert cache.get("g1", version) is None
+            recorded = cache.record(iter_ranked_hits(self.VARIANTS, sample_db), "g1", version, len(self.VARIANTS))
+            fresh = select_top_variants(recorded, sample_db, top=10, per_category=2)
+
+            hits, count = cache.get("g1", version)
+            cached = select_top_variants(hits, sample_db, top=10, per_category=2)
+
+        assert count == len(self.VARIANTS)
+        assert [vars(r) for r in cached.top] == [vars(r) for r in fresh.top]
+        assert cached.category_counts == fresh.category_counts
+        assert cached.significant == fresh.significant
+
+    def test_keyed_by_options(self, sample_db, tmp_dir):
+        """Test that entries for other analysis options are not returned."""
+        version = sample_db.data_version()
+        with self._cache(tmp_dir) as cache:
+            cache.put("g1", version, [], 3, include_benign=True)
+            assert cache.get("g1", version) is None
+            assert cache.get("g1", version, include_benign=True) == ([], 3)
+            assert cache.get("g2", version, include_benign=True) is None
+
+    def test_record_stores_only_when_exhausted(self, sample_db, tmp_dir):
+        """Test that a partially consumed stream is not cached."""
+        from allelio.analysis.lookup import iter_ranked_hits
+
+        version = sample_db.data_version()
+        with self._cache(tmp_dir) as cache:
+            recorded = cache.record(iter_ranked_hits(self.VARIANTS, sample_db), "g1", version, 6)
+            next(recorded)
+            assert cache.get("g1", version) is None
+            list(recorded)
+            assert cache.get("g1", version) is not None
+
+    def test_stale_after_database_changes(self, sample_db, tmp_dir):
+        """Test that entries from an earlier data version are not returned."""
+        version = sample_db.data_version()
+        with self._cache(tmp_dir) as cache:
+            cache.put("g1", version, [], 3)
+            sample_db.bump_data_version()
+            assert sample_db.data_version() != version
+            assert cache.get("g1", sample_db.data_version()) is None
+            # Kept for incremental re-analysis until evicted
+            assert cache.load("g1")[2] == version
+            assert cache.evict_stale(sample_db.data_version()) == 1
+            assert cache.stats()["entries"] == 0
+
+    def test_lru_limit(self, sample_db, tmp_dir):
+        """Test that only the most recently used entries are kept."""
+        version = sample_db.data_version()
+        with self._cache(tmp_dir, max_entries=2) as cache:
+            cache.put("g1", version, [], 1)
+            cache.put("g2", version, [], 2)
+            cache.get("g1", version)
+            cache.put("g3", version, [], 3)
+            assert cache.get("g2", version) is None
+            assert cache.get("g1", version) is not None
+            assert cache.get("g3", version) is not None
+
+    def test_analyze_saves_only_when_asked(self, sample_db, sample_23andme_file, tmp_dir, monkeypatch):
+        """Test that `allelio analyze` writes no genotypes unless --save-for-reanalysis is given."""
+        from pathlib import Path
+        from click.testing import CliRunner
+        from allelio.analysis.cache import ResultCache
+        from allelio.cli import allelio
+
+        home = Path(tmp_dir) / "home"
+        monkeypatch.setenv("HOME", str(home))
+        monkeypatch.setenv("ALLELIO_DB", str(sample_db.db_path))
+        cache_path = home / ".allelio" / "data" / "result_cache.db"
+        args = ["analyze", sample_23andme_file, "--no-ai", "-o", str(Path(tmp_dir) / "report.html")]
+
+        result = CliRunner().invoke(allelio, args)
+        assert result.exit_code == 0, result.output
+        assert not cache_path.exists()
+
+        result = CliRunner().invoke(allelio, args + ["--save-for-reanalysis"])
+        assert result.exit_code == 0, result.output
+        with ResultCache(str(cache_path)) as cache:
+            assert cache.stats()["genomes"] == 1
+            assert cache.stats()["entries"] == 1
+
+        result = CliRunner().invoke(allelio, ["cache", "clear"])
+        assert result.exit_code == 0, result.output
+        with ResultCache(str(cache_path)) as cache:
+            assert cache.stats() == {"entries": 0, "bytes": 0, "genomes": 0}
+
+
+class TestIncrementalReanalysis:
+    """Tests for re-analyzing cached genomes from the database change log."""
+
+    VARIANTS = TestTopVariants.VARIANTS + [
+        Variant(rsid="rs555", chromosome="2", position=7, genotype="CC"),
+        Variant(rsid="i7001", chromosome="3", position=8, genotype="GG"),
+    ]
+
+    def _analyze(self, cache, db, genome_hash="g1"):
+        from allelio.analysis.lookup import iter_ranked_hits
+
+        cache.store_genome(genome_hash, self.VARIANTS, name="me.txt")
+        version = db.data_version()
+        list(cache.record(iter_ranked_hits(self.VARIANTS, db), genome_hash, version, len(self.VARIANTS),
+                          strings=db))
+
+    def _update(self, db):
+        db.cursor.execute("UPDATE clinvar SET clinical_significance = 'pathogenic' WHERE rsid = 'rs4988235'")
+        db.cursor.execute("DELETE FROM clinvar WHERE rsid = 'rs7412'")
+        db.cursor.execute("DELETE FROM gwas WHERE rsid = 'rs7412'")
+        db.conn.commit()
+        db.insert_gwas_batch([{
+            "rsid": "rs555", "trait": "Height", "p_value": 1e-9, "odds_ratio": None, "mapped_gene": None,
+            "study": None, "pubmed_id": None, "link": None,
+        }])
+        db.bump_data_version()
+
+    def test_only_changed_rsids_rechecked(self, sample_db, tmp_dir):
+        """Test that re-analysis looks up the changed rsIDs and reports the diff."""
+        import os
+        from allelio.analysis.cache import ResultCache, _encode_hit
+        from allelio.analysis.incremental import reanalyze_cached
+        from allelio.analysis.lookup import iter_ranked_hits
+
+        sample_db.bump_data_version()
+        with ResultCache(os.path.join(tmp_dir, "cache.db")) as cache:
+            self._analyze(cache, sample_db)
+            self._update(sample_db)
+
+            [diff] = reanalyze_cached(cache, sample_db)
+            assert not diff.full and diff.name == "me.txt"
+            assert diff.rechecked == 3
+            assert {(c.rsid, c.change) for c in diff.changes} == {
+                ("rs4988235", "changed"), ("rs7412", "removed"), ("rs555", "new"),
+            }
+            changed = next(c for c in diff.changes if c.change == "changed")
+            assert changed.before.significance_rank > changed.after.significance_rank
+
+            # The refreshed entry matches a full analysis at the new version
+            hits, count = cache.get("g1", sample_db.data_version())
+            fresh = list(iter_ranked_hits(self.VARIANTS, sample_db))
+            assert [_encode_hit(h, sample_db) for h in hits] == [_encode_hit(h, sample_db) for h in fresh]
+            assert count == len(self.VARIANTS)
+            assert reanalyze_cached(cache, sample_db) == []
+
+    def test_reload_with_reassigned_string_ids(self, sample_db, tmp_dir):
+        """Test that kept hits show their own text after a reload hands string ids to other values."""
+        import os
+        from allelio.analysis.cache import ResultCache
+        from allelio.analysis.incremental import reanalyze_cached
+        from allelio.analysis.lookup import results_from_hits
+
+        def texts(results):
+            return {r.rsid: ([c.conditions for c in r.clinvar_entries], [g.study for g in r.gwas_entries])
+                    for r in results}
+
+        sample_db.bump_data_version()
+        expected = texts(analyze_variants(self.VARIANTS, sample_db, include_benign=True))
+        with ResultCache(os.path.join(tmp_dir, "cache.db")) as cache:
+            self._analyze(cache, sample_db)
+
+            # Same content, reloaded in reverse order: every string gets a new id
+            clinvar = [r for batch in sample_db.iter_records("clinvar") for r in batch]
+            gwas = [r for batch in sample_db.iter_records("gwas") for r in batch]
+            sample_db.clear_annotations()
+            sample_db.insert_clinvar_batch(clinvar[::-1])
+            sample_db.insert_gwas_batch(gwas[::-1])
+            sample_db.bump_data_version()
+
+            [diff] = reanalyze_cached(cache, sample_db)
+            assert diff.rechecked == 0 and diff.changes == []
+            hits, _ = cache.get("g1", sample_db.data_version())
+            cached = texts(results_from_hits(hits, sample_db))
+            assert cached == {rsid: expected[rsid] for rsid in cached}
+
+    def test_unknown_version_rechecks_everything(self, sample_db, tmp_dir):
+        """Test the full fallback when the change log does not reach the cached version."""
+        import os
+        from allelio.analysis.cache import ResultCache
+        from allelio.analysis.incremental import reanalyze_cached
+
+        with ResultCache(os.path.join(tmp_dir, "cache.db")) as cache:
+            # Analyzed before the database had any versions
+            self._analyze(cache, sample_db)
+            cache.put("g2", sample_db.data_version(), [], 3)
+            self._update(sample_db)
+
+            [diff] = reanalyze_cached(cache, sample_db)
+            assert diff.full
+            # i7001 is not an rsID and never stored
+            assert diff.rechecked == len(self.VARIANTS) - 1
+            assert len(diff.changes) == 3
+            # Entries without a stored genome can't be refreshed
+            assert cache.load("g2") is None
+
+
+class TestCohortAnalysis:
+    """Tests for cohort analysis with shared lookups."""
+
+    GENOMES = {
+        "a": TestTopVariants.VARIANTS,
+        "b": [Variant(rsid="rs7412", chromosome="19", position=1, genotype="CC"),
+              Variant(rsid="rs1234", chromosome="1", position=2, genotype="AA"),
+              Variant(rsid="rs429358", chromosome="19", position=3, genotype="TT")],
+        "c": [Variant(rsid="rs999", chromosome="1", position=4, genotype="GG")],
+    }
+
+    @staticmethod
+    def _summary(results):
+        return [(r.rsid, r.genotype, r.category, r.significance_rank,
+                 [e.conditions for e in r.clinvar_entries], [e.study for e in r.gwas_entries])
+                for r in results]
+
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_matches_per_sample_analysis(self, sample_db, workers):
+        """Test that each sample's results equal analyze_variants on its own."""
+        from allelio.analysis.cohort import analyze_cohort
+
+        cohort = analyze_cohort(self.GENOMES, sample_db, include_benign=True, workers=workers)
+
+        assert list(cohort.results) == ["a", "b", "c"]
+        for sample, variants in self.GENOMES.items():
+            expected = analyze_variants(variants, sample_db, include_benign=True)
+            assert self._summary(cohort.results[sample]) == self._summary(expected)
+        assert cohort.unique_rsids == 7
+
+    def test_each_rsid_looked_up_once(self, sample_db):
+        """Test that the union of rsIDs is looked up once, and top truncation."""
+        from allelio.analysis.cohort import analyze_cohort
+
+        looked_up = []
+        lookup = sample_db.lookup_rsids_batch
+
+        def counting_lookup(rsids):
+            looked_up.extend(rsids)
+            return lookup(rsids)
+
+        sample_db.lookup_rsids_batch = counting_lookup
+        cohort = analyze_cohort(self.GENOMES, sample_db, top=1, workers=1, chunk_size=3)
+
+        assert sorted(looked_up) == sorted({v.rsid for vs in self.GENOMES.values() for v in vs})
+        for sample, variants in self.GENOMES.items():
+            assert [r.rsid for r in cohort.results[sample]] == [r.rsid for r in analyze_variants(variants, sample_db)[:1]]
+
+
+class TestAlleleMatching:
+    """Tests for genotype-aware allele dosage and carrier filtering."""
+
+    @pytest.mark.parametrize("genotype,allele,known,expected", [
+        ("CT", "T", ("C", "T"), 1),
+        ("TT", "T", ("C", "T"), 2),
+        ("CC", "T", ("C", "T"), 0),
+        ("T", "T", ("C", "T"), 2),
+        # Minus-strand calls, and an allele reported on the other strand
+        ("GA", "T", ("C", "T"), 1),
+        ("GG", "T", ("C", "T"), 0),
+        ("CT", "A", ("C", "T"), 1),
+        # A/T and C/G SNPs are counted as reported
+        ("AA", "T", ("A", "T"), 0),
+        ("CG", "T", ("A", "T"), None),
+        # Array I/D codes and concatenated VCF indels
+        ("DI", "AT", ("A", "AT"), 1),
+        ("II", "A", ("AT", "A"), 0),
+        ("ATAT", "AT", ("A", "AT"), 2),
+        ("AAT", "AT", ("A", "AT"), 1),
+        ("DD", "D", (), 2),
+        ("DI", "AT", (), None),
+        ("AG", "D", (), None),
+        # Unknown site alleles: flip only when the call can't be on the reported strand
+        ("AG", "G", (), 1),
+        ("AA", "G", (), 0),
+        ("AG", "C", (), 1),
+        ("AT", "C", (), None),
+        ("--", "T", ("C", "T"), None),
+        ("", "T", (), None),
+    ])
+    def test_allele_dosage(self, genotype, allele, known, expected):
+        """Test zygosity, strand resolution, indels and no-calls."""
+        from allelio.analysis.alleles import allele_dosage
+
+        assert allele_dosage(genotype, allele, known) == expected
+
+    def test_hit_dosage_takes_best_evidence(self):
+        """Test that ClinVar ALT alleles and GWAS risk alleles both count."""
+        from allelio.analysis.alleles import hit_dosage
+
+        data = {"clinvar": [{"alleles": "C>G,C>T"}], "gwas": [{"risk_allele": "C"}, {"risk_allele": None}]}
+
+        assert hit_dosage(data, "CT") == 1
+        assert hit_dosage(data, "CC") == 2
+        assert hit_dosage(data, "--") is None
+        assert hit_dosage({"clinvar": [], "gwas": [{}]}, "CC") is None
+
+    def test_non_carriers_filtered(self, sample_db):
+        """Test that hits whose genotype lacks every reported allele are dropped."""
+        from allelio.analysis.cohort import analyze_cohort
+
+        sample_db.cursor.execute("UPDATE clinvar SET alleles = 'T>C' WHERE rsid = 'rs429358'")
+        sample_db.cursor.execute("UPDATE gwas SET risk_allele = 'C' WHERE rsid = 'rs429358'")
+        sample_db.cursor.execute("UPDATE clinvar SET alleles = 'C>T' WHERE rsid = 'rs7412'")
+        sample_db.conn.commit()
+        variants = [
+            # Homozygous reference for the ALT allele and the risk allele
+            Variant(rsid="rs429358", chromosome="19", position=45411941, genotype="TT"),
+            # Carrier reported on the minus strand
+            Variant(rsid="rs7412", chromosome="19", position=45412079, genotype="GA"),
+            # No alleles ingested: kept with an unknown dosage
+            Variant(rsid="rs4988235", chromosome="2", position=135951944, genotype="CC"),
+        ]
+
+        results = analyze_variants(variants, sample_db)
+        everything = analyze_variants(variants, sample_db, carriers_only=False)
+        cohort = analyze_cohort({"a": variants}, sample_db, workers=1)
+
+        assert {(r.rsid, r.dosage) for r in results} == {("rs7412", 1), ("rs4988235", None)}
+        assert {(r.rsid, r.dosage) for r in everything} == {("rs429358", 0), ("rs7412", 1), ("rs4988235", None)}
+        assert [r.rsid for r in cohort.results["a"]] == [r.rsid for r in results]
+        rs7412 = next(r for r in results if r.rsid == "rs7412")
+        assert rs7412.clinvar_entries[0].alleles == "C>T"
+
+
+class TestPolygenicScores:
+    """Tests for the array-backed polygenic score engine."""
+
+    SCORE_A = (
+        "#pgs_id=PGS_A\n"
+        "rsID\tchr_name\tchr_position\teffect_allele\tother_allele\teffect_weight\n"
+        "rs1\t1\t100\tA\tG\t0.5\n"
+        "rs2\t1\t200\tT\tC\t-0.25\n"
+        "\t2\t300\tG\tA\t1.0\n"
+        "rs4\t3\t400\tC\tT\t2.0\n"
+        "rs5\t3\t500\tA\tC\tnot-a-number\n"
+    )
+    SCORE_B = (
+        "hm_rsID\thm_chr\thm_pos\teffect_allele\thm_inferOtherAllele\teffect_weight\n"
+        "rs1\tchr1\t100\tG\tA\t0.1\n"
+        "rs2\tchr1\t200\tT\tC\t0.3\n"
+        "rs9\tchr9\t900\tA\tG\t5.0\n"
+    )
+    GENOME = [
+        Variant(rsid="rs1", chromosome="1", position=100, genotype="AG"),
+        # Reported on the minus strand: AG is CT on the score's strand
+        Variant(rsid="rs2", chromosome="1", position=200, genotype="AG"),
+        # No rsID on the chip, matched by position
+        Variant(rsid="i300", chromosome="2", position=300, genotype="GG"),
+        Variant(rsid="rs4", chromosome="3", position=400, genotype="--"),
+    ]
+
+    def _files(self, tmp_dir):
+        import gzip
+        from pathlib import Path
+
+        a = Path(tmp_dir) / "PGS_A.txt"
+        a.write_text(self.SCORE_A)
+        b = Path(tmp_dir) / "PGS_B.txt.gz"
+        with gzip.open(b, "wt") as f:
+            f.write(self.SCORE_B)
+        return a, b
+
+    def test_compute_many_scores(self, tmp_dir):
+        """Test dosage-weighted sums, strand flips, position joins and counters."""
+        from allelio.analysis.prs import ScoreSet, stream_scores
+
+        a, b = self._files(tmp_dir)
+        scores = ScoreSet()
+        assert scores.add_file(a) == "PGS_A"
+        assert scores.add_file(b) == "PGS_B"
+
+        results = scores.compute(self.GENOME)
+
+        assert list(results) == ["PGS_A", "PGS_B"]
+        assert results["PGS_A"].score == pytest.approx(0.5 * 1 - 0.25 * 1 + 1.0 * 2)
+        assert (results["PGS_A"].variants, results["PGS_A"].matched, results["PGS_A"].unresolved) == (4, 3, 1)
+        assert results["PGS_B"].score == pytest.approx(0.1 + 0.3)
+        assert results["PGS_B"].coverage == pytest.approx(2 / 3)
+        # rs1 is weighted on both alleles; rs2 is one slot shared by both scores
+        assert scores.slot_count == 6
+        assert [r.to_dict() for r in stream_scores([a, b], self.GENOME)] == [r.to_dict() for r in results.values()]
+
+    def test_join_by_position_and_from_db(self, tmp_dir):
+        """Test harmonized position joins and loading the pgs_weights table."""
+        from pathlib import Path
+        from allelio.analysis.prs import ScoreSet
+        from allelio.database.sources import PGSScoringSource
+
+        a, _ = self._files(tmp_dir)
+        by_position = ScoreSet(join="position")
+        by_position.add_file(a)
+        renamed = [Variant(rsid=f"chip{i}", chromosome=v.chromosome, position=v.position, genotype=v.genotype)
+                   for i, v in enumerate(self.GENOME)]
+        assert by_position.compute(renamed)["PGS_A"].score == pytest.approx(2.25)
+        with pytest.raises(ValueError):
+            ScoreSet(join="gene")
+
+        source = PGSScoringSource(str(a))
+        with AllelioDB(str(Path(tmp_dir) / "pgs.db")) as db:
+            db.initialize()
+            db.initialize_source(source)
+            db.insert_source_batch(source, list(source.parse_lines(self.SCORE_A.splitlines(True), {})))
+            from_db = ScoreSet.from_db(db)
+
+        # The table keeps rsID rows only
+        result = from_db.compute(self.GENOME)["PGS_A"]
+        assert (result.score, result.variants) == (pytest.approx(0.25), 3)
+
+
+class TestRelatedness:
+    """Tests for bit-packed pairwise genome comparison."""
+
+    @staticmethod
+    def _family(sites=3000):
+        import random
+
+        rng = random.Random(7)
+        loci = [(f"rs{i}", str(i % 22 + 1), rng.choice([("A", "G"), ("C", "T")]), rng.uniform(0.1, 0.5))
+                for i in range(sites)]
+
+        def haplotype():
+            return [pair[1] if rng.random() < freq else pair[0] for _, _, pair, freq in loci]
+
+        def genome(first, second):
+            return [Variant(rsid=rsid, chromosome=chrom, position=i, genotype=a + b)
+                    for i, ((rsid, chrom, _, _), a, b) in enumerate(zip(loci, first, second))]
+
+        mother, father = (haplotype(), haplotype()), (haplotype(), haplotype())
+        child = ([rng.choice(pair) for pair in zip(*mother)], [rng.choice(pair) for pair in zip(*father)])
+        sibling = ([rng.choice(pair) for pair in zip(*mother)], [rng.choice(pair) for pair in zip(*father)])
+        return {
+            "mother": genome(*mother),
+            "father": genome(*father),
+            "child": genome(*child),
+            "sibling": genome(*sibling),
+        }
+
+    def test_ibs_counts(self):
+        """Test IBS0/1/2 and heterozygote counts, and which sites are used."""
+        from allelio.analysis.relatedness import pack_genomes
+
+        a = [Variant("rs1", "1", 1, "AA"), Variant("rs2", "1", 2, "AG"), Variant("rs3", "2", 3, "CC"),
+             Variant("rs4", "3", 4, "AT"), Variant("rs5", "X", 5, "AG"), Variant("rs6", "4", 6, "GG"),
+             Variant("rs7", "5", 7, "--"), Variant("rs8", "5", 8, "CT")]
+        # Another chip: different order, "chr" prefixes
+        b = [Variant("rs8", "5", 8, "TT"), Variant("rs1", "1", 1, "GG"), Variant("rs2", "1", 2, "GA"),
+             Variant("rs3", "chr2", 3, "CT"), Variant("rs4", "3", 4, "TT"), Variant("rs5", "X", 5, "GG"),
+             Variant("rs6", "4", 6, "GG"), Variant("rs7", "5", 7, "CC")]
+
+        packed = pack_genomes({"a": a, "b": b})
+        [pair] = packed.all_pairs()
+
+        # A/T, X, monomorphic and singly-called sites are left out
+        assert packed.sites == ["rs1", "rs2", "rs3", "rs8"]
+        assert (pair.sites, pair.ibs0, pair.ibs1, pair.ibs2) == (4, 1, 2, 1)
+        assert (pair.het_het, pair.het_a, pair.het_b) == (1, 2, 2)
+        assert pair.relationship == "too few shared sites"
+        assert pack_genomes({"a": a, "b": b}, autosomes_only=False).sites == ["rs1", "rs2", "rs3", "rs5", "rs8"]
+
+    def test_family_relationships(self):
+        """Test kinship and relationship calls, and that chip layout doesn't matter."""
+        from allelio.analysis.relatedness import compare_genomes
+
+        genomes = self._family()
+        genomes["twin"] = list(reversed(genomes["child"]))
+
+        pairs = {(p.sample_a, p.sample_b): p for p in compare_genomes(genomes)}
+
+        assert pairs["mother", "father"].relationship == "unrelated"
+        assert pairs["mother", "child"].relationship == "parent-child"
+        assert pairs["mother", "child"].ibs0 == 0
+        assert pairs["father", "sibling"].kinship == pytest.approx(0.25, abs=0.03)
+        assert pairs["child", "sibling"].relationship == "full siblings"
+        assert pairs["child", "twin"].relationship == "duplicate or identical twin"
+        assert pairs["child", "twin"].ibs2 == pairs["child", "twin"].sites
+        for other in ("mother", "father"):
+            assert pairs[other, "child"].to_dict()["ibs2"] == pairs[other, "twin"].ibs2
+        assert pairs["child", "sibling"].ibs2 == pairs["sibling", "twin"].ibs2
+
+
+class TestStarAlleleCalling:
+    """Tests for pharmacogenomic diplotype calling."""
+
+    CYP2C19 = (
+        "GENE: CYP2C19\n"
+        "Nucleotide change to gene from http://www.pharmvar.org\tg.-806C>T\tg.1A>G\tg.19154G>A\tg.17948G>A\n"
+        "rsID\trs12248560\trs28399504\trs4244285\trs4986893\n"
+        "CYP2C19 Allele\t\t\t\t\n"
+        "*1\tC\tA\tG\tG\n"
+        "*2\t\t\tA\t\n"
+        "*3\t\t\t\tA\n"
+        "*4\tT\tG\t\t\n"
+        "*17\tT\t\t\t\n"
+        "*99\t\tR\t\t\n"
+    )
+
+    @staticmethod
+    def _genome(**genotypes):
+        reference = {"rs12248560": "CC", "rs28399504": "AA", "rs4244285": "GG", "rs4986893": "GG"}
+        reference.update(genotypes)
+        return [Variant(rsid=rsid, chromosome="10", position=i, genotype=genotype)
+                for i, (rsid, genotype) in enumerate(reference.items()) if genotype is not None]
+
+    def test_call_diplotypes(self):
+        """Test diplotype matching, specificity, strand flips and unexplained genotypes."""
+        from allelio.analysis.pgx import StarAlleleCaller, parse_definition_lines
+
+        definition = parse_definition_lines(self.CYP2C19.splitlines(True))
+        assert (definition.gene, definition.reference) == ("CYP2C19", "*1")
+        assert list(definition.alleles) == ["*2", "*3", "*4", "*17"]
+        assert [name for name, _ in definition.skipped] == ["*99"]
+
+        caller = StarAlleleCaller()
+        assert caller.add_definition(definition) == "CYP2C19"
+        assert "rs4244285" in caller.rsids
+
+        def call(**genotypes):
+            return caller.call(self._genome(**genotypes))["CYP2C19"]
+
+        assert call().diplotype == "*1/*1"
+        # rs4244285 reported on the minus strand
+        assert call(rs12248560="CT", rs4244285="CT").diplotype == "*2/*17"
+        # *4 carries the *17 variant: *4/*17 explains more than *1/*4 plus an extra T
+        result = call(rs12248560="TT", rs28399504="AG")
+        assert (result.diplotype, result.alleles, result.ambiguous) == ("*4/*17", ("*4", "*17"), False)
+        assert (result.variants, result.called, result.missing) == (4, 4, [])
+        # Three variant alleles can't come from two haplotypes
+        assert call(rs4244285="AA", rs4986893="GA").diplotype is None
+
+    def test_missing_variants_and_files(self, tmp_dir):
+        """Test ambiguity from untyped variants, and loading tables from a directory."""
+        from pathlib import Path
+        from allelio.analysis.pgx import StarAlleleCaller
+
+        directory = Path(tmp_dir) / "pgx"
+        directory.mkdir()
+        (directory / "CYP2C19_allele_definition_table.tsv").write_text(self.CYP2C19)
+        # No GENE row: the symbol comes from the file name
+        (directory / "VKORC1_allele_definition_table.csv").write_text(
+            "rsID,rs9923231\nReference,C\n\"-1639G>A\",T\n"
+        )
+        (directory / "notes.md").write_text("not a table")
+
+        caller = StarAlleleCaller.from_paths([directory])
+        assert caller.genes == ["CYP2C19", "VKORC1"]
+
+        calls = caller.call(self._genome(rs4986893=None, rs9923231="CT"))
+        assert calls["CYP2C19"].diplotype == "*1/*1"
+        assert calls["CYP2C19"].alternatives == ["*1/*3", "*3/*3"]
+        assert calls["CYP2C19"].missing == ["rs4986893"]
+        assert calls["VKORC1"].to_dict()["diplotype"] == "Reference/-1639G>A"
+
+        with pytest.raises(ValueError):
+            caller.add_file(directory / "notes.md")
+
+
+class TestAnalysisSession:
+    """Tests for in-memory analysis sessions and their pool."""
+
+    def test_queries_without_reanalysis(self, sample_db, sample_23andme_file):
+        """Test filters, paging and lookups against analyze_variants, with no further lookups."""
+        from allelio.analysis.session import AnalysisSession
+        from allelio.parsers import parse_genotype_file
+
+        session = AnalysisSession.from_file(sample_23andme_file, sample_db, include_benign=True)
+        expected = analyze_variants(parse_genotype_file(sample_23andme_file), sample_db, include_benign=True)
+
+        def lookup_again(rsids):
+            raise AssertionError("session queries must not hit the database lookup")
+
+        sample_db.lookup_rsids_batch = lookup_again
+
+        everything = session.query(limit=100)
+        assert [r.rsid for r in everything.results] == [r.rsid for r in expected]
+        assert everything.total == len(session) and not everything.has_more
+
+        first, second = session.query(limit=2), session.query(offset=2, limit=2)
+        assert first.has_more
+        assert [r.rsid for r in first.results + second.results] == [r.rsid for r in expected[:4]]
+        # Results are built once and reused across pages and lookups
+        assert session.lookup("RS429358") is session.query(gene="apoe").results[0]
+
+        assert [r.rsid for r in session.query(gene="APOE").results] == ["rs429358", "rs7412"]
+        health = session.query(category="Health Conditions")
+        assert [r.rsid for r in health.results] == ["rs762551"]
+        assert health.results[0].clinvar_entries[0].conditions == "Caffeine sensitivity"
+        assert session.query(min_stars=2).total == 1
+        assert {r.rsid for r in session.query(max_p_value=1e-18).results} == {"rs429358", "rs4988235", "rs1052373"}
+        assert session.query(gene="APOE", max_p_value=1e-18).total == 1
+        assert session.categories == {category: sum(r.category == category for r in expected)
+                                      for category in session.categories}
+
+        assert session.genotype("rs1800795") == "GG"
+        assert session.genotype("rs999") is None
+        assert session.lookup("rs1800795") is None
+
+    def test_pool_evicts_idle_and_over_budget(self, sample_db):
+        """Test idle-timeout and least-recently-used eviction."""
+        from allelio.analysis.lookup import iter_ranked_hits
+        from allelio.analysis.session import AnalysisSession, SessionPool
+
+        def session():
+            variants = [Variant(rsid="rs429358", chromosome="19", position=1, genotype="CT")]
+            return AnalysisSession(variants, iter_ranked_hits(variants, sample_db), sample_db)
+
+        pool = SessionPool(max_bytes=10**9, idle_timeout=60)
+        first, second = pool.add(session()), pool.add(session())
+        assert len(pool) == 2 and pool.get(first).lookup("rs429358").genotype == "CT"
+
+        # Over budget: the least recently used session goes first
+        pool.max_bytes = pool.memory_bytes
+        third = pool.add(session())
+        assert second not in pool and first in pool and third in pool
+
+        pool.get(third).last_used -= 120
+        assert pool.get(third) is None
+        assert pool.evict() == [] and len(pool) == 1
+        # The most recent session stays even if it alone exceeds the budget
+        pool.max_bytes = 0
+        assert pool.evict() == [] and pool.get(first) is not None
+        assert pool.remove(first) and not pool.remove(first)
@@ -1,5 +1,6 @@
 """Test suite for Allelio database operations."""
 
+import hashlib
 import pytest
 import sqlite3
 from pathlib import Path
@@ -535,3 +536,1671 @@ class TestDatabaseIntegrity:
             result = db.lookup_rsid("rs1234")
             assert len(result["clinvar"]) > 0
             assert result["clinvar"][0]["rsid"] == "rs1234"
+
+
+class TestSnapshot:
+    """Tests for database snapshot export and import."""
+
+    def test_snapshot_roundtrip(self, sample_db, tmp_dir):
+        """Test that an exported snapshot restores an identical database."""
+        from allelio.database.snapshot import export_snapshot, import_snapshot
+
+        sample_db.set_metadata("last_update", "2026-01-01T00:00:00")
+        snapshot_path = str(Path(tmp_dir) / "allelio.snapshot")
+        manifest = export_snapshot(sample_db, snapshot_path)
+
+        assert manifest["metadata"]["last_update"] == "2026-01-01T00:00:00"
+        assert len(manifest["sha256"]) == 64
+
+        restored_path = str(Path(tmp_dir) / "restored" / "allelio.db")
+        import_snapshot(snapshot_path, restored_path)
+
+        with AllelioDB(db_path=restored_path) as restored:
+            stats = restored.get_stats()
+            assert stats["clinvar_entries"] == 5
+            assert stats["gwas_entries"] == 5
+            result = restored.lookup_rsid("rs429358")
+            assert result["clinvar"][0]["gene"] == "APOE"
+            assert restored.get_metadata("last_update") == "2026-01-01T00:00:00"
+
+    def test_snapshot_read_manifest(self, sample_db, tmp_dir):
+        """Test that the manifest can be read without restoring."""
+        from allelio.database.snapshot import export_snapshot, read_snapshot_manifest
+
+        snapshot_path = str(Path(tmp_dir) / "allelio.snapshot")
+        manifest = export_snapshot(sample_db, snapshot_path)
+
+        assert read_snapshot_manifest(snapshot_path) == manifest
+
+    def test_snapshot_corrupt_payload_rejected(self, sample_db, tmp_dir):
+        """Test that a truncated snapshot does not replace the existing database."""
+        from allelio.database.snapshot import export_snapshot, import_snapshot
+
+        snapshot_path = Path(tmp_dir) / "allelio.snapshot"
+        export_snapshot(sample_db, str(snapshot_path))
+        data = snapshot_path.read_bytes()
+        snapshot_path.write_bytes(data[:len(data) // 2])
+
+        existing_path = Path(tmp_dir) / "existing.db"
+        existing_path.write_bytes(b"original")
+
+        with pytest.raises(ValueError):
+            import_snapshot(str(snapshot_path), str(existing_path))
+
+        assert existing_path.read_bytes() == b"original"
+        assert not Path(str(existing_path) + ".restore").exists()
+
+    def test_snapshot_rejects_non_snapshot(self, tmp_dir):
+        """Test that arbitrary files are rejected."""
+        from allelio.database.snapshot import import_snapshot
+
+        bogus = Path(tmp_dir) / "bogus.snapshot"
+        bogus.write_bytes(b"not a snapshot\n")
+
+        with pytest.raises(ValueError):
+            import_snapshot(str(bogus), str(Path(tmp_dir) / "out.db"))
+
+
+class TestSlimProfile:
+    """Tests for the slim array-only ingest profile."""
+
+    def test_load_targets_from_genotype_file(self, sample_23andme_file):
+        """Test that target rsIDs are collected from a genotype file."""
+        from allelio.database.targets import load_target_rsids
+
+        targets = load_target_rsids([sample_23andme_file])
+
+        assert "rs429358" in targets
+        # No-calls are skipped by the parser
+        assert "rs3918290" not in targets
+        assert len(targets) == 18
+
+    def test_load_targets_from_manifest(self, tmp_dir, sample_23andme_file):
+        """Test that plain and delimited manifests are read and unioned."""
+        from allelio.database.targets import load_target_rsids
+
+        manifest = Path(tmp_dir) / "chip_manifest.csv"
+        manifest.write_text(
+            "# Illumina-style manifest\n"
+            "Name,Chr,MapInfo\n"
+            "rs999001,1,12345\n"
+            "RS999002,2,23456\n"
+            "kgp123,3,34567\n"
+        )
+
+        targets = load_target_rsids([str(manifest), sample_23andme_file])
+
+        assert {"rs999001", "rs999002"} <= targets
+        assert "kgp123" not in targets
+        assert "rs429358" in targets
+
+    def test_parse_gwas_filters_to_targets(self, tmp_dir):
+        """Test that parse_gwas skips rows outside the target set."""
+        from allelio.database.gwas import parse_gwas
+
+        gwas_path = Path(tmp_dir) / "gwas.tsv"
+        gwas_path.write_text(
+            "SNPS\tSNP_ID_CURRENT\tDISEASE/TRAIT\tP-VALUE\n"
+            "rs1\t1\tHeight\t1e-8\n"
+            "rs2\t2\tBMI\t1e-9\n"
+            "rs3\t3\tLDL\t1e-10\n"
+        )
+
+        records = list(parse_gwas(str(gwas_path), rsids={"rs1", "rs3"}))
+
+        assert [r["rsid"] for r in records] == ["rs1", "rs3"]
+
+    def test_clear_annotations_keeps_metadata(self, sample_db):
+        """Test that clearing annotations leaves metadata intact."""
+        sample_db.set_metadata("last_update", "2026-01-01")
+
+        sample_db.clear_annotations()
+
+        stats = sample_db.get_stats()
+        assert stats["clinvar_entries"] == 0
+        assert stats["gwas_entries"] == 0
+        assert sample_db.get_metadata("last_update") == "2026-01-01"
+
+    def test_parse_clinvar_filters_to_targets(self, sample_clinvar_file):
+        """Test that parse_clinvar skips rows outside the target set."""
+        from allelio.database.clinvar import parse_clinvar
+
+        records = list(parse_clinvar(sample_clinvar_file, rsids={"rs429358"}))
+
+        assert records
+        assert all(r["rsid"] == "rs429358" for r in records)
+
+    def test_failed_slim_update_keeps_data(self, tmp_dir, sample_clinvar_file, monkeypatch):
+        """Test that a slim load clears nothing before its downloads succeed."""
+        from allelio.database import downloader
+
+        fake_download = TestConcurrentSetup._fake_download(sample_clinvar_file)
+        monkeypatch.setattr(downloader, "download_file", fake_download)
+        monkeypatch.setattr(downloader, "fetch_md5", lambda url: None)
+
+        def offline(url, dest_path, progress_callback=None, **kwargs):
+            raise RuntimeError("network unreachable")
+
+        with AllelioDB(str(Path(tmp_dir) / "slim.db")) as db:
+            downloader.setup_database(db, data_dir=tmp_dir, workers=1)
+            before = db.get_stats()
+
+            monkeypatch.setattr(downloader, "download_file", offline)
+            with pytest.raises(RuntimeError):
+                downloader.setup_database(db, data_dir=str(Path(tmp_dir) / "offline"), workers=1,
+                                          target_rsids={"rs429358"})
+            after = db.get_stats()
+            assert (after["clinvar_entries"], after["gwas_entries"]) == \
+                (before["clinvar_entries"], before["gwas_entries"])
+
+            # A successful slim load drops the other rsIDs and their interned strings
+            monkeypatch.setattr(downloader, "download_file", fake_download)
+            downloader.setup_database(db, data_dir=tmp_dir, workers=1, target_rsids={"rs429358"})
+            assert db.get_stats()["clinvar_entries"] == 1
+            referenced = db.conn.execute(
+                "SELECT COUNT(DISTINCT conditions_id) FROM clinvar WHERE conditions_id IS NOT NULL"
+            ).fetchone()[0] + db.conn.execute(
+                "SELECT COUNT(DISTINCT study_id) FROM gwas WHERE study_id IS NOT NULL"
+            ).fetchone()[0]
+            assert db.conn.execute("SELECT COUNT(*) FROM strings").fetchone()[0] == referenced
+
+    def test_shard_database_keeps_targets(self, sample_db, tmp_dir):
+        """Test that sharding a slim database keeps its target rsIDs."""
+        from allelio.database.shards import shard_database
+
+        sample_db.set_target_rsids({"rs429358", "rs7412"})
+        sample_db.set_metadata("profile", "slim")
+        with shard_database(sample_db, str(Path(tmp_dir) / "shards"), shard_count=4) as sharded:
+            assert sharded.get_metadata("profile") == "slim"
+            assert sharded.get_target_rsids() == {"rs429358", "rs7412"}
+
+    def test_update_keeps_slim_profile(self, tmp_dir, sample_clinvar_file, monkeypatch):
+        """Test that `allelio update` reloads the stored target rsIDs instead of everything."""
+        from click.testing import CliRunner
+        from allelio.cli import allelio
+        from allelio.database import downloader
+
+        monkeypatch.setenv("HOME", tmp_dir)
+        monkeypatch.setattr(downloader, "download_file", TestConcurrentSetup._fake_download(sample_clinvar_file))
+        monkeypatch.setattr(downloader, "fetch_md5", lambda url: None)
+        db_path = Path(tmp_dir) / ".allelio" / "data" / "allelio.db"
+        db_path.parent.mkdir(parents=True)
+        with AllelioDB(str(db_path)) as db:
+            downloader.setup_database(db, data_dir=tmp_dir, workers=1, target_rsids={"rs429358"})
+            assert db.get_target_rsids() == {"rs429358"}
+
+        result = CliRunner().invoke(allelio, ["update", "--workers", "1"])
+        assert result.exit_code == 0, result.output
+        with AllelioDB(str(db_path)) as db:
+            assert db.get_metadata("profile") == "slim"
+            assert db.get_stats()["clinvar_entries"] == 1
+
+            # Slim databases from before target sets were stored need an explicit choice
+            db.set_target_rsids(None)
+        result = CliRunner().invoke(allelio, ["update", "--workers", "1"])
+        assert result.exit_code != 0 and "--full" in result.output
+
+        result = CliRunner().invoke(allelio, ["update", "--workers", "1", "--full"])
+        assert result.exit_code == 0, result.output
+        with AllelioDB(str(db_path)) as db:
+            assert db.get_metadata("profile") == "full"
+            assert db.get_stats()["clinvar_entries"] == 3
+            assert db.get_target_rsids() is None
+
+class TestShardedDatabase:
+    """Tests for the sharded layout and parallel batch lookup."""
+
+    def test_shard_index_is_stable(self):
+        """Test that numeric and non-numeric rsIDs map to a valid shard."""
+        from allelio.database.shards import shard_index
+
+        assert shard_index("rs17", 16) == 1
+        assert 0 <= shard_index("i5000123", 16) < 16
+        assert shard_index("i5000123", 16) == shard_index("i5000123", 16)
+
+    def test_sharded_lookup_matches_single_db(self, sample_db, tmp_dir):
+        """Test that a sharded copy answers batch lookups like the source."""
+        from allelio.database.shards import shard_database
+
+        rsids = ["rs429358", "rs7412", "rs4988235", "rs1052373", "rs1234", "rsMISSING"]
+        expected = sample_db.lookup_rsids_batch(rsids)
+
+        with shard_database(sample_db, str(Path(tmp_dir) / "shards"), shard_count=4) as sharded:
+            results = sharded.lookup_rsids_batch(rsids)
+
+            assert list(results) == rsids
+            for rsid in rsids:
+                assert [c["gene"] for c in results[rsid]["clinvar"]] == \
+                    [c["gene"] for c in expected[rsid]["clinvar"]]
+                assert [sharded.resolve_string(c["conditions_id"]) for c in results[rsid]["clinvar"]] == \
+                    [sample_db.resolve_string(c["conditions_id"]) for c in expected[rsid]["clinvar"]]
+                assert [g["trait"] for g in results[rsid]["gwas"]] == \
+                    [g["trait"] for g in expected[rsid]["gwas"]]
+
+            stats = sharded.get_stats()
+            assert stats["clinvar_entries"] == 5
+            assert stats["gwas_entries"] == 5
+
+    def test_sharding_assigns_new_data_version(self, sample_db, tmp_dir):
+        """Test that results cached against the source database don't match the shards."""
+        from allelio.database.shards import shard_database
+
+        version = sample_db.bump_data_version()
+        sample_db.set_metadata("last_update", "2026-01-01")
+        with shard_database(sample_db, str(Path(tmp_dir) / "shards"), shard_count=4) as sharded:
+            assert sharded.data_version() != version
+            assert sharded.get_metadata("last_update") == "2026-01-01"
+
+    def test_rebuild_shard_leaves_others(self, sample_db, tmp_dir):
+        """Test that one shard can be reloaded from an updated database on its own."""
+        from allelio.database.shards import rebuild_shard, shard_database, shard_index
+
+        with shard_database(sample_db, str(Path(tmp_dir) / "shards"), shard_count=4) as sharded:
+            version = sharded.data_version()
+            before = sharded.get_stats()["clinvar_entries"]
+            sample_db.insert_clinvar_batch([
+                {"rsid": rsid, "gene": "NEW", "clinical_significance": "benign",
+                 "conditions": "Added later", "review_status": None, "last_evaluated": None}
+                for rsid in ("rs1001", "rs1002")
+            ])
+            assert [shard_index(rsid, 4) for rsid in ("rs1001", "rs1002")] == [1, 2]
+            def rows(shard):
+                return [tuple(row) for row in shard.conn.execute("SELECT * FROM clinvar ORDER BY rowid")]
+
+            others = [rows(shard) for shard in sharded.shards[2:]]
+
+            rebuild_shard(sample_db, sharded, 1)
+
+            assert [rows(shard) for shard in sharded.shards[2:]] == others
+            row = sharded.lookup_rsid("rs1001")["clinvar"][0]
+            assert sharded.resolve_string(row["conditions_id"]) == "Added later"
+            assert sharded.lookup_rsid("rs1002")["clinvar"] == []
+            assert sharded.get_stats()["clinvar_entries"] == before + 1
+            assert sharded.data_version() != version
+
+            with pytest.raises(ValueError):
+                rebuild_shard(sample_db, sharded, 4)
+
+    def test_db_shard_command_rebuilds_one_shard(self, sample_db, tmp_dir, monkeypatch):
+        """Test `allelio db shard DIR --only N` against an existing shard directory."""
+        from click.testing import CliRunner
+        from allelio.cli import allelio
+        from allelio.database.shards import ShardedAllelioDB
+
+        shard_dir = str(Path(tmp_dir) / "shards")
+        monkeypatch.setenv("HOME", str(Path(tmp_dir) / "home"))
+        monkeypatch.setenv("ALLELIO_DB", str(sample_db.db_path))
+
+        runner = CliRunner()
+        result = runner.invoke(allelio, ["db", "shard", shard_dir, "--shards", "4"])
+        assert result.exit_code == 0, result.output
+        result = runner.invoke(allelio, ["db", "shard", shard_dir, "--shards", "4"])
+        assert result.exit_code != 0
+        assert "not empty" in result.output
+
+        sample_db.insert_clinvar_batch([
+            {"rsid": "rs1001", "gene": "NEW", "clinical_significance": "benign",
+             "conditions": "Added later", "review_status": None, "last_evaluated": None}
+        ])
+        result = runner.invoke(allelio, ["db", "shard", shard_dir, "--only", "1"])
+        assert result.exit_code == 0, result.output
+        assert "into shard 1" in result.output
+        with ShardedAllelioDB(shard_dir) as sharded:
+            assert sharded.lookup_rsid("rs1001")["clinvar"][0]["gene"] == "NEW"
+
+        result = runner.invoke(allelio, ["db", "shard", str(Path(tmp_dir) / "none"), "--only", "1"])
+        assert result.exit_code != 0
+        assert "not a sharded database" in result.output
+
+    def test_sharded_db_reopens_with_manifest(self, tmp_dir):
+        """Test that the shard count is read back from the manifest."""
+        from allelio.database.shards import ShardedAllelioDB
+
+        shard_dir = str(Path(tmp_dir) / "shards")
+        with ShardedAllelioDB(shard_dir, shard_count=3) as sharded:
+            sharded.initialize()
+            sharded.set_metadata("last_update", "2026-01-01")
+
+        with ShardedAllelioDB(shard_dir) as sharded:
+            assert sharded.shard_count == 3
+            assert sharded.get_metadata("last_update") == "2026-01-01"
+
+        with pytest.raises(ValueError):
+            ShardedAllelioDB(shard_dir, shard_count=5)
+
+    def test_analyze_variants_accepts_sharded_db(self, sample_db, tmp_dir):
+        """Test that analysis runs unchanged against a sharded database."""
+        from allelio.analysis.lookup import analyze_variants
+        from allelio.database.shards import shard_database
+        from allelio.parsers.base import Variant
+
+        variants = [
+            Variant(rsid="rs429358", chromosome="19", position=45411941, genotype="CT"),
+            Variant(rsid="rs762551", chromosome="11", position=62326389, genotype="AA"),
+        ]
+        expected = analyze_variants(variants, sample_db)
+
+        with shard_database(sample_db, str(Path(tmp_dir) / "shards"), shard_count=4) as sharded:
+            results = analyze_variants(variants, sharded)
+
+        assert [r.rsid for r in results] == [r.rsid for r in expected]
+
+    def test_analyze_command_uses_shards(self, sample_db, sample_23andme_file, tmp_dir, monkeypatch):
+        """Test that `allelio --db SHARD_DIR analyze` reads the shards."""
+        from click.testing import CliRunner
+        from allelio.cli import allelio
+        from allelio.database import open_database
+        from allelio.database.shards import ShardedAllelioDB, shard_database
+
+        shard_dir = str(Path(tmp_dir) / "shards")
+        shard_database(sample_db, shard_dir, shard_count=4).close()
+        monkeypatch.setenv("HOME", str(Path(tmp_dir) / "home"))
+        # --db takes precedence over the environment
+        monkeypatch.setenv("ALLELIO_DB", str(Path(tmp_dir) / "other.db"))
+
+        report = Path(tmp_dir) / "report.html"
+        result = CliRunner().invoke(
+            allelio,
+            ["--db", shard_dir, "analyze", sample_23andme_file, "--no-ai", "--no-cache", "-o", str(report)],
+        )
+        assert result.exit_code == 0, result.output
+        assert "rs429358" in result.output
+        assert report.exists()
+        assert not (Path(tmp_dir) / "home" / ".allelio" / "data" / "allelio.db").exists()
+
+        with open_database(shard_dir) as db:
+            assert isinstance(db, ShardedAllelioDB)
+        with open_database(str(Path(tmp_dir) / "single.db")) as db:
+            assert isinstance(db, AllelioDB)
+        with pytest.raises(ValueError):
+            open_database(tmp_dir)
+
+
+class TestStringInterning:
+    """Tests for deduplicated storage of conditions and study titles."""
+
+    def test_repeated_strings_stored_once(self, tmp_dir):
+        """Test that identical condition strings share one strings row."""
+        db = AllelioDB(db_path=str(Path(tmp_dir) / "test.db"))
+        db.initialize()
+
+        db.insert_clinvar_batch([
+            {
+                "rsid": f"rs{i}",
+                "gene": "BRCA1",
+                "clinical_significance": "pathogenic",
+                "conditions": "Hereditary breast and ovarian cancer syndrome",
+                "review_status": "reviewed by expert panel",
+                "last_evaluated": "2023-01-01"
+            }
+            for i in range(10)
+        ])
+
+        db.cursor.execute("SELECT COUNT(*) FROM strings")
+        assert db.cursor.fetchone()[0] == 1
+        db.cursor.execute("SELECT COUNT(DISTINCT conditions_id) FROM clinvar")
+        assert db.cursor.fetchone()[0] == 1
+
+    def test_lookup_returns_reference(self, sample_db):
+        """Test that lookups carry the reference, resolvable on demand."""
+        row = sample_db.lookup_rsid("rs429358")["clinvar"][0]
+
+        assert "conditions" not in row
+        assert sample_db.resolve_string(row["conditions_id"]) == "Alzheimer disease"
+
+        gwas_row = sample_db.lookup_rsid("rs429358")["gwas"][0]
+        assert sample_db.resolve_string(gwas_row["study_id"]) == "Jansen et al. 2019"
+
+    def test_resolve_string_none(self, sample_db):
+        """Test that a missing reference resolves to None."""
+        assert sample_db.resolve_string(None) is None
+
+    def test_initialize_migrates_inline_schema(self, tmp_dir):
+        """Test that inline conditions and study text are interned in place."""
+        db_path = Path(tmp_dir) / "old.db"
+        conn = sqlite3.connect(str(db_path))
+        conn.execute("CREATE TABLE clinvar (rsid TEXT PRIMARY KEY, gene TEXT, clinical_significance TEXT, "
+                     "conditions TEXT, review_status TEXT, last_evaluated TEXT)")
+        conn.execute("INSERT INTO clinvar VALUES ('rs1', 'G', 'benign', 'Old', 'none', '')")
+        conn.execute("INSERT INTO clinvar VALUES ('rs2', 'G', 'benign', 'Old', 'none', '')")
+        conn.execute("CREATE TABLE gwas (id INTEGER PRIMARY KEY AUTOINCREMENT, rsid TEXT NOT NULL, trait TEXT, "
+                     "p_value REAL, odds_ratio TEXT, mapped_gene TEXT, study TEXT, pubmed_id TEXT, link TEXT)")
+        conn.execute("INSERT INTO gwas (rsid, trait, study) VALUES ('rs1', 'Height', 'A study')")
+        conn.commit()
+        conn.close()
+
+        db = AllelioDB(db_path=str(db_path))
+        db.initialize()
+        # Running it again (as setup and db merges do) changes nothing
+        db.initialize()
+
+        assert not db._has_column("clinvar", "conditions")
+        assert db.get_stats()["clinvar_entries"] == 2
+        assert db.is_initialized()
+        row = db.lookup_rsid("rs1")
+        assert db.resolve_string(row["clinvar"][0]["conditions_id"]) == "Old"
+        assert db.resolve_string(row["gwas"][0]["study_id"]) == "A study"
+        db.cursor.execute("SELECT COUNT(*) FROM strings")
+        assert db.cursor.fetchone()[0] == 2
+
+
+class TestQueryProfiler:
+    """Tests for opt-in SQL instrumentation."""
+
+    def test_query_shape_folds_placeholder_lists(self):
+        """Test that batch queries of any size share one shape."""
+        from allelio.database.profiling import query_shape
+
+        assert query_shape("SELECT * FROM gwas WHERE rsid IN (?,?,?)") == \
+            query_shape("SELECT *\n  FROM gwas WHERE rsid IN (?, ?)")
+
+    def test_profiler_records_statements(self, tmp_dir):
+        """Test that statements are timed and rows counted per shape."""
+        from allelio.database.profiling import QueryProfiler
+
+        profiler = QueryProfiler(threshold_ms=1e9)
+        db = AllelioDB(db_path=str(Path(tmp_dir) / "test.db"), profiler=profiler)
+        db.initialize()
+        db.insert_gwas_batch([
+            {"rsid": f"rs{i}", "trait": "Height", "p_value": 1e-8, "odds_ratio": None,
+             "mapped_gene": None, "study": None, "pubmed_id": None, "link": None}
+            for i in range(3)
+        ])
+        db.lookup_rsids_batch(["rs0", "rs1", "rs2"])
+        db.lookup_rsids_batch(["rs1"])
+
+        by_shape = {row["shape"]: row for row in profiler.summary()}
+        gwas_select = by_shape["SELECT * FROM gwas WHERE rsid IN (?, ...)"]
+        assert gwas_select["calls"] == 2
+        assert gwas_select["rows"] == 4
+        assert gwas_select["plan"] is None
+        assert by_shape[next(s for s in by_shape if s.startswith("INSERT INTO gwas"))]["rows"] == 3
+
+    def test_profiler_captures_plan_and_flags_full_scan(self, sample_db, tmp_dir):
+        """Test that a missing index shows up as a full scan in the plan."""
+        from allelio.database.profiling import QueryProfiler
+
+        log_path = Path(tmp_dir) / "slow.jsonl"
+        profiler = QueryProfiler(threshold_ms=0, log_path=str(log_path))
+        sample_db.cursor.execute("DROP INDEX idx_gwas_rsid")
+        sample_db.conn.commit()
+
+        db = AllelioDB(db_path=str(sample_db.db_path), profiler=profiler)
+        db.lookup_rsid("rs429358")
+
+        by_shape = {row["shape"]: row for row in profiler.summary()}
+        gwas_lookup = by_shape["SELECT * FROM gwas WHERE rsid = ?"]
+        clinvar_lookup = by_shape["SELECT * FROM clinvar WHERE rsid = ?"]
+        assert gwas_lookup["full_scan"] is True
+        assert clinvar_lookup["full_scan"] is False
+        assert log_path.exists()
+        assert "SCAN" in log_path.read_text()
+
+
+class TestParseClinvar:
+    """Tests for the ClinVar parsers."""
+
+    def test_parse_clinvar_filters_rows(self, sample_clinvar_file):
+        """Test that rows without an rsID or on other assemblies are skipped."""
+        from allelio.database.clinvar import parse_clinvar
+
+        rsids = [r["rsid"] for r in parse_clinvar(sample_clinvar_file)]
+
+        assert "rs80357906" not in rsids  # NCBI36 only
+        assert set(rsids) == {"rs429358", "rs762551", "rs12913832"}
+
+    def test_parallel_matches_sequential(self, sample_clinvar_file):
+        """Test that the process pool yields the same records in file order."""
+        from allelio.database.clinvar import parse_clinvar, parse_clinvar_parallel
+
+        expected = list(parse_clinvar(sample_clinvar_file))
+        # A tiny block size forces many line-aligned block boundaries
+        batches = list(parse_clinvar_parallel(sample_clinvar_file, workers=2, block_size=64))
+
+        assert [r for batch in batches for r in batch] == expected
+
+    def test_parallel_honors_targets(self, sample_clinvar_file):
+        """Test that worker processes apply the target rsID filter."""
+        from allelio.database.clinvar import parse_clinvar_parallel
+
+        batches = parse_clinvar_parallel(sample_clinvar_file, rsids={"rs762551"}, workers=2)
+
+        assert [r["rsid"] for batch in batches for r in batch] == ["rs762551"]
+
+
+GWAS_TSV = (
+    "SNPS\tSNP_ID_CURRENT\tDISEASE/TRAIT\tP-VALUE\tOR or BETA\tMAPPED_GENE\tSTUDY\n"
+    "rs429358\t429358\tAlzheimer's disease\t1e-50\t3.5\tAPOE\tGenome-wide study of AD\n"
+    "rs12913832\t12913832\tEye color\t1e-100\t\tHERC2\tPigmentation GWAS\n"
+)
+
+
+def _zip_stream(members) -> bytes:
+    """Write a zip to a non-seekable stream so members use data descriptors."""
+    import io
+    import zipfile
+
+    class _Unseekable(io.RawIOBase):
+        def __init__(self):
+            self.data = bytearray()
+
+        def writable(self):
+            return True
+
+        def write(self, b):
+            self.data += b
+            return len(b)
+
+    out = _Unseekable()
+    with zipfile.ZipFile(out, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, text in members:
+            zf.writestr(name, text)
+    return bytes(out.data)
+
+
+def _chunked(data: bytes, size: int):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class TestStreamingIngest:
+    """Tests for download-to-database streaming without intermediate files."""
+
+    def test_gzip_lines_across_chunk_boundaries(self):
+        """Test that lines split across chunks and gzip members are rejoined."""
+        import gzip
+        from allelio.database.streaming import iter_gzip_lines
+
+        data = gzip.compress(b"header\nrow one\nro") + gzip.compress(b"w two\nrow three")
+
+        assert list(iter_gzip_lines(_chunked(data, 7))) == ["header", "row one", "row two", "row three"]
+
+    def test_zip_lines_picks_tsv_member(self):
+        """Test that other members are skipped and the TSV member is streamed."""
+        from allelio.database.streaming import iter_zip_lines
+
+        data = _zip_stream([("README.txt", "ignore me\n" * 50), ("associations.tsv", GWAS_TSV)])
+        lines = list(iter_zip_lines(_chunked(data, 5)))
+
+        assert lines == GWAS_TSV.rstrip("\n").split("\n")
+
+    def test_zip_without_tsv_raises(self):
+        """Test that an archive without a matching member is an error."""
+        from allelio.database.streaming import iter_zip_lines
+
+        with pytest.raises(ValueError):
+            list(iter_zip_lines([_zip_stream([("notes.txt", "x\n")])]))
+
+    def test_prefetch_preserves_order_and_errors(self):
+        """Test that prefetch yields chunks in order and re-raises source errors."""
+        from allelio.database.streaming import prefetch
+
+        def source():
+            yield b"a"
+            yield b"b"
+            raise RuntimeError("connection reset")
+
+        received = []
+        with pytest.raises(RuntimeError, match="connection reset"):
+            for chunk in prefetch(source(), max_chunks=1):
+                received.append(chunk)
+        assert received == [b"a", b"b"]
+
+    def test_setup_database_streams_without_files(self, tmp_dir, sample_clinvar_file, monkeypatch):
+        """Test that stream=True loads both sources and writes nothing to data_dir."""
+        from allelio.database import downloader
+
+        payloads = {
+            downloader.CLINVAR_URL: Path(sample_clinvar_file).read_bytes(),
+            downloader.GWAS_URL: _zip_stream([("gwas.tsv", GWAS_TSV)]),
+        }
+        monkeypatch.setattr(
+            downloader, "stream_url", lambda url, **kwargs: iter(_chunked(payloads[url], 16))
+        )
+
+        data_dir = Path(tmp_dir) / "data"
+        with AllelioDB(str(Path(tmp_dir) / "stream.db")) as db:
+            downloader.setup_database(db, data_dir=str(data_dir), stream=True)
+
+            stats = db.get_stats()
+            assert stats["clinvar_entries"] == 3
+            assert stats["gwas_entries"] == 2
+            assert db.get_metadata("gwas_version") == "latest"
+            assert db.lookup_rsid("rs12913832")["gwas"][0]["trait"] == "Eye color"
+        # Only the ingest report; no downloaded or extracted files
+        assert [p.name for p in data_dir.iterdir()] == ["ingest_report.json"]
+
+    def test_gwas_stream_failure_drops_partial_rows(self, tmp_dir, sample_clinvar_file, monkeypatch):
+        """Test that a GWAS stream cut mid-way leaves no partial GWAS rows."""
+        from allelio.database import downloader
+
+        gwas_zip = _zip_stream([("gwas.tsv", GWAS_TSV * 2000)])
+
+        def fake_stream(url, **kwargs):
+            if url == downloader.CLINVAR_URL:
+                yield Path(sample_clinvar_file).read_bytes()
+                return
+            yield gwas_zip[:len(gwas_zip) // 2]
+            raise RuntimeError("Incomplete download")
+
+        monkeypatch.setattr(downloader, "BATCH_SIZE", 10)
+        monkeypatch.setattr(downloader, "stream_url", fake_stream)
+
+        with AllelioDB(str(Path(tmp_dir) / "stream.db")) as db:
+            downloader.setup_database(db, data_dir=tmp_dir, stream=True)
+
+            assert db.get_stats()["gwas_entries"] == 0
+            assert db.get_stats()["clinvar_entries"] == 3
+            assert db.get_metadata("gwas_version") == "unavailable"
+
+    def test_stream_url_against_local_server(self, tmp_dir):
+        """Test stream_url end to end against a local HTTP server."""
+        pytest.importorskip("httpx")
+        import http.server
+        import threading
+        from allelio.database.streaming import stream_url
+
+        body = b"x" * 200_000
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = http.server.HTTPServer(("127.0.0.1", 0), Handler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            url = f"http://127.0.0.1:{server.server_port}/variant_summary.txt.gz"
+            assert b"".join(stream_url(url, chunk_size=4096)) == body
+        finally:
+            server.shutdown()
+
+
+class TestParseGwas:
+    """Tests for parsing the GWAS Catalog from files and streams."""
+
+    def test_parse_from_zip_member(self, tmp_dir):
+        """Test that parse_gwas reads a binary zip member without extracting it."""
+        import zipfile
+        from allelio.database.gwas import parse_gwas
+
+        zip_path = Path(tmp_dir) / "gwas.zip"
+        with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("associations.tsv", GWAS_TSV.replace("\n", "\r\n"))
+
+        with zipfile.ZipFile(zip_path) as zf, zf.open("associations.tsv") as src:
+            records = list(parse_gwas(src))
+            # The caller's stream is left open
+            assert not src.closed
+
+        assert [r["rsid"] for r in records] == ["rs429358", "rs12913832"]
+        assert records[0]["study"] == "Genome-wide study of AD"
+
+    def test_parse_from_text_stream(self):
+        """Test that parse_gwas accepts an open text stream."""
+        import io
+        from allelio.database.gwas import parse_gwas
+
+        records = list(parse_gwas(io.StringIO(GWAS_TSV), rsids={"rs12913832"}))
+
+        assert [r["trait"] for r in records] == ["Eye color"]
+
+    def test_parse_risk_alleles(self, tmp_dir):
+        """Test that each rsID keeps its strongest risk allele and is stored with it."""
+        import io
+        from allelio.database.gwas import parse_gwas
+
+        tsv = (
+            "SNPS\tSNP_ID_CURRENT\tDISEASE/TRAIT\tP-VALUE\tSTRONGEST SNP-RISK ALLELE\n"
+            "rs429358\t429358\tAlzheimer's disease\t1e-50\trs429358-C\n"
+            "rs1; rs2\t\tLDL\t1e-9\trs1-a; rs2-?\n"
+            "rs3\t3\tHeight\t1e-8\trs99-T\n"
+            "rs4\t4\tBMI\t1e-8\t\n"
+        )
+
+        records = list(parse_gwas(io.StringIO(tsv)))
+
+        assert [(r["rsid"], r["risk_allele"]) for r in records] == [
+            ("rs429358", "C"), ("rs1", "A"), ("rs2", None), ("rs3", "T"), ("rs4", None),
+        ]
+        with AllelioDB(str(Path(tmp_dir) / "risk.db")) as db:
+            db.initialize()
+            db.insert_gwas_batch(records)
+            assert db.lookup_rsids_batch(["rs429358"])["rs429358"]["gwas"][0]["risk_allele"] == "C"
+
+    def test_setup_parses_zip_without_extracting(self, tmp_dir, sample_clinvar_file, monkeypatch):
+        """Test that setup_database keeps the archive and writes no extracted TSV."""
+        import shutil
+        import zipfile
+        from allelio.database import downloader
+
+        def fake_download(url, dest_path, progress_callback=None, log=None, **kwargs):
+            if url == downloader.CLINVAR_URL:
+                shutil.copy(sample_clinvar_file, dest_path)
+            else:
+                with zipfile.ZipFile(dest_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+                    zf.writestr("gwas-catalog-associations.tsv", GWAS_TSV)
+            return True
+
+        monkeypatch.setattr(downloader, "download_file", fake_download)
+        monkeypatch.setattr(downloader, "fetch_md5", lambda url: None)
+
+        data_dir = Path(tmp_dir) / "data"
+        with AllelioDB(str(Path(tmp_dir) / "zip.db")) as db:
+            downloader.setup_database(db, data_dir=str(data_dir), workers=1)
+            assert db.get_stats()["gwas_entries"] == 2
+
+        assert sorted(p.name for p in data_dir.iterdir()) == [
+            "gwas_associations.zip",
+            "ingest_report.json",
+            "variant_summary.txt.gz",
+        ]
+
+
+class _FlakyServer:
+    """Local HTTP server serving one file with ETag, Range and dropped connections."""
+
+    def __init__(self, body: bytes, etag: str = '"v1"', support_range: bool = True):
+        import http.server
+        import threading
+
+        self.body = body
+        self.etag = etag
+        self.support_range = support_range
+        self.drops = []  # bytes to send before cutting each successive response
+        self.requests = []
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append(dict(self.headers))
+                if self.path.endswith(".md5"):
+                    text = f"{hashlib.md5(server.body).hexdigest()}  file.gz\n".encode()
+                    self.send_response(200)
+                    self.send_header("Content-Length", str(len(text)))
+                    self.end_headers()
+                    self.wfile.write(text)
+                    return
+                if self.headers.get("If-None-Match") == server.etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+
+                start = 0
+                range_header = self.headers.get("Range")
+                if_range = self.headers.get("If-Range")
+                if server.support_range and range_header and if_range in (None, server.etag):
+                    start = int(range_header.split("=")[1].rstrip("-"))
+                    self.send_response(206)
+                    self.send_header(
+                        "Content-Range", f"bytes {start}-{len(server.body) - 1}/{len(server.body)}"
+                    )
+                else:
+                    self.send_response(200)
+                payload = server.body[start:]
+                self.send_header("Content-Length", str(len(payload)))
+                self.send_header("ETag", server.etag)
+                self.end_headers()
+                if server.drops:
+                    self.wfile.write(payload[:server.drops.pop(0)])
+                    return  # HTTP/1.0: closing here truncates the body
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, args=(0.05,), daemon=True)
+        self.thread.start()
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}/variant_summary.txt.gz"
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def flaky_server():
+    pytest.importorskip("httpx")
+    server = _FlakyServer(bytes(range(256)) * 1000)
+    yield server
+    server.close()
+
+
+class TestResumableDownload:
+    """Tests for Range resume, conditional requests and checksum verification."""
+
+    def test_resumes_after_dropped_connection(self, tmp_dir, flaky_server):
+        """Test that a dropped transfer continues from the partial file."""
+        from allelio.database.downloader import download_file
+
+        flaky_server.drops = [100_000, 80_000]
+        dest = Path(tmp_dir) / "variant_summary.txt.gz"
+
+        assert download_file(flaky_server.url, str(dest), backoff=0) is True
+
+        assert dest.read_bytes() == flaky_server.body
+        ranges = [r.get("Range") for r in flaky_server.requests]
+        assert len(ranges) == 3 and ranges[0] is None
+        offsets = [int(r.split("=")[1].rstrip("-")) for r in ranges[1:]]
+        assert 0 < offsets[0] < offsets[1] < len(flaky_server.body)
+        assert flaky_server.requests[1]["If-Range"] == '"v1"'
+        assert not Path(str(dest) + ".partial").exists()
+
+    def test_unchanged_release_is_not_refetched(self, tmp_dir, flaky_server):
+        """Test that a second download sends If-None-Match and keeps the file."""
+        from allelio.database.downloader import download_file
+
+        dest = Path(tmp_dir) / "variant_summary.txt.gz"
+        download_file(flaky_server.url, str(dest), backoff=0)
+
+        assert download_file(flaky_server.url, str(dest), backoff=0) is False
+        assert flaky_server.requests[-1]["If-None-Match"] == '"v1"'
+        assert dest.read_bytes() == flaky_server.body
+
+    def test_changed_release_restarts_resume(self, tmp_dir, flaky_server):
+        """Test that If-Range makes a changed upstream file download from zero."""
+        from allelio.database.downloader import download_file
+
+        dest = Path(tmp_dir) / "variant_summary.txt.gz"
+        # Progress, then a failure without progress, leaves a partial file
+        flaky_server.drops = [100_000, 0]
+        with pytest.raises(RuntimeError):
+            download_file(flaky_server.url, str(dest), max_retries=1, backoff=0)
+        assert Path(str(dest) + ".partial").exists()
+
+        flaky_server.body = bytes(reversed(flaky_server.body))
+        flaky_server.etag = '"v2"'
+        download_file(flaky_server.url, str(dest), backoff=0)
+
+        assert dest.read_bytes() == flaky_server.body
+
+    def test_checksum_verified_across_resume(self, tmp_dir, flaky_server):
+        """Test that the streaming MD5 covers bytes from before the resume."""
+        from allelio.database.downloader import download_file, fetch_md5
+
+        expected = fetch_md5(flaky_server.url + ".md5")
+        assert expected == hashlib.md5(flaky_server.body).hexdigest()
+
+        flaky_server.drops = [70_000]
+        dest = Path(tmp_dir) / "variant_summary.txt.gz"
+        assert download_file(flaky_server.url, str(dest), expected_md5=expected, backoff=0)
+
+    def test_checksum_mismatch_fails(self, tmp_dir, flaky_server):
+        """Test that a corrupt download is discarded and reported."""
+        from allelio.database.downloader import download_file
+
+        dest = Path(tmp_dir) / "variant_summary.txt.gz"
+        with pytest.raises(RuntimeError, match="Checksum mismatch"):
+            download_file(flaky_server.url, str(dest), expected_md5="0" * 32, max_retries=2, backoff=0)
+
+        assert not dest.exists()
+        assert not Path(str(dest) + ".partial").exists()
+
+    def test_server_without_range_support(self, tmp_dir, flaky_server):
+        """Test that a 200 reply to a Range request restarts the file cleanly."""
+        from allelio.database.downloader import download_file
+
+        flaky_server.support_range = False
+        flaky_server.drops = [100_000]
+        dest = Path(tmp_dir) / "variant_summary.txt.gz"
+
+        download_file(flaky_server.url, str(dest), backoff=0)
+
+        assert dest.read_bytes() == flaky_server.body
+
+    def test_gives_up_without_progress(self, tmp_dir, flaky_server):
+        """Test that attempts that make no progress count towards max_retries."""
+        from allelio.database.downloader import download_file
+
+        flaky_server.drops = [0, 0, 0]
+        with pytest.raises(RuntimeError, match="after 3 attempts"):
+            download_file(flaky_server.url, str(Path(tmp_dir) / "f.gz"), backoff=0)
+        assert len(flaky_server.requests) == 3
+
+
+class TestConcurrentSetup:
+    """Tests for concurrent ClinVar and GWAS acquisition in setup_database."""
+
+    @staticmethod
+    def _fake_download(sample_clinvar_file, barrier=None, fail_gwas=False):
+        import shutil
+        import zipfile
+        from allelio.database import downloader
+
+        def fake_download(url, dest_path, progress_callback=None, log=None, **kwargs):
+            if barrier is not None:
+                # Only passes if both downloads are in flight at the same time
+                barrier.wait()
+            if progress_callback:
+                progress_callback(50, 100)
+                progress_callback(100, 100)
+            if url == downloader.CLINVAR_URL:
+                shutil.copy(sample_clinvar_file, dest_path)
+            elif fail_gwas:
+                raise RuntimeError("EBI unavailable")
+            else:
+                with zipfile.ZipFile(dest_path, "w") as zf:
+                    zf.writestr("gwas.tsv", GWAS_TSV)
+            return True
+
+        return fake_download
+
+    def test_downloads_overlap(self, tmp_dir, sample_clinvar_file, monkeypatch):
+        """Test that the GWAS download runs while ClinVar is downloading."""
+        import threading
+        from allelio.database import downloader
+
+        barrier = threading.Barrier(2, timeout=5)
+        monkeypatch.setattr(downloader, "download_file", self._fake_download(sample_clinvar_file, barrier))
+        monkeypatch.setattr(downloader, "fetch_md5", lambda url: None)
+
+        progress = []
+        with AllelioDB(str(Path(tmp_dir) / "c.db")) as db:
+            downloader.setup_database(
+                db, data_dir=tmp_dir, workers=1, progress_callback=lambda d, t: progress.append((d, t))
+            )
+            stats = db.get_stats()
+
+        assert stats["clinvar_entries"] == 3
+        assert stats["gwas_entries"] == 2
+        # One combined view: totals cover both sources once both have reported
+        assert progress[-1] == (200, 200)
+
+    def test_gwas_failure_keeps_clinvar(self, tmp_dir, sample_clinvar_file, monkeypatch):
+        """Test that a failed GWAS source does not abort the ClinVar ingest."""
+        from allelio.database import downloader
+
+        monkeypatch.setattr(
+            downloader, "download_file", self._fake_download(sample_clinvar_file, fail_gwas=True)
+        )
+        monkeypatch.setattr(downloader, "fetch_md5", lambda url: None)
+
+        messages = []
+        with AllelioDB(str(Path(tmp_dir) / "c.db")) as db:
+            downloader.setup_database(db, data_dir=tmp_dir, workers=1, log=messages.append)
+
+            assert db.get_stats()["clinvar_entries"] == 3
+            assert db.get_metadata("gwas_version") == "unavailable"
+        assert any("EBI unavailable" in m for m in messages)
+
+    def test_gwas_failure_keeps_previous_catalog(self, tmp_dir, sample_clinvar_file, monkeypatch):
+        """Test that a GWAS source failing mid-stream leaves the earlier catalog intact."""
+        from allelio.database import downloader
+
+        monkeypatch.setattr(downloader, "download_file", self._fake_download(sample_clinvar_file))
+        monkeypatch.setattr(downloader, "fetch_md5", lambda url: None)
+
+        def truncated(*args, **kwargs):
+            yield [{"rsid": "rs999", "trait": "Partial", "p_value": 1e-9, "odds_ratio": None,
+                    "mapped_gene": None, "study": "Partial study", "pubmed_id": None, "link": None}]
+            raise RuntimeError("connection reset")
+
+        with AllelioDB(str(Path(tmp_dir) / "c.db")) as db:
+            downloader.setup_database(db, data_dir=tmp_dir, workers=1)
+            before = db.get_stats()["gwas_entries"]
+            monkeypatch.setattr(downloader, "_gwas_batches", truncated)
+            downloader.setup_database(db, data_dir=tmp_dir, workers=1)
+
+            assert before == 2
+            assert db.get_stats()["gwas_entries"] == before
+            assert db.lookup_rsid("rs999")["gwas"] == []
+            assert db.cursor.execute(
+                "SELECT COUNT(*) FROM strings WHERE value = 'Partial study'"
+            ).fetchone()[0] == 0
+
+    def test_clinvar_failure_aborts(self, tmp_dir, monkeypatch):
+        """Test that a ClinVar failure is raised from setup_database."""
+        from allelio.database import downloader
+
+        def failing_download(url, dest_path, *args, **kwargs):
+            raise RuntimeError("NIH unavailable")
+
+        monkeypatch.setattr(downloader, "download_file", failing_download)
+        monkeypatch.setattr(downloader, "fetch_md5", lambda url: None)
+
+        with AllelioDB(str(Path(tmp_dir) / "c.db")) as db:
+            with pytest.raises(RuntimeError, match="NIH unavailable"):
+                downloader.setup_database(db, data_dir=tmp_dir, workers=1)
+
+
+class TestIngestTelemetry:
+    """Tests for structured ingest telemetry and the JSON report."""
+
+    def test_parsers_count_filtered_rows(self, sample_clinvar_file):
+        """Test that skipped ClinVar rows are counted by reason."""
+        from allelio.database.clinvar import parse_clinvar, parse_clinvar_parallel
+
+        skipped = {}
+        list(parse_clinvar(sample_clinvar_file, rsids={"rs429358"}, skipped=skipped))
+        assert skipped == {"no_rsid": 1, "wrong_assembly": 1, "not_targeted": 2}
+
+        parallel = {}
+        list(parse_clinvar_parallel(sample_clinvar_file, rsids={"rs429358"}, workers=2,
+                                    block_size=64, skipped=parallel))
+        assert parallel == skipped
+
+    def test_gwas_counts_filtered_rows(self):
+        """Test that GWAS rows without an rsID or with too few fields are counted."""
+        import io
+        from allelio.database.gwas import parse_gwas
+
+        skipped = {}
+        text = GWAS_TSV + "-\t-\tNo SNP\t1e-5\t\t\t\n" + "rs1\n"
+        list(parse_gwas(io.StringIO(text), skipped=skipped))
+
+        assert skipped == {"no_rsid": 1, "malformed": 1}
+
+    def test_phase_rates_and_eta(self):
+        """Test per-phase throughput and ETA arithmetic."""
+        import time
+        from allelio.database.telemetry import PhaseStats, format_eta
+
+        stats = PhaseStats("download:clinvar")
+        stats.bytes, stats.total_bytes = 25, 100
+        # 25 bytes in 5s -> 75 bytes left at 5 B/s
+        stats.started = time.perf_counter() - 5
+        assert 14 < stats.eta_seconds() <= 15.1
+        assert format_eta(125) == "2m 05s"
+        assert format_eta(None) == "?"
+
+        stats.finish()
+        report = stats.to_dict()
+        assert report["complete"] is True
+        assert 4.5 < report["bytes_per_second"] < 5.5
+
+    def test_setup_writes_report(self, tmp_dir, sample_clinvar_file, monkeypatch):
+        """Test that setup_database returns and writes a JSON ingest report."""
+        import json
+        from allelio.database import downloader
+
+        payloads = {
+            downloader.CLINVAR_URL: Path(sample_clinvar_file).read_bytes(),
+            downloader.GWAS_URL: _zip_stream([("gwas.tsv", GWAS_TSV)]),
+        }
+
+        def fake_stream(url, progress_callback=None, **kwargs):
+            data = payloads[url]
+            for i, chunk in enumerate(_chunked(data, 16)):
+                progress_callback(min((i + 1) * 16, len(data)), len(data))
+                yield chunk
+
+        monkeypatch.setattr(downloader, "stream_url", fake_stream)
+
+        report_path = Path(tmp_dir) / "metrics.json"
+        with AllelioDB(str(Path(tmp_dir) / "t.db")) as db:
+            report = downloader.setup_database(db, data_dir=tmp_dir, stream=True, report_path=str(report_path))
+
+        assert json.loads(report_path.read_text()) == report
+        # Both assemblies' rows for rs429358 are parsed, then merged into one
+        assert report["clinvar_records"] == 3
+        assert report["phases"]["merge:clinvar"]["rows"] == 3
+        clinvar = report["phases"]["ingest:clinvar"]
+        assert clinvar["rows"] == 4
+        assert clinvar["filtered"] == {"no_rsid": 1, "wrong_assembly": 1}
+        assert clinvar["insert_seconds"] >= 0 and clinvar["parse_seconds"] > 0
+        download = report["phases"]["download:clinvar"]
+        assert download["bytes"] == download["total_bytes"] == len(payloads[downloader.CLINVAR_URL])
+        assert download["complete"]
+        assert report["phases"]["ingest:gwas"]["rows"] == 2
+
+
+class TestClinvarMerge:
+    """Tests for per-rsID best-record selection during ClinVar ingest."""
+
+    RECORDS = [
+        {"rsid": "rs1", "gene": "BRCA1", "clinical_significance": "Uncertain significance",
+         "conditions": "not provided", "review_status": "criteria provided, single submitter",
+         "last_evaluated": "Mar 01, 2021", "alleles": "G>A"},
+        {"rsid": "rs1", "gene": "BRCA1", "clinical_significance": "Pathogenic",
+         "conditions": "Breast cancer|Ovarian cancer", "review_status": "reviewed by expert panel",
+         "last_evaluated": "Jan 05, 2019", "alleles": "G>T"},
+        {"rsid": "rs1", "gene": "BRCA1", "clinical_significance": "Pathogenic",
+         "conditions": "Breast cancer|Fanconi anemia", "review_status": "reviewed by expert panel",
+         "last_evaluated": "Jan 05, 2019", "alleles": "G>T"},
+    ]
+
+    def test_best_reviewed_record_wins(self):
+        """Test that stars decide, conditions merge and alleles are kept as a set."""
+        from allelio.database.clinvar import merge_clinvar_records
+
+        merged = merge_clinvar_records(self.RECORDS)
+
+        assert merged["clinical_significance"] == "Pathogenic"
+        assert merged["review_status"] == "reviewed by expert panel"
+        assert merged["conditions"] == "Breast cancer|Ovarian cancer|Fanconi anemia"
+        assert merged["alleles"] == "G>A,G>T"
+
+    def test_merge_is_order_independent(self):
+        """Test that input order does not change the merged record."""
+        from allelio.database.clinvar import merge_clinvar_records
+
+        forward = merge_clinvar_records(self.RECORDS)
+        backward = merge_clinvar_records(list(reversed(self.RECORDS)))
+
+        assert forward == backward
+
+    def test_more_recent_evaluation_breaks_star_ties(self):
+        """Test that equal review stars fall back to the latest evaluation date."""
+        from allelio.database.clinvar import merge_clinvar_records
+
+        old = dict(self.RECORDS[1], clinical_significance="Likely pathogenic", last_evaluated="Dec 31, 2015")
+        new = dict(self.RECORDS[1], clinical_significance="Pathogenic", last_evaluated="Feb 01, 2016")
+
+        assert merge_clinvar_records([new, old])["clinical_significance"] == "Pathogenic"
+        assert merge_clinvar_records([old, new])["clinical_significance"] == "Pathogenic"
+
+    def test_staging_groups_by_rsid(self, tmp_dir):
+        """Test that staged rows come back ordered by rsID and staging is dropped."""
+        from allelio.database.clinvar import merge_clinvar_groups
+
+        db = AllelioDB(str(Path(tmp_dir) / "stage.db"))
+        db.initialize()
+        db.stage_clinvar_batch([self.RECORDS[0], dict(self.RECORDS[0], rsid="rs0")])
+        db.stage_clinvar_batch(self.RECORDS[1:])
+
+        staged = [r for batch in db.iter_staged_clinvar(batch_size=2) for r in batch]
+        assert [r["rsid"] for r in staged] == ["rs0", "rs1", "rs1", "rs1"]
+        assert [m["rsid"] for m in merge_clinvar_groups(staged)] == ["rs0", "rs1"]
+        assert list(db.iter_staged_clinvar()) == []
+        db.close()
+
+    def test_setup_writes_each_rsid_once(self, tmp_dir, sample_clinvar_file, monkeypatch):
+        """Test that duplicate assembly rows become one row with its alleles."""
+        from allelio.database import downloader
+        from allelio.database.shards import ShardedAllelioDB
+
+        monkeypatch.setattr(
+            downloader, "stream_url",
+            lambda url, **kwargs: iter([Path(sample_clinvar_file).read_bytes()])
+            if url == downloader.CLINVAR_URL else iter([_zip_stream([("gwas.tsv", GWAS_TSV)])]),
+        )
+
+        with ShardedAllelioDB(str(Path(tmp_dir) / "shards"), shard_count=4) as db:
+            downloader.setup_database(db, data_dir=tmp_dir, stream=True)
+
+            assert db.get_stats()["clinvar_entries"] == 3
+            assert db.get_stats()["gwas_entries"] == 2
+            row = db.lookup_rsid("rs429358")["clinvar"][0]
+            assert row["alleles"] == "T>C"
+            assert db.resolve_string(row["conditions_id"]) == "Alzheimer disease"
+
+    def test_initialize_adds_alleles_column(self, tmp_dir):
+        """Test that a database without the alleles column is migrated in place."""
+        db_path = str(Path(tmp_dir) / "old.db")
+        conn = sqlite3.connect(db_path)
+        conn.execute("""CREATE TABLE clinvar (rsid TEXT PRIMARY KEY, gene TEXT, clinical_significance TEXT,
+                        conditions_id INTEGER, review_status TEXT, last_evaluated TEXT)""")
+        conn.execute("INSERT INTO clinvar (rsid, gene) VALUES ('rs1', 'BRCA1')")
+        conn.commit()
+        conn.close()
+
+        with AllelioDB(db_path) as db:
+            db.initialize()
+            row = db.lookup_rsid("rs1")["clinvar"][0]
+
+        assert row["gene"] == "BRCA1"
+        assert row["alleles"] is None
+
+
+class TestMultiSnpGwas:
+    """Tests for expanding multi-SNP GWAS associations into per-rsID rows."""
+
+    TSV = (
+        "SNPS\tSNP_ID_CURRENT\tDISEASE/TRAIT\tP-VALUE\tMULTI_SNP_HAPLOTYPE\tSNP_INTERACTION\n"
+        "rs123; rs456\t\tHaplotype trait\t1e-8\t1\t0\n"
+        "rs1 x rs2\t\tEpistasis\t1e-9\t0\t1\n"
+        "rs7, chr6:32658079\t\tMixed\t1e-7\t0\t0\n"
+        "rs9\t99\tMerged SNP\t1e-6\t0\t0\n"
+    )
+
+    def _records(self, **kwargs):
+        import io
+        from allelio.database.gwas import parse_gwas
+
+        return list(parse_gwas(io.StringIO(self.TSV), **kwargs))
+
+    def test_rows_expand_per_rsid(self):
+        """Test that each listed rsID gets its own row sharing an association ID."""
+        records = self._records()
+
+        assert [(r["rsid"], r["association_type"]) for r in records] == [
+            ("rs123", "haplotype"), ("rs456", "haplotype"),
+            ("rs1", "interaction"), ("rs2", "interaction"),
+            ("rs7", "multi"),
+            ("rs99", "single"),
+        ]
+        assert records[0]["association_id"] == records[1]["association_id"]
+        assert records[2]["association_id"] != records[0]["association_id"]
+
+    def test_targets_filter_each_rsid(self):
+        """Test that the slim filter keeps only targeted rsIDs of an association."""
+        records = self._records(rsids={"rs456", "rs2"})
+
+        assert [r["rsid"] for r in records] == ["rs456", "rs2"]
+
+    def test_lookup_finds_split_rows(self, tmp_dir):
+        """Test that batch lookup and association lookup use the split rows."""
+        db = AllelioDB(str(Path(tmp_dir) / "multi.db"))
+        db.initialize()
+        db.insert_gwas_batch(self._records())
+
+        results = db.lookup_rsids_batch(["rs123", "rs456", "rs2"])
+        assert results["rs456"]["gwas"][0]["trait"] == "Haplotype trait"
+        assert results["rs2"]["gwas"][0]["association_type"] == "interaction"
+
+        association_id = results["rs123"]["gwas"][0]["association_id"]
+        assert [r["rsid"] for r in db.lookup_association(association_id)] == ["rs123", "rs456"]
+        db.close()
+
+    def test_sharded_association_lookup(self, tmp_dir):
+        """Test that an association's rows are collected from every shard."""
+        from allelio.database.shards import ShardedAllelioDB
+
+        with ShardedAllelioDB(str(Path(tmp_dir) / "shards"), shard_count=4) as db:
+            db.initialize()
+            db.insert_gwas_batch(self._records())
+            association_id = db.lookup_rsid("rs1")["gwas"][0]["association_id"]
+
+            assert [r["rsid"] for r in db.lookup_association(association_id)] == ["rs1", "rs2"]
+
+
+class TestMergeHistory:
+    """Tests for remapping retired rsIDs through the dbSNP merge index."""
+
+    def _write(self, tmp_dir, name, content):
+        path = Path(tmp_dir) / name
+        path.write_text(content)
+        return str(path)
+
+    def _db(self, tmp_dir):
+        db = AllelioDB(str(Path(tmp_dir) / "merges.db"))
+        db.initialize()
+        db.insert_clinvar_batch([{
+            "rsid": "rs100", "gene": "GENE1", "clinical_significance": "Pathogenic",
+            "review_status": "reviewed by expert panel", "conditions": "Disease",
+            "last_evaluated": None, "variation_id": "1",
+        }])
+        return db
+
+    def test_parse_formats(self, tmp_dir):
+        """Test parsing RsMergeArch, refsnp-merged JSON and two-column lists."""
+        from allelio.database.merges import parse_merge_history
+
+        bcp = self._write(tmp_dir, "RsMergeArch.bcp",
+                          "300\t200\t137\t0\t2010-01-01\t2010-01-01\t100\t1\t\t\n")
+        json_file = self._write(
+            tmp_dir, "refsnp-merged.json",
+            '{"refsnp_id": "400", "merged_snapshot_data": {"merged_into": ["100"]}}\n'
+            '{"refsnp_id": "5", "merged_snapshot_data": {"merged_into": []}}\n',
+        )
+        pairs = self._write(tmp_dir, "pairs.txt", "# old current\nrs500 rs100\n600,600\nbad\n")
+
+        assert list(parse_merge_history(bcp)) == [(300, 100)]
+        assert list(parse_merge_history(json_file)) == [(400, 100)]
+        assert list(parse_merge_history(pairs)) == [(500, 100)]
+
+    def test_chains_are_flattened(self, tmp_dir):
+        """Test that a -> b -> c chains resolve straight to c."""
+        from allelio.database.merges import load_merge_history
+
+        db = self._db(tmp_dir)
+        path = self._write(tmp_dir, "pairs.txt", "rs300\trs200\nrs200\trs100\n")
+
+        assert load_merge_history(db, path) == 2
+        assert db.remap_rsids(["rs300", "rs200", "rs100", "i123"]) == {"rs300": "rs100", "rs200": "rs100"}
+        db.close()
+
+    def test_batch_lookup_resolves_retired_rsid(self, tmp_dir):
+        """Test that lookups return the current rsID's annotations for a retired one."""
+        from allelio.database.merges import load_merge_history
+
+        db = self._db(tmp_dir)
+        assert db.lookup_rsids_batch(["rs300"])["rs300"]["clinvar"] == []
+
+        load_merge_history(db, self._write(tmp_dir, "pairs.txt", "rs300 rs100\n"))
+        results = db.lookup_rsids_batch(["rs300", "rs100"])
+
+        assert results["rs300"]["current_rsid"] == "rs100"
+        assert results["rs300"]["clinvar"][0]["gene"] == "GENE1"
+        assert "current_rsid" not in results["rs100"]
+        assert db.lookup_rsid("rs300")["clinvar"][0]["gene"] == "GENE1"
+        db.close()
+
+    def test_sharded_remap(self, tmp_dir):
+        """Test that sharding keeps the merge index and routes remapped lookups."""
+        from allelio.database.merges import load_merge_history
+        from allelio.database.shards import shard_database
+
+        db = self._db(tmp_dir)
+        load_merge_history(db, self._write(tmp_dir, "pairs.txt", "rs300 rs100\n"))
+        sharded = shard_database(db, str(Path(tmp_dir) / "shards"), shard_count=4)
+
+        results = sharded.lookup_rsids_batch(["rs300"])
+        assert results["rs300"]["current_rsid"] == "rs100"
+        assert results["rs300"]["clinvar"][0]["gene"] == "GENE1"
+        sharded.close()
+        db.close()
+
+
+PHARMGKB_TSV = (
+    "Clinical Annotation ID\tVariant/Haplotypes\tGene\tLevel of Evidence\tPhenotype Category\tDrug(s)\tPhenotype(s)\n"
+    "1447954390\trs762551\tCYP1A2\t3\tMetabolism/PK\tcaffeine\t\n"
+    "981419260\tCYP2D6*1, CYP2D6*4\tCYP2D6\t1A\tEfficacy\tcodeine\tPain\n"
+    "1183614201\trs429358, rs7412\tAPOE\t2B\tToxicity\tstatins\tMyopathy\n"
+)
+
+PGS_TXT = (
+    "###PGS CATALOG SCORING FILE\n"
+    "#pgs_id=PGS000123\n"
+    "rsID\tchr_name\tchr_position\teffect_allele\tother_allele\teffect_weight\n"
+    "rs429358\t19\t44908684\tC\tT\t0.35\n"
+    "\t1\t1000\tA\tG\t0.1\n"
+    "rs12913832\t15\t28120472\tG\tA\tnot-a-number\n"
+)
+
+
+class TestAnnotationSources:
+    """Tests for annotation-source plugins and their ingest through setup_database."""
+
+    def _files(self, tmp_dir):
+        import gzip
+
+        pharmgkb = Path(tmp_dir) / "clinical_annotations.tsv"
+        pharmgkb.write_text(PHARMGKB_TSV)
+        pgs = Path(tmp_dir) / "PGS000123.txt.gz"
+        with gzip.open(pgs, "wt") as f:
+            f.write(PGS_TXT)
+        return str(pharmgkb), str(pgs)
+
+    def test_local_parsers(self, tmp_dir):
+        """Test PharmGKB and PGS parsing, including skipped rows."""
+        from allelio.database.sources import PGSScoringSource, PharmGKBSource, SourceContext
+
+        pharmgkb_path, pgs_path = self._files(tmp_dir)
+        context = SourceContext(data_dir=Path(tmp_dir))
+
+        pharmgkb = [r for batch in PharmGKBSource(pharmgkb_path).batches(context) for r in batch]
+        assert [(r["rsid"], r["drugs"]) for r in pharmgkb] == [
+            ("rs762551", "caffeine"), ("rs429358", "statins"), ("rs7412", "statins"),
+        ]
+        assert pharmgkb[0]["phenotypes"] is None
+
+        pgs = [r for batch in PGSScoringSource(pgs_path).batches(context) for r in batch]
+        assert pgs == [{"rsid": "rs429358", "pgs_id": "PGS000123", "effect_allele": "C",
+                        "other_allele": "T", "effect_weight": 0.35}]
+
+    def test_source_from_spec(self, tmp_dir):
+        """Test building sources from KIND=PATH specs."""
+        from allelio.database.sources import PharmGKBSource, source_from_spec
+
+        pharmgkb_path, _ = self._files(tmp_dir)
+        assert isinstance(source_from_spec(f"pharmgkb={pharmgkb_path}"), PharmGKBSource)
+        with pytest.raises(ValueError, match="Unknown annotation source"):
+            source_from_spec(f"dbnsfp={pharmgkb_path}")
+        with pytest.raises(FileNotFoundError):
+            source_from_spec("pgs=missing.txt")
+
+    def test_setup_loads_plugins(self, tmp_dir, sample_clinvar_file, monkeypatch):
+        """Test that plugin sources are ingested and joined into lookups."""
+        from allelio.analysis.lookup import analyze_variants
+        from allelio.database import downloader
+        from allelio.database.sources import PGSScoringSource, PharmGKBSource
+        from allelio.parsers.base import Variant
+
+        monkeypatch.setattr(downloader, "download_file", TestConcurrentSetup._fake_download(sample_clinvar_file))
+        monkeypatch.setattr(downloader, "fetch_md5", lambda url: None)
+        pharmgkb_path, pgs_path = self._files(tmp_dir)
+        sources = downloader.default_sources() + [PharmGKBSource(pharmgkb_path), PGSScoringSource(pgs_path)]
+
+        with AllelioDB(str(Path(tmp_dir) / "p.db")) as db:
+            report = downloader.setup_database(db, data_dir=tmp_dir, workers=1, sources=sources)
+            # A second run replaces the plugin rows instead of duplicating them
+            downloader.setup_database(db, data_dir=tmp_dir, workers=1, sources=sources)
+
+            results = db.lookup_rsids_batch(["rs429358", "rs7412"])
+            assert [r["drugs"] for r in results["rs429358"]["pharmgkb"]] == ["statins"]
+            assert results["rs429358"]["pgs"][0]["effect_weight"] == 0.35
+            assert results["rs7412"]["clinvar"] == [] and len(results["rs7412"]["pharmgkb"]) == 1
+            assert db.lookup_rsid("rs762551")["pharmgkb"][0]["gene"] == "CYP1A2"
+            assert db.get_metadata("pharmgkb_version") == "clinical_annotations.tsv"
+
+            variant = Variant(rsid="rs429358", chromosome="19", position=44908684, genotype="CT")
+            [result] = analyze_variants([variant], db, include_benign=True)
+            assert sorted(result.annotations) == ["pgs", "pharmgkb"]
+
+        assert report["sources"]["pharmgkb"] == {"records": 3, "available": True}
+        assert report["phases"]["ingest:pgs"]["filtered"] == {"malformed": 1, "no_rsid": 1}
+
+    def test_custom_source_failure_is_skipped(self, tmp_dir, sample_clinvar_file, monkeypatch):
+        """Test that a failing optional plugin drops its rows and keeps the rest."""
+        from allelio.database import downloader
+        from allelio.database.sources import AnnotationSource
+
+        class BrokenSource(AnnotationSource):
+            name = "broken"
+            label = "Broken"
+            table = "broken_annotations"
+            columns = {"note": "TEXT"}
+
+            def batches(self, context):
+                yield [{"rsid": "rs1", "note": "partial"}]
+                raise RuntimeError("feed cut off")
+
+        monkeypatch.setattr(downloader, "download_file", TestConcurrentSetup._fake_download(sample_clinvar_file))
+        monkeypatch.setattr(downloader, "fetch_md5", lambda url: None)
+
+        messages = []
+        with AllelioDB(str(Path(tmp_dir) / "b.db")) as db:
+            downloader.setup_database(
+                db, data_dir=tmp_dir, workers=1, log=messages.append,
+                sources=downloader.default_sources() + [BrokenSource()],
+            )
+
+            assert db.get_stats()["clinvar_entries"] == 3
+            assert db.lookup_rsid("rs1")["broken"] == []
+            assert db.get_metadata("broken_version") == "unavailable"
+        assert any("Broken failed: feed cut off" in m for m in messages)
+
+    def test_invalid_identifiers_rejected(self, tmp_dir):
+        """Test that plugin names are checked before being used in SQL."""
+        from allelio.database.sources import AnnotationSource
+
+        class BadSource(AnnotationSource):
+            name = "bad"
+            table = "gwas"
+
+        db = AllelioDB(str(Path(tmp_dir) / "i.db"))
+        db.initialize()
+        with pytest.raises(ValueError):
+            db.initialize_source(BadSource())
+        BadSource.table = "bad; DROP TABLE clinvar"
+        with pytest.raises(ValueError):
+            db.initialize_source(BadSource())
+        db.close()
+
+    def test_sharded_plugin_lookup(self, tmp_dir):
+        """Test that plugin rows are routed to shards and joined into lookups."""
+        from allelio.database.shards import ShardedAllelioDB
+        from allelio.database.sources import PharmGKBSource, SourceContext
+
+        pharmgkb_path, _ = self._files(tmp_dir)
+        source = PharmGKBSource(pharmgkb_path)
+        with ShardedAllelioDB(str(Path(tmp_dir) / "shards"), shard_count=4) as db:
+            db.initialize()
+            source.prepare(db)
+            for batch in source.batches(SourceContext(data_dir=Path(tmp_dir))):
+                source.insert(db, batch)
+
+            results = db.lookup_rsids_batch(["rs429358", "rs7412", "rs762551"])
+            assert {rsid: len(r["pharmgkb"]) for rsid, r in results.items()} == {
+                "rs429358": 1, "rs7412": 1, "rs762551": 1,
+            }
+
+    def test_shard_database_copies_plugins(self, sample_db, tmp_dir):
+        """Test that sharding keeps plugin sources, their registry and indexes."""
+        from allelio.database.shards import shard_database
+        from allelio.database.sources import PGSScoringSource, PharmGKBSource, SourceContext
+
+        pharmgkb_path, pgs_path = self._files(tmp_dir)
+        for source in (PharmGKBSource(pharmgkb_path), PGSScoringSource(pgs_path)):
+            source.prepare(sample_db)
+            for batch in source.batches(SourceContext(data_dir=Path(tmp_dir))):
+                source.insert(sample_db, batch)
+        rsids = ["rs429358", "rs7412", "rs762551"]
+        expected = sample_db.lookup_rsids_batch(rsids)
+
+        with shard_database(sample_db, str(Path(tmp_dir) / "shards"), shard_count=4) as sharded:
+            assert sharded.source_tables() == sample_db.source_tables()
+            results = sharded.lookup_rsids_batch(rsids)
+            for rsid in rsids:
+                for name in ("pharmgkb", "pgs"):
+                    assert [{k: v for k, v in row.items() if k != "id"} for row in results[rsid][name]] == \
+                        [{k: v for k, v in row.items() if k != "id"} for row in expected[rsid][name]]
+            shard = sharded.shards[0]
+            indexes = {row[1] for row in shard.conn.execute("PRAGMA index_list(pgs_weights)")}
+            assert "idx_pgs_weights_pgs_id" in indexes
+
+    def test_setup_loads_several_pgs_files(self, tmp_dir, sample_clinvar_file, monkeypatch):
+        """Test that two PGS sources both load and each replaces only its own score."""
+        from allelio.database import downloader
+        from allelio.database.sources import PGSScoringSource
+
+        monkeypatch.setattr(downloader, "download_file", TestConcurrentSetup._fake_download(sample_clinvar_file))
+        monkeypatch.setattr(downloader, "fetch_md5", lambda url: None)
+        _, first = self._files(tmp_dir)
+        second = Path(tmp_dir) / "PGS000456.txt"
+        second.write_text(PGS_TXT.replace("PGS000123", "PGS000456").replace("0.35", "-0.2"))
+
+        def weights(db):
+            rows = db.conn.execute("SELECT pgs_id, effect_weight FROM pgs_weights ORDER BY pgs_id").fetchall()
+            return [tuple(row) for row in rows]
+
+        with AllelioDB(str(Path(tmp_dir) / "p.db")) as db:
+            sources = [PGSScoringSource(first), PGSScoringSource(str(second))]
+            report = downloader.setup_database(db, data_dir=tmp_dir, workers=1, sources=sources)
+            assert weights(db) == [("PGS000123", 0.35), ("PGS000456", -0.2)]
+            assert report["sources"]["pgs"]["records"] == 1
+            assert report["sources"]["pgs#2"]["records"] == 1
+            assert db.get_metadata("pgs_version") == "PGS000123.txt.gz, PGS000456.txt"
+
+            second.write_text(PGS_TXT.replace("PGS000123", "PGS000456").replace("0.35", "0.5"))
+            downloader.setup_database(db, data_dir=tmp_dir, workers=1, sources=[PGSScoringSource(str(second))])
+            assert weights(db) == [("PGS000123", 0.35), ("PGS000456", 0.5)]
+
+
+class TestChangeLog:
+    """Tests for per-version rsID change sets."""
+
+    def test_records_added_changed_removed(self, sample_db):
+        """Test that a new version logs exactly the rsIDs whose rows differ."""
+        first = sample_db.bump_data_version()
+        assert sample_db.change_counts(first) is None
+        assert sample_db.changes_since(first) == set()
+
+        sample_db.insert_clinvar_batch([{
+            "rsid": "rs762551", "gene": "CYP1A2", "clinical_significance": "benign",
+            "conditions": "Caffeine sensitivity", "review_status": "reviewed by expert panel",
+            "last_evaluated": "2024-01-01",
+        }])
+        sample_db.insert_gwas_batch([{
+            "rsid": "rs555", "trait": "Height", "p_value": 1e-9, "odds_ratio": None, "mapped_gene": None,
+            "study": "New study", "pubmed_id": None, "link": None,
+        }])
+        sample_db.cursor.execute("DELETE FROM gwas WHERE rsid = 'rs1234'")
+        sample_db.conn.commit()
+        second = sample_db.bump_data_version()
+
+        assert sample_db.change_counts(second) == {"added": 1, "changed": 1, "removed": 1}
+        assert sample_db.changes_since(first) == {"rs762551", "rs555", "rs1234"}
+        assert sample_db.changes_since(second) == set()
+        assert sample_db.changes_since("unknown-version") is None
+
+    def test_identical_reload_is_unchanged(self, sample_db):
+        """Test that reloading the same rows (new ids, re-interned strings) logs no changes."""
+        sample_db.bump_data_version()
+        clinvar = [row for batch in sample_db.iter_records("clinvar") for row in batch]
+        gwas = [row for batch in sample_db.iter_records("gwas") for row in batch]
+        sample_db.clear_annotations()
+        sample_db.insert_gwas_batch(list(reversed(gwas)))
+        sample_db.insert_clinvar_batch(clinvar)
+
+        version = sample_db.bump_data_version()
+        assert sample_db.change_counts(version) == {"added": 0, "changed": 0, "removed": 0}
+
+    def test_changes_include_merged_rsids(self, sample_db):
+        """Test that retired rsIDs follow changes to the rsID they were merged into."""
+        sample_db.insert_merges_batch([(111, 429358)])
+        first = sample_db.bump_data_version()
+        sample_db.cursor.execute("UPDATE clinvar SET clinical_significance = 'pathogenic' WHERE rsid = 'rs429358'")
+        sample_db.conn.commit()
+        sample_db.bump_data_version()
+
+        assert sample_db.changes_since(first) == {"rs429358", "rs111"}
+
+    def test_setup_update_does_not_duplicate_gwas(self, tmp_dir, sample_clinvar_file, monkeypatch):
+        """Test that an unchanged re-run replaces the GWAS catalog and logs no changes."""
+        from allelio.database import downloader
+
+        monkeypatch.setattr(downloader, "download_file", TestConcurrentSetup._fake_download(sample_clinvar_file))
+        monkeypatch.setattr(downloader, "fetch_md5", lambda url: None)
+
+        with AllelioDB(str(Path(tmp_dir) / "u.db")) as db:
+            downloader.setup_database(db, data_dir=tmp_dir, workers=1)
+            gwas_entries = db.get_stats()["gwas_entries"]
+            report = downloader.setup_database(db, data_dir=tmp_dir, workers=1)
+
+            assert db.get_stats()["gwas_entries"] == gwas_entries
+        assert report["changes"] == {"added": 0, "changed": 0, "removed": 0}
+
+    def test_update_removes_rsids_clinvar_dropped(self, tmp_dir, sample_clinvar_file, monkeypatch):
+        """Test that an rsID missing from a new ClinVar release is deleted and logged as removed."""
+        import gzip
+        from allelio.database import downloader
+
+        monkeypatch.setattr(downloader, "download_file", TestConcurrentSetup._fake_download(sample_clinvar_file))
+        monkeypatch.setattr(downloader, "fetch_md5", lambda url: None)
+
+        with AllelioDB(str(Path(tmp_dir) / "r.db")) as db:
+            downloader.setup_database(db, data_dir=tmp_dir, workers=1)
+            first = db.data_version()
+            assert db.lookup_rsid("rs762551")["clinvar"]
+
+            with gzip.open(sample_clinvar_file, "rt") as f:
+                lines = [line for line in f if "\t762551\t" not in line]
+            with gzip.open(sample_clinvar_file, "wt") as f:
+                f.writelines(lines)
+            report = downloader.setup_database(db, data_dir=tmp_dir, workers=1)
+
+            assert db.lookup_rsid("rs762551")["clinvar"] == []
+            assert db.lookup_rsid("rs429358")["clinvar"]
+            assert db.changes_since(first) == {"rs762551"}
+        assert report["changes"] == {"added": 0, "changed": 0, "removed": 1}
+
+    def test_sharded_changes(self, tmp_dir):
+        """Test that shards log their own changes under one version."""
+        from allelio.database.shards import ShardedAllelioDB
+
+        with ShardedAllelioDB(str(Path(tmp_dir) / "shards"), shard_count=4) as db:
+            db.initialize()
+            db.insert_gwas_batch([{
+                "rsid": f"rs{n}", "trait": "Height", "p_value": 1e-9, "odds_ratio": None,
+                "mapped_gene": None, "study": None, "pubmed_id": None, "link": None,
+            } for n in range(1, 9)])
+            first = db.bump_data_version()
+            db.insert_merges_batch([(100, 6)])
+            for n in (3, 6):
+                db.insert_gwas_batch([{
+                    "rsid": f"rs{n}", "trait": "Weight", "p_value": 1e-9, "odds_ratio": None,
+                    "mapped_gene": None, "study": None, "pubmed_id": None, "link": None,
+                }])
+            second = db.bump_data_version()
+
+            assert db.data_version() == second
+            assert db.change_counts(second) == {"added": 1, "changed": 2, "removed": 0}
+            assert db.changes_since(first) == {"rs3", "rs6", "rs100"}